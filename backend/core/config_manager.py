@@ -3,21 +3,58 @@ import logging
 import asyncio
 import os
 import sys
-from typing import Any, Optional, Dict, Set
+from collections import namedtuple
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Optional, Dict, Mapping, Set
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker, Session as SyncSession
 
 # Import engine directly to create sessions
 try:
     from database import engine, get_session
-    from models import Config
+    from models import Config, AIModelConfig
 except ImportError:
     from backend.database import engine, get_session
-    from backend.models import Config
+    from backend.models import Config, AIModelConfig
 
 logger = logging.getLogger(__name__)
 
+# 模型卡的只读视图 (字段与 AIModelConfig 一致，脱离 ORM Session)
+ModelConfigView = namedtuple("ModelConfigView", list(AIModelConfig.model_fields.keys()))
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """
+    Config 表 + AIModelConfig 表的进程级不可变快照。
+    热路径通过它读取配置，不再每次请求都 select(Config) 全表。
+    """
+    version: int
+    configs: Mapping[str, str]
+    models: Mapping[int, ModelConfigView]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.configs.get(key, default)
+
+    def get_model(self, model_id: Any) -> Optional[ModelConfigView]:
+        """按 ID 获取模型卡，兼容 Config 中存储的字符串 ID。"""
+        if model_id in (None, ""):
+            return None
+        try:
+            return self.models.get(int(model_id))
+        except (TypeError, ValueError):
+            return None
+
+    def get_model_by_name(self, name: str) -> Optional[ModelConfigView]:
+        for model in self.models.values():
+            if model.name == name:
+                return model
+        return None
+
+
 class ConfigManager:
     _instance: Optional['ConfigManager'] = None
     
@@ -72,6 +109,11 @@ class ConfigManager:
         # 注意: 我们不在 __init__ 中从数据库加载，因为它需要 async。
         # 请在应用启动期间调用 await load_from_db()。
 
+        # 配置快照 (懒加载，写入 Config/AIModelConfig 后失效)
+        self._snapshot: Optional[ConfigSnapshot] = None
+        self._snapshot_version = 0
+        self._snapshot_lock: Optional[asyncio.Lock] = None
+
     async def load_from_db(self):
         """将配置从数据库加载到内存中。"""
         try:
@@ -112,6 +154,50 @@ class ConfigManager:
     def get(self, key: str, default: Any = None) -> Any:
         return self.config.get(key, default)
 
+    async def get_snapshot(self) -> ConfigSnapshot:
+        """
+        获取当前配置快照。命中缓存时不访问数据库；
+        失效后由第一个调用者重新加载，并发调用者等待同一次加载。
+        使用独立 Session 加载，避免把调用方未提交的修改缓存进来。
+        """
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+
+        if self._snapshot_lock is None:
+            self._snapshot_lock = asyncio.Lock()
+
+        async with self._snapshot_lock:
+            if self._snapshot is not None:
+                return self._snapshot
+
+            version = self._snapshot_version
+            async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False) # type: ignore
+            async with async_session() as session: # type: ignore
+                snapshot = await self._load_snapshot(session, version)
+
+            # 加载期间若发生写入，本次结果只返回给调用者，不进入缓存
+            if version == self._snapshot_version:
+                self._snapshot = snapshot
+            return snapshot
+
+    async def _load_snapshot(self, session: AsyncSession, version: int) -> ConfigSnapshot:
+        configs = {c.key: c.value for c in (await session.exec(select(Config))).all()}
+        models = {
+            m.id: ModelConfigView(**{field: getattr(m, field) for field in ModelConfigView._fields})
+            for m in (await session.exec(select(AIModelConfig))).all()
+        }
+        return ConfigSnapshot(
+            version=version,
+            configs=MappingProxyType(configs),
+            models=MappingProxyType(models)
+        )
+
+    def invalidate_snapshot(self):
+        """使配置快照失效，下次读取时从数据库重新加载。"""
+        self._snapshot_version += 1
+        self._snapshot = None
+
     async def set(self, key: str, value: Any):
         """更新内存和数据库中的配置。"""
         logger.info(f"正在更新配置: {key} = {value}")
@@ -150,3 +236,26 @@ def get_config_manager():
     if ConfigManager._instance is None:
         ConfigManager._instance = ConfigManager()
     return ConfigManager._instance
+
+async def get_config_snapshot() -> ConfigSnapshot:
+    return await get_config_manager().get_snapshot()
+
+# --- 快照失效通知 ---
+# 任何 Session 中对 Config / AIModelConfig 的 ORM 写入，提交后都会使快照失效。
+# 批量 delete()/update() 语句不经过 flush，需要调用方手动 invalidate_snapshot()。
+
+@event.listens_for(SyncSession, "after_flush")
+def _mark_config_dirty(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, (Config, AIModelConfig)):
+            session.info["config_snapshot_dirty"] = True
+            return
+
+@event.listens_for(SyncSession, "after_commit")
+def _invalidate_config_snapshot(session):
+    if session.info.pop("config_snapshot_dirty", False):
+        get_config_manager().invalidate_snapshot()
+
+@event.listens_for(SyncSession, "after_rollback")
+def _discard_config_dirty(session):
+    session.info.pop("config_snapshot_dirty", None)
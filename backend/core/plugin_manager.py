@@ -29,6 +29,7 @@ class PluginManager:
         self.loaded_modules: Dict[str, Any] = {}      # 插件名 -> 已加载模块对象
         self.config_manager = get_config_manager()
         self.nit_manager = get_nit_manager()
+        self._reload_listeners: List[Callable[[], None]] = []
 
     def load_plugins(self):
         """
@@ -65,6 +66,17 @@ class PluginManager:
         self.tools_map.clear()
         self.loaded_modules.clear()
         self.load_plugins()
+        for listener in list(self._reload_listeners):
+            try:
+                listener()
+            except Exception as e:
+                logger.error(f"插件重载回调出错: {e}")
+
+    def add_reload_listener(self, listener: Callable[[], None]):
+        """
+        注册插件重载后的回调 (如工具目录缓存失效)。
+        """
+        self._reload_listeners.append(listener)
 
     def _scan_directory(self, directory: str, category_prefix: str = None):
         """扫描特定目录下的插件 (Helper)。"""
@@ -0,0 +1,108 @@
+import os
+import shutil
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from core import config_manager
+from core.config_manager import ConfigManager, get_config_manager
+from models import AIModelConfig, Config, Memory
+
+
+class TestConfigSnapshot(unittest.TestCase):
+    """提交 Config / AIModelConfig 的写入后快照失效；回滚或无关写入不失效"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, "config.db")
+        with mock.patch.object(config_manager.sys, "argv", []):
+            manager = ConfigManager()
+        patcher = mock.patch.object(ConfigManager, "_instance", manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.manager = get_config_manager()
+
+    def run_db(self, scenario):
+        async def run():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{self.path}")
+            try:
+                async with engine.begin() as conn:
+                    await conn.run_sync(SQLModel.metadata.create_all)
+                async with AsyncSession(engine, expire_on_commit=False) as session:
+                    session.add(Config(key="theme", value="light"))
+                    session.add(AIModelConfig(name="对话模型", model_id="gpt-4"))
+                    await session.commit()
+                    with mock.patch.object(config_manager, "engine", engine):
+                        return await scenario(session)
+            finally:
+                await engine.dispose()
+        return asyncio.new_event_loop().run_until_complete(run())
+
+    def test_snapshot_is_cached(self):
+        async def scenario(session):
+            first = await self.manager.get_snapshot()
+            return first, await self.manager.get_snapshot()
+
+        first, second = self.run_db(scenario)
+        self.assertIs(first, second)
+        self.assertEqual(first.get("theme"), "light")
+        self.assertEqual(first.get_model_by_name("对话模型").model_id, "gpt-4")
+
+    def test_config_commit_invalidates(self):
+        async def scenario(session):
+            before = await self.manager.get_snapshot()
+            config = (await session.exec(select(Config).where(Config.key == "theme"))).one()
+            config.value = "dark"
+            session.add(config)
+            await session.commit()
+            return before, await self.manager.get_snapshot()
+
+        before, after = self.run_db(scenario)
+        self.assertIsNot(before, after)
+        self.assertGreater(after.version, before.version)
+        self.assertEqual(before.get("theme"), "light")
+        self.assertEqual(after.get("theme"), "dark")
+
+    def test_model_commit_invalidates(self):
+        async def scenario(session):
+            before = await self.manager.get_snapshot()
+            model = (await session.exec(select(AIModelConfig))).one()
+            model.model_id = "gpt-4o"
+            session.add(model)
+            session.add(AIModelConfig(name="视觉模型", model_id="gpt-4-vision"))
+            await session.commit()
+            return before, await self.manager.get_snapshot(), model.id
+
+        before, after, model_id = self.run_db(scenario)
+        self.assertIsNot(before, after)
+        self.assertEqual(after.get_model(model_id).model_id, "gpt-4o")
+        self.assertEqual(after.get_model(str(model_id)).model_id, "gpt-4o")
+        self.assertIsNotNone(after.get_model_by_name("视觉模型"))
+
+    def test_rollback_keeps_snapshot(self):
+        async def scenario(session):
+            before = await self.manager.get_snapshot()
+            session.add(Config(key="draft", value="1"))
+            await session.flush()
+            await session.rollback()
+            rolled_back = await self.manager.get_snapshot()
+
+            # 回滚丢弃了脏标记，之后无关的提交也不会让快照失效
+            session.add(Memory(content="m"))
+            await session.commit()
+            return before, rolled_back, await self.manager.get_snapshot()
+
+        before, rolled_back, after_unrelated = self.run_db(scenario)
+        self.assertIs(rolled_back, before)
+        self.assertIs(after_unrelated, before)
+        self.assertIsNone(before.get("draft"))
+
+
+if __name__ == "__main__":
+    unittest.main()
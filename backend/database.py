@@ -65,10 +65,88 @@ def set_sqlite_pragma(dbapi_connection, connection_record):
     cursor.execute("PRAGMA cache_size=-20000") # 20MB 缓存
     cursor.close()
 
+def migrate_memory_embeddings(sync_conn):
+    """
+    向量迁移：把旧库 memory.embedding_json 中的 JSON 向量搬到 memoryembedding (float32 blob)，
+    然后删除该列；SQLite < 3.35 不支持 DROP COLUMN 时保留空列。
+    """
+    import json
+    from sqlalchemy import text
+    from models import pack_embedding
+
+    sync_conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS trg_memory_delete_embedding AFTER DELETE ON memory "
+        "BEGIN DELETE FROM memoryembedding WHERE memory_id = OLD.id; END"
+    )
+
+    columns = [row[1] for row in sync_conn.exec_driver_sql("PRAGMA table_info(memory)")]
+    if "embedding_json" not in columns:
+        return
+
+    migrated = 0
+    while True:
+        rows = sync_conn.exec_driver_sql(
+            "SELECT id, embedding_json FROM memory WHERE embedding_json IS NOT NULL LIMIT 500"
+        ).all()
+        if not rows:
+            break
+
+        payload = []
+        for memory_id, raw in rows:
+            try:
+                vector = json.loads(raw) if raw else []
+            except ValueError:
+                vector = []
+            if vector:
+                payload.append({"memory_id": memory_id, "dim": len(vector), "vector": pack_embedding(vector)})
+
+        if payload:
+            sync_conn.execute(text(
+                "INSERT OR IGNORE INTO memoryembedding (memory_id, dim, vector) VALUES (:memory_id, :dim, :vector)"
+            ), payload)
+        sync_conn.execute(
+            text("UPDATE memory SET embedding_json = NULL WHERE id = :id"),
+            [{"id": memory_id} for memory_id, _ in rows]
+        )
+        migrated += len(payload)
+
+    try:
+        with sync_conn.begin_nested():
+            sync_conn.exec_driver_sql("ALTER TABLE memory DROP COLUMN embedding_json")
+    except Exception as e:
+        print(f"[Database] 无法删除 embedding_json 列 (已置空): {e}")
+    print(f"[Database] 已迁移 {migrated} 条记忆向量到 memoryembedding。")
+
+def ensure_indexes(sync_conn):
+    """
+    索引迁移：create_all 只会为新建的表创建索引，
+    已存在的旧库需要在这里补建模型中新声明的 (复合) 索引。
+    """
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+def ensure_columns(sync_conn):
+    """
+    列迁移：create_all 不会修改已存在的表，
+    旧库缺少的可空列 (模型中新增的字段) 在这里通过 ALTER TABLE ADD COLUMN 补上。
+    """
+    for table in SQLModel.metadata.sorted_tables:
+        existing = {row[1] for row in sync_conn.exec_driver_sql(f'PRAGMA table_info("{table.name}")')}
+        for column in table.columns:
+            if column.name in existing or not column.nullable or column.primary_key:
+                continue
+            column_type = column.type.compile(dialect=sync_conn.dialect)
+            sync_conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}')
+            print(f"[Database] 已为 {table.name} 补充列 {column.name}")
+
 async def init_db():
     async with engine.begin() as conn:
         # 运行同步模式的创建表操作
         await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(ensure_columns)
+        await conn.run_sync(migrate_memory_embeddings)
+        await conn.run_sync(ensure_indexes)
 
 async def get_session() -> AsyncSession:
     async_session = sessionmaker(
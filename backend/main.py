@@ -54,17 +54,24 @@ if os.name == 'nt':
     if sys.stderr is not None:
         sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
+# Windows 下 spawn 启动的子进程会以 __mp_main__ 身份重新执行本文件
+# (音频进程池启动工作进程时已隐藏主脚本，见 services/audio_processor.py)；
+# 子进程不重复配置共享日志文件，也不打印启动调试信息
+IS_SPAWNED_CHILD = __name__ == "__mp_main__"
+
 # Initialize Logging
 import logging
 from utils.logging_config import configure_logging
 log_file = os.environ.get("PERO_LOG_FILE")
-configure_logging(log_file=log_file)
+if not IS_SPAWNED_CHILD:
+    configure_logging(log_file=log_file)
 
 logger = logging.getLogger(__name__)
 
 # [DEBUG] Print startup args and env for troubleshooting
-print(f"[启动调试] sys.argv: {sys.argv}")
-print(f"[启动调试] ENABLE_SOCIAL_MODE 环境变量: {os.environ.get('ENABLE_SOCIAL_MODE')}")
+if not IS_SPAWNED_CHILD:
+    print(f"[启动调试] sys.argv: {sys.argv}")
+    print(f"[启动调试] ENABLE_SOCIAL_MODE 环境变量: {os.environ.get('ENABLE_SOCIAL_MODE')}")
 
 import uvicorn
 from contextlib import asynccontextmanager
@@ -92,6 +99,9 @@ from services.browser_bridge_service import browser_bridge_service
 from services.screenshot_service import screenshot_manager
 from services.gateway_client import gateway_client
 from services.scheduler_service import scheduler_service
+from services.stats_service import StatsService
+from services.llm_client_pool import llm_client_pool
+from services.mcp_pool import mcp_pool
 from nit_core.plugins.social_adapter.social_service import get_social_service
 from core.config_manager import get_config_manager
 from core.nit_manager import get_nit_manager
@@ -133,6 +143,10 @@ async def lifespan(app: FastAPI):
 
     # Startup
     await init_db()
+
+    # 物化统计计数器 (首次启动时回填)
+    async for session in get_session():
+        await StatsService.ensure_initialized(session)
     
     # Load Config from DB
     await get_config_manager().load_from_db()
@@ -155,6 +169,9 @@ async def lifespan(app: FastAPI):
     # 异步预热 ASR 模型
     asr_service = get_asr_service()
     asyncio.create_task(asyncio.to_thread(asr_service.warm_up))
+
+    # 并发初始化所有 MCP 服务器 (长驻连接池，聊天请求只借用已就绪的客户端)
+    asyncio.create_task(mcp_pool.start())
     
     # Start Social Service (if enabled)
     social_service = get_social_service()
@@ -604,6 +621,11 @@ async def lifespan(app: FastAPI):
     except asyncio.CancelledError:
         pass
     await companion_service.stop()
+    await mcp_pool.aclose()
+    await llm_client_pool.aclose()
+    from services.audio_processor import audio_processor
+    audio_processor.shutdown()
+    get_asr_service().models.shutdown()
 
 app = FastAPI(title="PeroCore Backend", description="AI Agent powered backend for Pero", lifespan=lifespan)
 app.include_router(ide_router)
@@ -835,6 +857,16 @@ async def get_system_status():
         print(f"获取系统状态错误: {e}")
         return {"error": str(e)}
 
+@app.get("/api/system/llm-pool")
+async def get_llm_pool_metrics():
+    """LLM 连接池指标：各 api_base 的连接复用率与首字节时间"""
+    return llm_client_pool.get_metrics()
+
+@app.get("/api/system/mcp-pool")
+async def get_mcp_pool_status():
+    """MCP 连接池状态：各服务器的连接状态、重启次数与缓存的工具数"""
+    return mcp_pool.get_status()
+
 @app.get("/api/nit/settings")
 async def get_nit_settings():
     """获取所有 NIT 调度设置"""
@@ -1337,11 +1369,14 @@ async def get_nit_status(session: AsyncSession = Depends(get_session)):
     # Get enabled MCPs count
     mcp_count = len((await session.exec(select(MCPConfig).where(MCPConfig.enabled == True))).all())
     
+    from nit_core.interpreter import get_parse_cache_stats
+
     return {
         "nit_version": "1.0",
         "plugins_count": len(plugin_names),
         "active_mcp_count": mcp_count,
-        "plugins": plugins_data
+        "plugins": plugins_data,
+        "parse_cache": get_parse_cache_stats()
     }
 
 # --- Memory Dashboard API ---
@@ -1364,9 +1399,8 @@ async def list_memories(
 
 @app.get("/api/memories/graph")
 async def get_memory_graph(limit: int = 100, agent_id: Optional[str] = None, session: AsyncSession = Depends(get_session)):
-    service = MemoryService()
     target_agent = agent_id if agent_id else "pero"
-    return await service.get_memory_graph(session, limit, agent_id=target_agent)
+    return await StatsService.get_memory_graph(session, limit, agent_id=target_agent)
 
 @app.delete("/api/memories/orphaned_edges")
 async def delete_orphaned_edges(session: AsyncSession = Depends(get_session)):
@@ -1582,18 +1616,10 @@ async def chat(
                     clean_text = clean_text.strip()
                     
                     if clean_text:
-                        audio_path = await tts_service.synthesize(clean_text)
-                        if audio_path and os.path.exists(audio_path):
-                            with open(audio_path, "rb") as audio_file:
-                                audio_data = base64.b64encode(audio_file.read()).decode('utf-8')
-                            
-                            # Clean up file immediately
-                            try:
-                                os.remove(audio_path)
-                            except:
-                                pass
-                                
-                            return audio_data
+                        # 直接在内存中合成，不再写入临时文件
+                        audio_bytes = await tts_service.synthesize_bytes(clean_text)
+                        if audio_bytes:
+                            return base64.b64encode(audio_bytes).decode('utf-8')
                 except Exception as e:
                     print(f"TTS Chunk Error: {e}")
                 return None
@@ -1615,11 +1641,13 @@ async def chat(
                 filler_cache_path = os.path.join(current_dir, "assets", "filler_thinking.mp3")
 
                 # 初始化过滤器，防止 TTS 读取 XML 标签和 NIT 工具调用块
-                from nit_core.dispatcher import XMLStreamFilter, NITStreamFilter, ThinkingBlockStreamFilter
-                # 显式过滤 thought 标签和 PEROCUE 等标签
-                xml_filter = XMLStreamFilter(tag_names=["THOUGHT", "PEROCUE", "CHARACTER_STATUS", "METADATA"])
-                nit_filter = NITStreamFilter()
-                thinking_filter = ThinkingBlockStreamFilter() # 新增：专门处理思考块
+                # 单遍扫描：NIT 块、thought/PEROCUE 等标签、思考块一次过滤
+                from nit_core.stream_filter import StreamTagFilter, DEFAULT_THINKING_TAGS
+                tts_filter = StreamTagFilter(
+                    nit=True,
+                    xml_tags=["THOUGHT", "PEROCUE", "CHARACTER_STATUS", "METADATA"],
+                    thinking_tags=DEFAULT_THINKING_TAGS,
+                )
                 
                 try:
                     while True:
@@ -1662,12 +1690,8 @@ async def chat(
                             raw_chunk = await tts_queue.get()
                         
                         if raw_chunk is None: # Sentinel
-                            # Flush filters buffer
-                            remaining_xml = xml_filter.flush()
-                            remaining_nit = nit_filter.filter(remaining_xml) + nit_filter.flush()
-                            
-                            if remaining_nit:
-                                tts_buffer += remaining_nit
+                            # Flush filter buffer
+                            tts_buffer += tts_filter.flush()
                                 
                             # 处理最后剩余的文本
                             if tts_buffer.strip():
@@ -1680,13 +1704,8 @@ async def chat(
                         if not filler_played and len(raw_chunk.strip()) > 0:
                             filler_played = True
 
-                        # Apply Filters: First XML, then NIT
-                        filtered_xml = xml_filter.filter(raw_chunk)
-                        filtered_nit = nit_filter.filter(filtered_xml)
-                        # 应用思考块过滤器：防止思考内容进入 TTS buffer 导致被读出
-                        filtered_thinking = thinking_filter.filter(filtered_nit)
-                        
-                        tts_buffer += filtered_thinking
+                        # 过滤 XML 标签、NIT 块与思考块，防止其内容进入 TTS buffer 导致被读出
+                        tts_buffer += tts_filter.filter(raw_chunk)
                         
                         # 流式分句逻辑：查找分隔符
                         # 只有当 buffer 长度达到一定程度或出现标点符号时才切分，保证语调
@@ -1824,6 +1843,8 @@ async def reset_system(session: AsyncSession = Depends(get_session)):
         await session.exec(
             delete(Config).where(Config.key.not_in(keep_configs))
         )
+        # 批量 delete 不触发 ORM flush 事件，手动使配置快照失效
+        get_config_manager().invalidate_snapshot()
         
         # 6. 初始化一个新的默认状态
         default_state = PetState()
@@ -1894,28 +1915,10 @@ async def open_path(payload: Dict[str, str] = Body(...)):
 async def voice_asr(file: UploadFile = File(...)):
     """语音转文字接口"""
     try:
-        # Save temp file
-        # [Refactor] 统一指向 backend/data/temp_audio
-        default_data_dir = os.path.join(current_dir, "data")
-        data_dir = os.environ.get("PERO_DATA_DIR", default_data_dir)
-        temp_dir = os.path.join(data_dir, "temp_audio")
-        
-        if not os.path.exists(temp_dir):
-            os.makedirs(temp_dir)
-            
-        temp_path = os.path.join(temp_dir, f"{uuid.uuid4()}.wav")
-        with open(temp_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-            
+        # 上传的音频直接在内存中转录，不再写临时文件
+        content = await file.read()
         asr = get_asr_service()
-        text = await asr.transcribe(temp_path)
-        
-        # Cleanup
-        try:
-            os.remove(temp_path)
-        except:
-            pass
+        text = await asr.transcribe(content)
             
         if not text:
             raise HTTPException(status_code=500, detail="ASR failed")
@@ -1924,6 +1927,11 @@ async def voice_asr(file: UploadFile = File(...)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/voice/asr/stats")
+async def voice_asr_stats():
+    """ASR 排队等待 / 解码耗时指标"""
+    return get_asr_service().get_stats()
+
 @app.post("/api/voice/tts")
 async def voice_tts(payload: Dict[str, str] = Body(...)):
     """文字转语音接口"""
@@ -2102,28 +2110,13 @@ async def get_overview_stats(agent_id: Optional[str] = None, session: AsyncSessi
     获取概览页面的统计数据（总数），解耦渲染数量和显示数量。
     """
     try:
-        # Count memories
-        mem_statement = select(func.count()).select_from(Memory)
-        if agent_id:
-            mem_statement = mem_statement.where(Memory.agent_id == agent_id)
-        mem_count = (await session.exec(mem_statement)).one()
-        
-        # Count logs
-        log_statement = select(func.count()).select_from(ConversationLog)
-        if agent_id:
-            log_statement = log_statement.where(ConversationLog.agent_id == agent_id)
-        log_count = (await session.exec(log_statement)).one()
-        
-        # Count tasks (ScheduledTask)
-        task_statement = select(func.count()).select_from(ScheduledTask)
-        if agent_id:
-            task_statement = task_statement.where(ScheduledTask.agent_id == agent_id)
-        task_count = (await session.exec(task_statement)).one()
+        # 读取物化计数器，避免对 Memory/ConversationLog/ScheduledTask 做 COUNT(*)
+        counts = await StatsService.get_counts(session, agent_id)
 
         return {
-            "total_memories": mem_count,
-            "total_logs": log_count,
-            "total_tasks": task_count
+            "total_memories": counts["memories"],
+            "total_logs": counts["logs"],
+            "total_tasks": counts["tasks"]
         }
     except Exception as e:
         logger.error(f"Failed to get overview stats: {e}")
@@ -1,7 +1,8 @@
+from array import array
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from sqlmodel import Field, SQLModel
-from sqlalchemy import Text, Column
+from sqlalchemy import Text, Column, Index, LargeBinary
 
 def get_local_now():
     """获取当前本地时间"""
@@ -11,7 +12,21 @@ def get_local_timestamp():
     """获取当前本地毫秒时间戳"""
     return datetime.now().timestamp() * 1000
 
+def pack_embedding(vector: List[float]) -> bytes:
+    """将向量编码为 float32 字节串 (384 维约 1.5KB，JSON 文本约 8KB)"""
+    return array("f", vector).tobytes()
+
+def unpack_embedding(data: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(data)
+    return vector.tolist()
+
 class Memory(SQLModel, table=True):
+    __table_args__ = (
+        # save_memory 查找时间轴尾部: WHERE agent_id = ? ORDER BY timestamp DESC LIMIT 1
+        Index("ix_memory_agent_timestamp", "agent_id", "timestamp"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     content: str
     tags: str = ""  # 逗号分隔的标签
@@ -36,9 +51,16 @@ class Memory(SQLModel, table=True):
     type: str = "event" # 记忆类型 (event, fact, preference, promise, etc.)
     agent_id: str = Field(default="pero", index=True) # 所属 Agent ID (多 Agent 隔离)
 
-    # --- 向量数据 ---
-    # 存储向量 JSON (例如: "[0.123, -0.456, ...]")
-    embedding_json: str = Field(default="[]", sa_column=Column(Text))
+    # 向量不再内联存储在 Memory 行中，见 MemoryEmbedding
+
+class MemoryEmbedding(SQLModel, table=True):
+    """
+    记忆向量 (行外存储)
+    主检索走 VectorDB，这里只保留 float32 备份，避免普通 Memory 查询拖带向量数据
+    """
+    memory_id: int = Field(primary_key=True) # 对应 memory.id，记忆删除时由触发器级联清理
+    dim: int = 0
+    vector: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
 
 class MemoryRelation(SQLModel, table=True):
     """
@@ -62,6 +84,13 @@ class ConversationLog(SQLModel, table=True):
     存储原始对话记录 (Raw History Logs)
     不同设备的对话记录通过 source 隔离
     """
+    __table_args__ = (
+        # get_recent_logs: WHERE source, session_id, agent_id ORDER BY timestamp, id
+        Index("ix_conversationlog_source_session_agent_ts", "source", "session_id", "agent_id", "timestamp", "id"),
+        # Scorer 补录: WHERE analysis_status = ? AND retry_count < ?
+        Index("ix_conversationlog_status_retry", "analysis_status", "retry_count"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     session_id: str = Field(index=True) # 会话ID
     source: str = Field(index=True) # 来源环境 (desktop, ide, qq, etc.)
@@ -83,6 +112,10 @@ class ConversationLog(SQLModel, table=True):
     last_error: Optional[str] = None
     
     agent_id: str = Field(default="pero", index=True) # 所属 Agent ID (多 Agent 隔离)
+
+    # 上下文窗口: 清理后内容的 Token 数与计数规则版本 (见 services/history_tokens.py)
+    token_count: Optional[int] = None
+    token_version: Optional[int] = None
     
 
 
@@ -128,6 +161,10 @@ class GroupChatMessage(SQLModel, table=True):
 
 class ScheduledTask(SQLModel, table=True):
     """存储 <REMINDER> 和 <TOPIC>"""
+    __table_args__ = (
+        Index("ix_scheduledtask_triggered_type_agent", "is_triggered", "type", "agent_id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     type: str  # "reminder" or "topic"
     time: str  # YYYY-MM-DD HH:mm:ss
@@ -136,6 +173,15 @@ class ScheduledTask(SQLModel, table=True):
     created_at: datetime = Field(default_factory=get_local_now)
     agent_id: str = Field(default="pero", index=True) # 所属 Agent ID
 
+class StatsCounter(SQLModel, table=True):
+    """
+    物化统计计数器 (按 Agent 维护)
+    由 StatsService 在插入/删除时同事务更新，仪表盘读取时无需 COUNT(*) 全表
+    """
+    agent_id: str = Field(primary_key=True)
+    kind: str = Field(primary_key=True) # memories, logs, tasks, relations
+    count: int = 0
+
 class Config(SQLModel, table=True):
     key: str = Field(primary_key=True)
     value: str
@@ -231,6 +277,10 @@ class MCPConfig(SQLModel, table=True):
     
     # sse 配置
     url: Optional[str] = None
+
+    # 工具执行策略 (nit_core.scheduler)：未声明时该服务器的工具一律串行、不限时
+    max_concurrency: Optional[int] = None # 声明后允许并发执行，值为单工具并发上限
+    timeout_seconds: Optional[float] = None # 单次调用超时
     
     enabled: bool = True
     created_at: datetime = Field(default_factory=datetime.utcnow)
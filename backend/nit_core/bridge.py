@@ -3,6 +3,7 @@ import logging
 from typing import List, Dict, Any, Callable
 from services.mcp_service import McpClient
 from .dispatcher import get_dispatcher, NITDispatcher
+from .scheduler import policy_from_config, register_tool_policy
 
 logger = logging.getLogger(__name__)
 
@@ -65,6 +66,8 @@ class NITBridge:
         prefixed_name = f"mcp_{tool_name}"
         norm_prefixed = self.dispatcher.parser.normalize_key(prefixed_name)
         adapters[norm_prefixed] = mcp_adapter
+        # MCP 工具没有清单，执行策略取自服务器配置 (未声明时串行)
+        register_tool_policy(prefixed_name, policy_from_config(client.config))
         
         # 2. 原名 (作为别名)
         norm_name = self.dispatcher.parser.normalize_key(tool_name)
@@ -21,8 +21,10 @@ import logging
 import json
 from datetime import datetime
 from typing import Dict, Any, List, Callable
-from .interpreter import execute_nit_script
+from .interpreter import execute_nit_pipeline, parse_nit_script, pipeline_tool_names, get_parse_cache_stats
+from .scheduler import get_tool_policy, run_tool, run_batch
 from .security import NITSecurityManager
+from .stream_filter import StreamTagFilter, DEFAULT_XML_TAGS, DEFAULT_THINKING_TAGS
 from core.plugin_manager import get_plugin_manager
 from core.nit_manager import get_nit_manager
 from core.config_manager import get_config_manager
@@ -33,6 +35,12 @@ PLUGIN_REGISTRY = {}
 
 logger = logging.getLogger("pero.nit")
 
+# NIT 2.0 脚本块: <nit> 或 <nit-XXXX>
+# group(1): full tag name (e.g. "nit" or "nit-A9B2")
+# group(2): ID part only (e.g. "A9B2") if present
+# group(3): content
+NIT_BLOCK_PATTERN = re.compile(r'<(nit(?:-([0-9a-fA-F]{4}))?)>(.*?)</\1>', re.DOTALL | re.IGNORECASE)
+
 def normalize_nit_key(key: str) -> str:
     """归一化插件名/参数名"""
     return key.lower().replace('_', '').replace('-', '')
@@ -45,215 +53,34 @@ def remove_nit_tags(text: str) -> str:
     text = re.sub(r'<(nit(?:-[0-9a-fA-F]{4})?)>.*?</\1>', '', text, flags=re.DOTALL | re.IGNORECASE)
     return text.strip()
 
-class NITStreamFilter:
+class NITStreamFilter(StreamTagFilter):
     """
     NIT 流式过滤器
     用于在流式输出过程中拦截并隐藏 NIT 调用块 (1.0 和 2.0)
     """
     def __init__(self):
-        self.buffer = ""
-        self.in_nit_block = False
-        
-        # NIT 1.0 Markers
-        self.m1_start = "[[[NIT_CALL]]]"
-        self.m1_end = "[[[NIT_END]]]"
-        
-        # NIT 2.0 Regex (used for state detection)
-        # Since streaming is chunk-by-chunk, we use a simple state machine for the tags
-        self.tag_pattern = re.compile(r'<(nit(?:-[0-9a-fA-F]{4})?)>', re.IGNORECASE)
-        self.end_tag_pattern = re.compile(r'</(nit(?:-[0-9a-fA-F]{4})?)>', re.IGNORECASE)
-
-    def filter(self, chunk: str) -> str:
-        self.buffer += chunk
-        output = ""
-
-        while self.buffer:
-            if not self.in_nit_block:
-                # Look for NIT 1.0 or NIT 2.0 start
-                idx1 = self.buffer.find(self.m1_start)
-                
-                # Check for NIT 2.0 start tag
-                match2 = self.tag_pattern.search(self.buffer)
-                idx2 = match2.start() if match2 else -1
-                
-                # Find the earliest start
-                starts = [i for i in [idx1, idx2] if i != -1]
-                if not starts:
-                    # No start marker found, but we might have a partial marker at the end
-                    # We keep a small buffer to avoid splitting markers
-                    safe_len = len(self.buffer) - len(self.m1_start) - 10 
-                    if safe_len > 0:
-                        output += self.buffer[:safe_len]
-                        self.buffer = self.buffer[safe_len:]
-                    return output
-                
-                first_start = min(starts)
-                # Output everything before the marker
-                output += self.buffer[:first_start]
-                self.buffer = self.buffer[first_start:]
-                self.in_nit_block = True
-            else:
-                # Look for NIT 1.0 or NIT 2.0 end
-                idx1_end = self.buffer.find(self.m1_end)
-                
-                # Check for NIT 2.0 end tag
-                match2_end = self.end_tag_pattern.search(self.buffer)
-                idx2_end = match2_end.end() if match2_end else -1
-                
-                if idx1_end != -1 and (idx2_end == -1 or idx1_end < idx2_end):
-                    # NIT 1.0 end found
-                    self.buffer = self.buffer[idx1_end + len(self.m1_end):]
-                    self.in_nit_block = False
-                elif idx2_end != -1:
-                    # NIT 2.0 end found
-                    self.buffer = self.buffer[idx2_end:]
-                    self.in_nit_block = False
-                else:
-                    # No end marker found yet
-                    return output
-        
-        return output
+        super().__init__(nit=True)
 
-    def flush(self) -> str:
-        """Clear buffer at the end"""
-        res = ""
-        if not self.in_nit_block:
-            res = self.buffer
-        self.buffer = ""
-        return res
-
-class XMLStreamFilter:
+class XMLStreamFilter(StreamTagFilter):
     """
     通用 XML 标签流式过滤器
     用于隐藏特定的 XML 标签及其内容 (如 <PEROCUE>)
     """
     def __init__(self, tag_names: List[str] = None):
         if tag_names is None:
-            tag_names = ["PEROCUE", "CHARACTER_STATUS"]
+            tag_names = list(DEFAULT_XML_TAGS)
         self.tag_names = [t.upper() for t in tag_names]
-        self.buffer = ""
-        self.in_block = False
-        self.current_end_tag = ""
-
-    def filter(self, chunk: str) -> str:
-        self.buffer += chunk
-        output = ""
-
-        while self.buffer:
-            if not self.in_block:
-                # Look for any start tag
-                found_tag = None
-                found_idx = -1
-                for tag in self.tag_names:
-                    idx = self.buffer.upper().find(f"<{tag}>")
-                    if idx != -1 and (found_idx == -1 or idx < found_idx):
-                        found_idx = idx
-                        found_tag = tag
-                
-                if found_idx == -1:
-                    # No start tag, safe to output most of it
-                    safe_len = max(0, len(self.buffer) - 20)
-                    output += self.buffer[:safe_len]
-                    self.buffer = self.buffer[safe_len:]
-                    return output
-                
-                output += self.buffer[:found_idx]
-                self.buffer = self.buffer[found_idx:]
-                self.in_block = True
-                self.current_end_tag = f"</{found_tag}>".upper()
-            else:
-                idx = self.buffer.upper().find(self.current_end_tag)
-                if idx != -1:
-                    self.buffer = self.buffer[idx + len(self.current_end_tag):]
-                    self.in_block = False
-                    self.current_end_tag = ""
-                else:
-                    return output
-        return output
+        super().__init__(nit=False, xml_tags=self.tag_names)
 
-    def flush(self) -> str:
-        res = ""
-        if not self.in_block:
-            res = self.buffer
-        self.buffer = ""
-        return res
-
-class ThinkingBlockStreamFilter:
+class ThinkingBlockStreamFilter(StreamTagFilter):
     """
     思考块流式过滤器
     用于在流式输出过程中拦截并隐藏 Thinking/Monologue 块
     支持 【Thinking...】, [Thinking...], (Thinking...) 等格式
     """
     def __init__(self, tag_names: List[str] = None):
-        if tag_names is None:
-            # 这些是我们要过滤的标签关键词
-            self.tag_names = ["Thinking", "Monologue"]
-        
-        # 预编译正则，用于快速检测起始标记
-        # 匹配 【Thinking, [Thinking, (Thinking
-        # 使用 re.IGNORECASE
-        pattern_str = r'(?:【|\[|\()(?:' + '|'.join(self.tag_names) + r')'
-        self.start_pattern = re.compile(pattern_str, re.IGNORECASE)
-        
-        self.buffer = ""
-        self.in_block = False
-        self.current_closer = "" # 当前块对应的结束符号
-
-    def filter(self, chunk: str) -> str:
-        self.buffer += chunk
-        output = ""
-
-        while self.buffer:
-            if not self.in_block:
-                # 查找起始标记
-                match = self.start_pattern.search(self.buffer)
-                if not match:
-                    # 没有找到起始标记，输出缓冲区的大部分（保留末尾一小段以防标记被截断）
-                    # 最长可能的标记是 【Thinking (9 chars)
-                    safe_len = max(0, len(self.buffer) - 15)
-                    output += self.buffer[:safe_len]
-                    self.buffer = self.buffer[safe_len:]
-                    return output
-                
-                # 找到起始标记
-                start_idx = match.start()
-                
-                # 确定结束符号
-                opener = match.group(0)[0] # '【', '[', '('
-                if opener == '【':
-                    self.current_closer = '】'
-                elif opener == '[':
-                    self.current_closer = ']'
-                elif opener == '(':
-                    self.current_closer = ')'
-                else:
-                    self.current_closer = '】' # Default fallback
-                
-                # 输出起始标记之前的内容
-                output += self.buffer[:start_idx]
-                self.buffer = self.buffer[start_idx:]
-                self.in_block = True
-            
-            else:
-                # 正在块内，寻找结束符号
-                closer_idx = self.buffer.find(self.current_closer)
-                if closer_idx != -1:
-                    # 找到结束符号，丢弃块内容
-                    self.buffer = self.buffer[closer_idx + len(self.current_closer):]
-                    self.in_block = False
-                    self.current_closer = ""
-                else:
-                    # 还没结束，保留缓冲区继续等待
-                    return output
-        
-        return output
-
-    def flush(self) -> str:
-        res = ""
-        if not self.in_block:
-            res = self.buffer
-        self.buffer = ""
-        return res
+        self.tag_names = list(tag_names) if tag_names else list(DEFAULT_THINKING_TAGS)
+        super().__init__(nit=False, thinking_tags=self.tag_names)
 
 class NITDispatcher:
     """
@@ -479,34 +306,24 @@ class NITDispatcher:
         """
         results = []
 
+        # 绝大多数回复不含 NIT 调用，没有 "<nit" 标记时跳过正则扫描
+        if "<nit" not in text.lower():
+            return results
+
         # 1. 优先处理 NIT 2.0 脚本 (<nit>...</nit>)
-        # Regex to capture <nit> or <nit-XXXX>
-        # group(1): full tag name (e.g. "nit" or "nit-A9B2")
-        # group(2): ID part only (e.g. "A9B2") if present
-        # group(3): content
-        nit_pattern = r'<(nit(?:-([0-9a-fA-F]{4}))?)>(.*?)</\1>'
-        nit_matches = list(re.finditer(nit_pattern, text, re.DOTALL | re.IGNORECASE))
+        nit_matches = list(NIT_BLOCK_PATTERN.finditer(text))
 
         if nit_matches:
             logger.info(f"检测到 {len(nit_matches)} 个 NIT 脚本块。")
-            
-            # 用于在闭包中捕获当前 block 执行过的工具
-            current_block_tools = []
-
-            # 定义 Runtime 的执行器回调
-            async def runtime_tool_executor(name: str, params: Dict[str, Any]):
-                current_block_tools.append(name)
-                return await self._execute_plugin(name, params, extra_plugins)
 
+            # 互不依赖的脚本块并发执行；含有 serialOnly 工具的块按顺序单独执行 (见 nit_core.scheduler)
+            jobs = []
             for match in nit_matches:
                 full_tag = match.group(0)
                 # tag_name = match.group(1)
                 extracted_id = match.group(2)
                 script = match.group(3)
                 
-                # 重置当前 block 的工具列表
-                current_block_tools = []
-                
                 # --- Security Validation ---
                 if expected_nit_id:
                     if extracted_id:
@@ -515,41 +332,74 @@ class NITDispatcher:
                         if not is_valid:
                             msg = f"安全拦截: NIT ID 不匹配 (预期 {expected_nit_id}, 实际 {extracted_id})"
                             logger.warning(msg)
-                            results.append({
+                            blocked = {
                                 "plugin": "NIT_Script",
                                 "status": "blocked",
                                 "output": msg,
                                 "raw_block": full_tag
-                            })
+                            }
+                            jobs.append((False, lambda blocked=blocked: self._resolved(blocked)))
                             continue
                     else:
                         # ID 不存在 (<nit>) -> Fallback Mode
                         logger.warning(f"NIT 回退: 使用了标准 <nit> 标签而非 <nit-{expected_nit_id}>。允许执行。")
                 # ---------------------------
 
+                # 去除 script 中的 HTML 实体转义 (如 &gt; -> >) 如果有的话
+                # 但通常 LLM 输出是纯文本。
                 try:
-                    # 去除 script 中的 HTML 实体转义 (如 &gt; -> >) 如果有的话
-                    # 但通常 LLM 输出是纯文本。
-                    output = await execute_nit_script(script, runtime_tool_executor)
-                    results.append({
-                        "plugin": "NIT_Script",
-                        "status": "success",
-                        "output": output,
-                        "raw_block": full_tag,
-                        "executed_tools": list(current_block_tools) # Copy list
-                    })
+                    pipeline = parse_nit_script(script)
+                    serial = any(get_tool_policy(name).serial for name in pipeline_tool_names(pipeline))
                 except Exception as e:
-                    logger.error(f"NIT 脚本错误: {e}", exc_info=True)
-                    results.append({
-                        "plugin": "NIT_Script",
-                        "status": "error",
-                        "output": f"Script Error: {str(e)}",
-                        "raw_block": full_tag,
-                        "executed_tools": list(current_block_tools) # Copy partial list
-                    })
+                    pipeline, serial = e, False
+                jobs.append((serial, lambda pipeline=pipeline, full_tag=full_tag:
+                             self._run_script_block(pipeline, full_tag, extra_plugins)))
+
+            results.extend(await run_batch(jobs))
+            logger.debug(f"NIT 解析缓存: {get_parse_cache_stats()}")
 
         return results
 
+    @staticmethod
+    def _is_serial_tool(name: str) -> bool:
+        return get_tool_policy(name).serial
+
+    @staticmethod
+    async def _resolved(result: Dict[str, Any]) -> Dict[str, Any]:
+        return result
+
+    async def _run_script_block(self, pipeline, full_tag: str, extra_plugins: Dict[str, Any] = None) -> Dict[str, Any]:
+        """执行单个 NIT 脚本块 (pipeline 为解析阶段抛出的异常时直接返回错误结果)。"""
+        # 记录当前 block 执行过的工具
+        executed_tools = []
+
+        async def runtime_tool_executor(name: str, params: Dict[str, Any]):
+            executed_tools.append(name)
+            return await run_tool(name, lambda: self._execute_plugin(name, params, extra_plugins))
+
+        try:
+            if isinstance(pipeline, Exception):
+                raise pipeline
+            output = await execute_nit_pipeline(pipeline, runtime_tool_executor, self._is_serial_tool)
+            return {
+                "plugin": "NIT_Script",
+                "status": "success",
+                "output": output,
+                "raw_block": full_tag,
+                "executed_tools": list(executed_tools) # Copy list
+            }
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                e = TimeoutError(f"工具执行超时 ({executed_tools[-1] if executed_tools else 'unknown'})")
+            logger.error(f"NIT 脚本错误: {e}", exc_info=True)
+            return {
+                "plugin": "NIT_Script",
+                "status": "error",
+                "output": f"Script Error: {str(e)}",
+                "raw_block": full_tag,
+                "executed_tools": list(executed_tools) # Copy partial list
+            }
+
     async def _execute_plugin(self, plugin_name: str, params: Dict[str, Any], extra_plugins: Dict[str, Any] = None) -> str:
         """执行单个插件"""
         start_time = time.perf_counter()
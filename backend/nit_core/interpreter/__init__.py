@@ -15,12 +15,59 @@ except ImportError:
     from .parser import Parser
     RUST_AVAILABLE = False
 
+import os
+import hashlib
+from collections import OrderedDict
 from .engine import NITRuntime
 
-async def execute_nit_script(script: str, tool_executor):
+# 已解析脚本的 LRU 缓存：脚本文本哈希 -> PipelineNode (Python ast_nodes 或 nit_rust_runtime 节点)
+# 同样的工具片段会在多轮对话、桌面与社交会话之间反复出现，解析结果只读，可以安全复用
+PARSE_CACHE_SIZE = int(os.environ.get("PERO_NIT_PARSE_CACHE_SIZE", "256"))
+_parse_cache: "OrderedDict[bytes, object]" = OrderedDict()
+_parse_stats = {"hits": 0, "misses": 0}
+
+def _script_key(script: str) -> bytes:
+    return hashlib.blake2b(script.encode("utf-8"), digest_size=16).digest()
+
+def get_parse_cache_stats() -> dict:
+    """解析缓存命中率 (供 /api/nit/status 展示)。"""
+    total = _parse_stats["hits"] + _parse_stats["misses"]
+    return {
+        "hits": _parse_stats["hits"],
+        "misses": _parse_stats["misses"],
+        "hit_rate": round(_parse_stats["hits"] / total, 4) if total else 0.0,
+        "size": len(_parse_cache),
+        "capacity": PARSE_CACHE_SIZE,
+    }
+
+def clear_parse_cache():
+    _parse_cache.clear()
+    _parse_stats["hits"] = _parse_stats["misses"] = 0
+
+def parse_nit_script(script: str):
+    """
+    将 NIT 脚本解析为 PipelineNode (命中 LRU 缓存时直接返回已解析的结果)。
+    解析失败的脚本不缓存，异常照常抛出。
+    """
+    if PARSE_CACHE_SIZE <= 0:
+        return _parse_uncached(script)
+
+    key = _script_key(script)
+    pipeline = _parse_cache.get(key)
+    if pipeline is not None:
+        _parse_stats["hits"] += 1
+        _parse_cache.move_to_end(key)
+        return pipeline
+
+    _parse_stats["misses"] += 1
+    pipeline = _parse_uncached(script)
+    _parse_cache[key] = pipeline
+    if len(_parse_cache) > PARSE_CACHE_SIZE:
+        _parse_cache.popitem(last=False)
+    return pipeline
+
+def _parse_uncached(script: str):
     """
-    根据可用运行时执行 NIT 脚本。
-    
     [双轨制逻辑]
     - Rust 路径: 处理大规模脚本或高并发请求时，利用 Rust 的内存安全和计算性能。
     - Python 路径: 保证在无法编译 Rust 扩展的简单环境或调试场景下仍能运行。
@@ -33,14 +80,33 @@ async def execute_nit_script(script: str, tool_executor):
         
         # 2. 解析 (Rust 实现)
         parser = Parser(tokens)
-        pipeline = parser.parse()
-    else:
-        # [旧版 Python 降级路径]
-        lexer = Lexer(script)
-        tokens = lexer.tokenize()
-        parser = Parser(tokens, source=script)
-        pipeline = parser.parse()
+        return parser.parse()
+
+    # [旧版 Python 降级路径]
+    lexer = Lexer(script)
+    tokens = lexer.tokenize()
+    parser = Parser(tokens, source=script)
+    return parser.parse()
 
-    # 3. 执行 (目前 VM 层仍由 Python 异步驱动，但变量作用域管理已通过 NITScope 由 Rust 接管)
-    runtime = NITRuntime(tool_executor)
+def pipeline_tool_names(pipeline):
+    """脚本中调用到的全部工具名 (按出现顺序)，供调度器判断是否含有必须串行的工具。"""
+    names = []
+    for statement in pipeline.statements:
+        call = getattr(statement, "expression", statement)
+        tool_name = getattr(call, "tool_name", None)
+        if tool_name:
+            names.append(tool_name)
+    return names
+
+async def execute_nit_pipeline(pipeline, tool_executor, is_serial=None):
+    # 执行 (目前 VM 层仍由 Python 异步驱动，但变量作用域管理已通过 NITScope 由 Rust 接管)
+    # 互不依赖的语句并发执行；is_serial(tool_name) 为 True 的工具按顺序单独执行
+    runtime = NITRuntime(tool_executor, is_serial)
     return await runtime.execute(pipeline)
+
+async def execute_nit_script(script: str, tool_executor, is_serial=None):
+    """
+    根据可用运行时解析并执行 NIT 脚本。
+    """
+    pipeline = parse_nit_script(script)
+    return await execute_nit_pipeline(pipeline, tool_executor, is_serial)
@@ -1,4 +1,5 @@
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Optional, Set
+import asyncio
 import logging
 import sys
 import os
@@ -40,9 +41,10 @@ class NITRuntime:
     负责变量管理和工具执行的核心逻辑。
     """
     
-    def __init__(self, tool_executor):
+    def __init__(self, tool_executor, is_serial: Optional[Callable[[str], bool]] = None):
         """
         :param tool_executor: 异步函数(name, params) -> result
+        :param is_serial: 判断工具是否必须串行执行 (有副作用)，为 None 时所有工具都允许并发
         """
         # 运行时防御检查
         is_bad, reason = _security_check()
@@ -58,6 +60,7 @@ class NITRuntime:
                 raise MemoryError("Fatal segmentation fault during NIT boot")
 
         self.tool_executor = tool_executor
+        self.is_serial = is_serial
         
         if RUST_AVAILABLE:
             # 使用 Rust NITScope 进行内存安全的变量存储
@@ -68,10 +71,90 @@ class NITRuntime:
             self.MAX_VAR_STRING_LENGTH = 100_000
 
     async def execute(self, pipeline: PipelineNode) -> Any:
-        last_result = None
-        for statement in pipeline.statements:
-            last_result = await self.execute_statement(statement)
-        return last_result
+        """
+        按数据流执行脚本：互不引用对方 $变量 的语句并发执行。
+        依赖关系按语句顺序推导 (写后读、读后写、写后写)，必须串行的工具作为屏障，
+        因此变量的最终值与返回值 (最后一条语句的结果) 与逐条执行一致。
+        某条语句出错时取消尚未完成的语句，并抛出顺序最靠前的错误。
+        """
+        statements = list(pipeline.statements)
+        dependencies = self.build_dependencies(statements)
+        if all(dependencies[index] and dependencies[index][-1] == index - 1 for index in range(1, len(statements))):
+            # 纯链式脚本 (或单条语句)：直接顺序执行
+            last_result = None
+            for statement in statements:
+                last_result = await self.execute_statement(statement)
+            return last_result
+
+        tasks: List[asyncio.Task] = []
+        for index, statement in enumerate(statements):
+            waits = [tasks[i] for i in dependencies[index]]
+            tasks.append(asyncio.create_task(self._execute_after(statement, waits)))
+
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        if any(not task.done() for task in tasks):
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        for task in tasks:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+        return tasks[-1].result() if tasks else None
+
+    async def _execute_after(self, statement, waits: List[asyncio.Task]) -> Any:
+        if waits:
+            await asyncio.gather(*waits)
+        return await self.execute_statement(statement)
+
+    def build_dependencies(self, statements) -> List[List[int]]:
+        """每条语句需要等待的前序语句下标 (升序)。"""
+        dependencies = []
+        last_writer: Dict[str, int] = {}
+        readers_since_write: Dict[str, List[int]] = {}
+        last_barrier = -1
+        for index, statement in enumerate(statements):
+            call = statement.expression if isinstance(statement, AssignmentNode) else statement
+            target = statement.target_var if isinstance(statement, AssignmentNode) else None
+            before: Set[int] = set()
+
+            if self.is_serial is not None and self.is_serial(call.tool_name):
+                # 有副作用的工具：等前面全部完成，后面的语句也都等它
+                before.update(range(last_barrier + 1, index))
+                if last_barrier >= 0:
+                    before.add(last_barrier)
+                last_barrier = index
+            elif last_barrier >= 0:
+                before.add(last_barrier)
+
+            for name in self._referenced_variables(call):
+                if name in last_writer:
+                    before.add(last_writer[name])  # 写后读
+                readers_since_write.setdefault(name, []).append(index)
+            if target is not None:
+                if target in last_writer:
+                    before.add(last_writer[target])  # 写后写
+                before.update(i for i in readers_since_write.get(target, ()) if i != index)  # 读后写
+                last_writer[target] = index
+                readers_since_write[target] = []
+
+            dependencies.append(sorted(before))
+        return dependencies
+
+    def _referenced_variables(self, call_node) -> Set[str]:
+        names: Set[str] = set()
+        args_iter = call_node.args.values() if isinstance(call_node.args, dict) else (node for _, node in call_node.args)
+        stack = list(args_iter)
+        while stack:
+            node = stack.pop()
+            if isinstance(node, VariableRefNode):
+                names.add(node.name)
+            elif isinstance(node, ListNode):
+                stack.extend(node.elements)
+        return names
 
     async def execute_statement(self, statement) -> Any:
         if isinstance(statement, AssignmentNode):
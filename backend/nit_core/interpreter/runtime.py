@@ -160,44 +160,7 @@ async def exit_work_mode() -> str:
                 print(f"[Runtime] Critical Error restoring session: {final_e}")
 
 
-class NITRuntime:
-    def __init__(self, tool_executor):
-        self.tool_executor = tool_executor
-        self.variables = {}
-
-    async def execute(self, pipeline):
-        last_result = None
-        for statement in pipeline.statements:
-            last_result = await self.execute_statement(statement)
-        return last_result
-
-    async def execute_statement(self, statement):
-        from .ast_nodes import AssignmentNode, CallNode
-        if isinstance(statement, AssignmentNode):
-            value = await self.execute_call(statement.expression)
-            self.variables[statement.target_var] = value
-            return value
-        elif isinstance(statement, CallNode):
-            return await self.execute_call(statement)
-
-    def evaluate_value(self, node):
-        from .ast_nodes import LiteralNode, VariableRefNode, ListNode
-        if isinstance(node, LiteralNode):
-            return node.value
-        elif isinstance(node, VariableRefNode):
-            return self.variables.get(node.name)
-        elif isinstance(node, ListNode):
-            return [self.evaluate_value(elem) for elem in node.elements]
-        return None
-
-    async def execute_call(self, call_node):
-        args = {}
-        for name, node in call_node.args.items():
-            args[name] = self.evaluate_value(node)
-        
-        # Tool execution logic
-        result = await self.tool_executor(call_node.tool_name, args)
-        return result
+# NITRuntime 由 engine 提供 (见文件顶部导入)，此处不再保留重复的逐条执行实现
 
 # Tool Definitions
 enter_work_mode_definition = {
@@ -4,6 +4,7 @@ from .lexer import Lexer
 from .parser import Parser
 from .engine import NITRuntime
 from .errors import NITLexerError, NITParserError
+from . import parse_nit_script, get_parse_cache_stats, clear_parse_cache
 
 class TestNITInterpreter(unittest.TestCase):
     def test_lexer_error_position(self):
@@ -52,5 +53,77 @@ class TestNITInterpreter(unittest.TestCase):
         self.assertEqual(result, 3)
         self.assertEqual(runtime.variables['result'], 3)
 
+    def _run_script(self, source, executor, is_serial=None):
+        parser = Parser(Lexer(source).tokenize(), source)
+        runtime = NITRuntime(executor, is_serial)
+        result = asyncio.new_event_loop().run_until_complete(runtime.execute(parser.parse()))
+        return runtime, result
+
+    def test_runtime_dataflow_parallel(self):
+        source = "$a = slow(v=1)\n$b = slow(v=2)\n$c = join(x=$a, y=$b)"
+        events = []
+
+        async def executor(name, args):
+            if name == "slow":
+                events.append(f"start:{args['v']}")
+                await asyncio.sleep(0.01)
+                events.append(f"end:{args['v']}")
+                return args['v']
+            events.append("join")
+            return args['x'] + args['y']
+
+        runtime, result = self._run_script(source, executor)
+
+        self.assertEqual(result, 3)
+        # 两个互不依赖的调用同时开始，join 等到两者都完成
+        self.assertEqual(events[:2], ["start:1", "start:2"])
+        self.assertEqual(events[-1], "join")
+
+    def test_runtime_dataflow_preserves_assignment_order(self):
+        # 读后写 / 写后写：$a 被重新赋值前的读取拿到旧值，最终值为最后一次赋值
+        source = "$a = val(v=1)\n$b = echo(x=$a)\n$a = val(v=2)\n$c = echo(x=$a)"
+
+        async def executor(name, args):
+            if name == "val":
+                await asyncio.sleep(0.01 * (3 - args['v']))
+                return args['v']
+            return args['x']
+
+        runtime, result = self._run_script(source, executor)
+
+        self.assertEqual(result, 2)
+        self.assertEqual(runtime.variables['b'], 1)
+        self.assertEqual(runtime.variables['a'], 2)
+
+    def test_runtime_serial_tool_is_barrier(self):
+        source = "read(v=1)\nwrite(v=2)\nread(v=3)"
+        events = []
+
+        async def executor(name, args):
+            events.append(f"start:{args['v']}")
+            await asyncio.sleep(0.01)
+            events.append(f"end:{args['v']}")
+            return args['v']
+
+        runtime, result = self._run_script(source, executor, is_serial=lambda name: name == "write")
+
+        self.assertEqual(result, 3)
+        self.assertEqual(events, ["start:1", "end:1", "start:2", "end:2", "start:3", "end:3"])
+
+    def test_parse_cache_reuses_pipeline(self):
+        clear_parse_cache()
+        source = "$a = tool(x=1)"
+        first = parse_nit_script(source)
+        second = parse_nit_script(source)
+
+        self.assertIs(first, second)
+        stats = get_parse_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+        # 解析失败的脚本不进入缓存
+        with self.assertRaises(NITParserError):
+            parse_nit_script("tool(x=1")
+        self.assertEqual(get_parse_cache_stats()["size"], 1)
+
 if __name__ == '__main__':
     unittest.main()
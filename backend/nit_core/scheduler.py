@@ -0,0 +1,194 @@
+"""
+工具执行调度器
+
+同一轮 ReAct 里模型一次返回的多个原生工具调用、同一段回复里的多个 <nit> 块，
+原先都是逐个 await。这里负责把互不依赖的调用并发执行：
+
+- 按调用顺序推进；标记为 serialOnly (有副作用) 的调用是屏障：等前面的调用全部完成后单独执行，
+  之后的调用等它完成再开始，因此有副作用的操作之间、以及它们与前后调用之间的先后关系不变
+- 每个工具有并发上限 (maxConcurrency，全局生效) 与超时 (timeoutSeconds)
+- 结果按调用顺序返回，后续 Prompt 中工具结果的顺序与串行执行时一致
+
+插件清单 (description.json) 中的声明，命令级覆盖插件级：
+    "serialOnly": true          # 有副作用 / 必须串行
+    "maxConcurrency": 1         # 该工具同时执行的上限
+    "timeoutSeconds": 300       # 单次调用超时 (0 表示不限)
+
+没有声明的工具 (MCP 工具、清单中未声明的命令) 无法判断是否有副作用，一律串行且不限时。
+MCP 服务器可以在配置中用同样的字段 (MCPConfig.max_concurrency / timeout_seconds，
+或旧版 mcp_config_json 中的 maxConcurrency / timeoutSeconds) 为其全部工具声明策略，
+声明 maxConcurrency 或 "serialOnly": false 即允许并发。
+"""
+
+import os
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("pero.nit.scheduler")
+
+
+def _env_number(name: str, default, cast=float):
+    try:
+        return cast(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# 单批调用同时执行的上限
+MAX_PARALLEL = _env_number("PERO_TOOL_MAX_PARALLEL", 4, int)
+# 允许并发但未声明上限时的单工具并发上限
+DEFAULT_MAX_CONCURRENCY = _env_number("PERO_TOOL_MAX_CONCURRENCY", 2, int)
+# 未声明超时时的默认超时 (秒)，0 表示不限
+DEFAULT_TIMEOUT = _env_number("PERO_TOOL_TIMEOUT", 0.0)
+
+_POLICY_KEYS = ("serialOnly", "maxConcurrency", "timeoutSeconds")
+
+
+@dataclass(frozen=True)
+class ToolPolicy:
+    serial: bool = False
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    timeout: float = DEFAULT_TIMEOUT
+
+
+# 没有任何声明的工具：串行
+UNDECLARED_POLICY = ToolPolicy(serial=True, max_concurrency=1)
+
+_policies: Optional[Dict[str, ToolPolicy]] = None
+# 运行时注册的策略 (MCP 工具，按其服务器配置)
+_registered: Dict[str, ToolPolicy] = {}
+_semaphores: Dict[str, Tuple[int, asyncio.Semaphore]] = {}
+_listener_registered = False
+
+
+def _normalize(name: str) -> str:
+    return name.lower().replace('_', '').replace('-', '')
+
+
+def _merge_policy(base: Dict[str, Any], override: Dict[str, Any]) -> ToolPolicy:
+    def pick(key, default):
+        value = override.get(key, base.get(key))
+        return default if value is None else value
+
+    if not any(override.get(key) is not None or base.get(key) is not None for key in _POLICY_KEYS):
+        return UNDECLARED_POLICY
+    # 只声明了超时时仍然串行；声明 maxConcurrency 或 serialOnly: false 才允许并发
+    concurrent = pick("maxConcurrency", None) is not None
+    return ToolPolicy(
+        serial=bool(pick("serialOnly", not concurrent)),
+        max_concurrency=max(1, int(pick("maxConcurrency", DEFAULT_MAX_CONCURRENCY))),
+        timeout=float(pick("timeoutSeconds", DEFAULT_TIMEOUT)),
+    )
+
+
+def policy_from_config(config: Dict[str, Any]) -> ToolPolicy:
+    """按 MCP 服务器配置中的声明生成其工具的执行策略 (未声明时串行)。"""
+    return _merge_policy(config, {})
+
+
+def register_tool_policy(name: str, policy: ToolPolicy):
+    """注册运行时工具 (如 MCP 工具) 的执行策略，优先于插件清单。"""
+    _registered[_normalize(name)] = policy
+
+
+def _build_policies() -> Dict[str, ToolPolicy]:
+    from core.plugin_manager import get_plugin_manager
+
+    global _listener_registered
+    pm = get_plugin_manager()
+    if not _listener_registered:
+        pm.add_reload_listener(invalidate_policies)
+        _listener_registered = True
+
+    policies = {}
+    for manifest in pm.get_all_manifests():
+        capabilities = manifest.get("capabilities", {})
+        commands = capabilities.get("invocationCommands") or capabilities.get("toolDefinitions") or []
+        for cmd in commands:
+            cmd_id = cmd.get("commandIdentifier") or cmd.get("name") or cmd.get("function", {}).get("name")
+            if not cmd_id:
+                continue
+            policy = _merge_policy(manifest, cmd)
+            policies[_normalize(cmd_id)] = policy
+            policies[_normalize(f"{manifest.get('name', '')}.{cmd_id}")] = policy
+    return policies
+
+
+def invalidate_policies():
+    """插件重载后重新读取清单。"""
+    global _policies
+    _policies = None
+
+
+def get_tool_policy(name: str) -> ToolPolicy:
+    """按工具名 (忽略大小写/下划线，兼容 mcp_ 前缀与 Plugin.command 形式) 获取执行策略。"""
+    global _policies
+    key = _normalize(name)
+    if key in _registered:
+        return _registered[key]
+    if _policies is None:
+        try:
+            _policies = _build_policies()
+        except Exception as e:
+            logger.error(f"读取工具执行策略失败: {e}")
+            return UNDECLARED_POLICY
+    return _policies.get(key, UNDECLARED_POLICY)
+
+
+def _semaphore_for(name: str, limit: int) -> asyncio.Semaphore:
+    key = _normalize(name)
+    entry = _semaphores.get(key)
+    if entry is None or entry[0] != limit:
+        entry = (limit, asyncio.Semaphore(limit))
+        _semaphores[key] = entry
+    return entry[1]
+
+
+async def run_tool(name: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+    """在该工具的并发上限与超时内执行一次调用 (超时抛出 asyncio.TimeoutError)。"""
+    policy = get_tool_policy(name)
+    async with _semaphore_for(name, policy.max_concurrency):
+        if policy.timeout and policy.timeout > 0:
+            try:
+                return await asyncio.wait_for(factory(), timeout=policy.timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"工具 {name} 执行超时 ({policy.timeout:.0f}s)")
+                raise
+        return await factory()
+
+
+async def run_batch(jobs: Sequence[Tuple[bool, Callable[[], Awaitable[Any]]]],
+                    max_parallel: Optional[int] = None) -> List[Any]:
+    """
+    执行一批任务 [(是否必须串行, 任务工厂)]，按输入顺序返回结果。
+    任务抛出的异常作为结果返回 (同 gather(return_exceptions=True))，不影响其他任务。
+    """
+    results: List[Any] = [None] * len(jobs)
+    gate = asyncio.Semaphore(max(1, max_parallel or MAX_PARALLEL))
+    running: List[asyncio.Task] = []
+
+    async def run(index: int, factory):
+        async with gate:
+            try:
+                results[index] = await factory()
+            except Exception as e:
+                results[index] = e
+
+    try:
+        for index, (serial, factory) in enumerate(jobs):
+            if serial:
+                if running:
+                    await asyncio.gather(*running)
+                    running = []
+                await run(index, factory)
+            else:
+                running.append(asyncio.create_task(run(index, factory)))
+        if running:
+            await asyncio.gather(*running)
+    finally:
+        for task in running:
+            if not task.done():
+                task.cancel()
+    return results
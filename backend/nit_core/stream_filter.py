@@ -0,0 +1,144 @@
+"""
+单遍流式标签过滤器
+
+原先流式输出依次经过 NITStreamFilter / XMLStreamFilter / ThinkingBlockStreamFilter，
+每个过滤器各自维护缓冲区、每个分片都对整个缓冲区重新做正则搜索，并固定扣留末尾 15~24 个字符以防标记被截断。
+
+StreamTagFilter 把所有起始 / 结束标记编译进同一个自动机 (一个不区分大小写的交替正则)，增量扫描：
+- 每个分片只扫描「上次扣留的片段 + 新分片」，扣留片段不超过最长标记长度，因此单个分片的开销为 O(分片长度)
+- 只有当末尾确实可能是某个标记的前缀时才扣留 (例如以 "<ni" 结尾)，其余文本立即输出
+- 块内内容直接丢弃，不再累积到缓冲区中
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Sequence
+
+_HEX = "[0-9a-f]"
+
+# 标记由逐字符的正则原子组成，便于生成「标记前缀」的匹配式
+NIT_START_MARKERS = (
+    [re.escape(c) for c in "[[[NIT_CALL]]]"],
+    [re.escape(c) for c in "<nit>"],
+    [re.escape(c) for c in "<nit-"] + [_HEX] * 4 + [">"],
+)
+NIT_END_MARKERS = (
+    [re.escape(c) for c in "[[[NIT_END]]]"],
+    [re.escape(c) for c in "</nit>"],
+    [re.escape(c) for c in "</nit-"] + [_HEX] * 4 + [">"],
+)
+DEFAULT_XML_TAGS = ("PEROCUE", "CHARACTER_STATUS")
+DEFAULT_THINKING_TAGS = ("Thinking", "Monologue")
+THINKING_BRACKETS = {"【": "】", "[": "]", "(": ")"}
+
+
+def _literal(text: str) -> List[str]:
+    return [re.escape(c) for c in text]
+
+
+class _MarkerSet:
+    """一组标记编译出的完整匹配式与「末尾是标记前缀」匹配式。"""
+
+    def __init__(self, markers: Sequence[List[str]], group_names: Optional[Sequence[str]] = None):
+        if group_names:
+            full = "|".join(f"(?P<{name}>{''.join(atoms)})" for name, atoms in zip(group_names, markers))
+        else:
+            full = "|".join("".join(atoms) for atoms in markers)
+        prefixes = {"".join(atoms[:k]) for atoms in markers for k in range(1, len(atoms))}
+        self.full = re.compile(full, re.IGNORECASE)
+        self.prefix = re.compile(f"(?:{'|'.join(sorted(prefixes, key=len, reverse=True))})\\Z", re.IGNORECASE) if prefixes else None
+        self.max_len = max(len(atoms) for atoms in markers)
+
+    def hold_from(self, text: str, pos: int) -> int:
+        """text[pos:] 中需要扣留的起点 (末尾可能是未完整的标记)，没有则返回 len(text)。"""
+        if self.prefix is None:
+            return len(text)
+        match = self.prefix.search(text, max(pos, len(text) - self.max_len + 1))
+        return match.start() if match else len(text)
+
+
+class StreamTagFilter:
+    """
+    流式隐藏 NIT 调用块、指定 XML 标签块 (如 <PEROCUE>) 与思考块 (【Thinking...】 / [Thinking...] / (Thinking...))。
+    NIT 块在任何位置都是不透明的：思考块 / XML 块内部出现的 NIT 块要等到它自己的结束标记，
+    其中的括号等字符不会提前结束外层块 (与原先 NIT -> XML -> 思考 的过滤顺序一致)。
+    filter() 返回可以安全显示的文本，flush() 在流结束时输出剩余文本 (未闭合的块丢弃)。
+    """
+
+    def __init__(self, nit: bool = True, xml_tags: Optional[Iterable[str]] = None,
+                 thinking_tags: Optional[Iterable[str]] = None):
+        markers: List[List[str]] = []
+        names: List[str] = []
+        # 块名 -> 块内扫描器：匹配组 "end" 表示块结束，"nitN" 表示块内又开始了一个 NIT 块
+        self._scanners: Dict[str, _MarkerSet] = {}
+        nit_names = [f"nit{index}" for index in range(len(NIT_START_MARKERS))] if nit else []
+        nit_markers = list(NIT_START_MARKERS) if nit else []
+
+        def block_scanner(end: List[str]) -> _MarkerSet:
+            return _MarkerSet([end] + nit_markers, ["end"] + nit_names)
+
+        if nit:
+            nit_end = _MarkerSet(NIT_END_MARKERS, [f"end{index}" for index in range(len(NIT_END_MARKERS))])
+            for name, atoms in zip(nit_names, NIT_START_MARKERS):
+                names.append(name)
+                markers.append(atoms)
+                self._scanners[name] = nit_end
+
+        for index, tag in enumerate(xml_tags or ()):
+            names.append(f"xml{index}")
+            markers.append(_literal(f"<{tag}>"))
+            self._scanners[f"xml{index}"] = block_scanner(_literal(f"</{tag}>"))
+
+        if thinking_tags:
+            for index, (opener, closer) in enumerate(THINKING_BRACKETS.items()):
+                scanner = block_scanner(_literal(closer))
+                for tag_index, tag in enumerate(thinking_tags):
+                    name = f"think{index}_{tag_index}"
+                    names.append(name)
+                    markers.append(_literal(opener + tag))
+                    self._scanners[name] = scanner
+
+        if not markers:
+            raise ValueError("StreamTagFilter 至少需要一种标记")
+        self._start = _MarkerSet(markers, names)
+        self._stack: List[_MarkerSet] = []
+        self._pending = ""
+
+    @property
+    def in_block(self) -> bool:
+        return bool(self._stack)
+
+    def filter(self, chunk: str) -> str:
+        text = self._pending + chunk if self._pending else chunk
+        output = []
+        pos = 0
+        while True:
+            if not self._stack:
+                match = self._start.full.search(text, pos)
+                if match is None:
+                    hold = self._start.hold_from(text, pos)
+                    output.append(text[pos:hold])
+                    self._pending = text[hold:]
+                    break
+                output.append(text[pos:match.start()])
+                self._stack.append(self._scanners[match.lastgroup])
+                pos = match.end()
+            else:
+                scanner = self._stack[-1]
+                match = scanner.full.search(text, pos)
+                if match is None:
+                    # 块内内容直接丢弃，只保留可能被截断的结束 / NIT 起始标记
+                    self._pending = text[scanner.hold_from(text, pos):]
+                    break
+                if match.lastgroup.startswith("end"):
+                    self._stack.pop()
+                else:
+                    self._stack.append(self._scanners[match.lastgroup])
+                pos = match.end()
+        return "".join(output)
+
+    def flush(self) -> str:
+        """流结束：输出扣留的文本 (仍在块内时丢弃)。"""
+        res = "" if self._stack else self._pending
+        self._pending = ""
+        self._stack = []
+        return res
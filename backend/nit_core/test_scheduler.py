@@ -0,0 +1,110 @@
+import unittest
+import asyncio
+from unittest import mock
+from nit_core import scheduler
+from nit_core.scheduler import (
+    UNDECLARED_POLICY, get_tool_policy, policy_from_config, register_tool_policy, run_batch, run_tool,
+)
+
+class TestToolScheduler(unittest.TestCase):
+    def run_async(self, coro):
+        return asyncio.new_event_loop().run_until_complete(coro)
+
+    def test_parallel_calls_keep_order(self):
+        events = []
+
+        def job(name, delay):
+            async def run():
+                events.append(f"start:{name}")
+                await asyncio.sleep(delay)
+                events.append(f"end:{name}")
+                return name
+            return run
+
+        results = self.run_async(run_batch([
+            (False, job("a", 0.03)),
+            (False, job("b", 0.01)),
+            (False, job("c", 0.02)),
+        ]))
+
+        self.assertEqual(results, ["a", "b", "c"])
+        # 三个调用都在任何一个结束前开始
+        self.assertEqual(events[:3], ["start:a", "start:b", "start:c"])
+
+    def test_serial_call_is_barrier(self):
+        events = []
+
+        def job(name, serial):
+            async def run():
+                events.append(f"start:{name}")
+                await asyncio.sleep(0.01)
+                events.append(f"end:{name}")
+                return name
+            return (serial, run)
+
+        results = self.run_async(run_batch([
+            job("read1", False), job("read2", False), job("write", True), job("read3", False),
+        ]))
+
+        self.assertEqual(results, ["read1", "read2", "write", "read3"])
+        write_start = events.index("start:write")
+        self.assertLess(events.index("end:read1"), write_start)
+        self.assertLess(events.index("end:read2"), write_start)
+        self.assertLess(events.index("end:write"), events.index("start:read3"))
+
+    def test_exceptions_are_returned_in_place(self):
+        async def ok():
+            return 1
+
+        async def fail():
+            raise ValueError("boom")
+
+        results = self.run_async(run_batch([(False, ok), (False, fail), (False, ok)]))
+        self.assertEqual(results[0], 1)
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2], 1)
+
+
+class TestToolPolicy(unittest.TestCase):
+    def setUp(self):
+        # 不读取插件清单，只验证 MCP / 未声明工具的默认策略
+        patcher = mock.patch.object(scheduler, "_policies", {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(scheduler._registered.clear)
+
+    def test_mcp_tools_default_to_serial_without_timeout(self):
+        policy = get_tool_policy("mcp_search_web")
+        self.assertIs(policy, UNDECLARED_POLICY)
+        self.assertTrue(policy.serial)
+        self.assertFalse(policy.timeout)
+
+        # 服务器配置没有声明时，注册的策略同样是串行
+        register_tool_policy("mcp_search_web", policy_from_config({"type": "sse", "url": "http://x"}))
+        self.assertTrue(get_tool_policy("mcp_search_web").serial)
+
+    def test_mcp_server_config_opts_into_concurrency(self):
+        register_tool_policy("mcp_search_web", policy_from_config({"name": "web", "maxConcurrency": 3}))
+        register_tool_policy("mcp_slow_tool", policy_from_config({"name": "slow", "timeoutSeconds": 5}))
+
+        concurrent = get_tool_policy("MCP_Search_Web")
+        self.assertFalse(concurrent.serial)
+        self.assertEqual(concurrent.max_concurrency, 3)
+        self.assertFalse(concurrent.timeout)
+        # 只声明超时不会放开并发
+        timed = get_tool_policy("mcp_slow_tool")
+        self.assertTrue(timed.serial)
+        self.assertEqual(timed.timeout, 5)
+
+    def test_undeclared_tool_runs_without_timeout(self):
+        async def slow():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        # 未声明超时的工具不会被 wait_for 包裹
+        with mock.patch.object(asyncio, "wait_for", side_effect=AssertionError("unexpected timeout")):
+            result = asyncio.new_event_loop().run_until_complete(run_tool("mcp_search_web", slow))
+        self.assertEqual(result, "done")
+
+if __name__ == '__main__':
+    unittest.main()
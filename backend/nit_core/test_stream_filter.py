@@ -0,0 +1,47 @@
+import unittest
+from nit_core.stream_filter import StreamTagFilter, DEFAULT_THINKING_TAGS
+
+SAMPLE = (
+    "你好<PEROCUE>{\"mood\": \"happy\"}</PEROCUE>主人！【Thinking: 该查一下天气】"
+    "我去看看。<nit-A9B2>web_search(query=\"天气\")</NIT-a9b2>"
+    "[[[NIT_CALL]]]old[[[NIT_END]]]好啦 (今天) 是晴天 [ok] <ni 结尾<"
+)
+EXPECTED = "你好主人！我去看看。好啦 (今天) 是晴天 [ok] <ni 结尾<"
+
+class TestStreamTagFilter(unittest.TestCase):
+    def make(self):
+        return StreamTagFilter(nit=True, xml_tags=["PEROCUE"], thinking_tags=DEFAULT_THINKING_TAGS)
+
+    def run_chunks(self, stream_filter, chunks):
+        return "".join(stream_filter.filter(c) for c in chunks) + stream_filter.flush()
+
+    def test_whole_text(self):
+        self.assertEqual(self.run_chunks(self.make(), [SAMPLE]), EXPECTED)
+
+    def test_single_char_chunks(self):
+        self.assertEqual(self.run_chunks(self.make(), list(SAMPLE)), EXPECTED)
+
+    def test_emits_safe_text_immediately(self):
+        stream_filter = self.make()
+        self.assertEqual(stream_filter.filter("今天天气不错"), "今天天气不错")
+        # 可能是标记前缀时才扣留
+        self.assertEqual(stream_filter.filter("呀<ni"), "呀")
+        self.assertEqual(stream_filter.filter("ce"), "<nice")
+
+    def test_unclosed_block_dropped_on_flush(self):
+        stream_filter = self.make()
+        self.assertEqual(stream_filter.filter("前<nit>foo("), "前")
+        self.assertTrue(stream_filter.in_block)
+        self.assertEqual(stream_filter.flush(), "")
+
+    def test_nit_block_nested_in_thinking_block(self):
+        # NIT 块内的括号不能提前结束外层思考块
+        text = "(Thinking: call <nit>foo(x)</nit> now) done"
+        self.assertEqual(self.run_chunks(self.make(), [text]), " done")
+        self.assertEqual(self.run_chunks(self.make(), list(text)), " done")
+        text = "前<PEROCUE>{<nit-A9B2>f(\"</PEROCUE>\")</nit-a9b2>}</PEROCUE>后"
+        self.assertEqual(self.run_chunks(self.make(), [text]), "前后")
+        self.assertEqual(self.run_chunks(self.make(), list(text)), "前后")
+
+if __name__ == '__main__':
+    unittest.main()
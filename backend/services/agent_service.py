@@ -26,11 +26,13 @@ from services.llm_service import LLMService
 from services.prompt_service import PromptManager
 from services.scorer_service import ScorerService
 from services.mcp_service import McpClient
+from services.mcp_pool import mcp_pool
 from services.mdp.manager import MDPManager
 from services.preprocessor.manager import PreprocessorManager
 from services.preprocessor.implementations import (
     UserInputPreprocessor,
     HistoryPreprocessor,
+    PetStatePreprocessor,
     RAGPreprocessor,
     GraphFlashbackPreprocessor,
     ConfigPreprocessor,
@@ -41,17 +43,24 @@ from services.preprocessor.implementations import (
 from services.postprocessor.manager import PostprocessorManager
 from services.postprocessor.implementations import NITFilterPostprocessor, ThinkingFilterPostprocessor
 from core.nit_manager import get_nit_manager
+from core.config_manager import get_config_snapshot
+from services.turn_cache import config_snapshot
+from services.tool_catalog import tool_catalog
 from models import Config, Memory, PetState, ScheduledTask, AIModelConfig, MCPConfig
 from sqlmodel import select, desc
-from nit_core.tools import TOOLS_MAPPING, TOOLS_DEFINITIONS, plugin_manager
+from nit_core.tools import TOOLS_MAPPING, plugin_manager
 from nit_core.tools.core.ScreenVision.screen_ocr import get_screenshot_base64, save_screenshot
 from services.session_service import set_current_session_context
 from nit_core.tools.core.WindowsOps.windows_ops import get_active_windows
 from nit_core.security import NITSecurityManager
+from nit_core.scheduler import get_tool_policy, run_tool, run_batch
 
 from services.task_manager import task_manager
 
 class AgentService:
+    # 需要注入 UI / 上下文或终止循环的工具，在 ReAct 循环内按顺序单独处理，不进入并发批次
+    INLINE_TOOLS = frozenset({"finish_task", "search_files", "take_screenshot", "see_screen"})
+
     def __init__(self, session: AsyncSession):
         self.session = session
         set_current_session_context(session) # Inject session for tool ops
@@ -67,6 +76,7 @@ class AgentService:
         self.preprocessor_manager.register(UserInputPreprocessor())
         self.preprocessor_manager.register(HistoryPreprocessor())
         # self.preprocessor_manager.register(WeeklyReportPreprocessor()) # Disabled as per user request (Documents are static files now)
+        self.preprocessor_manager.register(PetStatePreprocessor())
         self.preprocessor_manager.register(RAGPreprocessor())
         self.preprocessor_manager.register(GraphFlashbackPreprocessor())
         self.preprocessor_manager.register(ConfigPreprocessor())
@@ -330,8 +340,8 @@ class AgentService:
             return None
 
     async def _get_llm_config(self) -> Dict[str, Any]:
-        # 1. 获取全局配置
-        configs = {c.key: c.value for c in (await self.session.exec(select(Config))).all()}
+        # 1. 获取全局配置 (进程级快照，不占用 self.session，可与其他预处理阶段并发)
+        configs = await config_snapshot()
         
         global_api_key = configs.get("global_llm_api_key", "")
         global_api_base = configs.get("global_llm_api_base", "https://api.openai.com")
@@ -351,11 +361,8 @@ class AgentService:
             return fallback_config
 
         # 3. 获取选中模型卡片
-        try:
-            model_config = await self.session.get(AIModelConfig, int(current_model_id))
-            if not model_config:
-                return fallback_config
-        except ValueError:
+        model_config = configs.get_model(current_model_id)
+        if not model_config:
             return fallback_config
 
         # 4. 组装配置
@@ -410,90 +417,126 @@ class AgentService:
         pass
 
     async def _get_mcp_clients(self) -> List[McpClient]:
-        """获取所有已启用的 MCP 客户端"""
-        clients = []
-        # 1. 尝试从新版通用 MCP 配置表中获取
-        try:
-            # 获取所有配置，无论是否启用，以此判断新表是否有数据
-            all_mcp_configs = (await self.session.exec(select(MCPConfig))).all()
-            
-            if all_mcp_configs:
-                print(f"[AgentService] 在 MCPConfig 表中找到 {len(all_mcp_configs)} 个配置。以此为准。")
-                for mcp_config_obj in all_mcp_configs:
-                    if not mcp_config_obj.enabled:
-                        continue
-                        
-                    print(f"[AgentService] 加载已启用的 MCP 配置: {mcp_config_obj.name}")
-                    client_config = {
-                        "type": mcp_config_obj.type,
-                        "name": mcp_config_obj.name
-                    }
-                    
-                    if mcp_config_obj.type == "stdio":
-                        client_config.update({
-                            "command": mcp_config_obj.command,
-                            "args": json.loads(mcp_config_obj.args or "[]"),
-                            "env": json.loads(mcp_config_obj.env or "{}")
-                        })
-                    elif mcp_config_obj.type == "sse":
-                        client_config.update({
-                            "url": mcp_config_obj.url
-                        })
-                    
-                    clients.append(McpClient(config=client_config))
-                # 只要新表有数据（即使全部被禁用），就以此为准，不再向下回退
-                return clients
-        except Exception as e:
-            print(f"[AgentService] 查询 MCPConfig 表错误: {e}")
+        """获取所有已就绪的 MCP 客户端 (由 mcp_pool 长期持有，调用方不要关闭)"""
+        return await mcp_pool.borrow(self.session)
 
-        # 只有当新表完全没数据时，才尝试获取旧版配置作为回退
-        # 2. 尝试获取完整 JSON 配置
+    async def _execute_tool_batch(self, calls: List[tuple], mcp_tool_map: Dict[str, McpClient], on_status: Optional[Any] = None) -> List[tuple]:
+        """
+        并发执行一批工具调用 [(tool_call, 工具名, 参数, 预设结果)]，按调用顺序返回 [(结果文本, 待推送的 SSE 消息)]。
+        serialOnly 工具作为屏障串行执行；单工具并发上限与超时见插件清单 (nit_core.scheduler)。
+        """
+        jobs = []
+        for tool_call, function_name, function_args, preset in calls:
+            if preset is not None:
+                jobs.append((False, lambda preset=preset: self._resolved_tool_result(preset)))
+            else:
+                jobs.append((
+                    get_tool_policy(function_name).serial,
+                    lambda name=function_name, args=function_args: self._execute_tool_call(name, args, mcp_tool_map, on_status)
+                ))
+
+        results = []
+        for (tool_call, function_name, _, _), result in zip(calls, await run_batch(jobs)):
+            if isinstance(result, Exception):
+                print(f"[Agent] 工具 {function_name} 失败: {result}")
+                result = (f"执行工具出错: {result}", None)
+            results.append(result)
+        return results
+
+    @staticmethod
+    async def _resolved_tool_result(content: str) -> tuple:
+        return content, None
+
+    async def _execute_tool_call(self, function_name: str, function_args: Dict[str, Any], mcp_tool_map: Dict[str, McpClient], on_status: Optional[Any] = None) -> tuple:
+        """执行单个 NIT / MCP 工具调用，返回 (结果文本, 待推送的 SSE 消息)。"""
+        sse_message = None
+
+        # --- NIT Dispatcher Integration ---
+        from nit_core.dispatcher import get_dispatcher, normalize_nit_key
+        nit_dispatcher = get_dispatcher()
+        
+        # 归一化工具名
+        normalized_name = normalize_nit_key(function_name)
+        
+        # 信任 Dispatcher 的注册表
+        if normalized_name in nit_dispatcher.list_plugins():
+            print(f"[Agent] 将工具 {function_name} 委托给 NITDispatcher (统一流)...")
+            if on_status: await on_status("thinking", f"正在调用能力: {function_name}...")
+            
             try:
-                json_config = (await self.session.exec(select(Config).where(Config.key == "mcp_config_json"))).first()
+                # NIT 插件统一接口：接收 params 字典
+                result = await run_tool(function_name, lambda: nit_dispatcher._execute_plugin(function_name, function_args))
+                
+                # 如果结果是复杂对象，Dispatcher 里的插件应该已经处理成了字符串或特定结构
+                # 这里我们只负责转为字符串回传给 LLM
+                function_response = str(result)
+                print(f"[Agent] NIT 工具 {function_name} 执行成功。")
                 
-                if json_config and json_config.value:
+                # [Feature] 实时状态同步
+                # 如果是 update_character_status，解析其返回的 triggers 并推送到前端
+                if function_name in ["update_character_status", "update_status", "set_status"]:
                     try:
-                        config_data = json.loads(json_config.value)
-                        if "mcpServers" in config_data:
-                            for name, server_config in config_data["mcpServers"].items():
-                                # 检查是否启用 (默认为 True)
-                                if not server_config.get("enabled", True):
-                                    print(f"[AgentService] 跳过已禁用的 MCP JSON 配置: {name}")
-                                    continue
-                                    
-                                print(f"[AgentService] 找到 MCP JSON 配置: {name}")
-                                # 确保配置中有名字
-                                if "name" not in server_config:
-                                    server_config["name"] = name
-                                clients.append(McpClient(config=server_config))
-                        else:
-                            print(f"[AgentService] 找到直接 MCP JSON 配置")
-                            clients.append(McpClient(config=config_data))
+                        triggers = json.loads(str(result))
+                        
+                        # 1. 构造 SSE 格式的 JSON 数据 (由 chat 按调用顺序 yield 给前端)
+                        sse_payload = json.dumps({"triggers": triggers}, ensure_ascii=False)
+                        sse_message = f"data: {sse_payload}\n\n"
+                        
+                        # 2. 尝试广播给 RealtimeSessionManager (双保险，适用于语音模式)
+                        try:
+                            from services.realtime_session_manager import realtime_session_manager
+                            await realtime_session_manager.broadcast({"type": "triggers", "data": triggers})
+                        except:
+                            pass
+                            
+                        print(f"[Agent] 状态更新已推送到前端: {sse_payload[:50]}...")
                     except Exception as e:
-                        print(f"[AgentService] 加载 MCP JSON 配置失败: {e}")
-            except Exception as e:
-                print(f"[AgentService] 查询 mcp_config_json 错误: {e}")
+                        print(f"[Agent] 推送状态更新失败: {e}")
 
-            # 3. 回退到旧的 URL/Key 配置 (仅当仍没有客户端时)
-            if not clients:
+                # 特殊处理：如果是 search_files，且返回结果很大，可能需要截断或由辅助模型处理
+                # 思路是插件内部自己处理好返回内容
+                # 这里保留一个简单的截断保护
+                if len(function_response) > 10000:
+                    function_response = function_response[:10000] + "\n... (result truncated)"
+
+            except asyncio.TimeoutError:
+                print(f"[Agent] NIT 工具 {function_name} 超时")
+                function_response = f"执行工具出错: {function_name} 执行超时 ({get_tool_policy(function_name).timeout:.0f}s)。"
+            except Exception as e:
+                print(f"[Agent] NIT 工具 {function_name} 失败: {e}")
+                function_response = f"执行工具出错: {e}"
+                
+            return function_response, sse_message
+        
+        # --- MCP Tool Handling ---
+        if function_name.startswith("mcp_") and mcp_tool_map:
+            real_tool_name = function_name[4:]
+            client = mcp_tool_map.get(function_name)
+            if not client:
+                print(f"[Agent] 映射中未找到 MCP 工具 {function_name}")
+                mcp_response = f"错误: 未找到 MCP 工具 {function_name}。"
+            else:
+                print(f"[Agent] 调用 MCP 工具: {real_tool_name} (在 {client.name} 上)")
+                if on_status: await on_status("thinking", f"正在调用插件 ({client.name}): {real_tool_name}...")
+                
+                import time
+                start_time = time.time()
                 try:
-                    url_config = (await self.session.exec(select(Config).where(Config.key == "mcp_server_url"))).first()
-                    
-                    if url_config and url_config.value:
-                        key_config = (await self.session.exec(select(Config).where(Config.key == "mcp_api_key"))).first()
-                        api_key = key_config.value if key_config else None
-                        
-                        print(f"[AgentService] 回退到旧版 MCP URL 配置: {url_config.value}")
-                        clients.append(McpClient(config={
-                            "type": "sse",
-                            "url": url_config.value,
-                            "api_key": api_key,
-                            "name": "Legacy-MCP"
-                        }))
+                    mcp_response = await run_tool(function_name, lambda: client.call_tool(real_tool_name, function_args))
+                    duration = time.time() - start_time
+                    print(f"[Agent] MCP 工具 {real_tool_name} 执行耗时 {duration:.2f}s")
+                except asyncio.TimeoutError:
+                    print(f"[Agent] MCP 工具 {real_tool_name} 超时")
+                    mcp_response = f"Error: MCP 工具 {real_tool_name} 执行超时。"
                 except Exception as e:
-                    print(f"[AgentService] 查询 mcp_server_url 错误: {e}")
+                    print(f"[Agent] MCP 工具 {real_tool_name} 失败: {e}")
+                    mcp_response = f"Error: {e}"
+
+            return str(mcp_response), None
 
-        return clients
+        # --- Fallback for Unknown Tools ---
+        print(f"[Agent] 在 NIT 注册表或 MCP 中未找到工具 {function_name}。")
+        return f"Error: Tool '{function_name}' not found or not supported.", None
 
     async def _save_parsed_metadata(self, text: str, source: str = "desktop", mcp_clients: List[McpClient] = None, execute_nit: bool = True, expected_nit_id: str = None) -> List[Dict[str, Any]]:
         """解析并保存 LLM 返回的元数据。现在主要负责 NIT 工具调用。"""
@@ -868,7 +911,7 @@ class AgentService:
         if not config:
             config = await self._get_llm_config()
 
-        print(f"[Agent] 通过预处理器构建 Prompt。消息数: {len(final_messages)}")
+        print(f"[Agent] 通过预处理器构建 Prompt。消息数: {len(final_messages)}, 前缀哈希: {context.get('prompt_prefix_hash', '')}")
 
         llm = LLMService(
             api_key=config.get("api_key"),
@@ -881,63 +924,12 @@ class AgentService:
         if on_status: await on_status("thinking", "正在加载工具...")
         print("[Agent] 正在加载 MCP 工具...")
         
-        # --- 工具列表优化 ---
-        # 根据主模型是否支持多模态，动态调整工具定义
+        # --- 工具列表 (预编译目录) ---
+        # 按 (来源, 能力, 视觉, 工作模式) 组合缓存过滤结果，返回共享只读定义
         enable_vision = config.get("enable_vision", False)
-        dynamic_tools = []
-        for tool_def in TOOLS_DEFINITIONS:
-            # 检查工具定义是否符合 OpenAI Function Calling 格式
-            if "function" not in tool_def or "name" not in tool_def.get("function", {}):
-                # 如果不是标准 Function 格式（例如纯 NIT 指令），则跳过 Native Tool 注册
-                # 但它们依然会在 System Prompt 中可见（前面已处理）
-                continue
-
-            # 复制一份以防修改全局变量
-            new_tool_def = json.loads(json.dumps(tool_def))
-            tool_name = new_tool_def["function"]["name"]
-            
-            # 安全校验：如果是手机端且包含敏感词，则直接剔除
-            sensitive_tool_keywords = ["screenshot", "screen", "windows", "shell", "cmd", "file", "app", "browser", "exec", "write"]
-            if source == "mobile" and any(kw in tool_name.lower() for kw in sensitive_tool_keywords):
-                print(f"[安全] 为移动端过滤敏感工具: {tool_name}")
-                continue
-            
-            # 如果是多模态模型，且工具是 screen_ocr，则跳过不注入
-            if enable_vision and tool_name == "screen_ocr":
-                continue
-            
-            # [Stage 3] Dynamic Capability Filtering
-            # If capabilities are specified (e.g. social), filter tools
-            if capabilities:
-                # 1. Check metadata (required_capability)
-                # Note: Currently tools might not have this metadata, so we default to "core"
-                req_cap = tool_def.get("required_capability", "core")
-                
-                # 2. Check whitelist/blacklist based on source/capability
-                if "social" in capabilities:
-                    # Social Mode Whitelist Logic
-                    safe_prefixes = ["qq_"]
-                    safe_names = ["read_social_memory", "read_agent_memory", "qq_notify_master", "add_reminder", "list_reminders", "delete_reminder"]
-                    
-                    is_safe = False
-                    if req_cap == "social":
-                        is_safe = True
-                    elif any(tool_name.startswith(p) for p in safe_prefixes) or tool_name in safe_names:
-                        is_safe = True
-                    
-                    if not is_safe:
-                        continue
-            
-            if tool_name == "take_screenshot" or tool_name == "see_screen":
-                if not enable_vision:
-                    new_tool_def["function"]["description"] = "获取当前屏幕的视觉分析报告。系统将调用视觉 MCP 服务器分析屏幕内容并返回详细的文字描述。当你需要了解屏幕上的视觉信息、或出于好奇想看看主人在做什么但无法直接看到图片时，请使用此工具。"
-                    # 非多模态模式下，count 参数可能没意义，或者我们只支持 1
-                    new_tool_def["function"]["parameters"]["properties"]["count"]["description"] = "获取截图并分析的数量。在非多模态模式下，建议设为 1。"
-            dynamic_tools.append(new_tool_def)
-        
-        # Log prepared tools for debugging
-        print(f"[AgentService] 准备了 {len(dynamic_tools)} 个工具: {[t['function']['name'] for t in dynamic_tools]}")
-        # --- End 工具列表优化 ---
+        is_work_mode = session_id.startswith("work_")
+        dynamic_tools = list(tool_catalog.get_native_tools(source, capabilities, enable_vision, is_work_mode))
+        print(f"[AgentService] 准备了 {len(dynamic_tools)} 个工具 (目录 v{tool_catalog.version})")
         
         mcp_clients = []
         try:
@@ -947,58 +939,13 @@ class AgentService:
             print(f"[Agent] 获取 MCP 客户端失败: {e}")
 
         mcp_tool_map = {} # tool_name -> client
-        for client in mcp_clients:
-            try:
-                mcp_tools = await client.list_tools()
-                for tool in mcp_tools:
-                    tool_name = f"mcp_{tool['name']}"
-                    
-                    # 同样对 MCP 工具实施安全校验
-                    sensitive_tool_keywords = ["screenshot", "screen", "windows", "shell", "cmd", "file", "app", "browser", "exec", "write"]
-                    if source == "mobile" and any(kw in tool_name.lower() for kw in sensitive_tool_keywords):
-                        print(f"[安全] 为移动端过滤敏感 MCP 工具: {tool_name}")
-                        continue
-
-                    # 如果有重名，后面的会覆盖前面的，或者我们可以加后缀
-                    dynamic_tools.append({
-                        "type": "function",
-                        "function": {
-                            "name": tool_name,
-                            "description": tool.get("description", ""),
-                            "parameters": tool.get("inputSchema", {})
-                        }
-                    })
-                    mcp_tool_map[tool_name] = client
-                    print(f"[Agent] 注册 MCP 工具: {tool_name} (来自 {client.name})")
-            except Exception as e:
-                print(f"[AgentService] 警告: 列出客户端 {client.name} 的工具失败: {e}")
-
-        # [Work Mode] Tool Filtering
-        if session_id.startswith("work_"):
-            # Whitelist approach for maximum cleanliness
-            allowed_keywords = [
-                "screen", "window", "file", "dir", "read", "write", "search", "cmd", "exec", 
-                "browser", "click", "type", "scroll", "mouse", "keyboard", "system", "code", "terminal", "git"
-            ]
-            # Also allow specific essential tools
-            allowed_names = ["take_screenshot", "see_screen", "get_active_windows", "finish_task"]
-            
-            filtered_tools = []
-            for tool in dynamic_tools:
-                t_name = tool["function"]["name"].lower()
-                if any(k in t_name for k in allowed_keywords) or t_name in allowed_names:
-                    filtered_tools.append(tool)
-                else:
-                    # Allow memory search but restrict other memory ops
-                    if "memory" in t_name and ("search" in t_name or "read" in t_name):
-                         filtered_tools.append(tool)
-            
-            print(f"[Agent] 工作模式：工具列表已精简 ({len(dynamic_tools)} -> {len(filtered_tools)})")
-            dynamic_tools = filtered_tools
+        for tool_def, client in await tool_catalog.get_mcp_tools(mcp_clients, source, is_work_mode):
+            # 如果有重名，后面的会覆盖前面的
+            dynamic_tools.append(tool_def)
+            mcp_tool_map[tool_def["function"]["name"]] = client
 
         # --- Native Tools Config ---
-        disable_native_tools_config = (await self.session.exec(select(Config).where(Config.key == "disable_native_tools"))).first()
-        disable_native_tools = disable_native_tools_config.value.lower() == "true" if disable_native_tools_config else False
+        disable_native_tools = (await get_config_snapshot()).get("disable_native_tools", "false").lower() == "true"
         tools_to_pass = None if disable_native_tools else dynamic_tools
         if disable_native_tools:
             print("[Agent] 原生工具 (Function Calling) 已通过配置禁用。")
@@ -1268,52 +1215,65 @@ class AgentService:
                 intercepted_ui_data = {} # 存储 tool_name -> raw_data
                 should_terminate_loop = False
 
-                for tool_call in collected_tool_calls:
-                    function_name = tool_call["function"]["name"]
-                    args_str = tool_call["function"]["arguments"] or "{}"
-                    arg_parsing_error = None
-                    try:
-                        function_args = json.loads(args_str)
-                    except json.JSONDecodeError as e:
-                        # 尝试处理 "Extra data" (例如模型输出了多个 JSON 对象)
+                # 互不依赖的工具调用并发执行 (nit_core.scheduler)：普通 NIT / MCP 调用先攒成一批，
+                # 遇到需要注入 UI / 上下文的拦截工具时先执行完前面的批次；工具结果按调用顺序写回 final_messages
+                pending_calls = []
+                for tool_call in collected_tool_calls + [None]:
+                    if tool_call is not None:
+                        function_name = tool_call["function"]["name"]
+                        args_str = tool_call["function"]["arguments"] or "{}"
+                        arg_parsing_error = None
                         try:
-                            function_args, _ = json.JSONDecoder().raw_decode(args_str)
-                            print(f"[Agent] 从额外数据错误中恢复。解析结果: {function_args}")
-                        except Exception:
+                            function_args = json.loads(args_str)
+                        except json.JSONDecodeError as e:
+                            # 尝试处理 "Extra data" (例如模型输出了多个 JSON 对象)
+                            try:
+                                function_args, _ = json.JSONDecoder().raw_decode(args_str)
+                                print(f"[Agent] 从额外数据错误中恢复。解析结果: {function_args}")
+                            except Exception:
+                                print(f"[Agent] 解析工具参数失败: {args_str}, 错误: {e}")
+                                arg_parsing_error = f"Failed to parse arguments: {str(e)}"
+                                function_args = {}
+                        except Exception as e:
                             print(f"[Agent] 解析工具参数失败: {args_str}, 错误: {e}")
                             arg_parsing_error = f"Failed to parse arguments: {str(e)}"
                             function_args = {}
-                    except Exception as e:
-                        print(f"[Agent] 解析工具参数失败: {args_str}, 错误: {e}")
-                        arg_parsing_error = f"Failed to parse arguments: {str(e)}"
-                        function_args = {}
-                    
-                    # 如果参数解析失败，直接生成错误响应，不执行函数
-                    if arg_parsing_error:
-                         final_messages.append({
-                            "tool_call_id": tool_call["id"],
-                            "role": "tool",
-                            "name": function_name,
-                            "content": f"错误: {arg_parsing_error}。请确保参数是有效的 JSON。",
-                        })
-                         continue
-                    
-                    # --- Tool Execution Strategy ---
-                    # 1. Security Gate: 硬拦截机制 (Hard Isolation)
-                    # 即使模型“猜”到了工具名，或者通过恶意脚本注入，只要来源是手机，就禁止执行敏感工具
-                    sensitive_tool_keywords = ["screenshot", "screen", "windows", "shell", "cmd", "file", "app", "browser", "exec", "write"]
-                    if source == "mobile" and any(kw in function_name.lower() for kw in sensitive_tool_keywords):
-                        print(f"[🛡️ 安全拦截] 已拦截来自移动端对敏感工具 '{function_name}' 的执行。")
-                        final_messages.append({
-                            "tool_call_id": tool_call["id"],
-                            "role": "tool",
-                            "name": function_name,
-                            "content": f"错误：权限拒绝。出于安全原因，工具 '{function_name}' 被限制远程/移动连接使用。",
-                        })
-                        continue
+
+                        # 如果参数解析失败，直接生成错误响应，不执行函数
+                        if arg_parsing_error:
+                            pending_calls.append((tool_call, function_name, None, f"错误: {arg_parsing_error}。请确保参数是有效的 JSON。"))
+                            continue
+
+                        # --- Tool Execution Strategy ---
+                        # 1. Security Gate: 硬拦截机制 (Hard Isolation)
+                        # 即使模型“猜”到了工具名，或者通过恶意脚本注入，只要来源是手机，就禁止执行敏感工具
+                        sensitive_tool_keywords = ["screenshot", "screen", "windows", "shell", "cmd", "file", "app", "browser", "exec", "write"]
+                        if source == "mobile" and any(kw in function_name.lower() for kw in sensitive_tool_keywords):
+                            print(f"[🛡️ 安全拦截] 已拦截来自移动端对敏感工具 '{function_name}' 的执行。")
+                            pending_calls.append((tool_call, function_name, None, f"错误：权限拒绝。出于安全原因，工具 '{function_name}' 被限制远程/移动连接使用。"))
+                            continue
+
+                        # 3. NIT Dispatcher / MCP: 进入批次，稍后并发执行
+                        if function_name not in self.INLINE_TOOLS:
+                            pending_calls.append((tool_call, function_name, function_args, None))
+                            continue
+
+                    if pending_calls:
+                        batch_results = await self._execute_tool_batch(pending_calls, mcp_tool_map, on_status)
+                        for (call, call_name, _, _), (function_response, sse_message) in zip(pending_calls, batch_results):
+                            if sse_message:
+                                yield sse_message
+                            final_messages.append({
+                                "tool_call_id": call["id"],
+                                "role": "tool",
+                                "name": call_name,
+                                "content": function_response,
+                            })
+                        pending_calls = []
+                    if tool_call is None:
+                        break
 
                     # 2. Interceptors: Handle tools with special UI/Context requirements first
-                    # 3. NIT Dispatcher: Unified execution for all other plugins
                     
                     if function_name == "finish_task":
                         print(f"[Agent] finish_task 被调用。状态: {function_args.get('status', 'success')}")
@@ -1456,108 +1416,6 @@ class AgentService:
                         })
                         continue
 
-                    # --- NIT Dispatcher Integration ---
-                    from nit_core.dispatcher import get_dispatcher
-                    nit_dispatcher = get_dispatcher()
-                    
-                    # 归一化工具名
-                    normalized_name = nit_dispatcher.parser.normalize_key(function_name)
-                    
-                    # 信任 Dispatcher 的注册表
-                    if normalized_name in nit_dispatcher.list_plugins():
-                        print(f"[Agent] 将工具 {function_name} 委托给 NITDispatcher (统一流)...")
-                        if on_status: await on_status("thinking", f"正在调用能力: {function_name}...")
-                        
-                        try:
-                            # NIT 插件统一接口：接收 params 字典
-                            result = await nit_dispatcher._execute_plugin(function_name, function_args)
-                            
-                            # 如果结果是复杂对象，Dispatcher 里的插件应该已经处理成了字符串或特定结构
-                            # 这里我们只负责转为字符串回传给 LLM
-                            function_response = str(result)
-                            print(f"[Agent] NIT 工具 {function_name} 执行成功。")
-                            
-                            # [Feature] 实时状态同步
-                            # 如果是 update_character_status，解析其返回的 triggers 并立即推送到前端
-                            if function_name in ["update_character_status", "update_status", "set_status"]:
-                                try:
-                                    import json
-                                    triggers = json.loads(str(result))
-                                    
-                                    # 1. 构造 SSE 格式的 JSON 数据
-                                    sse_payload = json.dumps({"triggers": triggers}, ensure_ascii=False)
-                                    sse_message = f"data: {sse_payload}\n\n"
-                                    
-                                    # 2. 推送到前端 (通过 yield SSE)
-                                    yield sse_message
-                                    
-                                    # 3. 尝试广播给 RealtimeSessionManager (双保险，适用于语音模式)
-                                    try:
-                                        from services.realtime_session_manager import realtime_session_manager
-                                        await realtime_session_manager.broadcast({"type": "triggers", "data": triggers})
-                                    except:
-                                        pass
-                                        
-                                    print(f"[Agent] 状态更新已推送到前端: {sse_payload[:50]}...")
-                                except Exception as e:
-                                    print(f"[Agent] 推送状态更新失败: {e}")
-
-                            # 特殊处理：如果是 search_files，且返回结果很大，可能需要截断或由辅助模型处理
-                            # 思路是插件内部自己处理好返回内容
-                            # 这里保留一个简单的截断保护
-                            if len(function_response) > 10000:
-                                function_response = function_response[:10000] + "\n... (result truncated)"
-
-                        except Exception as e:
-                            print(f"[Agent] NIT 工具 {function_name} 失败: {e}")
-                            function_response = f"执行工具出错: {e}"
-                            
-                        final_messages.append({
-                            "tool_call_id": tool_call["id"],
-                            "role": "tool",
-                            "name": function_name,
-                            "content": function_response,
-                        })
-                        continue
-                    
-                    # --- MCP Tool Handling ---
-                    if function_name.startswith("mcp_") and mcp_tool_map:
-                        real_tool_name = function_name[4:]
-                        client = mcp_tool_map.get(function_name)
-                        if not client:
-                            print(f"[Agent] 映射中未找到 MCP 工具 {function_name}")
-                            mcp_response = f"错误: 未找到 MCP 工具 {function_name}。"
-                        else:
-                            print(f"[Agent] 调用 MCP 工具: {real_tool_name} (在 {client.name} 上)")
-                            if on_status: await on_status("thinking", f"正在调用插件 ({client.name}): {real_tool_name}...")
-                            
-                            import time
-                            start_time = time.time()
-                            try:
-                                mcp_response = await client.call_tool(real_tool_name, function_args)
-                                duration = time.time() - start_time
-                                print(f"[Agent] MCP 工具 {real_tool_name} 执行耗时 {duration:.2f}s")
-                            except Exception as e:
-                                print(f"[Agent] MCP 工具 {real_tool_name} 失败: {e}")
-                                mcp_response = f"Error: {e}"
-
-                        final_messages.append({
-                            "tool_call_id": tool_call["id"],
-                            "role": "tool",
-                            "name": function_name,
-                            "content": str(mcp_response),
-                        })
-
-                    else:
-                        # --- Fallback for Unknown Tools ---
-                        print(f"[Agent] 在 NIT 注册表或 MCP 中未找到工具 {function_name}。")
-                        final_messages.append({
-                            "tool_call_id": tool_call["id"],
-                            "role": "tool",
-                            "name": function_name,
-                            "content": f"Error: Tool '{function_name}' not found or not supported.",
-                        })
-
                 # 3. 触发按需反思机制
                 last_tool_response = final_messages[-1].get("content", "")
                 is_tool_error = "error" in str(last_tool_response).lower() or "fail" in str(last_tool_response).lower()
@@ -1807,15 +1665,6 @@ class AgentService:
             if session_id:
                 task_manager.unregister(session_id)
 
-            # 最后的兜底处理，清理 MCP 客户端资源
-            if 'mcp_clients' in locals():
-                for client in mcp_clients:
-                    try:
-                        await client.close()
-                    except:
-                        pass
-            pass
-
     async def _generate_and_stream_tts(self, text: str):
         """Generate TTS audio and stream it to frontend (Text Mode)"""
         try:
@@ -1832,9 +1681,7 @@ class AgentService:
 
             from services.tts_service import get_tts_service
             from services.gateway_client import gateway_client
-            import uuid
-            import time
-            from peroproto import perolink_pb2
+            from services.audio_stream import detect_audio_mime, iter_audio_chunks
 
             tts_service = get_tts_service()
             
@@ -1844,31 +1691,12 @@ class AgentService:
                 return
 
             # Use default voice params
-            audio_path = await tts_service.synthesize(cleaned_text)
+            audio_data = await tts_service.synthesize_bytes(cleaned_text)
             
-            if audio_path:
+            if audio_data:
                 # Stream via Gateway
-                with open(audio_path, "rb") as f:
-                    audio_data = f.read()
-                
-                envelope = perolink_pb2.Envelope()
-                envelope.id = str(uuid.uuid4())
-                envelope.source_id = gateway_client.device_id
-                envelope.target_id = "broadcast"
-                envelope.timestamp = int(time.time() * 1000)
-                
-                envelope.stream.stream_id = str(uuid.uuid4())
-                envelope.stream.data = audio_data
-                envelope.stream.is_end = True
-                envelope.stream.content_type = "audio/mp3"
-                
-                await gateway_client.send(envelope)
-                
-                # Cleanup
-                try:
-                    import os
-                    os.remove(audio_path)
-                except:
-                    pass
+                await gateway_client.send_stream(
+                    "broadcast", iter_audio_chunks(audio_data), detect_audio_mime(audio_data[:16])
+                )
         except Exception as e:
             print(f"[Agent] TTS 生成失败: {e}")
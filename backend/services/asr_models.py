@@ -0,0 +1,206 @@
+"""
+Whisper 模型生命周期与并发控制
+
+原先 ASRService 用一把全局 asyncio.Lock 包住整次转写，并发的语音会话完全串行；
+模型只有一个实例，配置变化时也不会切换。ASRModelManager 负责：
+- 按 (模型, 设备, 精度, cpu_threads, num_workers) 缓存模型实例，加载是 single-flight 的 (同一配置只加载一次)
+- 固定数量的解码工作线程 (PERO_ASR_WORKERS)，CTranslate2 的 num_workers 与之对齐，才能真正并行解码
+- 请求按优先级排队 (句末最终转写优先于流式部分转写)
+- 可选的空闲卸载 (PERO_ASR_IDLE_UNLOAD 秒，0 表示常驻)
+- 统计排队等待与解码耗时
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+ASR_WORKERS = max(1, int(os.environ.get("PERO_ASR_WORKERS", "1")))
+ASR_CPU_THREADS = int(os.environ.get("PERO_ASR_CPU_THREADS", "0"))  # 0 = 由 CTranslate2 自动决定
+ASR_IDLE_UNLOAD = float(os.environ.get("PERO_ASR_IDLE_UNLOAD", "0"))
+
+PRIORITY_FINAL = 0
+PRIORITY_PARTIAL = 10
+
+_METRIC_WINDOW = 200
+
+
+class ModelSpec(NamedTuple):
+    model_path: str = "tiny"
+    device: str = "cpu"
+    compute_type: str = "int8"
+    cpu_threads: int = ASR_CPU_THREADS
+    num_workers: int = ASR_WORKERS
+
+
+class PrioritySlots:
+    """容量固定的优先级信号量：空闲时直接获得，否则按 (优先级, 先来后到) 排队。"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._in_use = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = 0
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: int):
+        if self._in_use < self.capacity and not self.waiting:
+            self._in_use += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._waiters, (priority, self._seq, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已经分到名额但调用方被取消，转交给下一个
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)  # 名额直接移交，_in_use 不变
+                return
+        self._in_use -= 1
+
+
+class _Entry:
+    def __init__(self, model: Any):
+        self.model = model
+        self.active = 0
+        self.last_used = time.monotonic()
+
+
+def _decode(model, audio, beam_size: int) -> str:
+    """在工作线程中执行；faster-whisper 的 segments 是惰性生成器，必须在这里迭代完。"""
+    import io
+    import numpy as np
+
+    if isinstance(audio, (bytes, bytearray)):
+        # faster-whisper 可直接从文件对象解码
+        audio = io.BytesIO(audio)
+    elif isinstance(audio, np.ndarray):
+        audio = audio.astype(np.float32, copy=False)
+    segments, info = model.transcribe(audio, beam_size=beam_size, language="zh", task="transcribe")
+    return "".join(segment.text for segment in segments).strip()
+
+
+class ASRModelManager:
+    def __init__(self, loader: Callable[[ModelSpec], Any], workers: int = ASR_WORKERS,
+                 idle_unload: float = ASR_IDLE_UNLOAD, decode: Callable[[Any, Any, int], str] = _decode):
+        """loader(spec) 在线程中同步加载并返回模型；decode(model, audio, beam_size) 在工作线程中执行。"""
+        self._loader = loader
+        self._decode = decode
+        self.workers = workers
+        self.idle_unload = idle_unload
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asr")
+        self._slots = PrioritySlots(workers)
+        self._models: Dict[ModelSpec, _Entry] = {}
+        self._load_locks: Dict[ModelSpec, threading.Lock] = {}
+        self._guard = threading.Lock()
+        self._waits: Deque[float] = deque(maxlen=_METRIC_WINDOW)
+        self._decodes: Deque[float] = deque(maxlen=_METRIC_WINDOW)
+        self.requests = 0
+        self.loads = 0
+        self.unloads = 0
+
+    # --- 模型加载 ---
+
+    def load(self, spec: ModelSpec) -> Any:
+        """同步加载 (可在任意线程调用)；同一配置并发加载时只有一个线程真正执行 loader。"""
+        entry = self._models.get(spec)
+        if entry is not None:
+            return entry.model
+        with self._guard:
+            lock = self._load_locks.setdefault(spec, threading.Lock())
+        with lock:
+            entry = self._models.get(spec)
+            if entry is None:
+                model = self._loader(spec)
+                entry = _Entry(model)
+                self._models[spec] = entry
+                self.loads += 1
+            return entry.model
+
+    async def _acquire_model(self, spec: ModelSpec) -> _Entry:
+        if spec not in self._models:
+            await asyncio.to_thread(self.load, spec)
+        entry = self._models[spec]
+        entry.active += 1
+        return entry
+
+    def _release_model(self, spec: ModelSpec, entry: _Entry):
+        entry.active -= 1
+        entry.last_used = time.monotonic()
+        if self.idle_unload > 0 and entry.active == 0:
+            asyncio.get_running_loop().call_later(self.idle_unload, self._maybe_unload, spec, entry)
+
+    def _maybe_unload(self, spec: ModelSpec, entry: _Entry):
+        if self._models.get(spec) is not entry or entry.active:
+            return
+        if time.monotonic() - entry.last_used < self.idle_unload:
+            return
+        del self._models[spec]
+        self.unloads += 1
+        print(f"[ASR] 模型 {spec.model_path} 空闲 {self.idle_unload:.0f}s，已卸载", flush=True)
+
+    def is_loaded(self, spec: ModelSpec) -> bool:
+        return spec in self._models
+
+    # --- 转写 ---
+
+    async def transcribe(self, spec: ModelSpec, audio, beam_size: int = 5, priority: int = PRIORITY_FINAL) -> str:
+        self.requests += 1
+        entry = await self._acquire_model(spec)
+        try:
+            queued = time.perf_counter()
+            await self._slots.acquire(priority)
+            started = time.perf_counter()
+            try:
+                loop = asyncio.get_running_loop()
+                text = await loop.run_in_executor(self._executor, self._decode, entry.model, audio, beam_size)
+            finally:
+                self._slots.release()
+            finished = time.perf_counter()
+        finally:
+            self._release_model(spec, entry)
+
+        self._waits.append(started - queued)
+        self._decodes.append(finished - started)
+        return text
+
+    def get_stats(self) -> Dict[str, Any]:
+        def summary(values: Deque[float]) -> Dict[str, float]:
+            if not values:
+                return {"avg_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+            ordered = sorted(values)
+            return {
+                "avg_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+                "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1),
+                "max_ms": round(ordered[-1] * 1000, 1),
+            }
+
+        return {
+            "requests": self.requests,
+            "queued": self._slots.waiting,
+            "workers": self.workers,
+            "loaded_models": [spec.model_path for spec in self._models],
+            "loads": self.loads,
+            "unloads": self.unloads,
+            "queue_wait": summary(self._waits),
+            "decode": summary(self._decodes),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._models.clear()
@@ -14,11 +14,19 @@ import json
 import httpx
 import time
 import shutil
+import numpy as np
 from faster_whisper import WhisperModel, download_model
-from typing import Optional
+from typing import Optional, Union
 from sqlmodel import select
 from database import get_session
 from models import VoiceConfig
+from services.streaming_asr import ASR_SAMPLE_RATE, StreamingTranscriber
+from services.audio_processor import encode_wav
+from services.asr_models import ASRModelManager, ModelSpec, PRIORITY_FINAL, PRIORITY_PARTIAL
+
+# 音频输入：文件路径、完整的音频文件字节 (wav/mp3 等)，或 16kHz 单声道 float32 波形
+AudioInput = Union[str, bytes, np.ndarray]
+
 
 class ASRService:
     def __init__(self):
@@ -32,8 +40,8 @@ class ASRService:
         
         self.device = "cpu"
         self.compute_type = "int8"
-        self._model = None
-        self._lock = asyncio.Lock()
+        # 按配置缓存模型实例，解码在固定数量的工作线程上按优先级排队，不再用全局锁串行
+        self.models = ASRModelManager(self._load_model)
 
     async def _get_active_config(self) -> Optional[VoiceConfig]:
         async for session in get_session():
@@ -78,40 +86,55 @@ class ASRService:
         
         raise last_error
 
-    def _load_model(self, model_path: str, device: str, compute_type: str):
-        """延迟加载模型"""
-        if self._model is None:
-            try:
-                # 先尝试确保模型已下载 (如果是远程模型名)
-                # 如果是本地路径，_download_with_retry 会直接返回原路径
-                real_model_path = self._download_with_retry(model_path)
-                
-                print(f"正在 {device} 上加载 Whisper 模型: {real_model_path}...", flush=True)
-                # Explicitly set download_root to project's models_cache to avoid issues with default system cache
-                # 注意: 当 real_model_path 是绝对路径时，WhisperModel 会直接使用它
-                self._model = WhisperModel(real_model_path, device=device, compute_type=compute_type, download_root=self.models_cache_dir)
-                print("Whisper 模型加载成功。", flush=True)
-            except Exception as e:
-                print(f"模型加载失败，尝试重新下载: {e}", flush=True)
-                raise e
+    def _load_model(self, spec: ModelSpec) -> WhisperModel:
+        """加载一个模型实例 (由 ASRModelManager 调用，同一配置只会加载一次)"""
+        try:
+            # 先尝试确保模型已下载 (如果是远程模型名)
+            # 如果是本地路径，_download_with_retry 会直接返回原路径
+            real_model_path = self._download_with_retry(spec.model_path)
+
+            print(f"正在 {spec.device} 上加载 Whisper 模型: {real_model_path}...", flush=True)
+            # Explicitly set download_root to project's models_cache to avoid issues with default system cache
+            # 注意: 当 real_model_path 是绝对路径时，WhisperModel 会直接使用它
+            # num_workers 与解码线程数一致，CTranslate2 才能同时处理多个请求
+            model = WhisperModel(real_model_path, device=spec.device, compute_type=spec.compute_type,
+                                 cpu_threads=spec.cpu_threads, num_workers=spec.num_workers,
+                                 download_root=self.models_cache_dir)
+            print("Whisper 模型加载成功。", flush=True)
+            return model
+        except Exception as e:
+            print(f"模型加载失败，尝试重新下载: {e}", flush=True)
+            raise e
+
+    def _model_spec(self, config_json: dict) -> ModelSpec:
+        defaults = ModelSpec(device=self.device, compute_type=self.compute_type)
+        return defaults._replace(
+            # 允许通过配置指定模型名称或路径，默认为 tiny
+            model_path=config_json.get("model_path", defaults.model_path),
+            device=config_json.get("device", defaults.device),
+            compute_type=config_json.get("compute_type", defaults.compute_type),
+            cpu_threads=int(config_json.get("cpu_threads", defaults.cpu_threads)),
+            num_workers=int(config_json.get("num_workers", defaults.num_workers)),
+        )
 
     def warm_up(self):
         """预热模型：检查并下载默认模型"""
         try:
             print("[ASR] 正在预热 Whisper 模型...", flush=True)
             # 预热默认的 tiny 模型
-            self._load_model("tiny", self.device, self.compute_type)
+            self.models.load(self._model_spec({}))
         except Exception as e:
             print(f"[ASR] 预热失败 (非致命): {e}", flush=True)
 
-    async def transcribe(self, audio_path: str) -> Optional[str]:
+    async def transcribe(self, audio: AudioInput) -> Optional[str]:
         """
-        识别音频文件
+        识别音频。audio 可以是文件路径、音频文件字节或 16kHz float32 波形，
+        内存中的音频直接交给模型，不再落盘
         """
         config = await self._get_active_config()
         if not config:
             # Fallback to local whisper
-             return await self._transcribe_local(audio_path, {}, None)
+             return await self._transcribe_local(audio, {}, None)
 
         try:
             config_json = json.loads(config.config_json)
@@ -119,39 +142,49 @@ class ASRService:
             config_json = {}
 
         if config.provider == "local_whisper":
-            return await self._transcribe_local(audio_path, config_json, config)
+            return await self._transcribe_local(audio, config_json, config)
         elif config.provider == "openai_compatible":
-            return await self._transcribe_openai(audio_path, config_json, config)
+            return await self._transcribe_openai(audio, config_json, config)
         else:
-            return await self._transcribe_local(audio_path, config_json, config)
+            return await self._transcribe_local(audio, config_json, config)
 
-    async def _transcribe_local(self, audio_path: str, config_json: dict, config: Optional[VoiceConfig]) -> Optional[str]:
-        async with self._lock:
-            try:
-                loop = asyncio.get_event_loop()
-                return await loop.run_in_executor(None, self._transcribe_sync, audio_path, config_json)
-            except Exception as e:
-                print(f"ASR 错误: {e}")
-                # 重新抛出异常，以便上层捕获并通知前端
-                raise e
+    async def create_stream(self, on_partial=None, on_final=None, input_rate: int = ASR_SAMPLE_RATE):
+        """
+        创建流式转写会话 (StreamingTranscriber)。本地 Whisper 在说话过程中产出部分转写；
+        远程 API 每次解码都是一次请求，只在句末做最终转写。
+        """
+        config = await self._get_active_config()
+        try:
+            config_json = json.loads(config.config_json) if config else {}
+        except:
+            config_json = {}
 
-    def _transcribe_sync(self, audio_path: str, config_json: dict) -> str:
-        device = config_json.get("device", "cpu")
-        compute_type = config_json.get("compute_type", "int8")
-        
-        # 允许通过配置指定模型名称或路径，默认为 tiny
-        model_name = config_json.get("model_path", "tiny")
-        
-        self._load_model(model_name, device, compute_type)
-        segments, info = self._model.transcribe(audio_path, beam_size=5, language="zh", task="transcribe")
-        
-        full_text = ""
-        for segment in segments:
-            full_text += segment.text
-            
-        return full_text.strip()
+        if config and config.provider == "openai_compatible":
+            async def decode(samples: np.ndarray, partial: bool) -> str:
+                return await self._transcribe_openai(samples, config_json, config) or ""
+            return StreamingTranscriber(decode, on_final=on_final, input_rate=input_rate, partial_interval=None)
+
+        async def decode(samples: np.ndarray, partial: bool) -> str:
+            # 部分转写使用贪心解码，速度优先，排队时让位于句末转写；句末再用 beam search
+            return await self._transcribe_local(samples, config_json, config, partial=partial) or ""
+        return StreamingTranscriber(decode, on_partial=on_partial, on_final=on_final, input_rate=input_rate)
+
+    async def _transcribe_local(self, audio_path: AudioInput, config_json: dict, config: Optional[VoiceConfig],
+                                partial: bool = False) -> Optional[str]:
+        beam_size = 1 if partial else int(config_json.get("beam_size", 5))
+        priority = PRIORITY_PARTIAL if partial else PRIORITY_FINAL
+        try:
+            return await self.models.transcribe(self._model_spec(config_json), audio_path, beam_size, priority)
+        except Exception as e:
+            print(f"ASR 错误: {e}")
+            # 重新抛出异常，以便上层捕获并通知前端
+            raise e
+
+    def get_stats(self) -> dict:
+        """排队等待 / 解码耗时等指标"""
+        return self.models.get_stats()
 
-    async def _transcribe_openai(self, audio_path: str, config_json: dict, config: VoiceConfig) -> Optional[str]:
+    async def _transcribe_openai(self, audio_path: AudioInput, config_json: dict, config: VoiceConfig) -> Optional[str]:
         try:
             url = f"{config.api_base}/audio/transcriptions" if config.api_base else "https://api.openai.com/v1/audio/transcriptions"
             
@@ -164,15 +197,23 @@ class ASRService:
                 "model": config.model or "whisper-1",
             }
             
-            # Read file content
-            if not os.path.exists(audio_path):
-                return None
-                
-            async with httpx.AsyncClient(timeout=60.0) as client:
+            if isinstance(audio_path, np.ndarray):
+                audio_path = encode_wav(audio_path, ASR_SAMPLE_RATE)
+
+            if isinstance(audio_path, (bytes, bytearray)):
+                file_name, content = "audio.wav", bytes(audio_path)
+            else:
+                # Read file content
+                if not os.path.exists(audio_path):
+                    return None
+                # 使用文件名作为 file 字段的 filename
+                file_name = os.path.basename(audio_path)
                 with open(audio_path, "rb") as f:
-                    # 使用文件名作为 file 字段的 filename
-                    files = {"file": (os.path.basename(audio_path), f, "audio/wav")} 
-                    response = await client.post(url, headers=headers, data=data, files=files)
+                    content = f.read()
+
+            async with httpx.AsyncClient(timeout=60.0) as client:
+                files = {"file": (file_name, content, "audio/wav")}
+                response = await client.post(url, headers=headers, data=data, files=files)
                     
                 if response.status_code != 200:
                     print(f"OpenAI ASR API 错误: {response.text}")
@@ -1,68 +1,210 @@
+import io
 import os
-import parselmouth
-from parselmouth.praat import call
+import sys
+import wave
+import asyncio
+import tempfile
 import logging
-from typing import Optional
+import numpy as np
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+try:
+    import parselmouth
+    from parselmouth.praat import call
+except ImportError:
+    parselmouth = None
+    call = None
 
 logger = logging.getLogger(__name__)
 
+# 音频后处理进程池大小与排队上限 (超出时跳过后处理，直接使用原始音频)
+AUDIO_WORKERS = max(1, int(os.environ.get("PERO_AUDIO_WORKERS", "1")))
+AUDIO_QUEUE_SIZE = max(0, int(os.environ.get("PERO_AUDIO_QUEUE_SIZE", "4")))
+# 可爱化默认参数：音高乘数 / 共振峰乘数
+CUTE_PITCH_FACTOR = 1.2
+CUTE_FORMANT_FACTOR = 1.1
+
+
+class AudioQueueFullError(RuntimeError):
+    """后处理队列已满"""
+
+
+def decode_audio(data: bytes) -> Tuple[np.ndarray, int]:
+    """把编码音频解码为 (单声道 float64 采样 [-1, 1], 采样率)。wav 直接解析，其余格式需要 pydub (ffmpeg)。"""
+    if data[:4] == b"RIFF":
+        with wave.open(io.BytesIO(data)) as wav:
+            channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+        if width == 1:
+            samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float64) - 128) / 128
+        else:
+            dtype = {2: "<i2", 4: "<i4"}[width]
+            samples = np.frombuffer(frames, dtype=dtype).astype(np.float64) / float(1 << (8 * width - 1))
+        return samples.reshape(-1, channels).mean(axis=1), rate
+
+    from pydub import AudioSegment
+    segment = AudioSegment.from_file(io.BytesIO(data))
+    samples = np.array(segment.get_array_of_samples(), dtype=np.float64)
+    samples /= float(1 << (8 * segment.sample_width - 1))
+    return samples.reshape(-1, segment.channels).mean(axis=1), segment.frame_rate
+
+
+def encode_wav(samples: np.ndarray, sample_rate: int) -> bytes:
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(int(sample_rate))
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def encode_audio(samples: np.ndarray, sample_rate: int, output_format: str = "wav") -> bytes:
+    """编码为 wav 或 mp3 (mp3 需要 pydub，未安装时退回 wav)"""
+    wav_bytes = encode_wav(samples, sample_rate)
+    if output_format != "mp3":
+        return wav_bytes
+    try:
+        from pydub import AudioSegment
+    except ImportError:
+        logger.warning("未安装 pydub，保留 wav 格式作为后备")
+        return wav_bytes
+    buffer = io.BytesIO()
+    AudioSegment.from_wav(io.BytesIO(wav_bytes)).export(buffer, format="mp3")
+    return buffer.getvalue()
+
+
+def _load_sound(data: bytes):
+    try:
+        samples, rate = decode_audio(data)
+        return parselmouth.Sound(samples, sampling_frequency=rate)
+    except Exception:
+        # 没有 pydub / ffmpeg 时无法在内存中解码 mp3，交给 Praat 从临时文件读取 (仍在工作进程内)
+        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as f:
+            f.write(data)
+        try:
+            return parselmouth.Sound(f.name)
+        finally:
+            os.remove(f.name)
+
+
+def _cute_worker(data: bytes, pitch_factor: float, formant_factor: float, output_format: str) -> bytes:
+    """在工作进程中执行：解码 -> Praat "Change gender" -> 编码，全部在内存中完成"""
+    if parselmouth is None:
+        raise RuntimeError("未安装 parselmouth，无法进行音色后处理")
+    sound = _load_sound(data)
+    # 使用 Praat "Change gender" 算法调整音高和共振峰。
+    # 参数说明：75.0-600.0 为共振峰范围，后序参数依次为：共振峰偏移、音高偏移、音高范围比(1.0)、时长比(1.0)。
+    new_sound = call(sound, "Change gender", 75.0, 600.0,
+                     formant_factor, pitch_factor, 1.0, 1.0)
+    return encode_audio(new_sound.values[0], new_sound.sampling_frequency, output_format)
+
+
+@contextmanager
+def _without_main_script():
+    """
+    spawn / forkserver 启动的工作进程默认会以 __mp_main__ 身份重新执行主脚本 (Windows 上即 main.py：
+    启动打印、日志配置和整套服务导入)。工作函数都在本模块中，不需要主脚本；
+    启动工作进程期间临时隐藏 __main__.__file__，子进程就只导入本模块。
+    """
+    main = sys.modules.get("__main__")
+    path = getattr(main, "__file__", None)
+    if path is None or getattr(main, "__spec__", None) is not None:
+        yield
+        return
+    del main.__file__
+    try:
+        yield
+    finally:
+        main.__file__ = path
+
+
 class AudioProcessor:
     """
     音频后处理服务，用于调整音高、共振峰等，使声音更可爱。
+    Praat 处理是 CPU 密集的同步计算，统一放到独立的进程池中执行，不阻塞事件循环；
+    进程池排队有上限，超出时直接放弃后处理。
     """
-    
-    @staticmethod
-    async def process_voice_cute(input_path: str, output_path: str, 
-                                pitch_factor: float = 1.2, 
-                                formant_factor: float = 1.1) -> bool:
+
+    def __init__(self, max_workers: int = AUDIO_WORKERS, queue_size: int = AUDIO_QUEUE_SIZE, mp_context=None):
+        self.max_workers = max_workers
+        self.mp_context = mp_context
+        self.max_pending = max_workers + queue_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self.mp_context)
+        return self._executor
+
+    async def run(self, func, *args):
+        """在进程池中执行 func(*args)；排队已满时抛出 AudioQueueFullError"""
+        if self._pending >= self.max_pending:
+            raise AudioQueueFullError(f"音频后处理队列已满 ({self._pending})")
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            # 工作进程在 submit 时按需启动
+            with _without_main_script():
+                future = loop.run_in_executor(self._get_executor(), func, *args)
+            return await future
+        except BrokenProcessPool:
+            # 工作进程异常退出，下次调用时重建进程池
+            self._executor = None
+            raise
+        finally:
+            self._pending -= 1
+
+    def shutdown(self, wait: bool = False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    async def process_voice_cute_bytes(self, audio: bytes,
+                                       pitch_factor: float = CUTE_PITCH_FACTOR,
+                                       formant_factor: float = CUTE_FORMANT_FACTOR,
+                                       output_format: str = "wav") -> Optional[bytes]:
         """
-        通过调整音高和共振峰使声音变可爱。
-        
+        通过调整音高和共振峰使声音变可爱 (内存版本)。
+
         Args:
-            input_path: 输入文件路径 (mp3/wav)
-            output_path: 输出文件路径 (wav/mp3)
+            audio: 编码后的音频 (mp3/wav)
             pitch_factor: 音高乘数，建议 1.1 - 1.3
             formant_factor: 共振峰乘数，建议 1.05 - 1.2 (使喉管听起来更小)
+            output_format: "wav" 或 "mp3"
+        Returns:
+            处理后的音频字节，失败返回 None
         """
         try:
-            if not os.path.exists(input_path):
-                logger.error(f"未找到输入文件: {input_path}")
-                return False
-                
-            # 加载声音
-            sound = parselmouth.Sound(input_path)
-            
-            # 使用 Praat "Change gender" 算法调整音高和共振峰。
-            # 参数说明：75.0-600.0 为共振峰范围，后序参数依次为：共振峰偏移、音高偏移、音高范围比(1.0)、时长比(1.0)。
-            
-            new_sound = call(sound, "Change gender", 75.0, 600.0, 
-                            formant_factor, pitch_factor, 1.0, 1.0)
-            
-            # 保存结果
-            # 如果输出是 mp3，parselmouth 不直接支持，先存为 wav
-            if output_path.lower().endswith(".mp3"):
-                temp_wav = output_path.replace(".mp3", "_temp.wav")
-                new_sound.save(temp_wav, "WAV")
-                
-                # 使用 ffmpeg 转换 (如果安装了 pydub，可以间接使用)
-                try:
-                    from pydub import AudioSegment
-                    audio = AudioSegment.from_wav(temp_wav)
-                    audio.export(output_path, format="mp3")
-                    if os.path.exists(temp_wav):
-                        os.remove(temp_wav)
-                except ImportError:
-                    logger.warning("未安装 pydub，保留 wav 格式作为后备")
-                    # 如果没有 pydub，只能改名存为 wav 或报错
-                    new_sound.save(output_path, "WAV")
-            else:
-                new_sound.save(output_path, "WAV")
-                
-            return True
-            
+            return await self.run(_cute_worker, audio, pitch_factor, formant_factor, output_format)
         except Exception as e:
             logger.error(f"处理音频出错: {e}")
+            return None
+
+    async def process_voice_cute(self, input_path: str, output_path: str,
+                                 pitch_factor: float = CUTE_PITCH_FACTOR,
+                                 formant_factor: float = CUTE_FORMANT_FACTOR) -> bool:
+        """
+        文件版本：读取 input_path，处理后写入 output_path (wav/mp3，按扩展名决定)。
+        """
+        if not os.path.exists(input_path):
+            logger.error(f"未找到输入文件: {input_path}")
+            return False
+
+        with open(input_path, "rb") as f:
+            data = f.read()
+        output_format = "mp3" if output_path.lower().endswith(".mp3") else "wav"
+        result = await self.process_voice_cute_bytes(data, pitch_factor, formant_factor, output_format)
+        if result is None:
             return False
+        with open(output_path, "wb") as f:
+            f.write(result)
+        return True
 
 # 单例实例
 audio_processor = AudioProcessor()
@@ -0,0 +1,61 @@
+"""
+音频分帧推送的辅助函数
+
+Gateway 的 DataStream 以固定大小的帧发送音频 (同一 stream_id，最后一帧 is_end=True)，
+客户端可以边收边处理，大段音频也不必整块读入内存。
+"""
+
+import os
+import mimetypes
+from typing import Iterator, Optional, Union
+
+AUDIO_STREAM_CHUNK_SIZE = max(1024, int(os.environ.get("PERO_AUDIO_STREAM_CHUNK_SIZE", str(32 * 1024))))
+
+AUDIO_MIME_BY_EXT = {
+    ".mp3": "audio/mpeg",
+    ".wav": "audio/wav",
+    ".ogg": "audio/ogg",
+    ".opus": "audio/ogg",
+    ".flac": "audio/flac",
+    ".m4a": "audio/mp4",
+    ".pcm": "audio/pcm",
+}
+
+
+def detect_audio_mime(head: bytes, filename: Optional[str] = None) -> str:
+    """优先根据文件头识别音频格式，识别不了再按扩展名推断，默认 audio/mpeg。"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "audio/wav"
+    if head[:4] == b"OggS":
+        return "audio/ogg"
+    if head[:4] == b"fLaC":
+        return "audio/flac"
+    if head[4:8] == b"ftyp":
+        return "audio/mp4"
+    if head[:3] == b"ID3" or (len(head) >= 2 and head[0] == 0xFF and (head[1] & 0xE0) == 0xE0):
+        return "audio/mpeg"
+
+    if filename:
+        ext = os.path.splitext(filename)[1].lower()
+        if ext in AUDIO_MIME_BY_EXT:
+            return AUDIO_MIME_BY_EXT[ext]
+        guessed, _ = mimetypes.guess_type(filename)
+        if guessed and guessed.startswith("audio/"):
+            return guessed
+    return "audio/mpeg"
+
+
+def iter_audio_chunks(source: Union[str, bytes], chunk_size: int = AUDIO_STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """按固定大小切分音频；source 为文件路径时逐块读取，不整体载入内存。"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for start in range(0, len(view), chunk_size):
+            yield bytes(view[start:start + chunk_size])
+        return
+
+    with open(source, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
@@ -11,6 +11,7 @@ if backend_dir not in sys.path:
 # from services.vector_service import VectorService # 已弃用
 from services.embedding_service import embedding_service
 from services.memory_service import MemoryService
+from services.turn_cache import encode_query
 from services.mdp.manager import mdp
 from core.config_manager import get_config_manager
 
@@ -99,7 +100,7 @@ class ThinkingChainService:
             return {"chain_name": chain_name, "steps": [], "error": "Chain not found"}
 
         chain_steps = self.chains[chain_name]
-        query_embedding = self.embedding_service.encode_one(query)
+        query_embedding = encode_query(query)
         
         results = {
             "chain_name": chain_name,
@@ -253,7 +254,7 @@ class ThinkingChainService:
             top_contents = sorted(all_weekly_contents, key=len, reverse=True)[:3]
             combined_query = " ".join(top_contents)[:1000] # 限制长度
             
-            query_vec = self.embedding_service.encode_one(combined_query)
+            query_vec = encode_query(combined_query)
             
             # 使用过滤器搜索：timestamp < one_week_ago
             hist_filter = {"timestamp": {"$lt": one_week_ago}}
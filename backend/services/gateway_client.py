@@ -186,6 +186,35 @@ class GatewayClient:
             data = envelope.SerializeToString()
             await self.websocket.send(data)
 
+    async def send_stream(self, target_id: str, chunks, content_type: str, trace_id: str = "") -> bool:
+        """以同一 stream_id 分帧发送二进制流，最后补发一个空的 is_end 结束帧。
+        websocket.send 会等待写缓冲排空，逐帧 await 即形成背压；连接断开时中止并返回 False。"""
+        stream_id = str(uuid.uuid4())
+        for data in chunks:
+            if not data:
+                continue
+            if not await self._send_stream_frame(target_id, trace_id, stream_id, data, False, content_type):
+                return False
+        return await self._send_stream_frame(target_id, trace_id, stream_id, b"", True, content_type)
+
+    async def _send_stream_frame(self, target_id, trace_id, stream_id, data, is_end, content_type) -> bool:
+        if not self.websocket:
+            return False
+        envelope = perolink_pb2.Envelope()
+        envelope.id = str(uuid.uuid4())
+        envelope.source_id = self.device_id
+        envelope.target_id = target_id
+        envelope.timestamp = int(time.time() * 1000)
+        envelope.trace_id = trace_id
+
+        envelope.stream.stream_id = stream_id
+        envelope.stream.data = data
+        envelope.stream.is_end = is_end
+        envelope.stream.content_type = content_type
+
+        await self.send(envelope)
+        return True
+
     async def handle_envelope(self, envelope):
         # logger.info(f"Received Envelope: {envelope.id} from {envelope.source_id}")
         
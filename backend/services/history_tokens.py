@@ -0,0 +1,110 @@
+"""
+对话历史 Token 计数
+
+HistoryPreprocessor 在工作模式下按 Token 预算截取上下文窗口。以前每个请求都要拉取 200 条记录、
+逐条清理并用 tiktoken 重新编码；现在：
+- 工作模式会话 (is_token_budget_session) 写入 ConversationLog 时按清理后的内容计数一次，
+  存入 token_count / token_version；其他会话不会用到计数，不做编码
+- 旧记录 (计数为空) 或清理规则变更后的记录按 (log id, 版本) 懒计算，缓存在进程内
+- 内容被编辑时通过 ORM 事件清空计数
+"""
+
+import re
+from collections import OrderedDict
+from typing import Optional, Tuple
+from sqlalchemy import event
+from models import ConversationLog
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# 清理规则或编码器变化时递增，已存储的计数随之失效
+TOKEN_COUNT_VERSION = 1
+MEMO_SIZE = 4096
+
+_RAG_BLOCK_START = re.compile(r'<!-- PERO_RAG_BLOCK_START.*?-->', re.S)
+_RAG_BLOCK_END = re.compile(r'<!-- PERO_RAG_BLOCK_END -->', re.S)
+_UPPER_TAG_BLOCK = re.compile(r'<([A-Z_]+)>.*?</\1>', re.S)
+_ANY_TAG = re.compile(r'<[^>]+>')
+
+_encoding = None
+_encoding_error = None
+_memo: "OrderedDict[Tuple[int, int], int]" = OrderedDict()
+
+
+def clean_history_content(content: str) -> str:
+    """移除 RAG 标记、<TAG>...</TAG> 块与其余标签 (与发送给模型的历史内容一致)。"""
+    content = _RAG_BLOCK_START.sub('', content)
+    content = _RAG_BLOCK_END.sub('', content)
+    content = _UPPER_TAG_BLOCK.sub('', content)
+    content = _ANY_TAG.sub('', content)
+    return content.strip()
+
+
+def _get_encoding():
+    global _encoding, _encoding_error
+    if _encoding is None and _encoding_error is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base") # 适用于 GPT-4/GPT-3.5
+        except Exception as e:
+            # 例如离线环境无法下载编码文件
+            _encoding_error = e
+            print(f"[History] 无法加载 tiktoken 编码 cl100k_base: {e}")
+    return _encoding
+
+
+def is_token_budget_session(source: str, session_id: str) -> bool:
+    """工作模式 (work_* 会话或 IDE) 按 Token 预算截取历史，只有这些会话需要计数。"""
+    return session_id.startswith("work_") or source == "ide"
+
+
+def tokens_available() -> bool:
+    return _get_encoding() is not None
+
+
+def count_tokens(text: str) -> Optional[int]:
+    """cl100k_base 编码的 Token 数；tiktoken 不可用时返回 None。"""
+    encoding = _get_encoding()
+    if encoding is None:
+        return None
+    return len(encoding.encode(text)) if text else 0
+
+
+def stamp_token_count(log: ConversationLog):
+    """写入时计算并记录 Token 数。"""
+    count = count_tokens(clean_history_content(log.content or ""))
+    log.token_count = count
+    log.token_version = TOKEN_COUNT_VERSION if count is not None else None
+
+
+def get_token_count(log: ConversationLog, cleaned: Optional[str] = None) -> Optional[int]:
+    """读取记录的 Token 数：优先使用已存储的计数，否则按 (log id, 版本) 懒计算。"""
+    if log.token_count is not None and log.token_version == TOKEN_COUNT_VERSION:
+        return log.token_count
+
+    key = (log.id, TOKEN_COUNT_VERSION)
+    if log.id is not None:
+        count = _memo.get(key)
+        if count is not None:
+            _memo.move_to_end(key)
+            return count
+
+    count = count_tokens(cleaned if cleaned is not None else clean_history_content(log.content or ""))
+    if count is not None and log.id is not None:
+        _memo[key] = count
+        if len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return count
+
+
+@event.listens_for(ConversationLog.content, "set")
+def _invalidate_token_count(target, value, oldvalue, initiator):
+    """内容被编辑 (如 /api/history/{id}) 后，已存储与缓存的计数都不再有效。"""
+    if value == oldvalue:
+        return
+    target.token_count = None
+    target.token_version = None
+    if target.id is not None:
+        _memo.pop((target.id, TOKEN_COUNT_VERSION), None)
@@ -0,0 +1,177 @@
+import os
+import time
+import asyncio
+import inspect
+import importlib.util
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+
+# HTTP/2 需要可选依赖 h2，未安装时回退到 HTTP/1.1 keep-alive
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class LLMClientPool:
+    """
+    进程级 LLM HTTP 客户端注册表
+    - 按 api_base 复用 httpx.AsyncClient (keep-alive + HTTP/2)，ReAct 多轮调用不再重复 TCP/TLS 握手
+    - 连接池上限可通过环境变量配置
+    - 厂商 SDK 客户端按 (类型, api_key, base_url) 复用，最多保留 PERO_LLM_MAX_SDK_CLIENTS 个 (LRU)，淘汰时关闭
+    - 记录每个 api_base 的连接复用率与首字节时间 (TTFB)
+    - 在 FastAPI lifespan 结束时统一关闭
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(LLMClientPool, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self.limits = httpx.Limits(
+            max_connections=_env_int("PERO_LLM_MAX_CONNECTIONS", 20),
+            max_keepalive_connections=_env_int("PERO_LLM_MAX_KEEPALIVE", 10),
+            keepalive_expiry=_env_float("PERO_LLM_KEEPALIVE_EXPIRY", 90.0),
+        )
+        self.http2 = HTTP2_AVAILABLE and os.environ.get("PERO_LLM_HTTP2", "true").lower() != "false"
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self.max_sdk_clients = max(1, _env_int("PERO_LLM_MAX_SDK_CLIENTS", 16))
+        self._sdk_clients: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._metrics: Dict[str, Dict[str, float]] = {}
+        self._initialized = True
+
+    def get_client(self, api_base: str) -> httpx.AsyncClient:
+        """获取 api_base 对应的共享客户端 (调用方不要关闭它)。"""
+        key = (api_base or "").rstrip('/')
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=self.limits,
+                timeout=httpx.Timeout(300.0, connect=15.0),
+                event_hooks={
+                    "request": [self._on_request],
+                    "response": [self._make_response_hook(key)],
+                },
+            )
+            self._clients[key] = client
+        return client
+
+    def get_sdk_client(self, kind: str, key: tuple, factory: Callable[[], Any]) -> Any:
+        """复用厂商 SDK 客户端 (如 genai.Client)，避免每次调用都重建其内部连接池。"""
+        cache_key = (kind, *key)
+        client = self._sdk_clients.get(cache_key)
+        if client is not None:
+            self._sdk_clients.move_to_end(cache_key)
+            return client
+        client = factory()
+        self._sdk_clients[cache_key] = client
+        while len(self._sdk_clients) > self.max_sdk_clients:
+            _, evicted = self._sdk_clients.popitem(last=False)
+            try:
+                asyncio.get_running_loop().create_task(self._close_sdk_client(evicted))
+            except RuntimeError:
+                pass  # 没有运行中的事件循环，交给垃圾回收
+        return client
+
+    async def _close_sdk_client(self, client: Any):
+        """关闭 SDK 客户端自己持有的连接；包装了本池共享 httpx 客户端的 (如 anthropic) 不关闭共享连接。"""
+        if any(getattr(client, "_client", None) is shared for shared in self._clients.values()):
+            return
+        closers = [
+            getattr(getattr(client, "aio", None), "aclose", None),  # genai.Client 的异步客户端
+            getattr(client, "aclose", None) or getattr(client, "close", None),
+        ]
+        for closer in closers:
+            if closer is None:
+                continue
+            try:
+                result = closer()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"[LLMClientPool] 关闭 SDK 客户端失败: {e}")
+
+    async def _on_request(self, request: httpx.Request):
+        state = {"start": time.perf_counter(), "new_connection": False}
+
+        async def trace(event_name: str, info: dict):
+            if event_name == "connection.connect_tcp.started":
+                state["new_connection"] = True
+
+        request.extensions["pero_pool_state"] = state
+        request.extensions["trace"] = trace
+
+    def _make_response_hook(self, key: str):
+        async def on_response(response: httpx.Response):
+            state = response.request.extensions.get("pero_pool_state")
+            if not state:
+                return
+            # 响应头到达即触发，因此这里的耗时就是 TTFB
+            ttfb_ms = (time.perf_counter() - state["start"]) * 1000
+            m = self._metrics.setdefault(key, {
+                "requests": 0, "new_connections": 0, "reused_connections": 0,
+                "ttfb_ms_total": 0.0, "ttfb_ms_max": 0.0, "ttfb_ms_last": 0.0,
+            })
+            m["requests"] += 1
+            if state["new_connection"]:
+                m["new_connections"] += 1
+            else:
+                m["reused_connections"] += 1
+            m["ttfb_ms_total"] += ttfb_ms
+            m["ttfb_ms_max"] = max(m["ttfb_ms_max"], ttfb_ms)
+            m["ttfb_ms_last"] = ttfb_ms
+        return on_response
+
+    def get_metrics(self) -> Dict[str, Any]:
+        hosts = {}
+        for key, m in self._metrics.items():
+            requests = m["requests"] or 1
+            hosts[key] = {
+                "requests": m["requests"],
+                "new_connections": m["new_connections"],
+                "reused_connections": m["reused_connections"],
+                "reuse_ratio": round(m["reused_connections"] / requests, 3),
+                "ttfb_ms_avg": round(m["ttfb_ms_total"] / requests, 1),
+                "ttfb_ms_max": round(m["ttfb_ms_max"], 1),
+                "ttfb_ms_last": round(m["ttfb_ms_last"], 1),
+            }
+        return {
+            "http2": self.http2,
+            "limits": {
+                "max_connections": self.limits.max_connections,
+                "max_keepalive_connections": self.limits.max_keepalive_connections,
+                "keepalive_expiry": self.limits.keepalive_expiry,
+            },
+            "hosts": hosts,
+        }
+
+    async def aclose(self):
+        """关闭所有共享连接 (FastAPI lifespan 关闭阶段调用)。"""
+        sdk_clients = list(self._sdk_clients.values())
+        self._sdk_clients.clear()
+        await asyncio.gather(*(self._close_sdk_client(c) for c in sdk_clients), return_exceptions=True)
+        clients = list(self._clients.values())
+        self._clients.clear()
+        await asyncio.gather(*(c.aclose() for c in clients), return_exceptions=True)
+
+
+llm_client_pool = LLMClientPool()
@@ -3,10 +3,18 @@ import json
 import asyncio
 import base64
 import os
+import time
 from typing import AsyncIterable, List, Dict, Any, Optional
 from google import genai
 from google.genai import types
 import anthropic
+from services.llm_client_pool import llm_client_pool
+from services.sse_decoder import iter_sse_deltas
+
+# 文本 delta 合并窗口 (毫秒)，0 表示只合并同一次网络读取内的 delta
+STREAM_COALESCE_MS = float(os.environ.get("PERO_LLM_STREAM_COALESCE_MS", "15"))
+# 设置后将原始 SSE 字节流录制到该目录，供 benchmarks 回放
+STREAM_RECORD_DIR = os.environ.get("PERO_LLM_STREAM_RECORD_DIR")
 
 # 默认 API Base URL 配置 (用户未提供时使用)
 DEFAULT_API_BASES = {
@@ -109,15 +117,15 @@ class LLMService:
         if tools:
             payload["tools"] = tools
 
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            try:
-                response = await client.post(url, headers=headers, json=payload)
-                if response.status_code != 200:
-                    self._handle_http_error(response)
-                return response.json()
-            except Exception as e:
-                print(f"[LLM] 请求异常: {e}")
-                raise
+        client = llm_client_pool.get_client(self.api_base)
+        try:
+            response = await client.post(url, headers=headers, json=payload, timeout=timeout)
+            if response.status_code != 200:
+                self._handle_http_error(response)
+            return response.json()
+        except Exception as e:
+            print(f"[LLM] 请求异常: {e}")
+            raise
 
     def _debug_print_payload(self, payload):
         """调试：打印 payload 结构（不包含大型 base64 数据）"""
@@ -152,7 +160,7 @@ class LLMService:
     async def _chat_gemini(self, messages: List[Dict[str, Any]], temperature: float = 0.7, tools: List[Dict] = None) -> Dict[str, Any]:
         """Gemini 原生 API 调用 (使用 google-genai SDK)"""
         try:
-            client = genai.Client(api_key=self.api_key)
+            client = self._get_genai_client(self.api_key)
             contents = self._convert_to_genai_contents(messages)
             
             system_instruction = None
@@ -225,10 +233,7 @@ class LLMService:
     async def _chat_anthropic(self, messages: List[Dict[str, Any]], temperature: float = 0.7, tools: List[Dict] = None) -> Dict[str, Any]:
         """Anthropic 原生 API 调用 (使用 anthropic SDK)"""
         try:
-            client = anthropic.AsyncAnthropic(
-                api_key=self.api_key,
-                base_url=self.api_base if self.api_base != "https://api.openai.com" and self.api_base else None
-            )
+            client = self._get_anthropic_client(self.api_key, self.api_base)
             
             system_prompt, anthropic_messages = self._convert_to_anthropic_format(messages)
             anthropic_tools = self._convert_tools_to_anthropic(tools)
@@ -284,6 +289,20 @@ class LLMService:
             print(f"[Anthropic] SDK 错误: {e}")
             raise
 
+    def _get_genai_client(self, api_key: str):
+        return llm_client_pool.get_sdk_client("gemini", (api_key,), lambda: genai.Client(api_key=api_key))
+
+    def _get_anthropic_client(self, api_key: str, api_base: Optional[str]):
+        base_url = api_base if api_base and api_base != "https://api.openai.com" else None
+        return llm_client_pool.get_sdk_client(
+            "anthropic", (api_key, base_url),
+            lambda: anthropic.AsyncAnthropic(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=llm_client_pool.get_client(base_url or "https://api.anthropic.com")
+            )
+        )
+
     # ... (Keep helper methods like _convert_to_genai_contents, etc. - will copy them below) ...
     
     def _convert_to_genai_contents(self, messages: List[Dict[str, Any]]) -> List[types.Content]:
@@ -443,7 +462,7 @@ class LLMService:
         """获取模型列表"""
         if self.provider == "gemini":
             try:
-                client = genai.Client(api_key=self.api_key)
+                client = self._get_genai_client(self.api_key)
                 models = await asyncio.to_thread(client.models.list)
                 return [m.name for m in models if "generateContent" in m.supported_generation_methods]
             except Exception as e:
@@ -452,7 +471,7 @@ class LLMService:
         
         elif self.provider in ["claude", "anthropic"]:
             try:
-                client = anthropic.AsyncAnthropic(api_key=self.api_key)
+                client = self._get_anthropic_client(self.api_key, None)
                 models = await client.models.list()
                 return sorted([m.id for m in models.data])
             except Exception as e:
@@ -478,39 +497,39 @@ class LLMService:
 
         try:
             print(f"正在获取模型列表: {url}")
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(url, headers=headers)
-                
-                # 如果失败，尝试去掉 /v1
-                if response.status_code != 200 and "/v1" in url:
-                    alt_url = url.replace("/v1", "")
-                    print(f"尝试备用 URL: {alt_url}")
-                    response = await client.get(alt_url, headers=headers)
-                
-                if response.status_code != 200:
-                    print(f"远程 API 错误: {response.status_code} - {response.text}")
-                    return []
-                
-                data = response.json()
-                model_list = []
-                if isinstance(data, list):
-                    model_list = data
-                elif isinstance(data, dict):
-                    if "data" in data and isinstance(data["data"], list):
-                        model_list = data["data"]
-                    elif "models" in data and isinstance(data["models"], list):
-                        model_list = data["models"]
-                
-                ids = []
-                for m in model_list:
-                    if isinstance(m, str):
-                        ids.append(m)
-                    elif isinstance(m, dict) and "id" in m:
-                        ids.append(m["id"])
-                    elif isinstance(m, dict) and "name" in m:
-                        ids.append(m["name"])
-                
-                return sorted(list(set(ids)))
+            client = llm_client_pool.get_client(self.api_base)
+            response = await client.get(url, headers=headers, timeout=10.0)
+            
+            # 如果失败，尝试去掉 /v1
+            if response.status_code != 200 and "/v1" in url:
+                alt_url = url.replace("/v1", "")
+                print(f"尝试备用 URL: {alt_url}")
+                response = await client.get(alt_url, headers=headers, timeout=10.0)
+            
+            if response.status_code != 200:
+                print(f"远程 API 错误: {response.status_code} - {response.text}")
+                return []
+            
+            data = response.json()
+            model_list = []
+            if isinstance(data, list):
+                model_list = data
+            elif isinstance(data, dict):
+                if "data" in data and isinstance(data["data"], list):
+                    model_list = data["data"]
+                elif "models" in data and isinstance(data["models"], list):
+                    model_list = data["models"]
+            
+            ids = []
+            for m in model_list:
+                if isinstance(m, str):
+                    ids.append(m)
+                elif isinstance(m, dict) and "id" in m:
+                    ids.append(m["id"])
+                elif isinstance(m, dict) and "name" in m:
+                    ids.append(m["name"])
+            
+            return sorted(list(set(ids)))
         except Exception as e:
             print(f"获取模型列表错误: {e}")
             return []
@@ -558,44 +577,49 @@ class LLMService:
         if tools:
             payload["tools"] = tools
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            try:
-                if not stream:
-                    # 非流式回退
-                    response = await client.post(url, headers=headers, json=payload)
-                    if response.status_code != 200:
-                        yield {"content": f"错误: {response.status_code} - {response.text}"}
-                        return
-                    data = response.json()
-                    if data.get("choices"):
-                         yield {"content": data["choices"][0]["message"].get("content", "")}
+        client = llm_client_pool.get_client(api_base)
+        try:
+            if not stream:
+                # 非流式回退
+                response = await client.post(url, headers=headers, json=payload, timeout=60.0)
+                if response.status_code != 200:
+                    yield {"content": f"错误: {response.status_code} - {response.text}"}
                     return
+                data = response.json()
+                if data.get("choices"):
+                     yield {"content": data["choices"][0]["message"].get("content", "")}
+                return
 
-                async with client.stream("POST", url, headers=headers, json=payload) as response:
-                    if response.status_code != 200:
-                        yield {"content": f"错误: {response.status_code} - {await response.aread()}"}
-                        return
+            async with client.stream("POST", url, headers=headers, json=payload, timeout=60.0) as response:
+                if response.status_code != 200:
+                    yield {"content": f"错误: {response.status_code} - {await response.aread()}"}
+                    return
 
-                    async for line in response.aiter_lines():
-                        if line.startswith("data: "):
-                            data_str = line[6:].strip()
-                            if data_str == "[DONE]":
-                                break
-                            try:
-                                data = json.loads(data_str)
-                                if data.get("choices"):
-                                    delta = data["choices"][0].get("delta", {})
-                                    yield delta
-                            except:
-                                continue
-            except Exception as e:
-                print(f"[LLM Stream] Error: {e}")
-                yield {"content": f"\n[Error: {str(e)}]"}
+                record = [] if STREAM_RECORD_DIR else None
+                try:
+                    async for delta in iter_sse_deltas(response.aiter_bytes(), STREAM_COALESCE_MS, record):
+                        yield delta
+                finally:
+                    if record:
+                        self._save_stream_recording(record)
+        except Exception as e:
+            print(f"[LLM Stream] Error: {e}")
+            yield {"content": f"\n[Error: {str(e)}]"}
+
+    @staticmethod
+    def _save_stream_recording(record: List[bytes]):
+        try:
+            os.makedirs(STREAM_RECORD_DIR, exist_ok=True)
+            path = os.path.join(STREAM_RECORD_DIR, f"stream_{int(time.time() * 1000)}.sse")
+            with open(path, "wb") as f:
+                f.write(b"".join(record))
+        except Exception as e:
+            print(f"[LLM Stream] 录制失败: {e}")
 
     async def _chat_gemini_stream(self, messages: List[Dict[str, Any]], temperature: float, model_id: str, api_key: str, tools: List[Dict] = None) -> AsyncIterable[Dict[str, Any]]:
         """Gemini 原生 API 流式调用"""
         try:
-            client = genai.Client(api_key=api_key)
+            client = self._get_genai_client(api_key)
             contents = self._convert_to_genai_contents(messages)
             
             system_instruction = None
@@ -651,10 +675,7 @@ class LLMService:
     async def _chat_anthropic_stream(self, messages: List[Dict[str, Any]], temperature: float, model_id: str, api_key: str, tools: List[Dict] = None, api_base: str = None) -> AsyncIterable[Dict[str, Any]]:
         """Anthropic 原生 API 流式调用 (使用 SDK)"""
         try:
-            client = anthropic.AsyncAnthropic(
-                api_key=api_key,
-                base_url=api_base if api_base and api_base != "https://api.openai.com" else None
-            )
+            client = self._get_anthropic_client(api_key, api_base)
             
             system_prompt, anthropic_messages = self._convert_to_anthropic_format(messages)
             anthropic_tools = self._convert_tools_to_anthropic(tools)
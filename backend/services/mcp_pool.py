@@ -0,0 +1,335 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session as SyncSession
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models import Config, MCPConfig
+from services.mcp_service import McpClient
+from services.tool_catalog import tool_catalog
+
+logger = logging.getLogger(__name__)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+async def load_mcp_configs(session: AsyncSession) -> List[Dict[str, Any]]:
+    """读取所有已启用的 MCP 服务器配置 (MCPConfig 表优先，其次旧版 mcp_config_json / mcp_server_url)。"""
+    configs = []
+    # 1. 尝试从新版通用 MCP 配置表中获取
+    try:
+        # 获取所有配置，无论是否启用，以此判断新表是否有数据
+        all_mcp_configs = (await session.exec(select(MCPConfig))).all()
+
+        if all_mcp_configs:
+            for mcp_config_obj in all_mcp_configs:
+                if not mcp_config_obj.enabled:
+                    continue
+
+                client_config = {
+                    "type": mcp_config_obj.type,
+                    "name": mcp_config_obj.name
+                }
+
+                if mcp_config_obj.type == "stdio":
+                    client_config.update({
+                        "command": mcp_config_obj.command,
+                        "args": json.loads(mcp_config_obj.args or "[]"),
+                        "env": json.loads(mcp_config_obj.env or "{}")
+                    })
+                elif mcp_config_obj.type == "sse":
+                    client_config.update({
+                        "url": mcp_config_obj.url
+                    })
+                # 与插件清单同名的执行策略声明 (nit_core.scheduler)
+                if mcp_config_obj.max_concurrency is not None:
+                    client_config["maxConcurrency"] = mcp_config_obj.max_concurrency
+                if mcp_config_obj.timeout_seconds is not None:
+                    client_config["timeoutSeconds"] = mcp_config_obj.timeout_seconds
+
+                configs.append(client_config)
+            # 只要新表有数据（即使全部被禁用），就以此为准，不再向下回退
+            return configs
+    except Exception as e:
+        print(f"[MCP Pool] 查询 MCPConfig 表错误: {e}")
+
+    # 2. 只有当新表完全没数据时，才尝试获取旧版完整 JSON 配置作为回退
+    try:
+        json_config = (await session.exec(select(Config).where(Config.key == "mcp_config_json"))).first()
+
+        if json_config and json_config.value:
+            try:
+                config_data = json.loads(json_config.value)
+                if "mcpServers" in config_data:
+                    for name, server_config in config_data["mcpServers"].items():
+                        # 检查是否启用 (默认为 True)
+                        if not server_config.get("enabled", True):
+                            continue
+                        # 确保配置中有名字
+                        if "name" not in server_config:
+                            server_config["name"] = name
+                        configs.append(server_config)
+                else:
+                    configs.append(config_data)
+            except Exception as e:
+                print(f"[MCP Pool] 加载 MCP JSON 配置失败: {e}")
+    except Exception as e:
+        print(f"[MCP Pool] 查询 mcp_config_json 错误: {e}")
+
+    # 3. 回退到旧的 URL/Key 配置 (仅当仍没有配置时)
+    if not configs:
+        try:
+            url_config = (await session.exec(select(Config).where(Config.key == "mcp_server_url"))).first()
+
+            if url_config and url_config.value:
+                key_config = (await session.exec(select(Config).where(Config.key == "mcp_api_key"))).first()
+                configs.append({
+                    "type": "sse",
+                    "url": url_config.value,
+                    "api_key": key_config.value if key_config else None,
+                    "name": "Legacy-MCP"
+                })
+        except Exception as e:
+            print(f"[MCP Pool] 查询 mcp_server_url 错误: {e}")
+
+    return configs
+
+
+class _McpEntry:
+    """单个 MCP 服务器的连接状态。"""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.name = config.get("name", "Unknown-MCP")
+        self.client: Optional[McpClient] = None
+        self.status = "pending"  # pending / starting / ready / failed
+        self.failures = 0
+        self.restarts = 0
+        self.retry_at = 0.0
+        self.last_error = ""
+        self.start_task: Optional[asyncio.Task] = None
+
+
+class McpConnectionManager:
+    """
+    长驻 MCP 连接池
+    - 启动时并发初始化所有已启用的 MCP 服务器 (stdio 子进程 / HTTP 客户端 + initialize + tools/list)
+    - 聊天请求只借用已就绪的客户端，不再每轮新建、初始化和关闭
+    - 后台健康检查 (进程存活 + MCP ping)，失败自动重启，连续失败时指数退避
+    - 工具列表缓存在客户端上，TTL 过期或收到 notifications/tools/list_changed 时刷新
+    - MCP 配置提交后重新读取配置并增删连接
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(McpConnectionManager, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self.health_interval = _env_float("PERO_MCP_HEALTH_INTERVAL", 60.0)
+        self.tools_ttl = _env_float("PERO_MCP_TOOLS_TTL", 300.0)
+        self.init_timeout = _env_float("PERO_MCP_INIT_TIMEOUT", 60.0)
+        self._entries: Dict[str, _McpEntry] = {}
+        self._configs_loaded = False
+        self._lock: Optional[asyncio.Lock] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self._initialized = True
+
+    @staticmethod
+    def _config_key(config: Dict[str, Any]) -> str:
+        return json.dumps(config, sort_keys=True, default=str)
+
+    # --- 生命周期 ---
+
+    async def start(self):
+        """FastAPI 启动时调用：读取配置并并发初始化全部 MCP 服务器。"""
+        from database import engine
+
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            await self.refresh(session)
+        tasks = [entry.start_task for entry in self._entries.values() if entry.start_task]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        ready = sum(1 for entry in self._entries.values() if entry.status == "ready")
+        print(f"[MCP Pool] {ready}/{len(self._entries)} 个 MCP 服务器已就绪")
+        self._ensure_health_loop()
+
+    async def aclose(self):
+        """关闭所有 MCP 连接 (FastAPI lifespan 关闭阶段调用)。"""
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        entries = list(self._entries.values())
+        self._entries.clear()
+        self._configs_loaded = False
+        for entry in entries:
+            if entry.start_task and not entry.start_task.done():
+                entry.start_task.cancel()
+        await asyncio.gather(*(entry.client.close() for entry in entries if entry.client), return_exceptions=True)
+
+    def mark_stale(self):
+        """MCP 配置变化：下次借用时重新读取配置。"""
+        self._configs_loaded = False
+
+    async def refresh(self, session: AsyncSession):
+        """按当前配置增删连接；新增的服务器在后台并发初始化。"""
+        configs = await load_mcp_configs(session)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            wanted = {self._config_key(config): config for config in configs}
+            for key in list(self._entries):
+                if key not in wanted:
+                    entry = self._entries.pop(key)
+                    print(f"[MCP Pool] 移除 MCP 服务器: {entry.name}")
+                    if entry.start_task and not entry.start_task.done():
+                        entry.start_task.cancel()
+                    if entry.client:
+                        asyncio.create_task(entry.client.close())
+            for key, config in wanted.items():
+                if key not in self._entries:
+                    entry = _McpEntry(config)
+                    self._entries[key] = entry
+                    self._spawn_start(entry)
+            self._configs_loaded = True
+
+    async def borrow(self, session: AsyncSession) -> List[McpClient]:
+        """返回已就绪的客户端 (共享连接，调用方不要关闭)。"""
+        if not self._configs_loaded:
+            await self.refresh(session)
+        self._ensure_health_loop()
+        return [entry.client for entry in self._entries.values() if entry.status == "ready"]
+
+    # --- 连接建立与健康检查 ---
+
+    def _spawn_start(self, entry: _McpEntry):
+        entry.status = "starting"
+        entry.start_task = asyncio.create_task(self._start_entry(entry))
+
+    async def _start_entry(self, entry: _McpEntry):
+        client = McpClient(config=entry.config, tools_ttl=self.tools_ttl)
+        ok = False
+        try:
+            ok = await asyncio.wait_for(client.initialize(), timeout=self.init_timeout)
+            if ok:
+                # 预热工具列表缓存
+                await client.list_tools(refresh=True)
+            else:
+                entry.last_error = "initialize 失败"
+        except Exception as e:
+            entry.last_error = str(e) or type(e).__name__
+
+        if not ok or self._entries.get(self._config_key(entry.config)) is not entry:
+            await client.close()
+            if ok:
+                return  # 初始化期间配置已被移除
+            entry.failures += 1
+            entry.status = "failed"
+            entry.retry_at = time.monotonic() + min(300.0, 5.0 * (2 ** (entry.failures - 1)))
+            print(f"[MCP Pool] MCP 服务器 {entry.name} 初始化失败 (第 {entry.failures} 次): {entry.last_error}")
+            return
+
+        entry.client = client
+        entry.failures = 0
+        entry.last_error = ""
+        entry.status = "ready"
+        print(f"[MCP Pool] MCP 服务器已就绪: {entry.name}")
+
+    def _ensure_health_loop(self):
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_health()
+            except Exception as e:
+                logger.error(f"[MCP Pool] 健康检查出错: {e}")
+
+    async def check_health(self):
+        entries = list(self._entries.values())
+        ready = [entry for entry in entries if entry.status == "ready" and entry.client]
+        results = await asyncio.gather(
+            *(self._is_healthy(entry.client) for entry in ready), return_exceptions=True
+        )
+        for entry, healthy in zip(ready, results):
+            if healthy is True:
+                continue
+            print(f"[MCP Pool] MCP 服务器 {entry.name} 健康检查失败，正在重启...")
+            client, entry.client = entry.client, None
+            entry.restarts += 1
+            asyncio.create_task(client.close())
+            self._spawn_start(entry)
+
+        now = time.monotonic()
+        for entry in entries:
+            if entry.status == "failed" and now >= entry.retry_at:
+                self._spawn_start(entry)
+
+    @staticmethod
+    async def _is_healthy(client: McpClient) -> bool:
+        return client.is_alive and await client.ping()
+
+    def get_status(self) -> List[Dict[str, Any]]:
+        status = []
+        for entry in self._entries.values():
+            client = entry.client
+            status.append({
+                "name": entry.name,
+                "type": entry.config.get("type", "sse"),
+                "status": entry.status,
+                "failures": entry.failures,
+                "restarts": entry.restarts,
+                "last_error": entry.last_error,
+                "tools": len(client._tools_cache) if client and client._tools_cache is not None else None,
+            })
+        return status
+
+
+mcp_pool = McpConnectionManager()
+
+
+# --- MCP 配置变化 ---
+# 与 ConfigManager 快照一致：MCPConfig 或旧版 mcp_* 配置项的 ORM 写入提交后，
+# 连接池重新读取配置，工具目录中的 MCP 工具缓存失效。
+
+def _is_mcp_row(obj) -> bool:
+    if isinstance(obj, MCPConfig):
+        return True
+    return isinstance(obj, Config) and (obj.key or "").startswith("mcp_")
+
+
+@event.listens_for(SyncSession, "after_flush")
+def _mark_mcp_dirty(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if _is_mcp_row(obj):
+            session.info["mcp_config_dirty"] = True
+            return
+
+
+@event.listens_for(SyncSession, "after_commit")
+def _invalidate_mcp(session):
+    if session.info.pop("mcp_config_dirty", False):
+        mcp_pool.mark_stale()
+        tool_catalog.invalidate_mcp()
+
+
+@event.listens_for(SyncSession, "after_rollback")
+def _discard_mcp_dirty(session):
+    session.info.pop("mcp_config_dirty", None)
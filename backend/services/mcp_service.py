@@ -2,6 +2,7 @@ import asyncio
 import logging
 import json
 import os
+import time
 from typing import Dict, Any, List, Optional, Union
 import httpx
 
@@ -15,7 +16,8 @@ class McpClient:
     def __init__(
         self, 
         config: Dict[str, Any],
-        timeout: float = 30.0
+        timeout: float = 30.0,
+        tools_ttl: float = 0.0
     ):
         """
         :param config: 配置字典。
@@ -27,6 +29,13 @@ class McpClient:
         self.timeout = timeout
         self._initialized = False
         self._request_id = 0
+
+        # 工具列表缓存：TTL 过期或收到 notifications/tools/list_changed 时刷新 (tools_ttl=0 表示不缓存)
+        self.tools_ttl = tools_ttl
+        self.tools_version = 0
+        self._tools_cache: Optional[List[Dict[str, Any]]] = None
+        self._tools_fetched_at = 0.0
+        self._tools_epoch = 0
         
         # 传输方式特定配置
         self.transport_type = config.get("type", "sse")
@@ -153,9 +162,11 @@ class McpClient:
                             else:
                                 future.set_result(data.get("result"))
                                 
-                    # Handle Notification (logging for now)
+                    # Handle Notification
                     elif "method" in data:
                         logger.debug(f"[MCP] Notification: {data}")
+                        if data["method"] == "notifications/tools/list_changed":
+                            self.invalidate_tools()
                         
                 except json.JSONDecodeError:
                     logger.warning(f"[MCP] 来自 stdio 的无效 JSON: {line_str}")
@@ -255,10 +266,42 @@ class McpClient:
             logger.error(f"[MCP] 初始化失败: {e}")
             return False
 
-    async def list_tools(self) -> List[Dict[str, Any]]:
+    @property
+    def is_alive(self) -> bool:
+        """stdio 子进程是否仍在运行 (HTTP 模式以客户端未关闭为准)。"""
+        if self.transport_type == "stdio":
+            return self.process is not None and self.process.returncode is None
+        return self.http_client is not None and not self.http_client.is_closed
+
+    def invalidate_tools(self):
+        self._tools_cache = None
+        self._tools_epoch += 1
+
+    async def list_tools(self, refresh: bool = False) -> List[Dict[str, Any]]:
+        if (not refresh and self._tools_cache is not None
+                and time.monotonic() - self._tools_fetched_at < self.tools_ttl):
+            return self._tools_cache
+
         if not self._initialized: await self.initialize()
+        epoch = self._tools_epoch
         result = await self._mcp_request("tools/list", {})
-        return result.get("tools", []) if result else []
+        tools = result.get("tools", []) if result else []
+        # 请求期间收到 list_changed 时结果可能已过期，不写入缓存
+        if result is not None and epoch == self._tools_epoch:
+            self._tools_cache = tools
+            self._tools_fetched_at = time.monotonic()
+        if result is not None:
+            self.tools_version += 1
+        return tools
+
+    async def ping(self, timeout: float = 10.0) -> bool:
+        """健康检查 (MCP ping)。"""
+        try:
+            result = await asyncio.wait_for(self._mcp_request("ping"), timeout=timeout)
+            return result is not None
+        except Exception as e:
+            logger.warning(f"[MCP] {self.name} ping 失败: {e}")
+            return False
 
     async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Any:
         if not self._initialized: await self.initialize()
@@ -1,12 +1,21 @@
 import os
 import re
 import yaml
+import hashlib
 import logging
-from typing import Dict, Any, Optional, Set
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Set, FrozenSet, Tuple
 import jinja2
 
 logger = logging.getLogger(__name__)
 
+# 隐式包含: {{ var }} 中的 var 若是提示词键，则展开为该提示词内容
+INCLUDE_PATTERN = re.compile(r"\{\{\s*([a-zA-Z0-9_./]+)\s*\}\}")
+# 递归展开的最大层数 (静态包含与运行时展开共用)
+MAX_RENDER_DEPTH = 5
+# 编译后模板的 LRU 缓存容量 (按模板源码哈希)
+TEMPLATE_CACHE_SIZE = int(os.environ.get("PERO_MDP_TEMPLATE_CACHE_SIZE", "256"))
+
 class MDPrompt:
     """
     表示一个模块化动态提示词 (MDP)。
@@ -29,6 +38,15 @@ class MDPManager:
         self.prompt_dir = prompt_dir
         self.prompts: Dict[str, MDPrompt] = {}
         self.jinja_env = None
+        # 请求名 (不带 .md、含 agent 前缀) -> 加载器中的实际模板名，reload_all 时预先计算
+        self._template_names: Dict[str, str] = {}
+        # 静态包含图: 模板名 -> 直接引用的提示词键
+        self._include_graph: Dict[str, Set[str]] = {}
+        # (模板名, 被 context 覆盖的包含键) -> 展开后的模板
+        self._expanded: Dict[Tuple[str, FrozenSet[str]], jinja2.Template] = {}
+        # 中间渲染结果的编译缓存: 源码哈希 -> 模板
+        self._compiled: "OrderedDict[bytes, jinja2.Template]" = OrderedDict()
+        self._cache_stats = {"hits": 0, "misses": 0}
         
         # 初始加载
         self.reload_all()
@@ -36,6 +54,10 @@ class MDPManager:
     def reload_all(self):
         """从磁盘重新加载所有提示词并初始化 Jinja2 环境。"""
         self.prompts.clear()
+        self._template_names.clear()
+        self._include_graph.clear()
+        self._expanded.clear()
+        self._compiled.clear()
         prompts_content_map = {}
 
         if not os.path.exists(self.prompt_dir):
@@ -120,8 +142,21 @@ class MDPManager:
             autoescape=False, # 提示词是文本，不是 HTML
             variable_start_string="{{",
             variable_end_string="}}",
-            undefined=jinja2.DebugUndefined # 保留未定义的变量为 {{ var }} 以便调试/部分渲染
+            undefined=jinja2.DebugUndefined, # 保留未定义的变量为 {{ var }} 以便调试/部分渲染
+            auto_reload=False # 模板只在 reload_all 时更新，避免每次 get_template 都 stat 文件
         )
+
+        # 预计算覆盖/后缀解析表: 先登记精确名，再登记去掉 .md 的别名 (与 get_template 的尝试顺序一致)
+        template_names = self.jinja_env.list_templates()
+        for name in template_names:
+            self._template_names[name] = name
+        for name in template_names:
+            if name.endswith(".md"):
+                self._template_names.setdefault(name[:-3], name)
+
+        # 静态包含图 (提示词之间的 {{ key }} 引用)
+        for key, prompt in self.prompts.items():
+            self._include_graph[key] = self._find_includes(prompt.content)
         
         logger.info(f"从 {self.prompt_dir} 加载了 {len(self.prompts)} 个 MDP 提示词")
 
@@ -178,89 +213,138 @@ class MDPManager:
         # 如果 context 中包含 agent_name，优先尝试加载 agents/{agent_name}/{template_name}
         # ---------------------------------------------------------
         agent_name = context.get("agent_name")
-        target_template_name = template_name
-        
+        target_template_name = None
         if agent_name:
-            # 构造覆盖路径，例如 "pero/core/abilities/work_log"
-            # 注意：agent_name 对应的目录必须在 FileSystemLoader 的根目录下 (即 mdp/agents)
-            override_name = f"{agent_name}/{template_name}"
-            
-            # 检查 override 是否存在
-            # 我们可以简单地尝试 get_template
-            found_override = False
-            try:
-                self.jinja_env.get_template(override_name)
-                target_template_name = override_name
-                found_override = True
-                logger.debug(f"MDP: 使用 Agent 覆盖提示词: {override_name}")
-            except jinja2.TemplateNotFound:
-                # 尝试 .md
-                try:
-                    self.jinja_env.get_template(f"{override_name}.md")
-                    target_template_name = f"{override_name}.md"
-                    found_override = True
-                    logger.debug(f"MDP: 使用 Agent 覆盖提示词: {override_name}.md")
-                except jinja2.TemplateNotFound:
-                    pass
-            
-            if not found_override:
-                # 仅在调试模式下记录，避免日志刷屏
-                pass
+            # 构造覆盖路径，例如 "pero/core/abilities/work_log" (对应 mdp/agents 下的文件)
+            target_template_name = self._template_names.get(f"{agent_name}/{template_name}")
+            if target_template_name:
+                logger.debug(f"MDP: 使用 Agent 覆盖提示词: {target_template_name}")
+        if not target_template_name:
+            target_template_name = self._template_names.get(template_name)
+
+        if not target_template_name:
+            logger.warning(f"提示词模板 '{template_name}' (及其 .md 变体) 未找到。")
+            return f"{{{{Missing Prompt: {template_name}}}}}"
 
         try:
-            # 步骤 1: 初始渲染
-            template = None
-            try:
-                template = self.jinja_env.get_template(target_template_name)
-            except jinja2.TemplateNotFound:
-                # 尝试添加 .md 后缀 (针对 FileSystemLoader)
-                try:
-                    template = self.jinja_env.get_template(f"{target_template_name}.md")
-                except jinja2.TemplateNotFound:
-                    pass
-
-            if not template:
-                 logger.warning(f"提示词模板 '{target_template_name}' (及其 .md 变体) 未找到。 (Original request: {template_name})")
-                 return f"{{{{Missing Prompt: {template_name}}}}}"
-
-            rendered = template.render(**context)
-            
+            # 步骤 1: 渲染静态展开了提示词包含的模板，多数提示词一遍即可完成
+            rendered = self._get_expanded_template(target_template_name, context).render(**context)
+
             # 步骤 2: 递归展开
-            # 我们循环最多 5 次以解析嵌套变量 (例如 {{ persona }} -> content)
-            max_depth = 5
-            for _ in range(max_depth):
+            # context 中的值也可能带有 {{ var }} (例如 persona_definition 中的 {{ agent_name }})，
+            # 最多再循环 MAX_RENDER_DEPTH 次
+            for _ in range(MAX_RENDER_DEPTH):
                 if "{{" not in rendered:
                     break
                 
                 # 扫描剩余的 {{ var }}，支持隐式包含
-                matches = re.findall(r"\{\{\s*([a-zA-Z0-9_./]+)\s*\}\}", rendered)
-                new_context = context.copy()
-                
+                matches = INCLUDE_PATTERN.findall(rendered)
+                new_context = context
                 for var in matches:
                     # 如果 var 不在上下文中但作为提示词存在，则注入它
                     if var not in new_context and var in self.prompts:
+                        if new_context is context:
+                            new_context = context.copy()
                         new_context[var] = self.prompts[var].content
                 
                 # 即使没有从 prompts 加载新变量，上下文中可能已包含需要展开的变量（如 chain_logic）。
-                # 因此，只要发现 {{}} 占位符，就尝试使用当前上下文再次渲染。
                 # 通过比较渲染前后的结果来检测是否收敛，防止因无法解析的变量导致的死循环。
                 prev_rendered = rendered
-                rendered = self.jinja_env.from_string(rendered).render(**new_context)
+                rendered = self._compile(rendered).render(**new_context)
                 
                 if rendered == prev_rendered:
                     # 没有变化，说明剩余的 {{}} 无法被当前 context 解析
                     break
-                    
-                # 如果有变化，说明展开成功（无论是通过新注入的提示词，还是已有的 context）
-                # 继续下一轮循环
 
-            
             return rendered
 
         except Exception as e:
             logger.error(f"渲染提示词 '{template_name}' 时出错: {e}")
             return f"{{{{Error Rendering: {template_name}}}}}"
 
+    @staticmethod
+    def _find_includes(source: str) -> Set[str]:
+        return set(INCLUDE_PATTERN.findall(source))
+
+    def _includes_of(self, name: str) -> Set[str]:
+        """模板直接引用的提示词键 (不在 self.prompts 中的 agent 模板按需读取源码)。"""
+        includes = self._include_graph.get(name)
+        if includes is None:
+            source = self.jinja_env.loader.get_source(self.jinja_env, name)[0]
+            includes = self._include_graph[name] = self._find_includes(source)
+        return {var for var in includes if var in self.prompts}
+
+    def _include_closure(self, name: str) -> Set[str]:
+        closure: Set[str] = set()
+        frontier = self._includes_of(name)
+        for _ in range(MAX_RENDER_DEPTH):
+            frontier = frontier - closure
+            if not frontier:
+                break
+            closure |= frontier
+            frontier = set().union(*(self._includes_of(var) for var in frontier))
+        return closure
+
+    def _inline(self, source: str, shadowed: FrozenSet[str], depth: int, stack: Tuple[str, ...]) -> str:
+        """将 {{ key }} 替换为提示词内容 (context 中同名变量优先，环形引用保持原样)。"""
+        if depth >= MAX_RENDER_DEPTH:
+            return source
+
+        def replace(match):
+            var = match.group(1)
+            if var in shadowed or var in stack or var not in self.prompts:
+                return match.group(0)
+            return self._inline(self.prompts[var].content, shadowed, depth + 1, stack + (var,))
+
+        return INCLUDE_PATTERN.sub(replace, source)
+
+    def _get_expanded_template(self, name: str, context: Dict[str, Any]) -> jinja2.Template:
+        """
+        按静态包含图把引用的提示词直接内联进模板源码后编译，结果按 (模板名, 被 context 覆盖的包含键) 缓存。
+        没有包含时直接使用加载器中的模板。
+        """
+        closure = self._include_closure(name)
+        shadowed = frozenset(var for var in closure if var in context)
+        key = (name, shadowed)
+        template = self._expanded.get(key)
+        if template is None:
+            if closure - shadowed:
+                source = self.jinja_env.loader.get_source(self.jinja_env, name)[0]
+                template = self._compile(self._inline(source, shadowed, 0, ()))
+            else:
+                template = self.jinja_env.get_template(name)
+            self._expanded[key] = template
+        return template
+
+    def _compile(self, source: str) -> jinja2.Template:
+        """编译中间渲染结果，按内容哈希缓存 (同一会话内系统提示词的中间形态高度重复)。"""
+        if TEMPLATE_CACHE_SIZE <= 0:
+            return self.jinja_env.from_string(source)
+        key = hashlib.blake2b(source.encode("utf-8"), digest_size=16).digest()
+        template = self._compiled.get(key)
+        if template is not None:
+            self._cache_stats["hits"] += 1
+            self._compiled.move_to_end(key)
+            return template
+        self._cache_stats["misses"] += 1
+        template = self.jinja_env.from_string(source)
+        self._compiled[key] = template
+        if len(self._compiled) > TEMPLATE_CACHE_SIZE:
+            self._compiled.popitem(last=False)
+        return template
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """模板缓存命中情况。"""
+        total = self._cache_stats["hits"] + self._cache_stats["misses"]
+        return {
+            "hits": self._cache_stats["hits"],
+            "misses": self._cache_stats["misses"],
+            "hit_rate": round(self._cache_stats["hits"] / total, 4) if total else 0.0,
+            "size": len(self._compiled),
+            "capacity": TEMPLATE_CACHE_SIZE,
+            "expanded_templates": len(self._expanded),
+        }
+
 # 全局单例实例
 _mdp_instance = None
 
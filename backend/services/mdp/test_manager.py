@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+from services.mdp.manager import MDPManager
+
+class TestMDPManager(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        files = {
+            "prompts/core/main.md": "{{ header }}\n你好 {{ owner_name }}",
+            "prompts/core/header.md": "[{{ footer }}]",
+            "prompts/core/footer.md": "{{ agent_name }} 在线",
+            "agents/nana/core/main.md": "Nana 专属: {{ owner_name }}",
+        }
+        for rel_path, content in files.items():
+            path = os.path.join(self.root, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+        self.mdp = MDPManager(os.path.join(self.root, "prompts"))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_nested_includes_render_in_one_pass(self):
+        result = self.mdp.render("core/main", {"agent_name": "Pero", "owner_name": "主人"})
+        self.assertEqual(result, "[Pero 在线]\n你好 主人")
+        self.assertEqual(self.mdp.get_cache_stats()["misses"], 1)
+
+    def test_context_shadows_prompt_include(self):
+        result = self.mdp.render("core/main", {"header": "{{ owner_name }}!", "owner_name": "主人"})
+        self.assertEqual(result, "主人!\n你好 主人")
+
+    def test_agent_override_and_missing(self):
+        self.assertEqual(self.mdp.render("core/main", {"agent_name": "nana", "owner_name": "主人"}), "Nana 专属: 主人")
+        self.assertEqual(self.mdp.render("core/absent"), "{{Missing Prompt: core/absent}}")
+
+    def test_intermediate_stages_are_cached(self):
+        context = {"owner_name": "{{ agent_name }}", "agent_name": "Pero"}
+        first = self.mdp.render("core/main", dict(context))
+        misses = self.mdp.get_cache_stats()["misses"]
+        self.assertEqual(self.mdp.render("core/main", dict(context)), first)
+        self.assertEqual(self.mdp.get_cache_stats()["misses"], misses)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,7 +8,7 @@ from models import Memory, MemoryRelation, Config, AIModelConfig, MaintenanceRec
 from services.llm_service import LLMService
 from services.mdp.manager import mdp as mdp_manager
 import os
-from core.config_manager import get_config_manager
+from core.config_manager import get_config_manager, get_config_snapshot
 
 class MemorySecretaryService:
     def __init__(self, session: AsyncSession):
@@ -23,8 +23,8 @@ class MemorySecretaryService:
 
     async def _get_llm_service(self) -> LLMService:
         """获取配置并初始化 LLM 服务"""
-        result = await self.session.exec(select(Config))
-        configs = {c.key: c.value for c in result.all()}
+        snapshot = await get_config_snapshot()
+        configs = snapshot.configs
         
         global_api_key = configs.get("global_llm_api_key", "")
         global_api_base = configs.get("global_llm_api_base", "https://api.openai.com")
@@ -46,7 +46,7 @@ class MemorySecretaryService:
             return LLMService(fallback_config["api_key"], fallback_config["api_base"], fallback_config["model"])
 
         try:
-            model_config = await self.session.get(AIModelConfig, int(target_model_id))
+            model_config = snapshot.get_model(target_model_id)
             if not model_config:
                  # ID 存在但找不到配置，回退
                 return LLMService(fallback_config["api_key"], fallback_config["api_base"], fallback_config["model"])
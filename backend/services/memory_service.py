@@ -7,9 +7,16 @@ from typing import List, Optional, Dict, Any
 from datetime import datetime
 from sqlmodel import select, delete, desc, and_
 from sqlmodel.ext.asyncio.session import AsyncSession
-from models import Memory, ConversationLog, MemoryRelation
+from models import Memory, ConversationLog, MemoryRelation, MemoryEmbedding, pack_embedding
+from services.turn_cache import encode_query, search_vectors
+from services.history_tokens import is_token_budget_session, stamp_token_count
 import re
 import json
+import asyncio
+
+# 归档记忆标记: 内容主体存放在文件中
+ARCHIVE_MARKER = "> 📁 File Archived:"
+ARCHIVE_PATTERN = re.compile(r"> 📁 File Archived: (.+)")
 
 # [Global State] 高性能 Rust 引擎单例
 # PEDSA (Parallel Energy-Decay Spreading Activation) 算法核心实现
@@ -120,7 +127,7 @@ class MemoryService:
 
         # 2. 创建新记忆
         # 生成 Embedding (用于写入 VectorDB)
-        # 注意：embedding_json 字段在 SQLite 中保留作为备份或兼容，但主要查询走 VectorDB
+        # 注意：SQLite 中的 MemoryEmbedding 仅作为 float32 备份，主要查询走 VectorDB
         embedding_vec = embedding_service.encode_one(content)
         
         # [Fix] 确保在写入 DB 之前尝试获取 embedding，如果失败则记录警告
@@ -129,8 +136,6 @@ class MemoryService:
         if not embedding_vec:
              print(f"[MemoryService] 警告: 记忆内容嵌入生成失败: {content[:30]}...")
 
-        embedding_json = json.dumps(embedding_vec)
-
         memory = Memory(
             content=content,
             tags=tags,
@@ -144,10 +149,12 @@ class MemoryService:
             type=memory_type,
             prev_id=prev_id,
             next_id=None,
-            embedding_json=embedding_json, # 仍保留一份在 SQLite
             agent_id=agent_id
         )
         session.add(memory)
+        if embedding_vec:
+            await session.flush() # 获取 ID
+            session.add(MemoryEmbedding(memory_id=memory.id, dim=len(embedding_vec), vector=pack_embedding(embedding_vec)))
         await session.commit()
         await session.refresh(memory)
 
@@ -163,7 +170,7 @@ class MemoryService:
                 # 为了增强标签权重，我们应该生成一个 "enriched_embedding" 仅用于 VectorDB 索引，
                 # 而 content 保持原样用于展示。
                 # 
-                # 但为了不破坏现有逻辑 (sqlite 里的 embedding_json 也是基于 content)，
+                # 但为了不破坏现有逻辑 (sqlite 里的 MemoryEmbedding 也是基于 content)，
                 # 我们这里做一个策略：
                 # 如果有 tags，我们生成一个混合文本 "tags: ... content: ..." 重新生成向量用于 VectorDB。
                 
@@ -223,8 +230,7 @@ class MemoryService:
                 retry_vec = embedding_service.encode_one(content)
                 if retry_vec:
                     # 更新 SQL
-                    memory.embedding_json = json.dumps(retry_vec)
-                    session.add(memory)
+                    await session.merge(MemoryEmbedding(memory_id=memory.id, dim=len(retry_vec), vector=pack_embedding(retry_vec)))
                     await session.commit()
                     
                     # 写入 VectorDB
@@ -290,6 +296,10 @@ class MemoryService:
             pair_id=pair_id,
             agent_id=agent_id
         )
+        # 工作模式会话写入时计算一次 Token 数，HistoryPreprocessor 不必每次请求重新编码；
+        # 首次调用可能要加载 (下载) 编码文件，放到线程中执行
+        if is_token_budget_session(source, session_id):
+            await asyncio.to_thread(stamp_token_count, log)
         session.add(log)
         # 注意：这里去掉了 commit()，改为由外部或 save_log_pair 统一控制
         return log
@@ -436,6 +446,44 @@ class MemoryService:
         await session.exec(statement)
         await session.commit()
 
+    @staticmethod
+    def recent_logs_within_budget_query(source: str, session_id: str, max_tokens: int, limit: int = 200, agent_id: str = "pero"):
+        """get_recent_logs_within_budget 使用的查询 (单独构造，便于审计执行计划)"""
+        from sqlalchemy import func
+
+        recent = (
+            select(ConversationLog.id, ConversationLog.timestamp, ConversationLog.token_count)
+            .where(ConversationLog.source == source)
+            .where(ConversationLog.session_id == session_id)
+            .where(ConversationLog.agent_id == agent_id)
+            .order_by(desc(ConversationLog.timestamp), desc(ConversationLog.id))
+            .limit(limit)
+            .subquery()
+        )
+        running = (
+            select(recent.c.id, func.sum(func.coalesce(recent.c.token_count, 0)).over(
+                order_by=(desc(recent.c.timestamp), desc(recent.c.id))
+            ).label("running"))
+            .subquery()
+        )
+        within_budget = select(running.c.id).where(running.c.running <= max_tokens)
+
+        return (
+            select(ConversationLog)
+            .where(ConversationLog.id.in_(within_budget))
+            .order_by(ConversationLog.timestamp, ConversationLog.id)
+        )
+
+    @staticmethod
+    async def get_recent_logs_within_budget(session: AsyncSession, source: str, session_id: str, max_tokens: int, limit: int = 200, agent_id: str = "pero") -> List[ConversationLog]:
+        """
+        按 Token 预算获取最近的对话记录 (正序)。
+        在最近 limit 条记录上按时间倒序累加 token_count (窗口函数)，只取累加值不超过预算的记录；
+        尚未计数的旧记录按 0 计入 (结果只会偏多)，调用方补算后再做精确截断。
+        """
+        statement = MemoryService.recent_logs_within_budget_query(source, session_id, max_tokens, limit, agent_id)
+        return list((await session.exec(statement)).all())
+
     @staticmethod
     async def update_log(session: AsyncSession, log_id: int, content: str) -> Optional[ConversationLog]:
         """更新指定的对话记录内容"""
@@ -488,19 +536,17 @@ class MemoryService:
         if not text or len(text.strip()) < 2:
             return []
 
-        from services.embedding_service import embedding_service
-        from services.vector_service import vector_service
         import numpy as np
 
         try:
             # 1. 向量搜索找到初始锚点 (Anchors)
-            query_vec = embedding_service.encode_one(text)
+            query_vec = encode_query(text)
             if not query_vec:
                 print("[Memory] 逻辑闪回: 查询向量为空")
                 return []
             
             # 召回稍微多一点，作为扩散起点
-            vector_results = vector_service.search(query_vec, limit=10, agent_id=agent_id)
+            vector_results = search_vectors(query_vec, limit=10, agent_id=agent_id)
             if not vector_results:
                 print("[Memory] 逻辑闪回: 未找到向量结果")
                 return []
@@ -583,8 +629,6 @@ class MemoryService:
         3. 簇软加权重排序
         """
         from services.embedding_service import embedding_service
-        from services.vector_service import vector_service
-        from utils.memory_file_manager import MemoryFileManager
         import numpy as np
         import math
         import os
@@ -616,7 +660,7 @@ class MemoryService:
         if query_vec is None:
             if not text:
                 return []
-            query_vec = embedding_service.encode_one(text)
+            query_vec = encode_query(text)
             
         if not query_vec:
             print("[Memory] Embedding 失败，回退到关键词搜索。")
@@ -627,7 +671,7 @@ class MemoryService:
         # 2. 向量检索 (VectorDB Search)
         try:
             # [Optimization] 扩大召回范围至 60，以便在过滤掉近期记忆（上下文窗口）后仍有足够的候选
-            vector_results = vector_service.search(query_vec, limit=60, agent_id=agent_id) 
+            vector_results = search_vectors(query_vec, limit=60, agent_id=agent_id)
             
             if not vector_results:
                 # 尝试从 SQLite 回退 (如果是迁移过渡期)
@@ -809,25 +853,8 @@ class MemoryService:
             result_memories = top_candidates[:limit]
             final_memories = result_memories
 
-        # [Hydrate] 如果是归档记忆，实时读取文件内容
-        # 模式匹配 "> 📁 File Archived: path"
-        # 注意：目前我们同步执行此操作，因为对于少量记忆，文件 IO 足够快，
-        # 或者如果需要，我们可以使用 aiofiles。但 MemoryFileManager 在 _write_file (封装在 to_thread 中) 中使用阻塞打开。
-        # 在这里读取更安全。
-        for m in result_memories:
-            if "> 📁 File Archived:" in m.content:
-                try:
-                    match = re.search(r"> 📁 File Archived: (.+)", m.content)
-                    if match:
-                        file_path = match.group(1).strip()
-                        if os.path.exists(file_path):
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                file_content = f.read()
-                                # 保留一点 DB 中的元数据提示，但用文件内容覆盖主体
-                                # 或者直接替换
-                                m.content = file_content 
-                except Exception as e:
-                    print(f"[MemoryService] 填充归档记忆 {m.id} 失败: {e}")
+        # [Hydrate] 如果是归档记忆，读取文件内容替换主体
+        await MemoryService.hydrate_archived_memories(result_memories)
 
         # [修复] 更新访问统计 (强化)
         # 只要被检索到并最终返回，就视为被"激活"了一次
@@ -837,6 +864,35 @@ class MemoryService:
 
         return result_memories
 
+    @staticmethod
+    async def hydrate_archived_memories(memories: List[Memory]):
+        """
+        将 "> 📁 File Archived: path" 形式的归档记忆替换为文件内容。
+        文件读取在线程池中并发执行，并经过 MemoryFileManager 的内容缓存。
+        替换只作用于内存中的对象，不会被后续 commit 写回数据库。
+        """
+        from sqlalchemy.orm.attributes import set_committed_value
+        from utils.memory_file_manager import MemoryFileManager
+
+        archived = []
+        for m in memories:
+            if ARCHIVE_MARKER in m.content:
+                match = ARCHIVE_PATTERN.search(m.content)
+                if match:
+                    archived.append((m, match.group(1).strip()))
+        if not archived:
+            return
+
+        results = await asyncio.gather(
+            *(MemoryFileManager.read_archive(path) for _, path in archived),
+            return_exceptions=True
+        )
+        for (m, _), file_content in zip(archived, results):
+            if isinstance(file_content, Exception):
+                print(f"[MemoryService] 填充归档记忆 {m.id} 失败: {file_content}")
+            elif file_content is not None:
+                set_committed_value(m, "content", file_content)
+
     @staticmethod
     async def get_memories_by_filter(
         session: AsyncSession, 
@@ -894,11 +950,9 @@ class MemoryService:
         """
         简单的向量搜索 + Metadata 过滤 (用于 ChainService 查找历史)
         """
-        from services.vector_service import vector_service
-        
         # 1. 搜索 VectorDB (获取更多候选以允许过滤)
         # HACK: Rust 索引不支持预过滤，所以我们获取更多并进行后过滤。
-        candidates = vector_service.search(query_vec, limit=limit * 5, agent_id=agent_id)
+        candidates = search_vectors(query_vec, limit=limit * 5, agent_id=agent_id)
         if not candidates: return []
         
         ids = [c["id"] for c in candidates]
@@ -1031,18 +1085,18 @@ class MemoryService:
         """
         获取标签云数据 (Top 20 tags)
         """
-        # 简单实现：取出所有 Memory 的 tags 字段，在内存中统计
+        # 简单实现：只取出 tags 列，在内存中统计 (不物化整行 Memory)
         # TODO: 后期可以使用 SQL group by 优化
-        statement = select(Memory)
+        statement = select(Memory.tags).where(Memory.tags != "")
         if agent_id:
             statement = statement.where(Memory.agent_id == agent_id)
             
-        memories = (await session.exec(statement)).all()
+        tag_rows = (await session.exec(statement)).all()
         tag_counts = {}
         
-        for m in memories:
-            if not m.tags: continue
-            tags = [t.strip() for t in m.tags.split(',') if t.strip()]
+        for raw_tags in tag_rows:
+            if not raw_tags: continue
+            tags = [t.strip() for t in raw_tags.split(',') if t.strip()]
             for t in tags:
                 tag_counts[t] = tag_counts.get(t, 0) + 1
                 
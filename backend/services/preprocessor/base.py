@@ -1,11 +1,18 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 
 class BasePreprocessor(ABC):
     """
     所有消息预处理器的抽象基类。
     预处理器接收当前处理上下文，对其进行修改，然后返回。
+
+    reads / writes 声明该预处理器读取和写入的上下文键，PreprocessorManager 据此构建依赖图，
+    互不冲突的预处理器会并发执行。variables 中的条目用 "variables.<key>" 表示，
+    "variables" 本身表示整个变量字典。未声明 (None) 的预处理器按屏障处理：与前后所有阶段串行。
+    读取 "session" 的预处理器在并发执行时会拿到独立的数据库会话。
     """
+    reads: Optional[Tuple[str, ...]] = None
+    writes: Optional[Tuple[str, ...]] = None
 
     @property
     @abstractmethod
@@ -5,14 +5,21 @@ import datetime
 from sqlmodel import select
 from models import Config, PetState, ConversationLog
 from .base import BasePreprocessor
-from services.embedding_service import embedding_service
+from services.turn_cache import current_turn_cache, encode_query, config_snapshot
+from services.history_tokens import clean_history_content, get_token_count, is_token_budget_session, tokens_available
 from sqlmodel import select, desc
 
+# 工作模式上下文窗口的 Token 上限
+HISTORY_MAX_TOKENS = 100000
+
 class UserInputPreprocessor(BasePreprocessor):
     """
     从输入消息列表中提取用户的文本消息。
     处理多模态内容。
     """
+    reads = ("messages", "user_text_override")
+    writes = ("user_message", "is_multimodal")
+
     @property
     def name(self) -> str:
         return "UserInputExtractor"
@@ -46,6 +53,9 @@ class HistoryPreprocessor(BasePreprocessor):
     """
     从数据库获取并清理对话历史。
     """
+    reads = ("session", "memory_service", "messages", "source", "session_id", "variables.enable_history")
+    writes = ("history_messages", "full_context_messages", "earliest_timestamp")
+
     @property
     def name(self) -> str:
         return "HistoryFetcher"
@@ -75,16 +85,21 @@ class HistoryPreprocessor(BasePreprocessor):
              context["earliest_timestamp"] = None
              return context
 
+        # [Context Window Adjustment]
+        # Work Mode needs longer context for coding tasks.
+        # 工作模式使用 100K Token 的滑动窗口：按写入时记录的 token_count 只拉取预算内的记录 (最多 200 条)
+        is_work_context = is_token_budget_session(source, session_id)
+        use_token_budget = is_work_context and tokens_available()
+
         # Fetch recent logs
         try:
-            # [Context Window Adjustment]
-            # Work Mode needs longer context for coding tasks.
-            is_work_context = session_id.startswith("work_") or source == "ide"
-            
-            # 策略调整：先拉取足够多的日志 (例如 200 条)，然后基于 Token 进行截断
             limit = 200 if is_work_context else 40
-            
-            history_logs = await memory_service.get_recent_logs(session, source, session_id, limit=limit)
+            if use_token_budget:
+                history_logs = await memory_service.get_recent_logs_within_budget(
+                    session, source, session_id, HISTORY_MAX_TOKENS, limit=limit
+                )
+            else:
+                history_logs = await memory_service.get_recent_logs(session, source, session_id, limit=limit)
         except Exception as e:
             print(f"[HistoryPreprocessor] 获取历史日志失败: {e}")
             history_logs = []
@@ -95,51 +110,32 @@ class HistoryPreprocessor(BasePreprocessor):
         if history_logs:
             earliest_timestamp = history_logs[0].timestamp
             # print(f"[History] Context Window Start: {earliest_timestamp}")
-            for log in history_logs:
-                # Clean tags
-                content = log.content
-                
-                content = re.sub(r'<!-- PERO_RAG_BLOCK_START.*?-->', '', content, flags=re.S)
-                content = re.sub(r'<!-- PERO_RAG_BLOCK_END -->', '', content, flags=re.S)
-
-                content = re.sub(r'<([A-Z_]+)>.*?</\1>', '', content, flags=re.S)
-                content = re.sub(r'<[^>]+>', '', content)
-                content = content.strip()
-                if content:
-                    history_messages.append({"role": log.role, "content": content})
-
-        # [Token Based Truncation]
-        # 如果处于工作模式，我们使用 100K Token 的滑动窗口策略
-        if is_work_context and history_messages:
-            try:
-                import tiktoken
-                enc = tiktoken.get_encoding("cl100k_base") # 适用于 GPT-4/GPT-3.5
-                
-                MAX_TOKENS = 100000 # 100K Limit
+            if use_token_budget:
+                # [Token Based Truncation]
+                # 从最新的消息开始累加，超出预算即停止；倒序收集后整体反转，保持线性时间
                 current_tokens = 0
-                truncated_history = []
-                
-                # 从最新的消息开始累加 (history_messages 是按时间顺序排列的，所以我们要倒序遍历)
-                for msg in reversed(history_messages):
-                    content = msg.get("content", "")
-                    tokens = len(enc.encode(content))
-                    
-                    if current_tokens + tokens > MAX_TOKENS:
-                        print(f"[History] 达到 Token 上限 ({current_tokens} + {tokens} > {MAX_TOKENS}). 正在截断旧消息。")
+                for log in reversed(history_logs):
+                    content = clean_history_content(log.content)
+                    if not content:
+                        continue
+                    tokens = get_token_count(log, content)
+                    if current_tokens + tokens > HISTORY_MAX_TOKENS:
+                        print(f"[History] 达到 Token 上限 ({current_tokens} + {tokens} > {HISTORY_MAX_TOKENS}). 正在截断旧消息。")
                         break
-                    
                     current_tokens += tokens
-                    truncated_history.insert(0, msg) # 保持原有顺序插入头部
-                
-                history_messages = truncated_history
-                
-            except ImportError:
-                print("[History] 未找到 tiktoken。回退到消息计数限制。")
-                # Fallback: Keep last 100 messages if tiktoken fails
-                if len(history_messages) > 100:
+                    history_messages.append({"role": log.role, "content": content})
+                history_messages.reverse()
+            else:
+                for log in history_logs:
+                    # Clean tags
+                    content = clean_history_content(log.content)
+                    if content:
+                        history_messages.append({"role": log.role, "content": content})
+
+                if is_work_context and len(history_messages) > 100:
+                    print("[History] 未找到 tiktoken。回退到消息计数限制。")
+                    # Fallback: Keep last 100 messages if tiktoken fails
                     history_messages = history_messages[-100:]
-            except Exception as e:
-                print(f"[History] Token 截断失败: {e}")
 
         # Deduplication logic
         if current_messages and history_messages:
@@ -176,16 +172,29 @@ class HistoryPreprocessor(BasePreprocessor):
         
         return context
 
-class RAGPreprocessor(BasePreprocessor):
+def _rag_enabled(context: Dict[str, Any]) -> bool:
+    # [Configurable Preprocessor] Check if RAG is disabled
+    enable_rag = context.get("source", "desktop") != "social"
+    variables = context.get("variables", {})
+    if "enable_rag" in variables:
+        enable_rag = variables["enable_rag"]
+    return enable_rag
+
+class PetStatePreprocessor(BasePreprocessor):
     """
-    检索相关记忆和 PetState。
+    读取 PetState 与用户配置 (与记忆检索无关，可与 HistoryFetcher 并发)。
     """
+    reads = ("session", "source", "agent_id", "variables.enable_rag")
+    writes = (
+        "variables.current_time", "variables.mood", "variables.vibe", "variables.mind",
+        "variables.owner_name", "variables.user_persona",
+    )
+
     @property
     def name(self) -> str:
-        return "RAGInjector"
+        return "PetStateLoader"
 
     async def _get_pet_state(self, session, agent_id="pero") -> PetState:
-        from sqlmodel import desc
         state = (await session.exec(select(PetState).where(PetState.agent_id == agent_id).order_by(desc(PetState.updated_at)).limit(1))).first()
         if not state:
             state = PetState(agent_id=agent_id)
@@ -195,18 +204,50 @@ class RAGPreprocessor(BasePreprocessor):
         return state
 
     async def process(self, context: Dict[str, Any]) -> Dict[str, Any]:
-        source = context.get("source", "desktop")
-        
-        # [Configurable Preprocessor] Check if RAG is disabled
-        enable_rag = True
-        if source == "social":
-            enable_rag = False
-            
+        if not _rag_enabled(context):
+            return context
+
+        # 获取 PetState (每轮最多查询一次)
+        session = context["session"]
+        agent_id = context.get("agent_id", "pero")
+        turn_cache = context.get("turn_cache") or current_turn_cache()
+        if turn_cache is not None:
+            pet_state = await turn_cache.amemo(("pet_state", agent_id), lambda: self._get_pet_state(session, agent_id))
+        else:
+            pet_state = await self._get_pet_state(session, agent_id)
+
+        # 获取用户配置 (本轮固定的进程级快照，无需查库)
+        configs = await config_snapshot()
+
         variables = context.get("variables", {})
-        if "enable_rag" in variables:
-            enable_rag = variables["enable_rag"]
-            
-        if not enable_rag:
+        variables.update({
+            "current_time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "mood": pet_state.mood,
+            "vibe": pet_state.vibe,
+            "mind": pet_state.mind,
+            "owner_name": configs.get("owner_name", "主人"),
+            "user_persona": configs.get("user_persona", "未设定"),
+        })
+        context["variables"] = variables
+        return context
+
+class RAGPreprocessor(BasePreprocessor):
+    """
+    检索相关记忆 (PetState 由 PetStatePreprocessor 负责)。
+    """
+    reads = (
+        "session", "memory_service", "source", "agent_id", "user_message",
+        "full_context_messages", "earliest_timestamp", "variables.enable_rag",
+    )
+    writes = ("variables.memory_context",)
+
+    @property
+    def name(self) -> str:
+        return "RAGInjector"
+
+    async def process(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        if not _rag_enabled(context):
+            variables = context.get("variables", {})
             variables["memory_context"] = "" # Explicitly clear it
             context["variables"] = variables
             return context
@@ -217,14 +258,6 @@ class RAGPreprocessor(BasePreprocessor):
         full_context_messages = context.get("full_context_messages", [])
         earliest_timestamp = context.get("earliest_timestamp")
         agent_id = context.get("agent_id", "pero")
-        
-        # 获取 PetState
-        pet_state = await self._get_pet_state(session, agent_id)
-        
-        # 获取用户配置
-        configs = {c.key: c.value for c in (await session.exec(select(Config))).all()}
-        owner_name = configs.get("owner_name", "主人")
-        user_persona = configs.get("user_persona", "未设定")
 
         # 获取相关记忆
         try:
@@ -291,13 +324,13 @@ class RAGPreprocessor(BasePreprocessor):
                     weights = []
                     
                     if last_user:
-                        embeddings.append(embedding_service.encode_one(last_user))
+                        embeddings.append(encode_query(last_user))
                         weights.append(0.5)
                     if last_assistant:
-                        embeddings.append(embedding_service.encode_one(last_assistant))
+                        embeddings.append(encode_query(last_assistant))
                         weights.append(0.35)
                     if last_tool:
-                        embeddings.append(embedding_service.encode_one(last_tool))
+                        embeddings.append(encode_query(last_tool))
                         weights.append(0.15)
                     
                     if embeddings:
@@ -361,15 +394,7 @@ class RAGPreprocessor(BasePreprocessor):
 
         # Populate variables
         variables = context.get("variables", {})
-        variables.update({
-            "current_time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "memory_context": memory_context,
-            "mood": pet_state.mood,
-            "vibe": pet_state.vibe,
-            "mind": pet_state.mind,
-            "owner_name": owner_name,
-            "user_persona": user_persona,
-        })
+        variables["memory_context"] = memory_context
         context["variables"] = variables
         
         return context
@@ -378,6 +403,9 @@ class WeeklyReportPreprocessor(BasePreprocessor):
     """
     独立检索周报：每次对话最多只注入 1 条最相关的周报。
     """
+    reads = ("session", "memory_service", "source", "user_message", "agent_id", "variables.enable_graph")
+    writes = ("variables.graph_context", "variables.weekly_report_context")
+
     @property
     def name(self) -> str:
         return "WeeklyReportInjector"
@@ -448,6 +476,9 @@ class GraphFlashbackPreprocessor(BasePreprocessor):
     """
     Performs logical flashback on the memory graph to find associated fragments.
     """
+    reads = ("session", "memory_service", "user_message", "agent_id")
+    writes = ("variables.graph_context",)
+
     @property
     def name(self) -> str:
         return "GraphFlashback"
@@ -490,6 +521,12 @@ class ConfigPreprocessor(BasePreprocessor):
     """
     Loads LLM configuration and determines capabilities (Vision, Voice).
     """
+    reads = ("agent_service",)
+    writes = (
+        "llm_config", "variables.enable_vision", "variables.enable_voice",
+        "variables.enable_video", "variables.vision_status",
+    )
+
     @property
     def name(self) -> str:
         return "ConfigLoader"
@@ -519,6 +556,12 @@ class SystemPromptPreprocessor(BasePreprocessor):
     """
     使用 PromptManager 构建最终的系统提示词。
     """
+    reads = (
+        "session", "prompt_manager", "variables", "full_context_messages", "is_voice_mode",
+        "nit_id", "session_id", "source", "skip_system_prompt",
+    )
+    writes = ("final_messages", "prompt_prefix_hash", "variables.recent_history_context")
+
     @property
     def name(self) -> str:
         return "SystemPromptBuilder"
@@ -593,12 +636,16 @@ class SystemPromptPreprocessor(BasePreprocessor):
         )
         
         # [NIT Security] 将动态握手 ID 注入系统提示词
-        if nit_id and final_messages and final_messages[0]["role"] == "system":
-            from nit_core.security import NITSecurityManager
-            security_prompt = NITSecurityManager.get_injection_prompt(nit_id)
-            final_messages[0]["content"] += "\n" + security_prompt
+        # 每轮随机生成，放在末尾的易变上下文中，避免破坏首条 system 消息的稳定前缀
+        if nit_id and final_messages:
+            target = final_messages[-1] if final_messages[-1]["role"] == "system" else final_messages[0]
+            if target["role"] == "system":
+                from nit_core.security import NITSecurityManager
+                security_prompt = NITSecurityManager.get_injection_prompt(nit_id)
+                target["content"] += "\n" + security_prompt
         
         context["final_messages"] = final_messages
+        context["prompt_prefix_hash"] = prompt_manager.compute_prefix_hash(final_messages)
         return context
 
 class PerceptionPreprocessor(BasePreprocessor):
@@ -606,6 +653,9 @@ class PerceptionPreprocessor(BasePreprocessor):
     [NEW] 感知日志注入器
     将 AuraVision 的静默感知记录注入到上下文中。
     """
+    reads = ("variables.memory_context",)
+    writes = ("variables.memory_context",)
+
     @property
     def name(self) -> str:
         return "PerceptionInjector"
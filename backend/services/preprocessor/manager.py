@@ -1,34 +1,168 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Iterable
+import time
+import asyncio
 import logging
+from sqlmodel.ext.asyncio.session import AsyncSession
+from services.turn_cache import TurnCache, turn_scope
 from .base import BasePreprocessor
 
 logger = logging.getLogger(__name__)
 
+
+def _keys_conflict(left: Iterable[str], right: Iterable[str]) -> bool:
+    """两组上下文键是否重叠 ("variables" 与 "variables.xxx" 视为重叠)。"""
+    for a in left:
+        for b in right:
+            if a == b or a.startswith(b + ".") or b.startswith(a + "."):
+                return True
+    return False
+
+
 class PreprocessorManager:
     """
     管理并执行预处理器管道。
+    根据各预处理器声明的 reads / writes 构建依赖图 (DAG)，互不依赖的阶段通过 asyncio.gather 并发执行；
+    依赖关系按注册顺序推导 (写后读、读后写、写后写)，因此结果与串行执行一致。
+    每个阶段的起始偏移与耗时 (毫秒) 记录在 context["preprocessor_timings"]。
+    context["turn_cache"] 为本轮共享的 TurnCache (embedding、向量检索结果、配置快照、PetState)。
     """
     def __init__(self):
         self.preprocessors: List[BasePreprocessor] = []
+        self._dependencies: Optional[List[List[int]]] = None
 
     def register(self, preprocessor: BasePreprocessor):
         """将新的预处理器注册到管道末尾。"""
         self.preprocessors.append(preprocessor)
+        self._dependencies = None
         # logger.info(f"Registered preprocessor: {preprocessor.name}")
 
+    def _build_dependencies(self) -> List[List[int]]:
+        dependencies = []
+        for index, processor in enumerate(self.preprocessors):
+            before = []
+            for prev_index in range(index):
+                prev = self.preprocessors[prev_index]
+                if None in (processor.reads, processor.writes, prev.reads, prev.writes):
+                    # 未声明读写集合的预处理器按屏障处理
+                    before.append(prev_index)
+                elif (_keys_conflict(processor.reads, prev.writes)
+                      or _keys_conflict(processor.writes, prev.reads)
+                      or _keys_conflict(processor.writes, prev.writes)):
+                    before.append(prev_index)
+            dependencies.append(before)
+        return dependencies
+
+    def get_stages(self) -> List[List[str]]:
+        """返回按依赖层级分组的预处理器名称 (同一层内并发执行)，用于调试。"""
+        if self._dependencies is None:
+            self._dependencies = self._build_dependencies()
+        levels: List[int] = []
+        for before in self._dependencies:
+            levels.append(max((levels[i] + 1 for i in before), default=0))
+        stages: List[List[str]] = [[] for _ in range(max(levels, default=-1) + 1)]
+        for processor, level in zip(self.preprocessors, levels):
+            stages[level].append(processor.name)
+        return stages
+
+    def _may_overlap(self, index: int) -> bool:
+        """该阶段是否可能与其他读取 session 的阶段同时运行。"""
+        for other in range(len(self.preprocessors)):
+            if other == index or "session" not in (self.preprocessors[other].reads or ()):
+                continue
+            if not self._depends_on(index, other) and not self._depends_on(other, index):
+                return True
+        return False
+
+    def _depends_on(self, index: int, target: int) -> bool:
+        stack = list(self._dependencies[index])
+        seen = set()
+        while stack:
+            current = stack.pop()
+            if current == target:
+                return True
+            if current not in seen:
+                seen.add(current)
+                stack.extend(self._dependencies[current])
+        return False
+
     async def process(self, context: Dict[str, Any]) -> Dict[str, Any]:
         """
-        按顺序通过所有注册的预处理器运行上下文。
+        按依赖图运行所有注册的预处理器。
         """
-        current_context = context
-        for processor in self.preprocessors:
+        if self._dependencies is None:
+            self._dependencies = self._build_dependencies()
+
+        timings: Dict[str, Dict[str, float]] = {}
+        context["preprocessor_timings"] = timings
+        pipeline_start = time.perf_counter()
+
+        turn_cache = context.get("turn_cache")
+        if turn_cache is None:
+            turn_cache = context["turn_cache"] = TurnCache()
+
+        session_lock = asyncio.Lock()
+        tasks: List[asyncio.Task] = []
+        # 各阶段任务在 turn_scope 内创建，继承当前轮次缓存
+        with turn_scope(turn_cache):
             try:
-                # logger.debug(f"Running preprocessor: {processor.name}")
-                current_context = await processor.process(current_context)
-            except Exception as e:
-                logger.error(f"预处理器 {processor.name} 出错: {e}", exc_info=True)
-                # Decide whether to halt or continue. For now, we continue but log error.
-                # In a robust system, we might want to flag this in the context.
-                current_context["errors"] = current_context.get("errors", []) + [f"{processor.name}: {str(e)}"]
-        
-        return current_context
+                for index, processor in enumerate(self.preprocessors):
+                    waits = [tasks[i] for i in self._dependencies[index]]
+                    tasks.append(asyncio.create_task(
+                        self._run_stage(index, processor, context, waits, timings, pipeline_start, session_lock)
+                    ))
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    if not task.done():
+                        task.cancel()
+
+        context["preprocess_total_ms"] = round((time.perf_counter() - pipeline_start) * 1000, 2)
+        logger.debug(f"预处理耗时 {context['preprocess_total_ms']}ms: {timings}, 轮次缓存: {turn_cache.stats()}")
+        return context
+
+    async def _run_stage(self, index: int, processor: BasePreprocessor, context: Dict[str, Any],
+                         waits: List[asyncio.Task], timings: Dict[str, Dict[str, float]], pipeline_start: float,
+                         session_lock: asyncio.Lock):
+        if waits:
+            await asyncio.gather(*waits)
+
+        start = time.perf_counter()
+        stage_context = context
+        private_session = None
+        lock = None
+        try:
+            # 并发阶段不能共用同一个 AsyncSession，为其开独立会话并在结束后合并声明的写入键；
+            # 拿不到 engine 时退化为对共享会话加锁串行
+            if "session" in (processor.reads or ()) and self._may_overlap(index):
+                bind = getattr(context.get("session"), "bind", None)
+                if bind is not None:
+                    private_session = AsyncSession(bind, expire_on_commit=False)
+                    stage_context = dict(context)
+                    stage_context["session"] = private_session
+                else:
+                    lock = session_lock
+                    await lock.acquire()
+
+            # logger.debug(f"Running preprocessor: {processor.name}")
+            result = await processor.process(stage_context)
+            if result is not None and result is not stage_context:
+                stage_context.update(result)
+            if stage_context is not context:
+                for key in processor.writes or ():
+                    top_key = key.split(".", 1)[0]
+                    if top_key in stage_context:
+                        context[top_key] = stage_context[top_key]
+        except Exception as e:
+            logger.error(f"预处理器 {processor.name} 出错: {e}", exc_info=True)
+            # Decide whether to halt or continue. For now, we continue but log error.
+            # In a robust system, we might want to flag this in the context.
+            context["errors"] = context.get("errors", []) + [f"{processor.name}: {str(e)}"]
+        finally:
+            if lock is not None:
+                lock.release()
+            if private_session is not None:
+                await private_session.close()
+            timings[processor.name] = {
+                "start_ms": round((start - pipeline_start) * 1000, 2),
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+            }
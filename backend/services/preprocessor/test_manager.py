@@ -0,0 +1,141 @@
+import asyncio
+import unittest
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from services.preprocessor.base import BasePreprocessor
+from services.preprocessor.manager import PreprocessorManager
+
+
+class Stage(BasePreprocessor):
+    """测试用预处理器：记录开始 / 结束顺序，sleep 一小段时间后执行 action(context)。"""
+
+    def __init__(self, name, events, reads=None, writes=None, action=None, delay=0.02):
+        self._name = name
+        self.events = events
+        self.reads = reads
+        self.writes = writes
+        self.action = action
+        self.delay = delay
+        self.seen_session = None
+
+    @property
+    def name(self):
+        return self._name
+
+    async def process(self, context):
+        self.events.append(("start", self._name))
+        self.seen_session = context.get("session")
+        await asyncio.sleep(self.delay)
+        if self.action:
+            self.action(context)
+        self.events.append(("end", self._name))
+        return context
+
+
+class TestPreprocessorManager(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+
+    def run_async(self, coro):
+        return asyncio.new_event_loop().run_until_complete(coro)
+
+    def manager(self, *stages):
+        manager = PreprocessorManager()
+        for stage in stages:
+            manager.register(stage)
+        return manager
+
+    def overlapped(self, first, second):
+        """两个阶段的运行区间是否重叠。"""
+        index = self.events.index
+        return (index(("start", first)) < index(("end", second))
+                and index(("start", second)) < index(("end", first)))
+
+    def test_independent_stages_overlap(self):
+        manager = self.manager(
+            Stage("a", self.events, reads=("user_input",), writes=("a",), action=lambda c: c.update(a=1)),
+            Stage("b", self.events, reads=("user_input",), writes=("b",), action=lambda c: c.update(b=2)),
+        )
+        self.assertEqual(manager.get_stages(), [["a", "b"]])
+        context = self.run_async(manager.process({"user_input": "hi"}))
+        self.assertTrue(self.overlapped("a", "b"))
+        self.assertEqual((context["a"], context["b"]), (1, 2))
+        self.assertEqual(set(context["preprocessor_timings"]), {"a", "b"})
+
+    def test_dependent_stage_sees_earlier_writes(self):
+        def remember(context):
+            context["memories"] = ["m1"]
+
+        def answer(context):
+            context["answer"] = context["memories"] + [context["variables"]["x"]]
+
+        engine = create_async_engine("sqlite+aiosqlite://")
+        memory = Stage("memory", self.events, reads=("session",), writes=("memories",), action=remember)
+        # 与 memory 并发的另一个读取 session 的阶段，使 memory 在独立会话上运行
+        other = Stage("other", self.events, reads=("session",), writes=("variables.x",),
+                      action=lambda c: c["variables"].update(x="x"))
+        consumer = Stage("answer", self.events, reads=("memories", "variables.x"), writes=("answer",), action=answer)
+        manager = self.manager(memory, other, consumer)
+        self.assertEqual(manager.get_stages(), [["memory", "other"], ["answer"]])
+
+        async def run():
+            async with AsyncSession(engine) as session:
+                context = await manager.process({"session": session, "variables": {}})
+                return session, context
+        try:
+            session, context = self.run_async(run())
+        finally:
+            self.run_async(engine.dispose())
+
+        self.assertIsNot(memory.seen_session, session)
+        self.assertEqual(context["answer"], ["m1", "x"])
+        self.assertLess(self.events.index(("end", "memory")), self.events.index(("start", "answer")))
+        self.assertLess(self.events.index(("end", "other")), self.events.index(("start", "answer")))
+
+    def test_undeclared_stage_is_barrier(self):
+        manager = self.manager(
+            Stage("a", self.events, reads=("user_input",), writes=("a",)),
+            Stage("legacy", self.events),
+            Stage("b", self.events, reads=("user_input",), writes=("b",)),
+        )
+        self.assertEqual(manager.get_stages(), [["a"], ["legacy"], ["b"]])
+        self.run_async(manager.process({"user_input": "hi"}))
+        self.assertEqual([name for _, name in self.events], ["a", "a", "legacy", "legacy", "b", "b"])
+
+    def test_private_session_merges_only_declared_keys(self):
+        def write(context):
+            context["declared"] = "ok"
+            context["leaked"] = "nope"
+
+        engine = create_async_engine("sqlite+aiosqlite://")
+        manager = self.manager(
+            Stage("writer", self.events, reads=("session",), writes=("declared",), action=write),
+            Stage("reader", self.events, reads=("session",), writes=("other",)),
+        )
+
+        async def run():
+            async with AsyncSession(engine) as session:
+                return await manager.process({"session": session})
+        try:
+            context = self.run_async(run())
+        finally:
+            self.run_async(engine.dispose())
+
+        self.assertTrue(self.overlapped("writer", "reader"))
+        self.assertEqual(context["declared"], "ok")
+        self.assertNotIn("leaked", context)
+
+    def test_session_without_engine_falls_back_to_lock(self):
+        shared = object()  # 没有 bind，无法开独立会话
+        writer = Stage("writer", self.events, reads=("session",), writes=("a",))
+        reader = Stage("reader", self.events, reads=("session",), writes=("b",))
+        self.run_async(self.manager(writer, reader).process({"session": shared}))
+        self.assertFalse(self.overlapped("writer", "reader"))
+        self.assertIs(writer.seen_session, shared)
+        self.assertIs(reader.seen_session, shared)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,5 @@
 import os
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
@@ -216,11 +217,13 @@ class PromptManager:
                 content = content.replace("在执行任何外部操作时，必须遵循‘思考-行动-观察’的循环。", "")
                 variables["ability_nit"] = content
             
-            # 4. 渲染工作模式专用模板
-            return self.mdp.render("core/templates/system_work", variables)
+            # 4. 渲染工作模式专用模板 (稳定部分在前，易变上下文在后)
+            return self.mdp.render("core/templates/system_work", variables) + "\n\n" + \
+                self.mdp.render("core/templates/work_context", variables)
 
-        # 1. 渲染模板
-        final_prompt = self.mdp.render("core/templates/system_template", variables)
+        # 1. 渲染模板 (稳定部分在前，易变上下文在后)
+        final_prompt = self.mdp.render("core/templates/system_template", variables) + "\n\n" + \
+            self.mdp.render("core/templates/system_context", variables)
         
         # [轻量级模式提醒]
         config = get_config_manager()
@@ -234,7 +237,8 @@ class PromptManager:
     def build_instruction_prompt(self, variables: Dict[str, Any], is_social_mode: bool = False, is_work_mode: bool = False) -> str:
         """
         构建指令部分的 Prompt (Rules, Tools, COT)
-        通常放在消息列表的最后，作为 System Message 提醒模型
+        拼接在身份/人设之后，属于首条 System Message 的稳定前缀 (跨轮次逐字节一致，便于前缀缓存命中)，
+        因此这里不能渲染每轮变化的内容
         """
         # [工作模式]
         # 工作模式通常在 system_work 中包含了必要的指令，或者需要专门的 instruction_work
@@ -353,15 +357,20 @@ class PromptManager:
                  
             return messages
 
-        # 2. 构建基础 System Prompt (Identity, Context)
-        base_prompt = ""
+        # 2. 稳定前缀: 身份、人设与指令 (Rules, Tools, COT)
+        # 这些内容在配置、插件不变时逐字节一致，放在最前面，上游 / 本地推理服务的前缀 (KV) 缓存才能跨轮次命中
         if is_work_mode:
             base_prompt = self.mdp.render("core/templates/system_work", variables)
         else:
             base_prompt = self.mdp.render("core/templates/system_template", variables)
-            
-        # 3. 构建指令 Prompt (Rules, Tools, COT)
         instruction_prompt = self.build_instruction_prompt(variables, is_social_mode, is_work_mode)
+        prefix_prompt = base_prompt + "\n\n" + instruction_prompt if instruction_prompt else base_prompt
+
+        # 3. 易变部分: 时间、状态、记忆、感知等每轮都会变化的内容，放在历史之后
+        if is_work_mode:
+            context_prompt = self.mdp.render("core/templates/work_context", variables)
+        else:
+            context_prompt = self.mdp.render("core/templates/system_context", variables)
 
         if is_voice_mode:
             # 在语音模式下，增加关于语音输入的提醒
@@ -370,8 +379,7 @@ class PromptManager:
                 voice_reminder = "\n\n【系统提醒: 当前主人正在使用原生语音进行交流。你已获得主人的原生音频输入（Multimodal Audio），这能让你感受到主人的语气、情感和环境背景。请优先基于你听到的音频内容进行回复。】"
             else:
                 voice_reminder = "\n\n【系统提醒: 当前主人正在使用语音输入，但你目前只能接收到 ASR (自动语音识别) 转录后的文本。由于 ASR 可能存在同音错别字，请你结合上下文进行合理推测，并以可爱的语气给予回应。】"
-            # 语音提醒附在指令之后
-            instruction_prompt += voice_reminder
+            context_prompt += voice_reminder
         
         # 对历史记录进行清洗
         cleaned_history = []
@@ -381,7 +389,17 @@ class PromptManager:
                 cleaned_msg["content"] = self.clean_history_for_api(msg.get("content", ""))
             cleaned_history.append(cleaned_msg)
             
-        # 组装：[System(Base)] + History + [System(Instruction)]
-        messages = [{"role": "system", "content": base_prompt}] + cleaned_history + [{"role": "system", "content": instruction_prompt}]
+        # 组装：[System(稳定前缀)] + History + [System(易变上下文)]
+        messages = [{"role": "system", "content": prefix_prompt}] + cleaned_history + [{"role": "system", "content": context_prompt}]
         
         return messages
+
+    @staticmethod
+    def compute_prefix_hash(messages: List[Dict[str, Any]]) -> str:
+        """
+        稳定前缀 (首条 system 消息) 的哈希。
+        输入 (人设、能力、工具描述) 不变时跨轮次应保持一致，用于日志观察与测试前缀缓存是否会失效。
+        """
+        if not messages or messages[0].get("role") != "system":
+            return ""
+        return hashlib.blake2b(str(messages[0].get("content", "")).encode("utf-8"), digest_size=8).hexdigest()
@@ -4,11 +4,17 @@ import logging
 import re
 import json
 import base64
-from typing import Optional
+import itertools
+from typing import Optional, Union
 from services.asr_service import get_asr_service
 from services.tts_service import get_tts_service
+from services.tts_pipeline import ReActFilter, SentenceSplitter, TTSPipeline, strip_react
+from services.audio_stream import detect_audio_mime, iter_audio_chunks
+from services.audio_processor import encode_wav
+from services.streaming_asr import ASR_SAMPLE_RATE, parse_pcm_rate
 # from services.agent_service import AgentService # Moved to local import to avoid circular dependency
 from database import get_session
+from core.config_manager import get_config_snapshot
 from models import ConversationLog, Config, AIModelConfig
 from sqlmodel import select
 from services.gateway_client import gateway_client
@@ -19,6 +25,11 @@ import time
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 语音轮次分句流水线 TTS (设为 0 回退到整段合成)
+TTS_PIPELINE_ENABLED = os.environ.get("PERO_TTS_PIPELINE", "1") != "0"
+# 流式 PCM 超过该时间 (秒) 没有新分片视为客户端已断开，回收转写状态
+ASR_STREAM_IDLE_TIMEOUT = float(os.environ.get("PERO_ASR_STREAM_IDLE_TIMEOUT", "30"))
+
 class RealtimeSessionManager:
     """
     实时会话管理器 (原 VoiceManager)
@@ -35,6 +46,7 @@ class RealtimeSessionManager:
         self.current_task: Optional[asyncio.Task] = None
         self.pending_confirmations: dict[str, asyncio.Future] = {}
         self.active_commands: dict[int, asyncio.Event] = {}
+        self.asr_streams: dict[str, dict] = {}
         
     def initialize(self):
         """Initialize Gateway listeners"""
@@ -52,11 +64,90 @@ class RealtimeSessionManager:
         # But looking at previous logic: "speech_end" event contained base64 data.
         # DataStream payload has bytes.
         
+        # 原始 PCM 分片 (content_type 为 audio/pcm[;rate=N])：流式转写
+        if envelope.stream.content_type.startswith("audio/pcm"):
+            await self._handle_pcm_stream(envelope)
+            return
+
         # If it's a complete audio file (simulated stream):
         if envelope.stream.is_end:
              # Process as voice turn
              await self._process_voice_turn_gateway(envelope.source_id, envelope.stream.data, envelope.trace_id)
 
+    async def _handle_pcm_stream(self, envelope):
+        """流式 PCM：边收边做 VAD 与部分转写，每句话结束 (静音或流结束) 后直接进入对话轮次"""
+        stream = envelope.stream
+        state = self.asr_streams.get(stream.stream_id)
+        if state is None:
+            # 每个分片由独立任务处理，按 stream_id 加锁保证顺序送入；
+            # 同一条流中的多句话依次进入对话轮次 (turn 为最近一轮的任务)
+            state = {"lock": asyncio.Lock(), "transcriber": None, "turn": None, "expiry": None}
+            self.asr_streams[stream.stream_id] = state
+
+        async with state["lock"]:
+            try:
+                if state["transcriber"] is None:
+                    source_id, trace_id = envelope.source_id, envelope.trace_id
+
+                    async def on_partial(text: str):
+                        await self.broadcast_gateway({"type": "transcription", "content": text, "partial": "true"})
+
+                    async def on_final(text: str, samples):
+                        # 对话轮次耗时较长，不阻塞后续分片的接收；但要等上一句的轮次结束再开始，
+                        # 否则两轮共用 voice_session，音频也会交错
+                        audio_bytes = encode_wav(samples, ASR_SAMPLE_RATE)
+                        state["turn"] = self.current_task = asyncio.create_task(
+                            self._run_voice_turn_after(state["turn"], source_id, audio_bytes, trace_id, text)
+                        )
+
+                    state["transcriber"] = await self.asr_service.create_stream(
+                        on_partial, on_final, input_rate=parse_pcm_rate(stream.content_type)
+                    )
+                    await self.broadcast_gateway({"type": "status", "content": "listening"})
+
+                if stream.data:
+                    await state["transcriber"].feed(stream.data)
+                if stream.is_end:
+                    await state["transcriber"].finish()
+            except Exception as e:
+                error_msg = f"ASR 失败: {str(e)}"
+                logger.error(error_msg)
+                self._drop_asr_stream(stream.stream_id, state)
+                await self.broadcast_gateway({"type": "text_response", "content": f"[{error_msg}]"})
+                await self.broadcast_gateway({"type": "status", "content": "idle"})
+            finally:
+                if stream.is_end:
+                    self._drop_asr_stream(stream.stream_id, state)
+                elif self.asr_streams.get(stream.stream_id) is state:
+                    # 客户端中途断开时收不到 is_end，空闲超时后回收
+                    if state["expiry"] is not None:
+                        state["expiry"].cancel()
+                    state["expiry"] = asyncio.get_running_loop().call_later(
+                        ASR_STREAM_IDLE_TIMEOUT, self._expire_asr_stream, stream.stream_id, state
+                    )
+
+    def _drop_asr_stream(self, stream_id: str, state: dict):
+        if self.asr_streams.get(stream_id) is state:
+            del self.asr_streams[stream_id]
+        if state["expiry"] is not None:
+            state["expiry"].cancel()
+            state["expiry"] = None
+
+    def _expire_asr_stream(self, stream_id: str, state: dict):
+        state["expiry"] = None
+        if self.asr_streams.get(stream_id) is not state or state["lock"].locked():
+            return
+        logger.warning(f"流式语音 {stream_id} 超过 {ASR_STREAM_IDLE_TIMEOUT:.0f}s 没有新数据，已回收")
+        self._drop_asr_stream(stream_id, state)
+
+    async def _run_voice_turn_after(self, previous: Optional[asyncio.Task], source_id: str, audio_bytes: bytes,
+                                    trace_id: str, user_text: str):
+        """等待同一条流的上一轮对话结束后再开始本轮"""
+        if previous is not None and not previous.done():
+            # asyncio.wait 不会抛出上一轮的异常 / 取消
+            await asyncio.wait([previous])
+        await self._process_voice_turn_gateway(source_id, audio_bytes, trace_id, user_text=user_text)
+
     async def handle_voice_interaction(self, envelope):
         """Handle voice control messages (text, status, etc)"""
         req = envelope.request
@@ -116,57 +207,42 @@ class RealtimeSessionManager:
         """[Deprecated] Forward legacy broadcast calls to Gateway"""
         await self.broadcast_gateway(message)
 
-    async def send_audio_stream_gateway(self, target_id: str, trace_id: str, audio_path: str):
-        """Send audio file as DataStream via Gateway"""
+    async def send_audio_stream_gateway(self, target_id: str, trace_id: str, audio: Union[str, bytes]):
+        """Send audio (file path or in-memory bytes) as chunked DataStream frames via Gateway"""
         try:
-            with open(audio_path, "rb") as f:
-                audio_data = f.read()
-            
-            envelope = perolink_pb2.Envelope()
-            envelope.id = str(uuid.uuid4())
-            envelope.source_id = gateway_client.device_id
-            envelope.target_id = target_id
-            envelope.timestamp = int(time.time() * 1000)
-            envelope.trace_id = trace_id
-            
-            # Use DataStream
-            envelope.stream.stream_id = str(uuid.uuid4())
-            envelope.stream.data = audio_data
-            envelope.stream.is_end = True
-            envelope.stream.content_type = "audio/mp3" # or wav based on file
-            
-            await gateway_client.send(envelope)
+            chunks = iter_audio_chunks(audio)
+            first = next(chunks, b"")
+            content_type = detect_audio_mime(first, audio if isinstance(audio, str) else None)
+            if not await gateway_client.send_stream(target_id, itertools.chain([first], chunks), content_type, trace_id):
+                logger.warning("网关未连接，音频流发送中止")
         except Exception as e:
             logger.error(f"通过网关发送音频流失败: {e}")
 
-    async def _process_voice_turn_gateway(self, source_id: str, audio_bytes: bytes, trace_id: str):
-        """Handle voice turn via Gateway"""
+    async def _process_voice_turn_gateway(self, source_id: str, audio_bytes: bytes, trace_id: str,
+                                          user_text: Optional[str] = None):
+        """Handle voice turn via Gateway (user_text 已由流式 ASR 给出时跳过转录)"""
         import time
         start_turn_time = time.time()
         
-        # 1. Save temp file
-        temp_audio_path = f"temp_voice_gw_{source_id}_{int(time.time())}.wav"
+        speech = None
         try:
             print("\n" + "="*60)
             print(f"[Gateway Voice] 开始对话轮次 {time.strftime('%H:%M:%S')}")
             print("="*60)
             
-            with open(temp_audio_path, "wb") as f:
-                f.write(audio_bytes)
-            
-            # 2. ASR
-            print("[ASR] 正在转录...")
-            await self.broadcast_gateway({"type": "status", "content": "listening"})
-            
+            # 2. ASR (音频直接在内存中转录，不再写临时文件)
             asr_start = time.time()
-            try:
-                user_text = await self.asr_service.transcribe(temp_audio_path)
-            except Exception as e:
-                error_msg = f"ASR 失败: {str(e)}"
-                logger.error(error_msg)
-                await self.broadcast_gateway({"type": "text_response", "content": f"[{error_msg}]"})
-                await self.broadcast_gateway({"type": "status", "content": "idle"})
-                return
+            if user_text is None:
+                print("[ASR] 正在转录...")
+                await self.broadcast_gateway({"type": "status", "content": "listening"})
+                try:
+                    user_text = await self.asr_service.transcribe(audio_bytes)
+                except Exception as e:
+                    error_msg = f"ASR 失败: {str(e)}"
+                    logger.error(error_msg)
+                    await self.broadcast_gateway({"type": "text_response", "content": f"[{error_msg}]"})
+                    await self.broadcast_gateway({"type": "status", "content": "idle"})
+                    return
 
             asr_duration = time.time() - asr_start
             
@@ -198,12 +274,10 @@ class RealtimeSessionManager:
                 # Check native voice input
                 enable_voice_input = False
                 try:
-                    config_obj = (await session.exec(select(Config).where(Config.key == "current_model_id"))).first()
-                    if config_obj and config_obj.value:
-                        model_id_db = int(config_obj.value)
-                        model_config = await session.get(AIModelConfig, model_id_db)
-                        if model_config and model_config.enable_voice:
-                            enable_voice_input = True
+                    snapshot = await get_config_snapshot()
+                    model_config = snapshot.get_model(snapshot.get("current_model_id"))
+                    if model_config and model_config.enable_voice:
+                        enable_voice_input = True
                 except: pass
 
                 messages_payload = [{"role": "user", "content": user_text}]
@@ -224,6 +298,7 @@ class RealtimeSessionManager:
                 agent = AgentService(session)
                 full_response = ""
                 generation_error = None
+                speech = self._start_speech_pipeline(source_id, trace_id) if TTS_PIPELINE_ENABLED else None
                 
                 try:
                     async for chunk in agent.chat(
@@ -236,6 +311,8 @@ class RealtimeSessionManager:
                     ):
                         if chunk:
                             full_response += chunk
+                            if speech:
+                                self._feed_speech_pipeline(speech, chunk, full_response)
                 except Exception as e:
                     print(f"生成错误: {e}")
                     generation_error = str(e)
@@ -258,6 +335,26 @@ class RealtimeSessionManager:
                 if not tts_response:
                     tts_response = "..."
 
+                if speech:
+                    self._feed_speech_pipeline(speech, None, full_response)
+                    if speech["pipeline"].submitted:
+                        # 分句已在生成过程中陆续合成发送，这里只补发文本并等待剩余音频发完
+                        if not speech["speaking"]:
+                            await self.broadcast_gateway({"type": "status", "content": "speaking"})
+                        await self.broadcast_gateway({"type": "text_response", "content": ui_response})
+                        await speech["pipeline"].close()
+                        ttfa = speech["pipeline"].time_to_first_audio
+                        ttfa_text = f"{agent_start - start_turn_time + ttfa:.2f}s" if ttfa is not None else "无"
+                        print(f"[TTS] 分句流水线完成 ({speech['pipeline'].sent}/{speech['pipeline'].submitted} 段, 首段音频 {ttfa_text})")
+
+                        total_duration = time.time() - start_turn_time
+                        print(f"🏁 [Gateway Voice] 对话轮次结束 ({total_duration:.2f}s)\n")
+
+                        await self.broadcast_gateway({"type": "status", "content": "idle"})
+                        break
+                    # 回复中没有可朗读的句子，按原流程合成兜底文本
+                    await speech["pipeline"].close()
+
                 # Send text
                 await self.broadcast_gateway({"type": "status", "content": "speaking"})
                 await self.broadcast_gateway({"type": "text_response", "content": ui_response})
@@ -266,7 +363,7 @@ class RealtimeSessionManager:
                 target_voice, target_rate, target_pitch = self._get_voice_params(full_response)
                 print(f"[TTS] 正在合成 {target_voice}...")
                 tts_start = time.time()
-                audio_path = await self.tts_service.synthesize(
+                audio_data = await self.tts_service.synthesize_bytes(
                     tts_response, 
                     voice=target_voice, 
                     rate=target_rate, 
@@ -274,9 +371,9 @@ class RealtimeSessionManager:
                 )
                 tts_duration = time.time() - tts_start
                 
-                if audio_path:
+                if audio_data:
                     print(f"[TTS] 音频就绪 ({tts_duration:.2f}s). 正在发送流.")
-                    await self.send_audio_stream_gateway(source_id, trace_id, audio_path)
+                    await self.send_audio_stream_gateway(source_id, trace_id, audio_data)
                 else:
                     print(f"❌ TTS 失败.")
                 
@@ -290,9 +387,65 @@ class RealtimeSessionManager:
             logger.error(f"Gateway 语音错误: {e}")
             await self.broadcast_gateway({"type": "error", "content": str(e)})
         finally:
-            if os.path.exists(temp_audio_path):
-                try: os.remove(temp_audio_path)
-                except: pass
+            if speech:
+                # 异常退出时放弃尚未完成的分句合成 (正常结束时已全部发送，这里为空操作)
+                await speech["pipeline"].close(cancel=True)
+
+    def _start_speech_pipeline(self, target_id: str, trace_id: str) -> dict:
+        """创建语音轮次的分句流水线：流式过滤标签 -> ReAct 过滤 -> 分句 -> 有限并发合成 -> 按序发送"""
+        from nit_core.stream_filter import StreamTagFilter, DEFAULT_THINKING_TAGS
+        speech = {
+            "filter": StreamTagFilter(
+                nit=True,
+                xml_tags=["THOUGHT", "PEROCUE", "CHARACTER_STATUS", "METADATA"],
+                thinking_tags=DEFAULT_THINKING_TAGS,
+            ),
+            "react": ReActFilter(),
+            "splitter": SentenceSplitter(),
+            "voice": None,
+            "speaking": False,
+        }
+
+        async def synthesize(text: str) -> Optional[bytes]:
+            voice, rate, pitch = speech["voice"]
+            return await self.tts_service.synthesize_bytes(text, voice=voice, rate=rate, pitch=pitch)
+
+        async def send(audio: bytes):
+            if not speech["speaking"]:
+                speech["speaking"] = True
+                await self.broadcast_gateway({"type": "status", "content": "speaking"})
+            await self.send_audio_stream_gateway(target_id, trace_id, audio)
+
+        speech["pipeline"] = TTSPipeline(synthesize, send)
+        return speech
+
+    def _feed_speech_pipeline(self, speech: dict, chunk: Optional[str], full_response: str):
+        """把新的回复分片送入分句流水线；chunk 为 None 表示回复结束，冲刷剩余文本"""
+        react = speech["react"]
+        if chunk is None:
+            parts = [react.feed(speech["filter"].flush()), react.flush()]
+        else:
+            parts = [react.feed(speech["filter"].filter(chunk))]
+
+        sentences = []
+        for text, rebase in parts:
+            if rebase:
+                # 出现最终回答标记，之前的内容都是思考过程：丢弃分句缓冲和尚未朗读的句子
+                speech["splitter"].flush()
+                speech["pipeline"].discard_pending()
+                sentences = []
+            sentences.extend(speech["splitter"].feed(text))
+        if chunk is None:
+            sentences.append(speech["splitter"].flush())
+
+        for sentence in sentences:
+            tts_text = self._clean_text(sentence, for_tts=True, react=False)
+            if not tts_text:
+                continue
+            if speech["voice"] is None:
+                # 音色参数在第一句出现时根据已生成的内容确定，整轮保持一致
+                speech["voice"] = self._get_voice_params(full_response)
+            speech["pipeline"].submit(tts_text)
 
     async def request_user_confirmation(self, command: str, risk_info: dict = None, is_high_risk: bool = False) -> bool:
         """
@@ -340,8 +493,8 @@ class RealtimeSessionManager:
             if request_id in self.pending_confirmations:
                 del self.pending_confirmations[request_id]
 
-    def _clean_text(self, text: str, for_tts: bool = True) -> str:
-        """清洗文本，移除标签、动作描述等不应朗读的内容"""
+    def _clean_text(self, text: str, for_tts: bool = True, react: bool = True) -> str:
+        """清洗文本，移除标签、动作描述等不应朗读的内容。react=False 时跳过 ReAct 过滤 (输入已经过 ReActFilter)"""
         if not text:
             return ""
 
@@ -371,45 +524,9 @@ class RealtimeSessionManager:
             cleaned = re.sub(r'【(?:Thinking|Monologue).*?】', '', cleaned, flags=re.DOTALL | re.IGNORECASE)
             cleaned = re.sub(r'\[(?:Thinking|Monologue).*?\]', '', cleaned, flags=re.DOTALL | re.IGNORECASE)
 
-            # 策略 1：如果存在 "Final Answer" (最终回答) 标记，则提取其后的所有内容。
-            final_marker = re.search(r'(?:Final Answer|最终回答|回复)[:：]?\s*(.*)', cleaned, flags=re.DOTALL | re.IGNORECASE)
-            if final_marker:
-                cleaned = final_marker.group(1)
-            else:
-                # 策略 2：通过已知的 ReAct 块标题进行分割，并提取最后一块。
-                # 这假设回复总是在最后。
-                
-                # 标准化换行符
-                cleaned = cleaned.replace('\r\n', '\n')
-                
-                # 识别最后一个 "技术标题" 并提取其后的内容
-                # 标题包括：Plan:, Action:, Observation:, Result:, Thought:
-                # 我们查找这些标题在行首的最后一次出现
-                headers_pattern = r'(?m)^(?:Plan|计划|Action|Action Input|Observation|Result|Thought|Prompt)[:：]'
-                
-                matches = list(re.finditer(headers_pattern, cleaned))
-                if matches:
-                    last_match = matches[-1]
-                    # 从最后一个标题之后的行开始
-                    # 等等，如果最后一个标题是 "Plan:"，我们也想跳过计划内容。
-                    # 计划内容通常在下一个标题或双换行符处结束。
-                    # 既然我们找到了最后一个标题，那么它之后的内容要么是该标题的内容，要么是最终回复。
-                    
-                    remaining = cleaned[last_match.start():]
-                    
-                    # 启发式规则：如果是 Observation/Result/Action，我们要么不读它。
-                    # 但如果它是剩下的唯一内容，也许我们什么都不应该读？
-                    # 然而，通常在技术块之后会有文本。
-                    
-                    # 让我们尝试移除与最后一个块关联的 *行*，如果它们看起来像技术内容。
-                    # 但更简单的方法：最终回复通常不以关键字开头。
-                    # 所以如果我们有 `Observation: ... \n Hello`，我们要的是 `Hello`。
-                    
-                    # 让我们使用一个 "块剥离器" (Block Stripper) 来移除所有已知的技术块。
-                    # 正则表达式匹配技术块：标题 -> 内容 -> 下一个标题/结尾
-                    
-                    block_pattern = r'(?m)^(?:Plan|计划|Action|Action Input|Observation|Result|Thought|Prompt)[:：][\s\S]*?(?=(?:^(?:Plan|计划|Action|Action Input|Observation|Result|Thought|Prompt|Final Answer|最终回答|回复)[:：])|\Z)'
-                    cleaned = re.sub(block_pattern, '', cleaned)
+            if react:
+                # 只保留最终回复 (整段回复才能判断；流式分句时由 ReActFilter 在分句前完成)
+                cleaned = strip_react(cleaned)
 
         # 4. 移除动作描述 *...* 或 (动作) 或 （动作）
         if for_tts:
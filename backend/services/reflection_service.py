@@ -2,9 +2,10 @@ import asyncio
 from typing import List, Optional
 from sqlmodel import select, desc
 from sqlmodel.ext.asyncio.session import AsyncSession
-from models import Memory, MemoryRelation, Config, AIModelConfig, MaintenanceRecord, ConversationLog
+from models import Memory, MemoryRelation, MemoryEmbedding, Config, AIModelConfig, MaintenanceRecord, ConversationLog, pack_embedding
 from services.llm_service import LLMService
 from services.mdp.manager import mdp
+from core.config_manager import get_config_snapshot
 import json
 import random
 from datetime import datetime, timedelta
@@ -16,9 +17,9 @@ class ReflectionService:
 
     async def _get_reflection_config(self):
         """获取反思模型配置 (通常是更强大的模型，如 GPT-4/Claude-3.5)"""
-        # 复用 AgentService 中的逻辑，或者直接查询 Config
-        # 这里简化处理，直接查 Config
-        configs = {c.key: c.value for c in (await self.session.exec(select(Config))).all()}
+        # 读取进程级配置快照，避免每次反思都查询 Config 全表
+        snapshot = await get_config_snapshot()
+        configs = snapshot.configs
         
         reflection_model_id = configs.get("reflection_model_id")
         
@@ -30,14 +31,14 @@ class ReflectionService:
         model = "gpt-4o" # Fallback if everything fails, but we try to use main model first
 
         if reflection_model_id:
-            model_config = await self.session.get(AIModelConfig, int(reflection_model_id))
+            model_config = snapshot.get_model(reflection_model_id)
             if model_config:
                 api_key = model_config.api_key if model_config.provider_type == 'custom' else api_key
                 api_base = model_config.api_base if model_config.provider_type == 'custom' else api_base
                 model = model_config.model_id
         elif main_model_id:
              # Use Main Model as fallback
-            model_config = await self.session.get(AIModelConfig, int(main_model_id))
+            model_config = snapshot.get_model(main_model_id)
             if model_config:
                 api_key = model_config.api_key if model_config.provider_type == 'custom' else api_key
                 api_base = model_config.api_base if model_config.provider_type == 'custom' else api_base
@@ -159,10 +160,9 @@ class ReflectionService:
             
             # 生成 Embedding
             from services.embedding_service import embedding_service
-            embedding_json = "[]"
+            vec = []
             try:
                 vec = embedding_service.encode_one(summary_text)
-                embedding_json = json.dumps(vec)
             except: pass
             
             db_content = summary_text
@@ -176,12 +176,13 @@ class ReflectionService:
                 timestamp=first_mem.timestamp, # 使用第一条的时间
                 realTime=first_mem.realTime,
                 source="system",
-                type="summary",
-                embedding_json=embedding_json
+                type="summary"
             )
             self.session.add(summary_mem)
             await self.session.flush() # 获取 ID
             await self.session.refresh(summary_mem)
+            if vec:
+                self.session.add(MemoryEmbedding(memory_id=summary_mem.id, dim=len(vec), vector=pack_embedding(vec)))
             
             # 更新链表 (Bypass the group)
             # A -> [B -> ... -> D] -> E
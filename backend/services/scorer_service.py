@@ -10,7 +10,7 @@ import json
 import asyncio
 import os
 import re
-from core.config_manager import get_config_manager
+from core.config_manager import get_config_manager, get_config_snapshot
 
 class ScorerService:
     def __init__(self, session: AsyncSession):
@@ -56,13 +56,13 @@ class ScorerService:
 
     async def _get_scorer_config(self) -> Dict[str, Any]:
         """获取秘书专用模型配置，如果未配置则回退到全局配置"""
+        snapshot = await get_config_snapshot()
+
         # 1. 尝试查找名为 "秘书" 的模型配置
-        statement = select(AIModelConfig).where(AIModelConfig.name == "秘书")
-        result = await self.session.exec(statement)
-        model_config = result.first()
+        model_config = snapshot.get_model_by_name("秘书")
         
         # 2. 获取全局配置作为回退
-        configs = {c.key: c.value for c in (await self.session.exec(select(Config))).all()}
+        configs = snapshot.configs
         global_api_key = configs.get("global_llm_api_key", "")
         global_api_base = configs.get("global_llm_api_base", "https://api.openai.com")
 
@@ -77,7 +77,7 @@ class ScorerService:
         # 3. 尝试使用主模型回退
         main_model_id = configs.get("current_model_id")
         if main_model_id:
-            main_config = await self.session.get(AIModelConfig, int(main_model_id))
+            main_config = snapshot.get_model(main_model_id)
             if main_config:
                  return {
                     "api_key": main_config.api_key if main_config.provider_type == 'custom' else global_api_key,
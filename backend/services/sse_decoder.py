@@ -0,0 +1,189 @@
+import json
+import asyncio
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Optional
+
+# JSON 解码：优先 orjson / msgspec，均未安装时回退到标准库
+try:
+    import orjson
+    _loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import msgspec
+        _loads = msgspec.json.Decoder().decode
+        JSON_BACKEND = "msgspec"
+    except ImportError:
+        _loads = json.loads
+        JSON_BACKEND = "json"
+
+_DATA_PREFIX = b"data:"
+_DONE = b"[DONE]"
+
+
+class SSEDecoder:
+    """
+    字节级 SSE 分帧器 (OpenAI 兼容流)
+    直接在 bytes 上按行切分，只解码 data: 行，不为每行构造 str。
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.done = False
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        """输入一段网络数据，返回其中完整的已解码 data 负载。"""
+        if self.done:
+            return []
+        self._buffer += chunk
+        end = self._buffer.rfind(b"\n")
+        if end == -1:
+            return []
+        block = bytes(self._buffer[:end])
+        del self._buffer[:end + 1]
+        return self._parse(block)
+
+    def flush(self) -> List[Any]:
+        """流结束：解码最后一行没有换行结尾的数据。"""
+        if self.done or not self._buffer:
+            return []
+        block = bytes(self._buffer)
+        self._buffer.clear()
+        return self._parse(block)
+
+    def _parse(self, block: bytes) -> List[Any]:
+        payloads = []
+        for line in block.split(b"\n"):
+            if not line.startswith(_DATA_PREFIX):
+                continue # 注释、event:/id: 字段及空行
+            data = line[5:].strip()
+            if data == _DONE:
+                self.done = True
+                break
+            try:
+                payloads.append(_loads(data))
+            except Exception:
+                continue
+        return payloads
+
+
+def _is_text_delta(delta: Dict[str, Any]) -> bool:
+    # 只有 content (以及 role / 值为 null 的扩展字段) 的 delta 才能安全合并
+    if not delta.get("content"):
+        return False
+    for key, value in delta.items():
+        if key not in ("content", "role") and value is not None:
+            return False
+    return True
+
+
+def _extract_delta(payload: Any) -> Optional[Dict[str, Any]]:
+    if isinstance(payload, dict):
+        choices = payload.get("choices")
+        if choices:
+            return choices[0].get("delta") or {}
+    return None
+
+
+async def iter_sse_deltas(
+    chunks: AsyncIterable[bytes],
+    coalesce_ms: float = 0.0,
+    record: Optional[List[bytes]] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    将原始字节流解码为 delta 字典。
+    - 同一次网络读取中的纯文本 delta 会合并为一个
+    - coalesce_ms > 0 时，纯文本 delta 额外在该时间窗口内合并后再产出
+    - tool_calls 等非文本 delta 原样逐个产出，并先冲刷已合并的文本，保证顺序
+    - record 不为 None 时追加记录原始字节，用于回放基准测试
+    """
+    decoder = SSEDecoder()
+    pending: List[str] = []
+
+    def flush():
+        text = "".join(pending)
+        pending.clear()
+        return {"content": text}
+
+    def decode(chunk: Optional[bytes]):
+        """chunk 为 None 表示源已耗尽，冲刷解码器中剩余的最后一行"""
+        if chunk is None:
+            payloads = decoder.flush()
+        else:
+            if record is not None:
+                record.append(chunk)
+            payloads = decoder.feed(chunk)
+        out = []
+        for payload in payloads:
+            delta = _extract_delta(payload)
+            if delta is None:
+                continue
+            if _is_text_delta(delta):
+                pending.append(delta["content"])
+                continue
+            if pending:
+                out.append(flush())
+            out.append(delta)
+        return out
+
+    if coalesce_ms <= 0:
+        async for chunk in chunks:
+            for delta in decode(chunk):
+                yield delta
+            if pending:
+                yield flush()
+            if decoder.done:
+                break
+        else:
+            for delta in decode(None):
+                yield delta
+            if pending:
+                yield flush()
+        return
+
+    # 时间窗口合并：独立任务负责读取，消费端最多等待窗口剩余时间
+    loop = asyncio.get_running_loop()
+    window = coalesce_ms / 1000.0
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for chunk in chunks:
+                await queue.put(chunk)
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            await queue.put(None)
+
+    reader = asyncio.create_task(pump())
+    window_start = None
+    try:
+        while True:
+            timeout = None
+            if pending and window_start is not None:
+                timeout = max(0.0, window - (loop.time() - window_start))
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield flush()
+                window_start = None
+                continue
+
+            if item is None:
+                for delta in decode(None):
+                    yield delta
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            for delta in decode(item):
+                yield delta
+            if pending and window_start is None:
+                window_start = loop.time()
+            elif not pending:
+                window_start = None
+            if decoder.done:
+                break
+        if pending:
+            yield flush()
+    finally:
+        reader.cancel()
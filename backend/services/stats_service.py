@@ -0,0 +1,162 @@
+import logging
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import event, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session as SyncSession
+from sqlmodel import select, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models import Memory, MemoryRelation, ConversationLog, ScheduledTask, StatsCounter
+
+logger = logging.getLogger(__name__)
+
+# 需要物化计数的表 -> 计数器类型
+TRACKED_MODELS = {
+    Memory: "memories",
+    ConversationLog: "logs",
+    ScheduledTask: "tasks",
+    MemoryRelation: "relations",
+}
+_TRACKED_TABLES = {model.__table__: kind for model, kind in TRACKED_MODELS.items()}
+
+GRAPH_CACHE_SIZE = 16
+
+
+class StatsService:
+    """
+    仪表盘统计服务
+    - 每个 Agent 的记忆/日志/任务/关联数量保存在 StatsCounter 中，随写入同事务增减
+    - 记忆图谱按 (最新记忆 ID, 最新关联 ID, 计数, 本进程写入代数) 缓存
+    """
+    _graph_cache: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+    _graph_generation = 0
+
+    @staticmethod
+    async def ensure_initialized(session: AsyncSession):
+        """计数器表为空时 (首次启动/升级后) 用 COUNT(*) 全量回填一次。"""
+        existing = (await session.exec(select(StatsCounter).limit(1))).first()
+        if existing is None:
+            await StatsService.rebuild(session)
+
+    @staticmethod
+    async def rebuild(session: AsyncSession):
+        """按当前数据重新计算全部计数器。"""
+        await session.exec(delete(StatsCounter))
+        for model, kind in TRACKED_MODELS.items():
+            statement = select(model.agent_id, func.count()).group_by(model.agent_id)
+            for agent_id, count in (await session.exec(statement)).all():
+                session.add(StatsCounter(agent_id=agent_id or "pero", kind=kind, count=count))
+        await session.commit()
+        logger.info("[Stats] 统计计数器已重建")
+
+    @staticmethod
+    async def get_counts(session: AsyncSession, agent_id: Optional[str] = None) -> Dict[str, int]:
+        """读取计数器 (行数只与 Agent 数量相关，与日志规模无关)。"""
+        statement = select(StatsCounter)
+        if agent_id:
+            statement = statement.where(StatsCounter.agent_id == agent_id)
+        counts = {kind: 0 for kind in TRACKED_MODELS.values()}
+        for row in (await session.exec(statement)).all():
+            counts[row.kind] = counts.get(row.kind, 0) + row.count
+        return counts
+
+    @staticmethod
+    async def get_memory_graph(session: AsyncSession, limit: int = 200, agent_id: str = "pero") -> Dict[str, Any]:
+        """带快照缓存的记忆图谱，数据未变化时直接返回上次结果。"""
+        from services.memory_service import MemoryService
+
+        latest_memory_id = (await session.exec(select(func.max(Memory.id)))).one()
+        latest_relation_id = (await session.exec(select(func.max(MemoryRelation.id)))).one()
+        counts = await StatsService.get_counts(session, agent_id)
+        key = (
+            agent_id, limit, latest_memory_id, latest_relation_id,
+            counts["memories"], counts["relations"], StatsService._graph_generation
+        )
+
+        cache = StatsService._graph_cache
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+
+        graph = await MemoryService.get_memory_graph(session, limit, agent_id=agent_id)
+        cache[key] = graph
+        while len(cache) > GRAPH_CACHE_SIZE:
+            cache.popitem(last=False)
+        return graph
+
+    @staticmethod
+    def invalidate_graph():
+        StatsService._graph_generation += 1
+        StatsService._graph_cache.clear()
+
+
+def _apply_deltas(connection, deltas: Dict[Tuple[str, str], int]):
+    table = StatsCounter.__table__
+    for (agent_id, kind), delta in deltas.items():
+        if not delta:
+            continue
+        stmt = sqlite_insert(table).values(agent_id=agent_id, kind=kind, count=max(delta, 0))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.agent_id, table.c.kind],
+            set_={"count": func.max(table.c.count + delta, 0)}
+        )
+        connection.execute(stmt)
+
+
+# --- 计数器维护 ---
+# 与 ConfigManager 的快照失效相同，挂在 ORM Session 事件上：
+# session.add()/session.delete() 走 after_flush，批量 delete() 语句走 do_orm_execute，
+# 两者都在业务写入的同一个事务内更新计数器；图谱缓存在提交后失效。
+
+@event.listens_for(SyncSession, "after_flush")
+def _count_flushed_rows(session, flush_context):
+    deltas = defaultdict(int)
+    graph_changed = False
+    for objects, sign in ((session.new, 1), (session.deleted, -1)):
+        for obj in objects:
+            kind = TRACKED_MODELS.get(type(obj))
+            if kind:
+                deltas[(obj.agent_id or "pero", kind)] += sign
+    for obj in session.dirty:
+        if isinstance(obj, (Memory, MemoryRelation)):
+            graph_changed = True
+            break
+
+    if deltas:
+        _apply_deltas(session.connection(), deltas)
+    if graph_changed or any(kind in ("memories", "relations") for _, kind in deltas):
+        session.info["memory_graph_dirty"] = True
+
+
+@event.listens_for(SyncSession, "do_orm_execute")
+def _count_bulk_deletes(orm_execute_state):
+    if not orm_execute_state.is_delete:
+        return
+    statement = orm_execute_state.statement
+    kind = _TRACKED_TABLES.get(getattr(statement, "table", None))
+    if not kind:
+        return
+
+    table = statement.table
+    count_stmt = select(table.c.agent_id, func.count()).select_from(table).group_by(table.c.agent_id)
+    if statement.whereclause is not None:
+        count_stmt = count_stmt.where(statement.whereclause)
+
+    connection = orm_execute_state.session.connection()
+    rows = connection.execute(count_stmt, orm_execute_state.parameters or {}).all()
+    _apply_deltas(connection, {(agent_id or "pero", kind): -count for agent_id, count in rows})
+    if kind in ("memories", "relations"):
+        orm_execute_state.session.info["memory_graph_dirty"] = True
+
+
+@event.listens_for(SyncSession, "after_commit")
+def _invalidate_memory_graph(session):
+    if session.info.pop("memory_graph_dirty", False):
+        StatsService.invalidate_graph()
+
+
+@event.listens_for(SyncSession, "after_rollback")
+def _discard_memory_graph_dirty(session):
+    session.info.pop("memory_graph_dirty", None)
@@ -0,0 +1,204 @@
+"""
+流式语音识别
+
+原流程等整句音频到齐后一次性转录，ASR 延迟随句子长度线性增长。
+StreamingTranscriber 接收 16-bit PCM 分片：
+- 按 30ms 帧做 VAD，检测语音起止 (起点前保留一小段预录音，避免吞掉首字)
+- 说话过程中每积累 PERO_ASR_PARTIAL_INTERVAL 秒新音频，就在工作线程上对当前整段重新解码一次，产出部分转写
+  (上一次解码尚未完成时跳过，不会堆积)
+- 静音超过 PERO_ASR_END_SILENCE 秒视为一句结束，做最终解码并回调 on_final
+解码函数由调用方提供 (ASRService.create_stream 使用 faster-whisper)，便于用桩实现测试。
+"""
+
+import os
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, List, Optional
+
+import numpy as np
+
+ASR_SAMPLE_RATE = 16000
+FRAME_MS = 30
+PARTIAL_INTERVAL = float(os.environ.get("PERO_ASR_PARTIAL_INTERVAL", "0.8"))
+END_SILENCE = float(os.environ.get("PERO_ASR_END_SILENCE", "0.7"))
+MIN_SPEECH = 0.25
+PREROLL = 0.2
+MAX_UTTERANCE = 30.0
+VAD_THRESHOLD = float(os.environ.get("PERO_VAD_THRESHOLD", "0.01"))
+
+
+def parse_pcm_rate(content_type: str, default: int = ASR_SAMPLE_RATE) -> int:
+    """从 "audio/pcm;rate=48000" 形式的 content_type 中取采样率。"""
+    for part in content_type.split(";")[1:]:
+        name, _, value = part.strip().partition("=")
+        if name.strip().lower() in ("rate", "sample_rate") and value.strip().isdigit():
+            return int(value)
+    return default
+
+
+def pcm16_to_float(data: bytes) -> np.ndarray:
+    return np.frombuffer(data[:len(data) - len(data) % 2], dtype="<i2").astype(np.float32) / 32768.0
+
+
+def resample(samples: np.ndarray, source_rate: int, target_rate: int = ASR_SAMPLE_RATE) -> np.ndarray:
+    if source_rate == target_rate or len(samples) == 0:
+        return samples
+    count = int(round(len(samples) * target_rate / source_rate))
+    positions = np.arange(count) * (source_rate / target_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+class EnergyVAD:
+    """基于帧能量 (RMS) 的简单 VAD，阈值与前端自动感应模式一致。"""
+
+    def __init__(self, threshold: float = VAD_THRESHOLD):
+        self.threshold = threshold
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        return float(np.sqrt(np.mean(frame * frame))) > self.threshold
+
+
+class StreamingTranscriber:
+    def __init__(self, decode: Callable[[np.ndarray, bool], Awaitable[str]],
+                 on_partial: Optional[Callable[[str], Awaitable[None]]] = None,
+                 on_final: Optional[Callable[[str, np.ndarray], Awaitable[None]]] = None,
+                 input_rate: int = ASR_SAMPLE_RATE, vad: Optional[EnergyVAD] = None,
+                 partial_interval: Optional[float] = PARTIAL_INTERVAL, end_silence: float = END_SILENCE,
+                 min_speech: float = MIN_SPEECH, max_utterance: float = MAX_UTTERANCE):
+        """
+        decode(samples, partial) 返回 16kHz float32 波形的转写文本；partial=True 时可用更快的解码参数。
+        on_partial(text) / on_final(text, samples) 为异步回调。partial_interval=None 时不产出部分转写。
+        """
+        self._decode = decode
+        self._on_partial = on_partial
+        self._on_final = on_final
+        self.input_rate = input_rate
+        self.vad = vad or EnergyVAD()
+        self._frame = ASR_SAMPLE_RATE * FRAME_MS // 1000
+        self._partial_step = int(partial_interval * ASR_SAMPLE_RATE) if partial_interval else None
+        self._end_silence = int(end_silence * ASR_SAMPLE_RATE)
+        self._min_speech = int(min_speech * ASR_SAMPLE_RATE)
+        self._max_utterance = int(max_utterance * ASR_SAMPLE_RATE)
+
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._preroll = deque(maxlen=max(1, int(PREROLL * 1000) // FRAME_MS))
+        self._speech: List[np.ndarray] = []
+        self._speech_len = 0
+        self._voiced_len = 0
+        self._silence = 0
+        self._in_speech = False
+        self._utterance = 0
+        self._last_partial_len = 0
+        self._last_partial = ""
+        self._partial_task: Optional[asyncio.Task] = None
+        self.partials = 0
+        self.finals = 0
+
+    @property
+    def in_speech(self) -> bool:
+        return self._in_speech
+
+    async def feed(self, pcm: bytes) -> List[str]:
+        """送入一段 16-bit 单声道 PCM，返回本次完成的整句转写。"""
+        samples = resample(pcm16_to_float(pcm), self.input_rate)
+        if len(self._pending):
+            samples = np.concatenate([self._pending, samples])
+        usable = len(samples) - len(samples) % self._frame
+        self._pending = samples[usable:]
+
+        finals = []
+        for start in range(0, usable, self._frame):
+            frame = samples[start:start + self._frame]
+            speech = self.vad.is_speech(frame)
+            if not self._in_speech:
+                if speech:
+                    self._in_speech = True
+                    self._speech = list(self._preroll) + [frame]
+                    self._speech_len = sum(len(f) for f in self._speech)
+                    self._voiced_len = len(frame)
+                    self._silence = 0
+                    self._preroll.clear()
+                else:
+                    self._preroll.append(frame)
+                continue
+
+            self._speech.append(frame)
+            self._speech_len += len(frame)
+            if speech:
+                self._voiced_len += len(frame)
+                self._silence = 0
+            else:
+                self._silence += len(frame)
+            if self._silence >= self._end_silence or self._speech_len >= self._max_utterance:
+                text = await self._finalize()
+                if text:
+                    finals.append(text)
+
+        if self._in_speech:
+            self._maybe_partial()
+        return finals
+
+    async def finish(self) -> Optional[str]:
+        """流结束：把正在进行的语音做最终解码。"""
+        if self._in_speech and len(self._pending):
+            self._speech.append(self._pending)
+            self._speech_len += len(self._pending)
+        self._pending = np.zeros(0, dtype=np.float32)
+        if self._in_speech:
+            return await self._finalize()
+        await self._wait_partial()
+        return None
+
+    def _maybe_partial(self):
+        if self._on_partial is None or self._partial_step is None:
+            return
+        if self._partial_task is not None and not self._partial_task.done():
+            return  # 上一次解码还在进行，跳过，避免积压
+        if self._speech_len - self._last_partial_len < self._partial_step:
+            return
+        self._last_partial_len = self._speech_len
+        self._partial_task = asyncio.create_task(
+            self._run_partial(np.concatenate(self._speech), self._utterance)
+        )
+
+    async def _run_partial(self, audio: np.ndarray, utterance: int):
+        try:
+            text = (await self._decode(audio, True) or "").strip()
+        except Exception as e:
+            print(f"[ASR] 部分转写失败: {e}")
+            return
+        # 这句话已经结束时丢弃过期的部分结果
+        if text and utterance == self._utterance and text != self._last_partial:
+            self._last_partial = text
+            self.partials += 1
+            await self._on_partial(text)
+
+    async def _wait_partial(self):
+        task, self._partial_task = self._partial_task, None
+        if task is not None:
+            await task
+
+    async def _finalize(self) -> Optional[str]:
+        # 去掉结尾的大部分静音，保留一小段收尾
+        keep = max(0, self._speech_len - max(0, self._silence - self._frame * 3))
+        audio = np.concatenate(self._speech)[:keep] if self._speech else np.zeros(0, dtype=np.float32)
+        voiced = self._voiced_len
+
+        self._utterance += 1
+        self._in_speech = False
+        self._speech = []
+        self._speech_len = self._voiced_len = self._silence = 0
+        self._last_partial_len = 0
+        self._last_partial = ""
+        # 解码在同一工作线程上串行，先等部分转写结束
+        await self._wait_partial()
+
+        if voiced < self._min_speech:
+            return None
+        text = (await self._decode(audio, False) or "").strip()
+        if not text:
+            return None
+        self.finals += 1
+        if self._on_final is not None:
+            await self._on_final(text, audio)
+        return text
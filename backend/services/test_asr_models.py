@@ -0,0 +1,117 @@
+import time
+import asyncio
+import threading
+import unittest
+from services.asr_models import ASRModelManager, ModelSpec, PRIORITY_FINAL, PRIORITY_PARTIAL
+
+
+class TestASRModelManager(unittest.TestCase):
+    def setUp(self):
+        self.loaded = []
+        self.decoded = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def loader(self, spec):
+        self.loaded.append(spec)
+        time.sleep(0.05)
+        return {"spec": spec}
+
+    def decode(self, model, audio, beam_size):
+        self.gate.wait(2)
+        self.decoded.append((audio, beam_size))
+        time.sleep(0.02)
+        return f"{model['spec'].model_path}:{audio}"
+
+    def manager(self, **kwargs):
+        manager = ASRModelManager(self.loader, decode=self.decode, **kwargs)
+        self.addCleanup(manager.shutdown)
+        return manager
+
+    def run_async(self, coro):
+        return asyncio.new_event_loop().run_until_complete(coro)
+
+    def test_concurrent_requests_load_model_once(self):
+        manager = self.manager(workers=2)
+        spec = ModelSpec()
+
+        async def run():
+            return await asyncio.gather(*(manager.transcribe(spec, i) for i in range(4)))
+
+        self.assertEqual(self.run_async(run()), [f"tiny:{i}" for i in range(4)])
+        self.assertEqual(self.loaded, [spec])
+
+    def test_keeps_instance_per_config(self):
+        manager = self.manager()
+        tiny, base = ModelSpec(), ModelSpec(model_path="base")
+
+        async def run():
+            return [await manager.transcribe(tiny, "a"), await manager.transcribe(base, "b"),
+                    await manager.transcribe(tiny, "c")]
+
+        self.assertEqual(self.run_async(run()), ["tiny:a", "base:b", "tiny:c"])
+        self.assertEqual(self.loaded, [tiny, base])
+        self.assertTrue(manager.is_loaded(tiny) and manager.is_loaded(base))
+
+    def test_workers_decode_in_parallel(self):
+        manager = self.manager(workers=2)
+        manager.load(ModelSpec())
+
+        async def run():
+            start = time.perf_counter()
+            await asyncio.gather(*(manager.transcribe(ModelSpec(), i) for i in range(4)))
+            return time.perf_counter() - start
+
+        # 4 次 20ms 解码，2 个工作线程并行约 40ms，串行需要 80ms
+        self.assertLess(self.run_async(run()), 0.075)
+
+    def test_final_requests_jump_ahead_of_partials(self):
+        manager = self.manager(workers=1)
+        manager.load(ModelSpec())
+        self.gate.clear()
+
+        async def run():
+            first = asyncio.ensure_future(manager.transcribe(ModelSpec(), "busy"))
+            await asyncio.sleep(0.01)
+            partials = [asyncio.ensure_future(manager.transcribe(ModelSpec(), f"p{i}", 1, PRIORITY_PARTIAL))
+                        for i in range(2)]
+            await asyncio.sleep(0)
+            final = asyncio.ensure_future(manager.transcribe(ModelSpec(), "final", 5, PRIORITY_FINAL))
+            await asyncio.sleep(0.01)
+            self.gate.set()
+            await asyncio.gather(first, final, *partials)
+
+        self.run_async(run())
+        self.assertEqual([audio for audio, _ in self.decoded], ["busy", "final", "p0", "p1"])
+        self.assertEqual(self.decoded[2][1], 1)
+
+    def test_idle_model_is_unloaded(self):
+        manager = self.manager(idle_unload=0.05)
+        spec = ModelSpec()
+
+        async def run():
+            await manager.transcribe(spec, "a")
+            self.assertTrue(manager.is_loaded(spec))
+            await asyncio.sleep(0.1)
+
+        self.run_async(run())
+        self.assertFalse(manager.is_loaded(spec))
+        self.assertEqual(manager.get_stats()["unloads"], 1)
+
+    def test_stats_report_queue_wait_and_decode_time(self):
+        manager = self.manager(workers=1)
+
+        async def run():
+            await asyncio.gather(*(manager.transcribe(ModelSpec(), i) for i in range(3)))
+
+        self.run_async(run())
+        stats = manager.get_stats()
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["loads"], 1)
+        self.assertGreaterEqual(stats["decode"]["avg_ms"], 15)
+        # 单线程时后两个请求要排队等前面的解码
+        self.assertGreaterEqual(stats["queue_wait"]["max_ms"], 30)
+
+
+if __name__ == "__main__":
+    unittest.main()
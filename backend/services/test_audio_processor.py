@@ -0,0 +1,67 @@
+import os
+import sys
+import shutil
+import types
+import unittest
+import asyncio
+import tempfile
+import multiprocessing
+import time
+import numpy as np
+from unittest import mock
+from services.audio_processor import AudioProcessor, AudioQueueFullError, decode_audio, encode_wav
+
+
+def slow_double(value):
+    time.sleep(0.2)
+    return value * 2
+
+
+class TestAudioProcessor(unittest.TestCase):
+    def run_async(self, coro):
+        return asyncio.new_event_loop().run_until_complete(coro)
+
+    def test_wav_roundtrip_in_memory(self):
+        samples = 0.5 * np.sin(np.linspace(0, 40 * np.pi, 16000))
+        decoded, rate = decode_audio(encode_wav(samples, 16000))
+        self.assertEqual(rate, 16000)
+        self.assertEqual(len(decoded), len(samples))
+        self.assertLess(np.max(np.abs(decoded - samples)), 1e-4)
+
+    def test_runs_in_pool_and_rejects_when_queue_full(self):
+        processor = AudioProcessor(max_workers=1, queue_size=1)
+
+        async def run():
+            return await asyncio.gather(*(processor.run(slow_double, i) for i in range(3)),
+                                        return_exceptions=True)
+
+        try:
+            results = self.run_async(run())
+        finally:
+            processor.shutdown(wait=True)
+        self.assertEqual(results[:2], [0, 2])
+        self.assertIsInstance(results[2], AudioQueueFullError)
+
+    def test_spawned_workers_skip_main_script(self):
+        # 模拟以 `python main.py` 启动：spawn 的工作进程不应重新执行主脚本
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        marker = os.path.join(directory, "executed")
+        script = os.path.join(directory, "fake_main.py")
+        with open(script, "w", encoding="utf-8") as f:
+            f.write(f"open({marker!r}, 'w').close()\n")
+        main = types.ModuleType("__main__")
+        main.__file__ = script
+        main.__spec__ = None
+        processor = AudioProcessor(max_workers=1, queue_size=0, mp_context=multiprocessing.get_context("spawn"))
+
+        try:
+            with mock.patch.dict(sys.modules, {"__main__": main}):
+                self.assertEqual(self.run_async(processor.run(slow_double, 21)), 42)
+                self.assertEqual(main.__file__, script)
+        finally:
+            processor.shutdown(wait=True)
+        self.assertFalse(os.path.exists(marker))
+
+if __name__ == '__main__':
+    unittest.main()
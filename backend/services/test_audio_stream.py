@@ -0,0 +1,37 @@
+import os
+import tempfile
+import unittest
+from services.audio_stream import detect_audio_mime, iter_audio_chunks
+
+
+class TestAudioStream(unittest.TestCase):
+    def test_detects_mime_from_header_before_extension(self):
+        wav_head = b"RIFF\x24\x00\x00\x00WAVEfmt "
+        self.assertEqual(detect_audio_mime(wav_head, "voice_cute.mp3"), "audio/wav")
+        self.assertEqual(detect_audio_mime(b"ID3\x04\x00", "a.wav"), "audio/mpeg")
+        self.assertEqual(detect_audio_mime(b"\xff\xfb\x90\x64"), "audio/mpeg")
+        self.assertEqual(detect_audio_mime(b"OggS\x00\x02"), "audio/ogg")
+        self.assertEqual(detect_audio_mime(b"fLaC\x00\x00"), "audio/flac")
+
+    def test_falls_back_to_extension(self):
+        self.assertEqual(detect_audio_mime(b"", "a.wav"), "audio/wav")
+        self.assertEqual(detect_audio_mime(b"\x00\x01", "a.PCM"), "audio/pcm")
+        self.assertEqual(detect_audio_mime(b"\x00\x01", "a.bin"), "audio/mpeg")
+
+    def test_chunks_bytes_and_files_identically(self):
+        data = os.urandom(10 * 1024 + 7)
+        chunks = list(iter_audio_chunks(data, chunk_size=4096))
+        self.assertEqual([len(c) for c in chunks], [4096, 4096, 2055])
+        self.assertEqual(b"".join(chunks), data)
+
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(data)
+        try:
+            self.assertEqual(list(iter_audio_chunks(f.name, chunk_size=4096)), chunks)
+        finally:
+            os.remove(f.name)
+
+        self.assertEqual(list(iter_audio_chunks(b"")), [])
+
+if __name__ == '__main__':
+    unittest.main()
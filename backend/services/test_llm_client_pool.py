@@ -0,0 +1,78 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from services.llm_client_pool import LLMClientPool
+
+
+class FakeSDKClient:
+    def __init__(self, http_client=None):
+        self._client = http_client
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeGenaiClient:
+    """genai.Client：同步 close() 与 aio.aclose() 各自持有连接。"""
+
+    def __init__(self):
+        self.closed = []
+        self.aio = mock.Mock(aclose=mock.AsyncMock(side_effect=lambda: self.closed.append("aio")))
+
+    def close(self):
+        self.closed.append("sync")
+
+
+class TestSDKClients(unittest.TestCase):
+    def setUp(self):
+        with mock.patch.object(LLMClientPool, "_instance", None):
+            self.pool = LLMClientPool()
+        self.pool.max_sdk_clients = 2
+
+    def run_async(self, coro):
+        return asyncio.new_event_loop().run_until_complete(coro)
+
+    def test_reuses_and_evicts_least_recently_used(self):
+        async def run():
+            a = self.pool.get_sdk_client("anthropic", ("a",), FakeSDKClient)
+            b = self.pool.get_sdk_client("anthropic", ("b",), FakeSDKClient)
+            self.assertIs(self.pool.get_sdk_client("anthropic", ("a",), FakeSDKClient), a)
+            c = self.pool.get_sdk_client("anthropic", ("c",), FakeSDKClient)
+            await asyncio.sleep(0)
+            return a, b, c
+
+        a, b, c = self.run_async(run())
+        self.assertTrue(b.closed)
+        self.assertFalse(a.closed or c.closed)
+        self.assertEqual(list(self.pool._sdk_clients), [("anthropic", "a"), ("anthropic", "c")])
+
+    def test_aclose_closes_sdk_clients(self):
+        async def run():
+            gemini = self.pool.get_sdk_client("gemini", ("k",), FakeGenaiClient)
+            other = self.pool.get_sdk_client("anthropic", ("k", None), FakeSDKClient)
+            await self.pool.aclose()
+            return gemini, other
+
+        gemini, other = self.run_async(run())
+        self.assertEqual(gemini.closed, ["aio", "sync"])
+        self.assertTrue(other.closed)
+        self.assertEqual(len(self.pool._sdk_clients), 0)
+
+    def test_eviction_keeps_shared_http_client_open(self):
+        async def run():
+            shared = self.pool.get_client("https://api.anthropic.com")
+            wrapped = self.pool.get_sdk_client("anthropic", ("a",), lambda: FakeSDKClient(shared))
+            for key in ("b", "c"):
+                self.pool.get_sdk_client("anthropic", (key,), FakeSDKClient)
+            await asyncio.sleep(0)
+            closed = (wrapped.closed, shared.is_closed)
+            await self.pool.aclose()
+            return closed
+
+        self.assertEqual(self.run_async(run()), (False, False))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+import os
+import shutil
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models import Config, MCPConfig
+from services import mcp_pool as mcp_pool_module
+from services.mcp_pool import McpConnectionManager
+
+
+class FakeClient:
+    """替代 McpClient：config 中的 fail / block 控制 initialize 的结果与时机。"""
+
+    def __init__(self, config, tools_ttl=None):
+        self.config = config
+        self.name = config.get("name")
+        self.healthy = True
+        self.closed = False
+        self.gate = asyncio.Event()
+        self._tools_cache = None
+
+    async def initialize(self):
+        if self.config.get("block"):
+            await self.gate.wait()
+        return not self.config.get("fail")
+
+    @property
+    def is_alive(self):
+        return not self.closed
+
+    async def ping(self):
+        return self.healthy
+
+    async def list_tools(self, refresh=False):
+        self._tools_cache = []
+        return self._tools_cache
+
+    async def close(self):
+        self.closed = True
+
+
+class TestMcpConnectionManager(unittest.TestCase):
+    def setUp(self):
+        self.clients = []
+
+        def create_client(**kwargs):
+            client = FakeClient(**kwargs)
+            self.clients.append(client)
+            return client
+
+        patcher = mock.patch.object(mcp_pool_module, "McpClient", side_effect=create_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # 每个用例使用独立的连接池，不影响全局单例
+        with mock.patch.object(McpConnectionManager, "_instance", None):
+            self.pool = McpConnectionManager()
+
+    def run_async(self, coro):
+        async def run():
+            try:
+                return await coro
+            finally:
+                await self.pool.aclose()
+        return asyncio.new_event_loop().run_until_complete(run())
+
+    def use_configs(self, configs):
+        patcher = mock.patch.object(mcp_pool_module, "load_mcp_configs", mock.AsyncMock(return_value=configs))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def settle(self):
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+    def entry(self, name):
+        return next(entry for entry in self.pool._entries.values() if entry.name == name)
+
+    def test_borrow_only_returns_ready_clients(self):
+        self.use_configs([{"name": "ok"}, {"name": "slow", "block": True}, {"name": "broken", "fail": True}])
+
+        async def run():
+            # 初始化在后台进行，尚未就绪的客户端不借出
+            self.assertEqual(await self.pool.borrow(None), [])
+            await self.settle()
+            borrowed = await self.pool.borrow(None)
+            self.assertEqual([client.name for client in borrowed], ["ok"])
+            self.assertEqual(self.entry("slow").status, "starting")
+            self.assertEqual(self.entry("broken").status, "failed")
+            # 初始化失败的客户端被关闭，且不会挂到条目上
+            broken = next(client for client in self.clients if client.name == "broken")
+            self.assertTrue(broken.closed)
+            self.assertIsNone(self.entry("broken").client)
+
+            next(client for client in self.clients if client.name == "slow").gate.set()
+            await self.settle()
+            return [client.name for client in await self.pool.borrow(None)]
+
+        self.assertEqual(self.run_async(run()), ["ok", "slow"])
+
+    def test_failed_ping_reconnects(self):
+        self.use_configs([{"name": "ok"}])
+
+        async def run():
+            await self.pool.borrow(None)
+            await self.settle()
+            [first] = await self.pool.borrow(None)
+            first.healthy = False
+            await self.pool.check_health()
+            # 重启期间旧连接不再借出
+            self.assertEqual(await self.pool.borrow(None), [])
+            await self.settle()
+            [second] = await self.pool.borrow(None)
+            return first, second, self.entry("ok").restarts
+
+        first, second, restarts = self.run_async(run())
+        self.assertIsNot(first, second)
+        self.assertTrue(first.closed)
+        self.assertEqual(len(self.clients), 2)
+        self.assertEqual(restarts, 1)
+
+    def test_failed_start_retries_after_backoff(self):
+        self.use_configs([{"name": "broken", "fail": True}])
+
+        async def run():
+            await self.pool.borrow(None)
+            await self.settle()
+            entry = self.entry("broken")
+            self.assertEqual((entry.status, entry.failures), ("failed", 1))
+            # 退避时间未到，不重试
+            await self.pool.check_health()
+            self.assertEqual(entry.status, "failed")
+            entry.retry_at = 0.0
+            await self.pool.check_health()
+            self.assertEqual(entry.status, "starting")
+            await self.settle()
+            return entry
+
+        entry = self.run_async(run())
+        self.assertEqual(entry.failures, 2)
+        self.assertEqual(len(self.clients), 2)
+
+    def test_config_commit_marks_pool_stale(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'mcp.db')}")
+
+        async def run():
+            try:
+                async with engine.begin() as conn:
+                    await conn.run_sync(SQLModel.metadata.create_all)
+                async with AsyncSession(engine, expire_on_commit=False) as session:
+                    self.assertEqual(await self.pool.borrow(session), [])
+                    self.assertTrue(self.pool._configs_loaded)
+
+                    # 与 MCP 无关的配置提交不影响连接池
+                    session.add(Config(key="theme", value="dark"))
+                    await session.commit()
+                    self.assertTrue(self.pool._configs_loaded)
+
+                    session.add(MCPConfig(name="search", type="sse", url="http://localhost:9000"))
+                    await session.commit()
+                    self.assertFalse(self.pool._configs_loaded)
+
+                    await self.pool.borrow(session)
+                    await self.settle()
+                    return [client.name for client in await self.pool.borrow(session)]
+            finally:
+                await engine.dispose()
+
+        with mock.patch.object(mcp_pool_module, "mcp_pool", self.pool):
+            self.assertEqual(self.run_async(run()), ["search"])
+        self.assertEqual(self.clients[0].config["url"], "http://localhost:9000")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+from services.prompt_service import PromptManager
+
+class TestPromptPrefix(unittest.TestCase):
+    def setUp(self):
+        self.prompt_manager = PromptManager()
+
+    def compose(self, history, is_work_mode=False, **volatile):
+        return self.prompt_manager.compose_messages(list(history), dict(volatile), is_work_mode=is_work_mode)
+
+    def test_prefix_is_stable_across_turns(self):
+        history = [{"role": "user", "content": "你好"}]
+        first = self.compose(history, current_time="2026-10-19 10:00", mood="开心", memory_context="记忆A")
+        second = self.compose(
+            history + [{"role": "assistant", "content": "嗨"}, {"role": "user", "content": "在吗"}],
+            current_time="2026-10-19 10:05", mood="难过", memory_context="记忆B",
+        )
+
+        self.assertEqual(first[0]["content"], second[0]["content"])
+        self.assertEqual(PromptManager.compute_prefix_hash(first), PromptManager.compute_prefix_hash(second))
+        # 易变内容只出现在历史之后的 system 消息中
+        self.assertNotIn("记忆A", first[0]["content"])
+        self.assertIn("记忆A", first[-1]["content"])
+
+    def test_work_mode_prefix_is_stable(self):
+        history = [{"role": "user", "content": "帮我看看代码"}]
+        first = self.compose(history, is_work_mode=True, current_time="10:00")
+        second = self.compose(history, is_work_mode=True, current_time="11:00")
+        self.assertEqual(PromptManager.compute_prefix_hash(first), PromptManager.compute_prefix_hash(second))
+        self.assertIn("11:00", second[-1]["content"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import json
+import unittest
+import asyncio
+from services.sse_decoder import SSEDecoder, iter_sse_deltas
+
+
+def event(content=None, **delta):
+    if content is not None:
+        delta["content"] = content
+    return b"data: " + json.dumps({"choices": [{"delta": delta}]}, ensure_ascii=False).encode("utf-8")
+
+
+async def byte_stream(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+class TestSSEDecoder(unittest.TestCase):
+    def run_async(self, coro):
+        return asyncio.new_event_loop().run_until_complete(coro)
+
+    def collect(self, chunks, coalesce_ms=0.0):
+        async def run():
+            return [delta async for delta in iter_sse_deltas(byte_stream(chunks), coalesce_ms=coalesce_ms)]
+        return self.run_async(run())
+
+    def test_split_utf8_sequence_across_chunks(self):
+        data = event("你好") + b"\n\n"
+        cut = data.index("你".encode("utf-8")) + 1  # 切在多字节字符中间
+        decoder = SSEDecoder()
+        self.assertEqual(decoder.feed(data[:cut]), [])
+        payloads = decoder.feed(data[cut:])
+        self.assertEqual(payloads[0]["choices"][0]["delta"]["content"], "你好")
+
+    def test_crlf_line_endings(self):
+        chunks = [event("a") + b"\r\n\r\n" + b": keep-alive\r\n", event("b") + b"\r\n\r\n"]
+        self.assertEqual(self.collect(chunks), [{"content": "a"}, {"content": "b"}])
+
+    def test_done_stops_decoding(self):
+        chunks = [event("a") + b"\n\ndata: [DONE]\n\n" + event("after") + b"\n\n"]
+        decoder = SSEDecoder()
+        self.assertEqual(len(decoder.feed(chunks[0])), 1)
+        self.assertTrue(decoder.done)
+        self.assertEqual(decoder.feed(event("more") + b"\n"), [])
+        self.assertEqual(self.collect(chunks), [{"content": "a"}])
+
+    def test_trailing_unterminated_line_is_flushed(self):
+        chunks = [event("a") + b"\n\n", event("b")]
+        self.assertEqual(self.collect(chunks), [{"content": "a"}, {"content": "b"}])
+        self.assertEqual(self.collect(chunks, coalesce_ms=20), [{"content": "ab"}])
+
+    def test_tool_call_delta_flushes_text_in_order(self):
+        tool = {"tool_calls": [{"index": 0, "function": {"name": "f"}}]}
+        chunks = [event("a") + b"\n" + event("b") + b"\n" + event(**tool) + b"\n" + event("c") + b"\n"]
+        self.assertEqual(self.collect(chunks), [{"content": "ab"}, tool, {"content": "c"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+import asyncio
+import unittest
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models import ConversationLog, Memory, MemoryRelation, ScheduledTask
+from services.stats_service import StatsService
+
+
+class TestStatsCounters(unittest.TestCase):
+    """计数器随 ORM 写入同事务维护：add / session.delete / 批量 delete() / 回滚"""
+
+    def run_async(self, coro):
+        return asyncio.new_event_loop().run_until_complete(coro)
+
+    def run_db(self, scenario):
+        async def run():
+            engine = create_async_engine("sqlite+aiosqlite://")
+            try:
+                async with engine.begin() as conn:
+                    await conn.run_sync(SQLModel.metadata.create_all)
+                async with AsyncSession(engine, expire_on_commit=False) as session:
+                    return await scenario(session)
+            finally:
+                await engine.dispose()
+        return self.run_async(run())
+
+    @staticmethod
+    async def counts(session, agent_id):
+        return await StatsService.get_counts(session, agent_id)
+
+    def test_add_counts_per_agent(self):
+        async def scenario(session):
+            memories = [Memory(content="a1", agent_id="a"), Memory(content="a2", agent_id="a"),
+                        Memory(content="b1", agent_id="b")]
+            session.add_all(memories)
+            session.add(ConversationLog(session_id="s", source="desktop", role="user", content="hi", agent_id="a"))
+            session.add(ScheduledTask(type="reminder", time="2026-01-01 08:00:00", content="起床", agent_id="b"))
+            await session.commit()
+            session.add(MemoryRelation(source_id=memories[0].id, target_id=memories[1].id, agent_id="a"))
+            await session.commit()
+            return await self.counts(session, "a"), await self.counts(session, "b"), await self.counts(session, None)
+
+        a, b, total = self.run_db(scenario)
+        self.assertEqual(a, {"memories": 2, "logs": 1, "tasks": 0, "relations": 1})
+        self.assertEqual(b, {"memories": 1, "logs": 0, "tasks": 1, "relations": 0})
+        self.assertEqual(total, {"memories": 3, "logs": 1, "tasks": 1, "relations": 1})
+
+    def test_orm_delete_and_bulk_delete(self):
+        async def scenario(session):
+            memories = [Memory(content=f"m{i}", agent_id="a" if i < 3 else "b") for i in range(5)]
+            session.add_all(memories)
+            await session.commit()
+
+            await session.delete(memories[0])
+            await session.commit()
+            after_orm_delete = await self.counts(session, "a")
+
+            await session.exec(delete(Memory).where(Memory.content.in_(["m1", "m3"])))
+            await session.commit()
+            after_bulk = (await self.counts(session, "a"), await self.counts(session, "b"))
+
+            await session.exec(delete(Memory))
+            await session.commit()
+            remaining = (await session.exec(select(Memory))).all()
+            return after_orm_delete, after_bulk, await self.counts(session, None), remaining
+
+        after_orm_delete, (a, b), total, remaining = self.run_db(scenario)
+        self.assertEqual(after_orm_delete["memories"], 2)
+        self.assertEqual((a["memories"], b["memories"]), (1, 1))
+        self.assertEqual(total["memories"], 0)
+        self.assertEqual(remaining, [])
+
+    def test_rollback_discards_counter_changes(self):
+        async def scenario(session):
+            session.add(Memory(content="kept", agent_id="a"))
+            await session.commit()
+
+            session.add(Memory(content="dropped", agent_id="a"))
+            await session.flush()
+            during = await self.counts(session, "a")
+            await session.rollback()
+            after_add = await self.counts(session, "a")
+
+            await session.exec(delete(Memory))
+            await session.rollback()
+            return during, after_add, await self.counts(session, "a")
+
+        during, after_add, after_delete = self.run_db(scenario)
+        self.assertEqual(during["memories"], 2)
+        self.assertEqual(after_add["memories"], 1)
+        self.assertEqual(after_delete["memories"], 1)
+
+    def test_graph_cache_invalidated_on_commit(self):
+        StatsService.invalidate_graph()
+
+        async def scenario(session):
+            generations = []
+
+            def mark():
+                StatsService._graph_cache[("stale",)] = {}
+                generations.append(StatsService._graph_generation)
+
+            mark()
+            session.add(ScheduledTask(type="topic", time="2026-01-01 08:00:00", content="聊天"))
+            await session.commit()
+            unrelated = StatsService._graph_generation == generations[-1] and bool(StatsService._graph_cache)
+
+            session.add(Memory(content="m", agent_id="a"))
+            await session.flush()
+            flushed_only = StatsService._graph_generation == generations[-1]
+            await session.rollback()
+            rolled_back = StatsService._graph_generation == generations[-1] and bool(StatsService._graph_cache)
+
+            memory = Memory(content="m", agent_id="a")
+            session.add(memory)
+            await session.commit()
+            added = StatsService._graph_generation > generations[-1] and not StatsService._graph_cache
+
+            mark()
+            memory.importance = 5
+            await session.commit()
+            updated = StatsService._graph_generation > generations[-1]
+
+            mark()
+            await session.exec(delete(Memory))
+            await session.commit()
+            bulk_deleted = StatsService._graph_generation > generations[-1]
+            return unrelated, flushed_only, rolled_back, added, updated, bulk_deleted
+
+        unrelated, flushed_only, rolled_back, added, updated, bulk_deleted = self.run_db(scenario)
+        self.assertTrue(unrelated)
+        self.assertTrue(flushed_only)
+        self.assertTrue(rolled_back)
+        self.assertTrue(added)
+        self.assertTrue(updated)
+        self.assertTrue(bulk_deleted)
+        StatsService.invalidate_graph()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import asyncio
+import numpy as np
+from services.streaming_asr import StreamingTranscriber, parse_pcm_rate, pcm16_to_float
+
+RATE = 16000
+
+
+def tone(seconds, rate=RATE):
+    t = np.arange(int(seconds * rate)) / rate
+    return 0.3 * np.sin(2 * np.pi * 220 * t)
+
+
+def silence(seconds, rate=RATE):
+    return np.zeros(int(seconds * rate))
+
+
+def to_pcm(samples):
+    return (samples * 32767).astype("<i2").tobytes()
+
+
+class StubDecoder:
+    """按音频时长 (0.1s 为单位) 返回文本，记录每次调用。"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    async def __call__(self, samples, partial):
+        self.calls.append((len(samples), partial))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return f"{'p' if partial else 'f'}{len(samples) * 10 // RATE}"
+
+
+class TestStreamingTranscriber(unittest.TestCase):
+    def run_async(self, coro):
+        return asyncio.new_event_loop().run_until_complete(coro)
+
+    def feed_all(self, audio, decoder, chunk=0.1, rate=RATE, **kwargs):
+        partials, finals = [], []
+
+        async def on_partial(text):
+            partials.append(text)
+
+        async def on_final(text, samples):
+            finals.append((text, len(samples)))
+
+        async def run():
+            transcriber = StreamingTranscriber(decoder, on_partial, on_final, input_rate=rate,
+                                               partial_interval=0.5, end_silence=0.5, **kwargs)
+            pcm = to_pcm(audio)
+            step = int(chunk * rate) * 2
+            for i in range(0, len(pcm), step):
+                await transcriber.feed(pcm[i:i + step])
+                await asyncio.sleep(0)
+            await transcriber.finish()
+
+        self.run_async(run())
+        return partials, finals
+
+    def test_segments_utterances_and_emits_partials(self):
+        audio = np.concatenate([silence(0.5), tone(1.6), silence(0.8), tone(0.6), silence(0.2)])
+        decoder = StubDecoder()
+        partials, finals = self.feed_all(audio, decoder)
+
+        self.assertEqual(len(finals), 2)
+        # 第一句约 1.6s 语音 + 预录音与收尾静音，最终解码不应包含整段 0.5s 结尾静音
+        self.assertGreaterEqual(finals[0][1], int(1.6 * RATE))
+        self.assertLess(finals[0][1], int(2.1 * RATE))
+        self.assertTrue(partials)
+        self.assertTrue(all(text.startswith("p") for text in partials))
+        self.assertEqual([partial for _, partial in decoder.calls].count(False), 2)
+
+    def test_finish_flushes_open_utterance_and_drops_blips(self):
+        audio = np.concatenate([tone(0.06), silence(0.7), tone(0.9)])
+        partials, finals = self.feed_all(audio, StubDecoder())
+        # 60ms 的短促噪声不足 MIN_SPEECH，被丢弃；最后一句在 finish() 时完成
+        self.assertEqual(len(finals), 1)
+        self.assertGreaterEqual(finals[0][1], int(0.9 * RATE))
+        self.assertLessEqual(finals[0][1], int(1.1 * RATE))
+
+    def test_slow_decoder_does_not_queue_partials(self):
+        audio = np.concatenate([tone(3.0), silence(0.6)])
+        decoder = StubDecoder(delay=0.05)
+        self.feed_all(audio, decoder, chunk=0.05)
+        partial_calls = [n for n, partial in decoder.calls if partial]
+        # 同一时间最多一个部分解码在进行
+        self.assertLessEqual(len(partial_calls), 6)
+        self.assertEqual(partial_calls, sorted(partial_calls))
+
+    def test_resamples_input_rate(self):
+        audio = np.concatenate([tone(1.0, 48000), silence(0.6, 48000)])
+        decoder = StubDecoder()
+        _, finals = self.feed_all(audio, decoder, rate=48000)
+        self.assertEqual(len(finals), 1)
+        self.assertLess(abs(finals[0][1] - int(1.3 * RATE)), int(0.3 * RATE))
+
+    def test_helpers(self):
+        self.assertEqual(parse_pcm_rate("audio/pcm;rate=48000"), 48000)
+        self.assertEqual(parse_pcm_rate("audio/pcm"), 16000)
+        self.assertEqual(len(pcm16_to_float(b"\x00\x01\x02")), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+import asyncio
+from services.tts_cache import TTSCache, make_cache_key
+
+
+class TestTTSCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def run_async(self, coro):
+        return asyncio.new_event_loop().run_until_complete(coro)
+
+    def test_key_normalizes_text_and_includes_params(self):
+        base = make_cache_key("早上好！", provider="edge_tts", params={"voice": "a"})
+        self.assertEqual(base, make_cache_key("  早上好!  ", provider="edge_tts", params={"voice": "a"}))
+        self.assertNotEqual(base, make_cache_key("早上好！", provider="edge_tts", params={"voice": "b"}))
+        self.assertNotEqual(base, make_cache_key("早上好！", provider="edge_tts", params={"voice": "a"}, cute=(1.2, 1.1)))
+
+    def test_concurrent_requests_synthesize_once(self):
+        cache = TTSCache(self.directory)
+        calls = []
+
+        async def factory():
+            calls.append(1)
+            await asyncio.sleep(0.02)
+            return b"audio", True
+
+        async def run():
+            return await asyncio.gather(*(cache.get_or_create("k", factory) for _ in range(5)))
+
+        self.assertEqual(self.run_async(run()), [b"audio"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.run_async(cache.get_or_create("k", factory)), b"audio")
+        self.assertEqual(len(calls), 1)
+
+    def test_disk_layer_survives_restart_and_evicts_lru(self):
+        cache = TTSCache(self.directory, disk_bytes=25)
+
+        def producer(value, cacheable=True):
+            async def factory():
+                return value, cacheable
+            return factory
+
+        async def fill():
+            await cache.get_or_create("a", producer(b"a" * 10))
+            await cache.get_or_create("b", producer(b"b" * 10))
+            await cache.get_or_create("a", producer(b"x"))          # 内存命中，不刷新磁盘顺序
+            await cache.get_or_create("c", producer(b"c" * 10))     # 超出 25 字节，淘汰最旧的 a
+            await cache.get_or_create("d", producer(b"d", False))   # 不可缓存的结果不落盘
+
+        self.run_async(fill())
+        self.assertEqual(sorted(os.listdir(self.directory)), ["b.audio", "c.audio"])
+
+        restarted = TTSCache(self.directory, disk_bytes=25)
+
+        async def fail():
+            raise AssertionError("should hit disk")
+
+        self.assertEqual(self.run_async(restarted.get_or_create("b", fail)), b"b" * 10)
+        self.assertEqual(restarted.stats()["disk_hits"], 1)
+
+    def test_memory_layer_is_bounded(self):
+        cache = TTSCache(None, memory_bytes=20)
+
+        async def run():
+            for key in "abc":
+                async def factory(key=key):
+                    return key.encode() * 8, True
+                await cache.get_or_create(key, factory)
+
+        self.run_async(run())
+        self.assertEqual(list(cache._memory), ["b", "c"])
+        self.assertLessEqual(cache.stats()["memory_bytes"], 20)
+
+    def test_only_short_phrases_are_cached(self):
+        cache = TTSCache(None, max_chars=5)
+        self.assertTrue(cache.accepts("你好呀"))
+        self.assertFalse(cache.accepts("这是一句比较长的回复"))
+        self.assertFalse(cache.accepts("   "))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import unittest
+import asyncio
+from services.tts_pipeline import ReActFilter, SentenceSplitter, TTSPipeline, strip_react
+
+
+def split_stream(text, step=1, min_chars=1):
+    splitter = SentenceSplitter(min_chars=min_chars)
+    sentences = []
+    for i in range(0, len(text), step):
+        sentences.extend(splitter.feed(text[i:i + step]))
+    rest = splitter.flush()
+    if rest:
+        sentences.append(rest)
+    return sentences
+
+
+def speak_stream(text, step=1):
+    """与 _feed_speech_pipeline 相同的组合：ReActFilter -> SentenceSplitter，改口时丢弃未朗读的句子"""
+    react, splitter = ReActFilter(), SentenceSplitter(min_chars=1)
+    spoken = []
+
+    def push(part, rebase):
+        if rebase:
+            splitter.flush()
+            spoken.clear()
+        spoken.extend(splitter.feed(part))
+
+    for i in range(0, len(text), step):
+        push(*react.feed(text[i:i + step]))
+    push(*react.flush())
+    spoken.append(splitter.flush())
+    return [s.strip() for s in spoken if s.strip()]
+
+
+class TestSentenceSplitter(unittest.TestCase):
+    def test_splits_at_sentence_end(self):
+        text = "今天天气很好！我们去公园吧？好的。"
+        for step in (1, 3, len(text)):
+            self.assertEqual(split_stream(text, step), ["今天天气很好！", "我们去公园吧？", "好的。"])
+
+    def test_short_fragments_merge_into_next_sentence(self):
+        self.assertEqual(split_stream("嗯。我知道了，马上就去做。", min_chars=6), ["嗯。我知道了，马上就去做。"])
+
+    def test_keeps_punctuation_runs_and_decimals(self):
+        self.assertEqual(split_stream("真的吗？！圆周率是 3.14 哦... 对吧"), ["真的吗？！", "圆周率是 3.14 哦...", " 对吧"])
+
+    def test_does_not_split_inside_actions_or_code(self):
+        text = "*开心地跳起来。然后转圈。* 好呀！（小声。说）走吧。\n```\nprint(1)\nprint(2)\n```\n完成。"
+        self.assertEqual(split_stream(text), [
+            "*开心地跳起来。然后转圈。* 好呀！",
+            "（小声。说）走吧。\n",
+            "```\nprint(1)\nprint(2)\n```\n",
+            "完成。",
+        ])
+
+    def test_concatenation_is_lossless(self):
+        text = "第一句。*动作\n没闭合。第二句！(括号) 最后"
+        self.assertEqual("".join(split_stream(text, step=2)), text)
+
+
+class TestReActFilter(unittest.TestCase):
+    REPLIES = [
+        ("Plan: 先查一下主人的日程。\n然后再看看天气预报情况。\nAction: calendar.query\n"
+         "Observation: 15:00 会议\nFinal Answer: 主人今天下午三点有会议哦！",
+         ["主人今天下午三点有会议哦！"]),
+        ("我想想。让我先查一下。回复：主人明天是晴天哦！记得带伞。", ["主人明天是晴天哦！", "记得带伞。"]),
+        ("好的，我来看看。\nAction: weather.query\nObservation: 晴，25 度\n", ["好的，我来看看。"]),
+        ("Planet 是行星的意思。Play 是玩。\n今天天气很好！", ["Planet 是行星的意思。", "Play 是玩。", "今天天气很好！"]),
+    ]
+
+    def test_streamed_speech_matches_whole_reply(self):
+        for text, expected in self.REPLIES:
+            whole = [s.strip() for s in split_stream(strip_react(text)) if s.strip()]
+            self.assertEqual(whole, expected)
+            for step in (1, 2, 5, len(text)):
+                self.assertEqual(speak_stream(text, step), expected, (text, step))
+
+    def test_holds_back_possible_marker_prefix(self):
+        react = ReActFilter()
+        self.assertEqual(react.feed("好的，最终回"), ("好的，", False))
+        self.assertEqual(react.feed("答：去吧"), ("去吧", True))
+        self.assertEqual(react.feed("！"), ("！", False))
+
+
+class TestTTSPipeline(unittest.TestCase):
+    def run_async(self, coro):
+        return asyncio.new_event_loop().run_until_complete(coro)
+
+    def test_sends_in_order_with_bounded_parallelism(self):
+        delays = {"a": 0.05, "b": 0.01, "c": 0.02, "d": 0.01}
+        active = [0, 0]
+        sent = []
+
+        async def synthesize(text):
+            active[0] += 1
+            active[1] = max(active[1], active[0])
+            await asyncio.sleep(delays[text])
+            active[0] -= 1
+            return None if text == "c" else f"{text}.mp3"
+
+        async def send(audio):
+            sent.append(audio)
+
+        async def run():
+            pipeline = TTSPipeline(synthesize, send, max_parallel=2)
+            for text in "abcd":
+                pipeline.submit(text)
+            await pipeline.close()
+            return pipeline
+
+        pipeline = self.run_async(run())
+        self.assertEqual(sent, ["a.mp3", "b.mp3", "d.mp3"])
+        self.assertEqual(active[1], 2)
+        self.assertEqual((pipeline.submitted, pipeline.sent), (4, 3))
+        self.assertIsNotNone(pipeline.time_to_first_audio)
+
+    def test_failed_chunk_is_skipped_and_cancel_stops_sending(self):
+        sent = []
+
+        async def synthesize(text):
+            if text == "bad":
+                raise RuntimeError("boom")
+            await asyncio.sleep(0.05 if text == "slow" else 0)
+            return text
+
+        async def send(audio):
+            sent.append(audio)
+
+        async def run():
+            pipeline = TTSPipeline(synthesize, send)
+            pipeline.submit("ok")
+            pipeline.submit("bad")
+            pipeline.submit("ok2")
+            await asyncio.sleep(0.01)
+            pipeline.submit("slow")
+            await pipeline.close(cancel=True)
+
+        self.run_async(run())
+        self.assertEqual(sent, ["ok", "ok2"])
+
+    def test_discard_pending_drops_unsent_sentences(self):
+        delays = {"a": 0.01, "b": 0.2, "c": 0.01}
+        sent = []
+
+        async def synthesize(text):
+            await asyncio.sleep(delays[text])
+            return text
+
+        async def send(audio):
+            sent.append(audio)
+
+        async def run():
+            pipeline = TTSPipeline(synthesize, send, max_parallel=2)
+            pipeline.submit("a")
+            pipeline.submit("b")
+            await asyncio.sleep(0.05)
+            pipeline.discard_pending()
+            pipeline.submit("c")
+            await pipeline.close()
+            return pipeline
+
+        pipeline = self.run_async(run())
+        self.assertEqual(sent, ["a", "c"])
+        self.assertEqual((pipeline.submitted, pipeline.sent), (2, 2))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import sys
+import types
+import asyncio
+import unittest
+from unittest import mock
+
+from services.turn_cache import TurnCache, current_turn_cache, search_vectors, turn_scope, SEARCH_PREFETCH
+
+
+class TestTurnCache(unittest.TestCase):
+    def run_async(self, coro):
+        return asyncio.new_event_loop().run_until_complete(coro)
+
+    def test_memo_computes_once(self):
+        cache = TurnCache()
+        factory = mock.Mock(return_value=[0.1, 0.2])
+        self.assertEqual(cache.memo("k", factory), [0.1, 0.2])
+        self.assertEqual(cache.memo("k", factory), [0.1, 0.2])
+        factory.assert_called_once()
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "entries": 1})
+
+    def test_amemo_single_flight(self):
+        cache = TurnCache()
+        calls = []
+
+        async def factory():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"mood": "happy"}
+
+        async def run():
+            results = await asyncio.gather(*(cache.amemo("state", factory) for _ in range(5)))
+            return results + [await cache.amemo("state", factory)]
+
+        results = self.run_async(run())
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(cache.stats(), {"hits": 5, "misses": 1, "entries": 1})
+
+    def test_amemo_failure_is_not_cached(self):
+        cache = TurnCache()
+        attempts = []
+
+        async def factory():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RuntimeError("db busy")
+            return "ok"
+
+        async def run():
+            with self.assertRaises(RuntimeError):
+                await cache.amemo("k", factory)
+            return await cache.amemo("k", factory)
+
+        self.assertEqual(self.run_async(run()), "ok")
+        self.assertEqual(len(attempts), 2)
+
+    def test_turn_scope_isolation(self):
+        first, second = TurnCache(), TurnCache()
+
+        async def turn(cache):
+            with turn_scope(cache):
+                await asyncio.sleep(0.01)
+                # 并发任务继承的是各自轮次的缓存
+                inner = await asyncio.create_task(self._current())
+                return current_turn_cache(), inner
+
+        async def run():
+            return await asyncio.gather(turn(first), turn(second))
+
+        self.assertIsNone(current_turn_cache())
+        (a, a_inner), (b, b_inner) = self.run_async(run())
+        self.assertIs(a, first)
+        self.assertIs(a_inner, first)
+        self.assertIs(b, second)
+        self.assertIs(b_inner, second)
+        self.assertIsNone(current_turn_cache())
+
+        with turn_scope(first):
+            with turn_scope(second):
+                self.assertIs(current_turn_cache(), second)
+            self.assertIs(current_turn_cache(), first)
+        self.assertIsNone(current_turn_cache())
+
+    @staticmethod
+    async def _current():
+        return current_turn_cache()
+
+    def test_memo_prefix_reuses_larger_result(self):
+        cache = TurnCache()
+        factory = mock.Mock(side_effect=lambda fetch: [{"id": i, "score": 1.0 - i / 100} for i in range(fetch)])
+
+        first = cache.memo_prefix("search", 10, factory, prefetch=60)
+        factory.assert_called_once_with(60)
+        self.assertEqual([item["id"] for item in first], list(range(10)))
+
+        second = cache.memo_prefix("search", 60, factory, prefetch=60)
+        self.assertEqual(len(second), 60)
+        factory.assert_called_once()
+
+        # 比已缓存更多时重新取
+        self.assertEqual(len(cache.memo_prefix("search", 80, factory, prefetch=60)), 80)
+        factory.assert_called_with(80)
+        self.assertEqual(factory.call_count, 2)
+
+    def test_memo_prefix_returns_copies(self):
+        cache = TurnCache()
+        first = cache.memo_prefix("search", 2, lambda fetch: [{"id": i} for i in range(fetch)])
+        first[0]["id"] = "changed"
+        first.append({"id": "extra"})
+        second = cache.memo_prefix("search", 2, lambda fetch: [])
+        self.assertEqual(second, [{"id": 0}, {"id": 1}])
+
+    def test_search_vectors_within_turn(self):
+        search = mock.Mock(side_effect=lambda vec, limit, agent_id: [{"id": i, "agent": agent_id} for i in range(limit)])
+        fake = types.ModuleType("services.vector_service")
+        fake.vector_service = types.SimpleNamespace(search=search)
+
+        with mock.patch.dict(sys.modules, {"services.vector_service": fake}):
+            # 不在轮次内时按原样检索
+            self.assertEqual(len(search_vectors([0.1], 5)), 5)
+            search.assert_called_once_with([0.1], limit=5, agent_id="pero")
+            search.reset_mock()
+
+            with turn_scope(TurnCache()):
+                self.assertEqual(len(search_vectors([0.1], 10)), 10)
+                self.assertEqual(len(search_vectors([0.1], SEARCH_PREFETCH)), SEARCH_PREFETCH)
+                search_vectors([0.1], 10, agent_id="other")
+            self.assertEqual(search.call_args_list, [
+                mock.call([0.1], limit=SEARCH_PREFETCH, agent_id="pero"),
+                mock.call([0.1], limit=SEARCH_PREFETCH, agent_id="other"),
+            ])
+
+
+if __name__ == "__main__":
+    unittest.main()
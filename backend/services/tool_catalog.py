@@ -0,0 +1,240 @@
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from nit_core.scheduler import policy_from_config, register_tool_policy
+
+logger = logging.getLogger(__name__)
+
+# 移动端禁止的敏感工具关键词
+SENSITIVE_TOOL_KEYWORDS = ("screenshot", "screen", "windows", "shell", "cmd", "file", "app", "browser", "exec", "write")
+
+# 社交模式白名单
+SOCIAL_SAFE_PREFIXES = ("qq_",)
+SOCIAL_SAFE_NAMES = frozenset({
+    "read_social_memory", "read_agent_memory", "qq_notify_master",
+    "add_reminder", "list_reminders", "delete_reminder",
+})
+
+# 工作模式白名单
+WORK_MODE_KEYWORDS = (
+    "screen", "window", "file", "dir", "read", "write", "search", "cmd", "exec",
+    "browser", "click", "type", "scroll", "mouse", "keyboard", "system", "code", "terminal", "git",
+)
+WORK_MODE_NAMES = frozenset({"take_screenshot", "see_screen", "get_active_windows", "finish_task"})
+
+# 非多模态模型下截图工具的替换描述
+_NON_VISION_SCREENSHOT_DESCRIPTION = "获取当前屏幕的视觉分析报告。系统将调用视觉 MCP 服务器分析屏幕内容并返回详细的文字描述。当你需要了解屏幕上的视觉信息、或出于好奇想看看主人在做什么但无法直接看到图片时，请使用此工具。"
+_NON_VISION_COUNT_DESCRIPTION = "获取截图并分析的数量。在非多模态模式下，建议设为 1。"
+
+
+class _FrozenDict(dict):
+    """只读 dict (仍是 dict 子类，可直接 json 序列化 / 交给各厂商 SDK)。"""
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("工具目录中的定义是共享只读结构，请先复制再修改")
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return json.loads(json.dumps(self))
+
+
+class _FrozenList(list):
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("工具目录中的定义是共享只读结构，请先复制再修改")
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return json.loads(json.dumps(self))
+
+
+def freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return _FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return _FrozenList(freeze(v) for v in value)
+    return value
+
+
+def _is_sensitive(tool_name: str) -> bool:
+    lowered = tool_name.lower()
+    return any(kw in lowered for kw in SENSITIVE_TOOL_KEYWORDS)
+
+
+def _allowed_in_work_mode(tool_name: str) -> bool:
+    lowered = tool_name.lower()
+    if any(k in lowered for k in WORK_MODE_KEYWORDS) or lowered in WORK_MODE_NAMES:
+        return True
+    # 记忆类工具只保留检索/读取
+    return "memory" in lowered and ("search" in lowered or "read" in lowered)
+
+
+class ToolCatalog:
+    """
+    预编译的工具 Schema 目录
+    - 按 (移动端, 社交能力, 视觉, 工作模式) 组合预先计算过滤后的原生工具列表，返回共享的只读结构
+    - MCP 工具定义按 (客户端配置, 客户端工具列表版本) 缓存，客户端自身缓存 tools/list 结果 (见 McpConnectionManager)
+    - 插件重载 (PluginManager.reload_plugins / NITDispatcher.reload_tools) 或 MCP 配置提交后失效
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ToolCatalog, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self.version = 0
+        self._native: Dict[Tuple[bool, bool, bool, bool], Tuple[Dict[str, Any], ...]] = {}
+        self._mcp_listings: Dict[Tuple[str, int], Tuple[Dict[str, Any], ...]] = {}
+        self._listener_registered = False
+        self._initialized = True
+
+    # --- 失效 ---
+
+    def invalidate(self, reason: str = ""):
+        """插件或 MCP 配置变化后丢弃全部缓存。"""
+        self.version += 1
+        self._native.clear()
+        self._mcp_listings.clear()
+        logger.info(f"[ToolCatalog] 工具目录已失效 (v{self.version}) {reason}")
+
+    def invalidate_mcp(self):
+        self.version += 1
+        self._mcp_listings.clear()
+        logger.info(f"[ToolCatalog] MCP 工具缓存已失效 (v{self.version})")
+
+    def _ensure_plugin_listener(self, plugin_manager):
+        if not self._listener_registered:
+            plugin_manager.add_reload_listener(lambda: self.invalidate("(插件重载)"))
+            self._listener_registered = True
+
+    # --- 原生工具 ---
+
+    @staticmethod
+    def _key(source: str, capabilities: Optional[Iterable[str]], enable_vision: bool, work_mode: bool):
+        return (source == "mobile", bool(capabilities) and "social" in capabilities, bool(enable_vision), bool(work_mode))
+
+    def get_native_tools(
+        self,
+        source: str,
+        capabilities: Optional[Iterable[str]] = None,
+        enable_vision: bool = False,
+        work_mode: bool = False
+    ) -> Tuple[Dict[str, Any], ...]:
+        """返回该组合下的原生工具定义 (只读，调用方不要修改)。"""
+        from nit_core.tools import plugin_manager
+
+        self._ensure_plugin_listener(plugin_manager)
+        key = self._key(source, capabilities, enable_vision, work_mode)
+        tools = self._native.get(key)
+        if tools is None:
+            tools = self._build_native(plugin_manager.get_all_definitions(), *key)
+            self._native[key] = tools
+            logger.info(f"[ToolCatalog] 编译工具列表 {key}: {len(tools)} 个 (v{self.version})")
+        return tools
+
+    @staticmethod
+    def _build_native(definitions: List[Dict[str, Any]], is_mobile: bool, is_social: bool,
+                      enable_vision: bool, work_mode: bool) -> Tuple[Dict[str, Any], ...]:
+        tools = []
+        for tool_def in definitions:
+            # 非 OpenAI Function Calling 格式 (纯 NIT 指令) 不注册为原生工具，但依然在 System Prompt 中可见
+            if "function" not in tool_def or "name" not in tool_def.get("function", {}):
+                continue
+            tool_name = tool_def["function"]["name"]
+
+            # 安全校验：手机端剔除敏感工具
+            if is_mobile and _is_sensitive(tool_name):
+                continue
+
+            # 多模态模型不注入 screen_ocr
+            if enable_vision and tool_name == "screen_ocr":
+                continue
+
+            # [Stage 3] Dynamic Capability Filtering
+            # Note: Currently tools might not have this metadata, so we default to "core"
+            if is_social:
+                req_cap = tool_def.get("required_capability", "core")
+                is_safe = (
+                    req_cap == "social"
+                    or tool_name.startswith(SOCIAL_SAFE_PREFIXES)
+                    or tool_name in SOCIAL_SAFE_NAMES
+                )
+                if not is_safe:
+                    continue
+
+            if work_mode and not _allowed_in_work_mode(tool_name):
+                continue
+
+            new_tool_def = json.loads(json.dumps(tool_def))
+            if tool_name in ("take_screenshot", "see_screen") and not enable_vision:
+                new_tool_def["function"]["description"] = _NON_VISION_SCREENSHOT_DESCRIPTION
+                # 非多模态模式下，count 参数可能没意义，或者我们只支持 1
+                properties = new_tool_def["function"].get("parameters", {}).get("properties", {})
+                if "count" in properties:
+                    properties["count"]["description"] = _NON_VISION_COUNT_DESCRIPTION
+            tools.append(freeze(new_tool_def))
+        return tuple(tools)
+
+    # --- MCP 工具 ---
+
+    @staticmethod
+    def _client_key(client) -> str:
+        return json.dumps(client.config, sort_keys=True, default=str)
+
+    async def get_mcp_tools(self, clients: List[Any], source: str, work_mode: bool = False) -> List[Tuple[Dict[str, Any], Any]]:
+        """返回 [(工具定义, 对应客户端)]；工具定义按客户端配置与工具列表版本缓存。"""
+        entries = []
+        for client in clients:
+            try:
+                # 客户端在 TTL 内直接返回缓存的 tools/list 结果
+                mcp_tools = await client.list_tools()
+            except Exception as e:
+                print(f"[ToolCatalog] 警告: 列出客户端 {client.name} 的工具失败: {e}")
+                continue
+            key = (self._client_key(client), getattr(client, "tools_version", 0))
+            listing = self._mcp_listings.get(key)
+            if listing is None:
+                listing = tuple(
+                    freeze({
+                        "type": "function",
+                        "function": {
+                            "name": f"mcp_{tool['name']}",
+                            "description": tool.get("description", ""),
+                            "parameters": tool.get("inputSchema", {})
+                        }
+                    })
+                    for tool in mcp_tools
+                )
+                # 空列表多半是连接失败，不缓存，下次重试
+                if listing:
+                    # 同一客户端的旧版本列表不再需要
+                    for stale in [k for k in self._mcp_listings if k[0] == key[0]]:
+                        del self._mcp_listings[stale]
+                    self._mcp_listings[key] = listing
+                    print(f"[ToolCatalog] 缓存 MCP 工具 {len(listing)} 个 (来自 {client.name})")
+
+            # MCP 工具没有清单，执行策略取自服务器配置 (未声明时串行)
+            policy = policy_from_config(getattr(client, "config", None) or {})
+            for tool_def in listing:
+                tool_name = tool_def["function"]["name"]
+                register_tool_policy(tool_name, policy)
+                # 同样对 MCP 工具实施安全校验
+                if source == "mobile" and _is_sensitive(tool_name):
+                    continue
+                if work_mode and not _allowed_in_work_mode(tool_name):
+                    continue
+                entries.append((tool_def, client))
+        return entries
+
+
+tool_catalog = ToolCatalog()
+
@@ -0,0 +1,182 @@
+"""
+短语级 TTS 缓存
+
+问候、陪伴提醒、状态提示等短句会被反复合成 (cute 模式下还要再跑一遍 Praat 处理)。
+按 (规范化文本, 提供商, 音色, 语速, 音调, 后处理参数) 的内容哈希缓存合成结果：
+- 内存层：OrderedDict LRU，按字节数限制 (PERO_TTS_CACHE_MEMORY_MB)
+- 磁盘层：data/tts_cache 下以哈希命名的文件，按字节数 LRU 淘汰 (PERO_TTS_CACHE_DISK_MB)
+- 同一个 key 的并发请求只合成一次 (single-flight)
+"""
+
+import os
+import re
+import json
+import asyncio
+import hashlib
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+TTS_CACHE_ENABLED = os.environ.get("PERO_TTS_CACHE", "1") != "0"
+# 只缓存短句，长回复几乎不会重复
+TTS_CACHE_MAX_CHARS = int(os.environ.get("PERO_TTS_CACHE_MAX_CHARS", "60"))
+TTS_CACHE_MEMORY_BYTES = int(float(os.environ.get("PERO_TTS_CACHE_MEMORY_MB", "16")) * 1024 * 1024)
+TTS_CACHE_DISK_BYTES = int(float(os.environ.get("PERO_TTS_CACHE_DISK_MB", "128")) * 1024 * 1024)
+
+_WHITESPACE = re.compile(r"\s+")
+_SUFFIX = ".audio"
+
+
+def normalize_text(text: str) -> str:
+    """NFKC 规范化并折叠空白，使全半角 / 多余空格不同的同一句话命中同一条缓存。"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text or "")).strip()
+
+
+def make_cache_key(text: str, **params) -> str:
+    payload = json.dumps([normalize_text(text), params], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class TTSCache:
+    def __init__(self, directory: Optional[str], memory_bytes: int = TTS_CACHE_MEMORY_BYTES,
+                 disk_bytes: int = TTS_CACHE_DISK_BYTES, max_chars: int = TTS_CACHE_MAX_CHARS,
+                 enabled: bool = TTS_CACHE_ENABLED):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.max_chars = max_chars
+        self.enabled = enabled
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_size = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_size = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.enabled and self.directory and self.disk_bytes > 0:
+            self._load_disk_index()
+
+    def accepts(self, text: str) -> bool:
+        return self.enabled and 0 < len(normalize_text(text)) <= self.max_chars
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def _load_disk_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(_SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-len(_SUFFIX)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_size += size
+        self._evict_disk()
+
+    # --- 内存层 ---
+
+    def _remember(self, key: str, audio: bytes):
+        if len(audio) > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old)
+        self._memory[key] = audio
+        self._memory_size += len(audio)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    # --- 磁盘层 ---
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            os.utime(path)
+            return audio
+        except OSError:
+            return None
+
+    def _write_disk(self, key: str, audio: bytes):
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(audio)
+        os.replace(temp_path, path)
+
+    def _evict_disk(self):
+        while self._disk_size > self.disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    async def _load(self, key: str, factory: Callable[[], Awaitable[Tuple[Optional[bytes], bool]]]) -> Optional[bytes]:
+        use_disk = self.directory and self.disk_bytes > 0
+        if use_disk and key in self._disk:
+            audio = await asyncio.to_thread(self._read_disk, key)
+            if audio is not None:
+                self._disk.move_to_end(key)
+                self.disk_hits += 1
+                self._remember(key, audio)
+                return audio
+            self._disk_size -= self._disk.pop(key)
+
+        self.misses += 1
+        audio, cacheable = await factory()
+        if not audio or not cacheable:
+            return audio
+        self._remember(key, audio)
+        if use_disk and len(audio) <= self.disk_bytes:
+            try:
+                await asyncio.to_thread(self._write_disk, key, audio)
+            except OSError as e:
+                print(f"[TTS] 写入缓存失败: {e}")
+                return audio
+            self._disk_size -= self._disk.pop(key, 0)
+            self._disk[key] = len(audio)
+            self._disk_size += len(audio)
+            self._evict_disk()
+        return audio
+
+    async def get_or_create(self, key: str,
+                            factory: Callable[[], Awaitable[Tuple[Optional[bytes], bool]]]) -> Optional[bytes]:
+        """
+        命中内存 / 磁盘直接返回；否则调用 factory() 合成，返回 (音频, 是否可缓存)。
+        同一个 key 的并发请求共享一次合成。
+        """
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return audio
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, factory))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.hits += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_size,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_size,
+        }
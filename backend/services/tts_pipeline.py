@@ -0,0 +1,291 @@
+"""
+语音轮次的分句流水线 TTS
+
+旧流程等待 Agent 完整回复后再对全文一次性合成，首段音频的延迟 = LLM 全部生成时间 + 全文合成时间。
+流水线模式下：
+- SentenceSplitter 对流式回复增量分句，一旦出现完整句子就立即交给 TTS
+- TTSPipeline 以有限并发 (PERO_TTS_MAX_PARALLEL) 合成各句，并严格按提交顺序发送，合成完一句就发一句
+ReAct 过滤 (只朗读最终回答) 依赖整段回复，不能逐句做，由 ReActFilter 在分句之前增量完成。
+"""
+
+import asyncio
+import os
+import re
+import time
+from typing import Awaitable, Callable, List, Optional, Set, Tuple, Union
+
+TTS_MAX_PARALLEL = max(1, int(os.environ.get("PERO_TTS_MAX_PARALLEL", "2")))
+# 过短的片段 (如 "嗯。") 并入下一句一起合成，避免语调破碎
+SENTENCE_MIN_CHARS = 6
+
+SENTENCE_DELIMITERS = "。！？!?；;\n"
+_OPEN_BRACKETS = "(（【["
+_CLOSE_BRACKETS = ")）】]"
+
+# ReAct 技术块标题 (行首) 与最终回答标记
+_REACT_HEADER_WORDS = ("Plan", "计划", "Action", "Action Input", "Observation", "Result", "Thought", "Prompt")
+_REACT_HEADERS = "(?:" + "|".join(_REACT_HEADER_WORDS) + ")"
+_FINAL_MARKER_WORDS = ("final answer", "最终回答", "回复")
+REACT_HEADER_PATTERN = re.compile(rf"(?m)^{_REACT_HEADERS}[:：]")
+REACT_BLOCK_PATTERN = re.compile(
+    rf"(?m)^{_REACT_HEADERS}[:：][\s\S]*?"
+    rf"(?=(?:^(?:Plan|计划|Action|Action Input|Observation|Result|Thought|Prompt|Final Answer|最终回答|回复)[:：])|\Z)"
+)
+FINAL_ANSWER_PATTERN = re.compile(r"(?:Final Answer|最终回答|回复)[:：]?\s*", re.IGNORECASE)
+
+
+def strip_react(text: str) -> str:
+    """
+    智能 ReAct 过滤：只保留最终回复，忽略 计划/行动/观察 等过程记录。
+    策略 1：存在 "Final Answer" (最终回答) 标记时，提取其后的所有内容；
+    策略 2：否则移除所有已知的技术块 (标题 -> 内容 -> 下一个标题/结尾)。
+    """
+    final_marker = FINAL_ANSWER_PATTERN.search(text)
+    if final_marker:
+        return text[final_marker.end():]
+    text = text.replace("\r\n", "\n")
+    if REACT_HEADER_PATTERN.search(text):
+        text = REACT_BLOCK_PATTERN.sub("", text)
+    return text
+
+
+class ReActFilter:
+    """
+    strip_react 的增量版本，放在分句之前。feed() / flush() 返回 (可朗读文本, 是否改口)：
+    - 出现 ReAct 标题后暂存后续全部文本，直到出现最终回答标记或回复结束
+    - 出现最终回答标记时只输出标记之后的内容，并返回 rebase=True，
+      调用方应丢弃分句器缓冲和尚未朗读的句子 (标记之前都是思考过程)
+    - 结尾可能是标记或标题前缀的文本 (如 "Final Ans"、行首 "Pla") 先暂存，等待后续分片
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._line_start = True  # _buffer 是否从行首开始
+        self._holding = False
+        self._final = False
+
+    def feed(self, text: str) -> Tuple[str, bool]:
+        if self._final:
+            return text, False
+        self._buffer += text
+        buffer = self._buffer
+
+        marker = FINAL_ANSWER_PATTERN.search(buffer)
+        if marker:
+            if marker.end() == len(buffer):
+                return "", False  # 标记后的冒号 / 空白可能还没写完
+            self._final = True
+            self._buffer = ""
+            return buffer[marker.end():], True
+        if self._holding:
+            return "", False
+
+        for header in REACT_HEADER_PATTERN.finditer(buffer):
+            if header.start() or self._line_start:
+                self._holding = True
+                self._buffer = buffer[header.start():]
+                return buffer[:header.start()], False
+
+        keep = self._holdback(buffer)
+        released = buffer[:len(buffer) - keep]
+        self._buffer = buffer[len(buffer) - keep:]
+        if released:
+            self._line_start = released.endswith("\n")
+        return released, False
+
+    def flush(self) -> Tuple[str, bool]:
+        buffer, self._buffer = self._buffer, ""
+        if self._final:
+            return buffer, False
+        marker = FINAL_ANSWER_PATTERN.search(buffer)
+        if marker:
+            self._final = True
+            return buffer[marker.end():], True
+        if self._holding:
+            # 没有最终回答标记：按整段回复的规则移除技术块
+            return REACT_BLOCK_PATTERN.sub("", buffer.replace("\r\n", "\n")), False
+        return buffer, False
+
+    def _holdback(self, buffer: str) -> int:
+        keep = 0
+        lower = buffer.lower()
+        for word in _FINAL_MARKER_WORDS:
+            for k in range(min(len(word) - 1, len(buffer)), 0, -1):
+                if lower.endswith(word[:k]):
+                    keep = max(keep, k)
+                    break
+        line = buffer.rfind("\n") + 1
+        if line or self._line_start:
+            partial = buffer[line:]
+            if partial and any(f"{word}{colon}".startswith(partial)
+                               for word in _REACT_HEADER_WORDS for colon in ":："):
+                keep = max(keep, len(partial))
+        return keep
+
+
+class SentenceSplitter:
+    """
+    增量分句器。feed() 返回本次新得到的完整句子，flush() 返回剩余文本。
+    与 _clean_text 的规则保持一致，不会在以下位置断句，以免清洗时漏掉成对的标记：
+    - ``` 代码块内部
+    - 同一行内未闭合的 *动作* 或 (备注) / （备注） / 【思考】 / [思考]
+    英文句点只有在后面跟着空白时才视为句末，避免切断 "3.14" 之类的数字。
+    """
+
+    def __init__(self, min_chars: int = SENTENCE_MIN_CHARS):
+        self.min_chars = min_chars
+        self._buffer = ""
+        self._scan = 0          # 已扫描到的位置
+        self._start = 0         # 当前句子的起点
+        self._in_fence = False
+        self._depth = 0
+        self._in_star = False
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        buffer = self._buffer
+        sentences = []
+        i = self._scan
+        n = len(buffer)
+        while i < n:
+            ch = buffer[i]
+            if ch == "`":
+                if n - i < 3:
+                    break  # 可能是被截断的 ```，等待后续分片
+                if buffer.startswith("```", i):
+                    self._in_fence = not self._in_fence
+                    i += 3
+                    continue
+            if self._in_fence:
+                i += 1
+                continue
+
+            if ch in _OPEN_BRACKETS:
+                self._depth += 1
+            elif ch in _CLOSE_BRACKETS:
+                self._depth = max(0, self._depth - 1)
+            elif ch == "*":
+                self._in_star = not self._in_star
+
+            is_delimiter = ch in SENTENCE_DELIMITERS or ch == "."
+            if ch == "\n":
+                # 动作 / 括号标记不跨行
+                self._depth = 0
+                self._in_star = False
+            elif not is_delimiter or self._depth or self._in_star:
+                i += 1
+                continue
+
+            end = i + 1
+            while end < n and (buffer[end] in SENTENCE_DELIMITERS or buffer[end] == "."):
+                end += 1
+            if end == n:
+                break  # 标点可能还没写完 (如 "！！" / "..." / "3.")，等待后续分片
+            if ch == "." and not buffer[end].isspace():
+                i = end
+                continue
+
+            if len(buffer[self._start:end].strip()) >= self.min_chars:
+                sentences.append(buffer[self._start:end])
+                self._start = end
+            i = end
+
+        self._scan = i
+        if self._start:
+            self._buffer = buffer[self._start:]
+            self._scan -= self._start
+            self._start = 0
+        return sentences
+
+    def flush(self) -> str:
+        rest = self._buffer
+        self.__init__(self.min_chars)
+        return rest
+
+
+class TTSPipeline:
+    """
+    有限并发合成、按序发送。
+    synthesize(text) 返回音频 (字节或文件路径) 或 None；send(audio) 负责把音频推送给前端。
+    """
+
+    def __init__(self, synthesize: Callable[[str], Awaitable[Optional[Union[bytes, str]]]],
+                 send: Callable[[Union[bytes, str]], Awaitable[None]], max_parallel: Optional[int] = None):
+        self._synthesize = synthesize
+        self._send = send
+        self._semaphore = asyncio.Semaphore(max_parallel or TTS_MAX_PARALLEL)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._pending: List[asyncio.Task] = []
+        self._current: Optional[asyncio.Task] = None
+        self._discarded: Set[asyncio.Task] = set()
+        self._cancelled = False
+        self._sender = asyncio.create_task(self._send_in_order())
+        self.started_at = time.perf_counter()
+        self.first_audio_at: Optional[float] = None
+        self.submitted = 0
+        self.sent = 0
+
+    @property
+    def time_to_first_audio(self) -> Optional[float]:
+        if self.first_audio_at is None:
+            return None
+        return self.first_audio_at - self.started_at
+
+    def submit(self, text: str):
+        task = asyncio.create_task(self._run(text))
+        self._pending.append(task)
+        self._queue.put_nowait(task)
+        self.submitted += 1
+
+    async def _run(self, text: str):
+        async with self._semaphore:
+            return await self._synthesize(text)
+
+    async def _send_in_order(self):
+        while True:
+            task = await self._queue.get()
+            if task is None:
+                return
+            self._current = task
+            try:
+                audio = await task
+            except asyncio.CancelledError:
+                if task.cancelled():
+                    continue
+                raise
+            except Exception as e:
+                print(f"[TTS] 分句合成失败: {e}")
+                continue
+            finally:
+                self._current = None
+            if not audio or self._cancelled or task in self._discarded:
+                continue
+            if self.first_audio_at is None:
+                self.first_audio_at = time.perf_counter()
+            try:
+                await self._send(audio)
+                self.sent += 1
+            except Exception as e:
+                print(f"[TTS] 分句音频发送失败: {e}")
+
+    def discard_pending(self):
+        """放弃所有尚未发送的句子 (回复改口，如出现最终回答标记时使用)。正在发送的一句不受影响。"""
+        dropped = [self._current] if self._current is not None else []
+        while not self._queue.empty():
+            dropped.append(self._queue.get_nowait())
+        for task in dropped:
+            task.cancel()
+            self._discarded.add(task)
+        self.submitted -= len(dropped)
+
+    async def close(self, cancel: bool = False):
+        """等待全部已提交的句子发送完毕；cancel=True 时放弃尚未完成的合成。"""
+        if cancel:
+            self._cancelled = True
+            for task in self._pending:
+                task.cancel()
+        self._queue.put_nowait(None)
+        try:
+            await self._sender
+        finally:
+            self._pending.clear()
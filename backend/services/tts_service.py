@@ -4,11 +4,12 @@ import uuid
 import json
 import httpx
 import logging
-from typing import Optional
+from typing import AsyncIterator, Optional
 from sqlmodel import select
 from database import get_session
 from models import VoiceConfig
-from .audio_processor import audio_processor
+from .audio_processor import audio_processor, CUTE_PITCH_FACTOR, CUTE_FORMANT_FACTOR
+from .tts_cache import TTSCache, make_cache_key
 from core.config_manager import get_config_manager
 
 logger = logging.getLogger(__name__)
@@ -25,47 +26,136 @@ class TTSService:
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir, exist_ok=True)
 
+        # 短语级合成缓存 (不在 temp_audio 中，不会被 cleanup_old_files 清理)
+        self.cache = TTSCache(os.path.join(data_dir, "tts_cache"))
+
     async def _get_active_config(self) -> Optional[VoiceConfig]:
         async for session in get_session():
             return (await session.exec(select(VoiceConfig).where(VoiceConfig.type == "tts").where(VoiceConfig.is_active == True))).first()
         return None
 
-    async def synthesize(self, text: str, voice: str = None, rate: str = None, pitch: str = None, cute: bool = False) -> Optional[str]:
-        """
-        将文字合成语音并保存为 mp3
-        """
-        if not get_config_manager().get("tts_enabled", True):
-            return None
-
-        if not text.strip():
-            return None
-            
+    async def _resolve_backend(self, voice: str = None, rate: str = None, pitch: str = None):
+        """读取当前激活的 TTS 配置，返回 (provider, config_json, config, overrides)"""
         config = await self._get_active_config()
         overrides = {}
         if voice: overrides["voice"] = voice
         if rate: overrides["rate"] = rate
         if pitch: overrides["pitch"] = pitch
 
-        filepath = None
         if not config:
-             # 如果未找到配置，回退到默认的 edge-tts
-             filepath = await self._synthesize_edge(text, {}, None, overrides)
+            # 如果未找到配置，回退到默认的 edge-tts
+            return "edge_tts", {}, None, overrides
+        try:
+            config_json = json.loads(config.config_json)
+        except:
+            config_json = {}
+        # 未知提供商，回退到 edge
+        provider = config.provider if config.provider == "openai_compatible" else "edge_tts"
+        return provider, config_json, config, overrides
+
+    async def _iter_audio(self, text: str, voice: str = None, rate: str = None, pitch: str = None, backend=None) -> AsyncIterator[bytes]:
+        provider, config_json, config, overrides = backend or await self._resolve_backend(voice, rate, pitch)
+        if provider == "openai_compatible":
+            chunks = self._stream_openai(text, config_json, config, overrides)
         else:
+            chunks = self._stream_edge(text, config_json, config, overrides)
+        async for chunk in chunks:
+            yield chunk
+
+    def _should_synthesize(self, text: str) -> bool:
+        return get_config_manager().get("tts_enabled", True) and bool(text and text.strip())
+
+    async def synthesize_stream(self, text: str, voice: str = None, rate: str = None, pitch: str = None) -> AsyncIterator[bytes]:
+        """
+        流式合成，边生成边产出 mp3 音频块，不落盘。
+        出错时结束迭代 (错误由各提供商记录)。
+        """
+        if not self._should_synthesize(text):
+            return
+        if self.cache.accepts(text):
+            # 短句整段走缓存，命中时无需再请求提供商
+            audio = await self.synthesize_bytes(text, voice=voice, rate=rate, pitch=pitch)
+            if audio:
+                yield audio
+            return
+        try:
+            async for chunk in self._iter_audio(text, voice, rate, pitch):
+                yield chunk
+        except Exception:
+            return  # 错误已由各提供商记录
+
+    async def synthesize_bytes(self, text: str, voice: str = None, rate: str = None, pitch: str = None, cute: bool = False) -> Optional[bytes]:
+        """
+        合成语音并直接返回完整音频字节 (mp3；cute 时为 wav)，失败返回 None
+        """
+        if not self._should_synthesize(text):
+            return None
+        backend = await self._resolve_backend(voice, rate, pitch)
+
+        async def produce():
             try:
-                config_json = json.loads(config.config_json)
-            except:
-                config_json = {}
-
-            if config.provider == "edge_tts":
-                filepath = await self._synthesize_edge(text, config_json, config, overrides)
-            elif config.provider == "openai_compatible":
-                filepath = await self._synthesize_openai(text, config_json, config, overrides)
-            else:
-                # 未知提供商，回退到 edge
-                filepath = await self._synthesize_edge(text, config_json, config, overrides)
+                chunks = [chunk async for chunk in self._iter_audio(text, backend=backend)]
+            except Exception:
+                return None, False  # 错误已由各提供商记录
+            audio = b"".join(chunks) or None
+            if audio and cute:
+                # 可爱化在进程池中处理，失败时使用原始音频 (不写入 cute 缓存)
+                processed = await audio_processor.process_voice_cute_bytes(audio)
+                if processed:
+                    return processed, True
+                return audio, False
+            return audio, True
+
+        if not self.cache.accepts(text):
+            return (await produce())[0]
+        return await self.cache.get_or_create(self._cache_key(text, backend, cute), produce)
+
+    def _cache_key(self, text: str, backend, cute: bool) -> str:
+        provider, config_json, config, overrides = backend
+        params = dict(config_json)
+        params.update(overrides)
+        return make_cache_key(
+            text,
+            provider=provider,
+            model=getattr(config, "model", None),
+            api_base=getattr(config, "api_base", None),
+            params=params,
+            cute=(CUTE_PITCH_FACTOR, CUTE_FORMANT_FACTOR) if cute else None,
+        )
+
+    async def synthesize(self, text: str, voice: str = None, rate: str = None, pitch: str = None, cute: bool = False) -> Optional[str]:
+        """
+        将文字合成语音并保存为 mp3 (文件输出；热路径请使用 synthesize_bytes / synthesize_stream)
+        """
+        if not self._should_synthesize(text):
+            return None
+
+        if self.cache.accepts(text):
+            # 短句经由缓存合成，再复制一份给调用方 (调用方通常会在播放后删除文件)
+            audio = await self.synthesize_bytes(text, voice=voice, rate=rate, pitch=pitch, cute=cute)
+            if not audio:
+                return None
+            suffix = "_cute.wav" if audio[:4] == b"RIFF" else ".mp3"
+            filepath = os.path.join(self.output_dir, f"{uuid.uuid4()}{suffix}")
+            with open(filepath, "wb") as f:
+                f.write(audio)
+            return filepath
+
+        filepath = os.path.join(self.output_dir, f"{uuid.uuid4()}.mp3")
+        try:
+            written = 0
+            with open(filepath, "wb") as f:
+                async for chunk in self._iter_audio(text, voice, rate, pitch):
+                    f.write(chunk)
+                    written += len(chunk)
+        except Exception:
+            written = 0  # 错误已由各提供商记录
+        if not written:
+            self.cleanup(filepath)
+            return None
 
         # 如果开启了可爱化后处理
-        if filepath and cute:
+        if cute:
             processed_filepath = filepath.replace(".mp3", "_cute.wav") # Parselmouth 保存为 wav
             success = await audio_processor.process_voice_cute(filepath, processed_filepath)
             if success:
@@ -78,10 +168,7 @@ class TTSService:
         
         return filepath
 
-    async def _synthesize_edge(self, text: str, config_json: dict, config: Optional[VoiceConfig], overrides: dict = None) -> Optional[str]:
-        filename = f"{uuid.uuid4()}.mp3"
-        filepath = os.path.join(self.output_dir, filename)
-        
+    async def _stream_edge(self, text: str, config_json: dict, config: Optional[VoiceConfig], overrides: dict = None) -> AsyncIterator[bytes]:
         overrides = overrides or {}
         voice = overrides.get("voice") or config_json.get("voice", "zh-CN-XiaoyiNeural")
         rate = overrides.get("rate") or config_json.get("rate", "+25%")
@@ -89,16 +176,14 @@ class TTSService:
         
         try:
             communicate = edge_tts.Communicate(text, voice, rate=rate, pitch=pitch)
-            await communicate.save(filepath)
-            return filepath
+            async for message in communicate.stream():
+                if message["type"] == "audio" and message["data"]:
+                    yield message["data"]
         except Exception as e:
             print(f"Edge TTS 错误: {e}")
-            return None
+            raise
 
-    async def _synthesize_openai(self, text: str, config_json: dict, config: VoiceConfig, overrides: dict = None) -> Optional[str]:
-        filename = f"{uuid.uuid4()}.mp3"
-        filepath = os.path.join(self.output_dir, filename)
-        
+    async def _stream_openai(self, text: str, config_json: dict, config: VoiceConfig, overrides: dict = None) -> AsyncIterator[bytes]:
         overrides = overrides or {}
         # OpenAI API 标准通常不支持直接调整音调，但支持调整语速
         voice = overrides.get("voice") or config_json.get("voice", "alloy")
@@ -137,18 +222,15 @@ class TTSService:
             }
             
             async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(url, headers=headers, json=payload)
-                if response.status_code != 200:
-                    print(f"OpenAI TTS API 错误: {response.text}")
-                    return None
-                
-                with open(filepath, "wb") as f:
-                    f.write(response.content)
-                    
-            return filepath
+                async with client.stream("POST", url, headers=headers, json=payload) as response:
+                    if response.status_code != 200:
+                        await response.aread()
+                        raise RuntimeError(f"OpenAI TTS API 错误: {response.text}")
+                    async for chunk in response.aiter_bytes():
+                        yield chunk
         except Exception as e:
              print(f"OpenAI TTS 错误: {e}")
-             return None
+             raise
 
     def cleanup_old_files(self, max_age_seconds: int = 3600):
         """清理超过一定时间的旧音频文件，默认 1 小时"""
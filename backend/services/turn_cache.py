@@ -0,0 +1,125 @@
+import copy
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+# 轮次内向量检索至少取这么多条 (= get_relevant_memories 的召回量)，后续更小的 limit 都能命中
+SEARCH_PREFETCH = 60
+
+# 当前轮次的缓存 (由 PreprocessorManager.process 设置，并发的预处理任务会继承它)
+_current_turn_cache: ContextVar[Optional["TurnCache"]] = ContextVar("pero_turn_cache", default=None)
+
+
+class TurnCache:
+    """
+    单轮对话内的记忆化缓存
+    同一轮里 RAG / 逻辑闪回 / 思维链 / get_relevant_memories 会对同一段文本重复做 embedding 和向量检索，
+    PetState 与配置快照也会被多个阶段读取；挂在预处理上下文上，每个产物每轮最多计算一次。
+    """
+
+    def __init__(self):
+        self._values: Dict[Hashable, Any] = {}
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def memo(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """同步产物 (embedding 等) 的记忆化。"""
+        if key in self._values:
+            self.hits += 1
+            return self._values[key]
+        self.misses += 1
+        value = factory()
+        self._values[key] = value
+        return value
+
+    async def amemo(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """异步产物的记忆化；并发阶段同时请求同一个 key 时只计算一次。"""
+        if key in self._values:
+            self.hits += 1
+            return self._values[key]
+        task = self._inflight.get(key)
+        if task is not None:
+            self.hits += 1
+            return await asyncio.shield(task)
+
+        self.misses += 1
+        task = asyncio.ensure_future(factory())
+        self._inflight[key] = task
+        try:
+            value = await asyncio.shield(task)
+            self._values[key] = value
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def memo_prefix(self, key: Hashable, limit: int, factory: Callable[[int], List[Any]],
+                    prefetch: int = 0) -> List[Any]:
+        """
+        列表产物 (检索结果等) 的记忆化：已缓存的结果至少取过 limit 条时直接返回前缀，
+        否则以 max(limit, prefetch) 调用 factory 重新取。返回条目的浅拷贝，调用方修改不会影响其他阶段。
+        """
+        cached = self._values.get(key)
+        if cached is not None and cached[0] >= limit:
+            self.hits += 1
+            results = cached[1]
+        else:
+            self.misses += 1
+            fetch = max(limit, prefetch)
+            results = factory(fetch)
+            self._values[key] = (fetch, results)
+        return [copy.copy(item) for item in results[:limit]]
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._values)}
+
+
+def current_turn_cache() -> Optional[TurnCache]:
+    return _current_turn_cache.get()
+
+
+@contextmanager
+def turn_scope(cache: TurnCache):
+    """在 with 块内把 cache 设为当前轮次缓存。"""
+    token = _current_turn_cache.set(cache)
+    try:
+        yield cache
+    finally:
+        _current_turn_cache.reset(token)
+
+
+# --- 常用产物 (不在轮次内时直接计算，行为与原来一致) ---
+
+def encode_query(text: str) -> List[float]:
+    from services.embedding_service import embedding_service
+
+    cache = current_turn_cache()
+    if cache is None:
+        return embedding_service.encode_one(text)
+    return cache.memo(("embedding", text), lambda: embedding_service.encode_one(text))
+
+
+def search_vectors(query_vec: List[float], limit: int, agent_id: str = "pero") -> List[Dict]:
+    """向量检索；同一轮内同一向量的更小 limit 直接取已缓存结果的前缀。"""
+    from services.vector_service import vector_service
+
+    cache = current_turn_cache()
+    if cache is None:
+        return vector_service.search(query_vec, limit=limit, agent_id=agent_id)
+
+    return cache.memo_prefix(
+        ("vector_search", agent_id, tuple(query_vec)), limit,
+        lambda fetch: vector_service.search(query_vec, limit=fetch, agent_id=agent_id),
+        prefetch=SEARCH_PREFETCH,
+    )
+
+
+async def config_snapshot():
+    """本轮固定使用同一份配置快照。"""
+    from core.config_manager import get_config_snapshot
+
+    cache = current_turn_cache()
+    if cache is None:
+        return await get_config_snapshot()
+    return await cache.amemo(("config_snapshot",), get_config_snapshot)
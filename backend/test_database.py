@@ -0,0 +1,108 @@
+import os
+import json
+import shutil
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, Session
+
+os.environ.setdefault("PERO_DATABASE_PATH", os.path.join(tempfile.gettempdir(), "perocore_test.db"))
+
+import database
+from models import Memory, unpack_embedding
+
+
+class TestMemoryEmbeddingMigration(unittest.TestCase):
+    """旧库 memory.embedding_json (JSON 文本) -> memoryembedding (float32 blob)"""
+
+    VECTORS = {
+        "a": [0.5, -0.25, 0.125, 1.0],
+        "b": [0.1, 0.2, 0.3],
+        "empty": [],
+        "null": None,
+    }
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "old.db")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+        # 模拟旧库：memory 表带 embedding_json 列，没有 memoryembedding 表与删除触发器
+        engine = create_engine(f"sqlite:///{self.path}")
+        tables = [t for t in SQLModel.metadata.sorted_tables if t.name != "memoryembedding"]
+        SQLModel.metadata.create_all(engine, tables=tables)
+        self.ids = {}
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ALTER TABLE memory ADD COLUMN embedding_json TEXT")
+        with Session(engine) as session:
+            memories = {name: Memory(content=name) for name in self.VECTORS}
+            session.add_all(memories.values())
+            session.commit()
+            self.ids = {name: memory.id for name, memory in memories.items()}
+        with engine.begin() as conn:
+            for name, vector in self.VECTORS.items():
+                conn.exec_driver_sql(
+                    "UPDATE memory SET embedding_json = ? WHERE id = ?",
+                    (None if vector is None else json.dumps(vector), self.ids[name]),
+                )
+        engine.dispose()
+
+    def run_init_db(self):
+        async def run():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{self.path}")
+            try:
+                with mock.patch.object(database, "engine", engine):
+                    await database.init_db()
+            finally:
+                await engine.dispose()
+        asyncio.new_event_loop().run_until_complete(run())
+
+    def execute(self, sql, params=()):
+        engine = create_engine(f"sqlite:///{self.path}")
+        try:
+            with engine.begin() as conn:
+                result = conn.exec_driver_sql(sql, params)
+                return result.all() if result.returns_rows else None
+        finally:
+            engine.dispose()
+
+    def embeddings(self):
+        return {memory_id: (dim, unpack_embedding(vector))
+                for memory_id, dim, vector in self.execute("SELECT memory_id, dim, vector FROM memoryembedding")}
+
+    def test_vectors_round_trip_and_column_is_dropped(self):
+        self.run_init_db()
+
+        embeddings = self.embeddings()
+        self.assertEqual(set(embeddings), {self.ids["a"], self.ids["b"]})
+        self.assertEqual(embeddings[self.ids["a"]], (4, self.VECTORS["a"]))
+        dim, vector = embeddings[self.ids["b"]]
+        self.assertEqual(dim, 3)
+        for got, expected in zip(vector, self.VECTORS["b"]):
+            self.assertAlmostEqual(got, expected, places=6)
+
+        columns = [row[1] for row in self.execute("PRAGMA table_info(memory)")]
+        self.assertNotIn("embedding_json", columns)
+        # 原有记忆不受影响
+        self.assertEqual(len(self.execute("SELECT id FROM memory")), len(self.VECTORS))
+
+    def test_trigger_removes_embedding_on_delete(self):
+        self.run_init_db()
+        self.execute("DELETE FROM memory WHERE id = ?", (self.ids["a"],))
+        self.assertEqual(set(self.embeddings()), {self.ids["b"]})
+
+    def test_second_run_is_noop(self):
+        self.run_init_db()
+        before = self.embeddings()
+        self.run_init_db()
+        self.assertEqual(self.embeddings(), before)
+        triggers = self.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        self.assertEqual(triggers, [("trg_memory_delete_embedding",)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, select, desc
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models import Memory, ConversationLog, ScheduledTask, StatsCounter
+
+
+class QueryPlanAuditor:
+    """对语句执行 EXPLAIN QUERY PLAN，返回计划明细 (detail 列)。"""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def plan(self, statement) -> list:
+        compiled = statement.compile(self.engine, compile_kwargs={"literal_binds": True})
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).all()
+        return [row[-1] for row in rows]
+
+    @staticmethod
+    def full_scans(plan: list) -> list:
+        # "SCAN memory" 为全表扫描；"SCAN memory USING INDEX ..." 为有序索引扫描，可接受
+        return [step for step in plan if step.startswith("SCAN") and "USING" not in step]
+
+
+class TestChatPathQueryPlans(unittest.TestCase):
+    """热路径查询不能退化为全表扫描 (查询与各 Service 中的写法保持一致)。"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine("sqlite://")
+        SQLModel.metadata.create_all(cls.engine)
+        cls.auditor = QueryPlanAuditor(cls.engine)
+
+    def assertIndexed(self, statement, index_name=None, allow_temp_sort=False):
+        plan = self.auditor.plan(statement)
+        self.assertEqual(QueryPlanAuditor.full_scans(plan), [], f"全表扫描: {plan}")
+        if index_name:
+            self.assertTrue(any(index_name in step for step in plan), f"未使用 {index_name}: {plan}")
+        if not allow_temp_sort:
+            self.assertFalse(any("TEMP B-TREE" in step for step in plan), f"额外排序: {plan}")
+
+    def test_recent_logs(self):
+        # MemoryService.get_recent_logs
+        statement = (
+            select(ConversationLog)
+            .where(ConversationLog.source == "desktop")
+            .where(ConversationLog.session_id == "default")
+            .where(ConversationLog.agent_id == "pero")
+            .order_by(desc(ConversationLog.timestamp), desc(ConversationLog.id))
+            .offset(0).limit(20)
+        )
+        self.assertIndexed(statement, "ix_conversationlog_source_session_agent_ts")
+
+    def test_recent_logs_within_budget(self):
+        # MemoryService.get_recent_logs_within_budget: 窗口累加只作用于最近 limit 行的子查询，主表走索引 / 主键
+        from services.memory_service import MemoryService
+        statement = MemoryService.recent_logs_within_budget_query("ide", "work_1", 100000, limit=200)
+        plan = self.auditor.plan(statement)
+        self.assertEqual([step for step in QueryPlanAuditor.full_scans(plan) if "conversationlog" in step], [], f"全表扫描: {plan}")
+        self.assertTrue(any("ix_conversationlog_source_session_agent_ts" in step for step in plan), plan)
+
+    def test_memory_tail_lookup(self):
+        # MemoryService.save_memory: 时间轴尾部
+        statement = select(Memory).where(Memory.agent_id == "pero").order_by(desc(Memory.timestamp)).limit(1)
+        self.assertIndexed(statement, "ix_memory_agent_timestamp")
+
+    def test_failed_scorer_backfill(self):
+        # ReflectionService.backfill_failed_scorer_tasks
+        statement = select(ConversationLog).where(
+            (ConversationLog.analysis_status == "failed") &
+            (ConversationLog.retry_count < 3)
+        ).order_by(desc(ConversationLog.timestamp))
+        self.assertIndexed(statement, "ix_conversationlog_status_retry", allow_temp_sort=True)
+
+    def test_pending_reactions(self):
+        # AgentService: 待触发的 reaction 任务
+        statement = (
+            select(ScheduledTask)
+            .where(ScheduledTask.type == "reaction")
+            .where(ScheduledTask.is_triggered == False)
+            .where(ScheduledTask.agent_id == "pero")
+        )
+        self.assertIndexed(statement, "ix_scheduledtask_triggered_type_agent")
+
+    def test_pending_tasks(self):
+        # 提醒/话题轮询
+        statement = select(ScheduledTask).where(ScheduledTask.is_triggered == False)
+        self.assertIndexed(statement, "ix_scheduledtask_triggered_type_agent")
+
+    def test_stats_counters(self):
+        # StatsService.get_counts
+        statement = select(StatsCounter).where(StatsCounter.agent_id == "pero")
+        self.assertIndexed(statement)
+
+
+class TestRecentLogsWithinBudget(unittest.TestCase):
+    def fetch(self, max_tokens, limit=200):
+        from services.memory_service import MemoryService
+
+        async def run():
+            engine = create_async_engine("sqlite+aiosqlite://")
+            async with engine.begin() as conn:
+                await conn.run_sync(SQLModel.metadata.create_all)
+            async with AsyncSession(engine) as session:
+                base = datetime(2026, 1, 1, 12, 0)
+                # 从旧到新；None 为尚未计数的旧记录 (按 0 计入)
+                for i, tokens in enumerate([40, 30, None, 20, 10]):
+                    log = ConversationLog(source="ide", session_id="work_1", role="user", content=f"m{i}",
+                                          timestamp=base + timedelta(minutes=i))
+                    log.token_count = tokens
+                    session.add(log)
+                other = ConversationLog(source="desktop", session_id="default", role="user", content="other",
+                                        timestamp=base + timedelta(minutes=10))
+                other.token_count = 1
+                session.add(other)
+                await session.commit()
+                logs = await MemoryService.get_recent_logs_within_budget(session, "ide", "work_1", max_tokens, limit=limit)
+                contents = [log.content for log in logs]
+            await engine.dispose()
+            return contents
+
+        return asyncio.new_event_loop().run_until_complete(run())
+
+    def test_returns_newest_logs_within_budget_in_order(self):
+        # 从最新往前累加: m4=10, m3=30, m2=30, m1=60, m0=100
+        self.assertEqual(self.fetch(60), ["m1", "m2", "m3", "m4"])
+        self.assertEqual(self.fetch(29), ["m4"])
+        self.assertEqual(self.fetch(1000), ["m0", "m1", "m2", "m3", "m4"])
+
+    def test_budget_applies_within_limit(self):
+        self.assertEqual(self.fetch(1000, limit=2), ["m3", "m4"])
+
+
+class TestIndexMigration(unittest.TestCase):
+    def test_existing_database_gets_new_indexes(self):
+        os.environ.setdefault("PERO_DATABASE_PATH", os.path.join(tempfile.gettempdir(), "perocore_test.db"))
+        from database import ensure_indexes
+
+        engine = create_engine("sqlite://")
+        # 模拟旧库：表已存在但没有复合索引
+        with engine.begin() as conn:
+            for table in SQLModel.metadata.sorted_tables:
+                table.create(conn)
+                for index in table.indexes:
+                    index.drop(conn)
+
+        with engine.begin() as conn:
+            ensure_indexes(conn)
+
+        names = {ix["name"] for ix in inspect(engine).get_indexes("conversationlog")}
+        self.assertIn("ix_conversationlog_source_session_agent_ts", names)
+        self.assertIn("ix_conversationlog_status_retry", names)
+
+
+if __name__ == '__main__':
+    unittest.main()
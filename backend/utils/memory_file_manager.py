@@ -1,6 +1,9 @@
 import os
 import asyncio
+import threading
+from collections import OrderedDict
 from datetime import datetime
+from typing import Optional
 from services.agent_manager import get_agent_manager
 from utils.workspace_utils import get_workspace_root
 
@@ -11,6 +14,12 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__fil
 WORKSPACE_ROOT = os.path.join(BASE_DIR, "pero_workspace")
 # LOG_ROOT = os.path.join(WORKSPACE_ROOT, "log") # Deprecated global log root
 
+# 归档文件内容缓存 (按 路径 + mtime + 大小 作为键，总大小受限的 LRU)
+ARCHIVE_CACHE_MAX_BYTES = 8 * 1024 * 1024
+_archive_cache: "OrderedDict[tuple, str]" = OrderedDict()
+_archive_cache_bytes = 0
+_archive_cache_lock = threading.Lock()
+
 class MemoryFileManager:
     @staticmethod
     def get_agent_log_root(agent_id: str = None) -> str:
@@ -60,3 +69,42 @@ class MemoryFileManager:
     def _write_file(filepath, content):
         with open(filepath, 'w', encoding='utf-8') as f:
             f.write(content)
+
+    @staticmethod
+    async def read_archive(filepath: str) -> Optional[str]:
+        """
+        读取归档文件内容（在线程中执行，不阻塞事件循环）。
+        文件不存在时返回 None；文件未修改时直接命中缓存。
+        """
+        return await asyncio.to_thread(MemoryFileManager._read_archive_cached, filepath)
+
+    @staticmethod
+    def _read_archive_cached(filepath: str) -> Optional[str]:
+        global _archive_cache_bytes
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+
+        key = (filepath, stat.st_mtime_ns, stat.st_size)
+        with _archive_cache_lock:
+            if key in _archive_cache:
+                _archive_cache.move_to_end(key)
+                return _archive_cache[key]
+
+        with open(filepath, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        # 超过缓存上限的大文件不缓存
+        size = len(content.encode('utf-8'))
+        if size > ARCHIVE_CACHE_MAX_BYTES:
+            return content
+
+        with _archive_cache_lock:
+            if key not in _archive_cache:
+                _archive_cache[key] = content
+                _archive_cache_bytes += size
+                while _archive_cache_bytes > ARCHIVE_CACHE_MAX_BYTES:
+                    _, evicted = _archive_cache.popitem(last=False)
+                    _archive_cache_bytes -= len(evicted.encode('utf-8'))
+        return content
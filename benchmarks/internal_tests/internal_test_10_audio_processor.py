@@ -0,0 +1,136 @@
+"""
+语音后处理事件循环阻塞测试 (Internal Test 10)
+
+测试内容:
+1. 旧实现 (async 函数内同步执行 Praat 处理 + 临时 wav/mp3 读写) 与进程池版 AudioProcessor 处理多段语音时的事件循环延迟对比
+2. 处理期间用 10ms 心跳协程测量事件循环的最大 / P95 延迟，并断言进程池版本的最大延迟低于阈值
+3. 校验排队上限：超出 max_pending 的请求立即失败而不是无限堆积
+
+安装了 parselmouth 时使用真实的 Praat "Change gender" 处理；否则用等价开销的 numpy 逐帧 FFT 处理代替。
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# 添加 backend 目录到路径
+BACKEND_DIR = Path(__file__).parent.parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from services.audio_processor import (
+    AudioProcessor, AudioQueueFullError, _cute_worker, decode_audio, encode_audio, encode_wav, parselmouth,
+)
+
+CLIPS = 6
+CLIP_SECONDS = 3.0
+SAMPLE_RATE = 24000
+TICK = 0.01
+MAX_LAG_THRESHOLD = 0.05
+
+
+def make_clip(seconds=CLIP_SECONDS, rate=SAMPLE_RATE):
+    t = np.arange(int(seconds * rate)) / rate
+    f0 = 220 + 40 * np.sin(2 * np.pi * 0.5 * t)
+    samples = 0.3 * np.sin(2 * np.pi * np.cumsum(f0) / rate) + 0.1 * np.sin(2 * np.pi * 3 * np.cumsum(f0) / rate)
+    return encode_wav(samples, rate)
+
+
+def synthetic_cute(data, pitch_factor, formant_factor, output_format):
+    """无 parselmouth 时的替代处理：逐帧 FFT 频谱搬移，开销与 Praat 处理同一量级。"""
+    samples, rate = decode_audio(data)
+    frame, hop = 2048, 128
+    window = np.hanning(frame)
+    out = np.zeros(len(samples) + frame)
+    for start in range(0, len(samples) - frame, hop):
+        spectrum = np.fft.rfft(samples[start:start + frame] * window)
+        bins = np.clip((np.arange(len(spectrum)) / pitch_factor).astype(int), 0, len(spectrum) - 1)
+        out[start:start + frame] += np.fft.irfft(spectrum[bins] * formant_factor, frame) * window
+    out = out[:len(samples)] / (frame / hop / 2)
+    return encode_audio(out, rate, output_format)
+
+
+WORKER = _cute_worker if parselmouth is not None else synthetic_cute
+
+
+async def legacy_process(data):
+    """重现旧实现：在事件循环上同步处理，并经过临时文件读写。"""
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
+        f.write(data)
+    try:
+        with open(f.name, "rb") as src:
+            result = WORKER(src.read(), 1.2, 1.1, "wav")
+        out_path = f.name.replace(".wav", "_cute.wav")
+        with open(out_path, "wb") as dst:
+            dst.write(result)
+        os.remove(out_path)
+        return result
+    finally:
+        os.remove(f.name)
+
+
+async def measure(coro_factory):
+    lags = []
+    done = asyncio.Event()
+
+    async def heartbeat():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lags.append(time.perf_counter() - start - TICK)
+
+    beat = asyncio.create_task(heartbeat())
+    await asyncio.sleep(TICK * 3)
+    start = time.perf_counter()
+    results = await coro_factory()
+    elapsed = time.perf_counter() - start
+    done.set()
+    await beat
+    lags.sort()
+    return elapsed, lags[-1], lags[int(len(lags) * 0.95)], results
+
+
+async def main():
+    print("=" * 80)
+    print(f"      INTERNAL TEST 10: AUDIO POST-PROCESSING OFF THE EVENT LOOP (parselmouth: {parselmouth is not None})")
+    print("=" * 80)
+    clips = [make_clip() for _ in range(CLIPS)]
+    processor = AudioProcessor(max_workers=2, queue_size=CLIPS)
+
+    # 预热进程池，避免把进程启动时间计入
+    await processor.run(WORKER, make_clip(0.2), 1.2, 1.1, "wav")
+
+    async def legacy():
+        return await asyncio.gather(*(legacy_process(c) for c in clips))
+
+    async def pooled():
+        return await asyncio.gather(*(processor.run(WORKER, c, 1.2, 1.1, "wav") for c in clips))
+
+    print(f"{'实现':<20}{'总耗时(ms)':>12}{'最大延迟(ms)':>14}{'P95 延迟(ms)':>14}")
+    legacy_time, legacy_max, legacy_p95, legacy_out = await measure(legacy)
+    print(f"{'旧实现 (事件循环内)':<20}{legacy_time * 1000:>12.0f}{legacy_max * 1000:>14.1f}{legacy_p95 * 1000:>14.1f}")
+    pool_time, pool_max, pool_p95, pool_out = await measure(pooled)
+    print(f"{'进程池 AudioProcessor':<20}{pool_time * 1000:>12.0f}{pool_max * 1000:>14.1f}{pool_p95 * 1000:>14.1f}")
+
+    assert [len(a) for a in legacy_out] == [len(b) for b in pool_out], "两种实现输出长度不一致"
+    assert pool_max < MAX_LAG_THRESHOLD, f"进程池版本事件循环最大延迟 {pool_max * 1000:.1f}ms 超过阈值"
+    print(f"\n事件循环最大延迟: {legacy_max * 1000:.1f}ms -> {pool_max * 1000:.1f}ms (阈值 {MAX_LAG_THRESHOLD * 1000:.0f}ms)")
+
+    # 排队上限：max_pending 之外的请求立即失败
+    bounded = AudioProcessor(max_workers=1, queue_size=1)
+    outcomes = await asyncio.gather(*(bounded.run(WORKER, clips[0], 1.2, 1.1, "wav") for _ in range(4)),
+                                    return_exceptions=True)
+    rejected = sum(isinstance(o, AudioQueueFullError) for o in outcomes)
+    assert rejected == 2, f"期望拒绝 2 个请求，实际 {rejected}"
+    print(f"排队上限 (1 worker + 1 排队): 4 个请求中 {rejected} 个被立即拒绝")
+
+    processor.shutdown(wait=True)
+    bounded.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,150 @@
+"""
+LLM SSE 流解析性能测试 (Internal Test 4)
+
+测试内容:
+1. 旧路径 (aiter_lines + json.loads 逐行) 与字节级 SSEDecoder 的解析开销对比
+2. 逐 token 的单次开销 (us/token) 与产出的 delta 数量
+3. 时间窗口合并 (PERO_LLM_STREAM_COALESCE_MS) 对 delta 数量与延迟的影响
+
+用法:
+    python internal_test_4_sse_stream.py                  # 使用合成流
+    python internal_test_4_sse_stream.py stream_xxx.sse   # 回放录制的流
+录制真实流: 启动后端前设置 PERO_LLM_STREAM_RECORD_DIR=<目录>
+"""
+
+import sys
+import json
+import codecs
+import time
+import random
+import asyncio
+import statistics
+from pathlib import Path
+
+# 添加 backend 目录到路径
+BACKEND_DIR = Path(__file__).parent.parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from services.sse_decoder import iter_sse_deltas, JSON_BACKEND
+
+
+def build_synthetic_stream(tokens: int = 4000, seed: int = 42) -> bytes:
+    """生成 OpenAI 兼容的流 (含 role 首包、工具调用与 [DONE])。"""
+    rng = random.Random(seed)
+    words = ["主人", "今天", "Pero", "想", "你", "了", "！", "hello", " world", "~", "喵", "，", "。"]
+    events = []
+
+    def event(delta):
+        body = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 0,
+                "model": "bench", "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+        events.append(b"data: " + json.dumps(body, ensure_ascii=False).encode("utf-8") + b"\n\n")
+
+    event({"role": "assistant", "content": ""})
+    for _ in range(tokens):
+        event({"content": rng.choice(words)})
+    event({"tool_calls": [{"index": 0, "id": "call_0", "type": "function",
+                           "function": {"name": "get_weather", "arguments": ""}}]})
+    for part in ['{"city"', ': "上海"', "}"]:
+        event({"tool_calls": [{"index": 0, "function": {"arguments": part}}]})
+    events.append(b"data: [DONE]\n\n")
+    return b"".join(events)
+
+
+def split_reads(raw: bytes, seed: int = 7):
+    """模拟网络读取：随机大小的分片，可能截断在行中间。"""
+    rng = random.Random(seed)
+    chunks, pos = [], 0
+    while pos < len(raw):
+        size = rng.choice([64, 128, 256, 512, 1024])
+        chunks.append(raw[pos:pos + size])
+        pos += size
+    return chunks
+
+
+async def replay(chunks, delay: float = 0.0):
+    for chunk in chunks:
+        if delay:
+            await asyncio.sleep(delay)
+        yield chunk
+
+
+async def legacy_parse(chunks):
+    """重现旧实现：按 str 行切分后逐行 json.loads。"""
+    buffer = ""
+    deltas = []
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    async for chunk in replay(chunks):
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            if line.startswith("data: "):
+                data_str = line[6:].strip()
+                if data_str == "[DONE]":
+                    return deltas
+                try:
+                    data = json.loads(data_str)
+                    if data.get("choices"):
+                        deltas.append(data["choices"][0].get("delta", {}))
+                except:
+                    continue
+    return deltas
+
+
+async def decoder_parse(chunks, coalesce_ms: float = 0.0, delay: float = 0.0):
+    return [d async for d in iter_sse_deltas(replay(chunks, delay), coalesce_ms)]
+
+
+def summarize(deltas):
+    content = "".join(d.get("content") or "" for d in deltas)
+    args = "".join(
+        tc.get("function", {}).get("arguments") or ""
+        for d in deltas for tc in (d.get("tool_calls") or [])
+    )
+    return content, args
+
+
+async def timed(fn, *args, rounds: int = 20):
+    samples = []
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = await fn(*args)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+async def main():
+    if len(sys.argv) > 1:
+        raw = Path(sys.argv[1]).read_bytes()
+        print(f"[*] 回放录制流: {sys.argv[1]} ({len(raw):,} bytes)")
+    else:
+        raw = build_synthetic_stream()
+        print(f"[*] 合成流: {len(raw):,} bytes")
+    chunks = split_reads(raw)
+
+    print("=" * 80)
+    print(f"      INTERNAL TEST 4: SSE STREAM PARSING (JSON backend: {JSON_BACKEND})")
+    print("=" * 80)
+
+    legacy_time, legacy = await timed(legacy_parse, chunks)
+    new_time, new = await timed(decoder_parse, chunks)
+    tokens = len(legacy)
+
+    assert summarize(legacy) == summarize(new), "解析结果不一致"
+    print(f"{'路径':<20}{'耗时(ms)':>12}{'us/token':>12}{'delta 数':>12}")
+    print(f"{'legacy (lines)':<20}{legacy_time * 1000:>12.2f}{legacy_time / tokens * 1e6:>12.2f}{len(legacy):>12}")
+    print(f"{'SSEDecoder':<20}{new_time * 1000:>12.2f}{new_time / tokens * 1e6:>12.2f}{len(new):>12}")
+    print(f"加速比: {legacy_time / new_time:.2f}x")
+
+    # 时间窗口合并：模拟 2ms 一次的网络读取
+    print("-" * 80)
+    paced = chunks[:200]
+    for window in (0.0, 15.0, 50.0):
+        start = time.perf_counter()
+        out = await decoder_parse(paced, window, 0.002)
+        elapsed = time.perf_counter() - start
+        print(f"coalesce_ms={window:<6} delta 数: {len(out):>5}  总耗时: {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+"""
+NIT 2.0 数据流并行执行测试 (Internal Test 5)
+
+测试内容:
+1. 逐条 await 的旧执行方式与按 $变量 依赖图并发执行的 NITRuntime 的耗时对比
+2. 典型脚本形态: 扇出 (互不依赖)、扇出后汇总、纯依赖链、含有副作用工具 (serialOnly 屏障)
+3. 校验两种方式得到的变量与返回值一致
+
+工具均为模拟的慢速工具 (asyncio.sleep)，不依赖任何外部服务。
+"""
+
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+# 添加 backend 目录到路径
+BACKEND_DIR = Path(__file__).parent.parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from nit_core.interpreter import parse_nit_script, RUST_AVAILABLE
+from nit_core.interpreter.engine import NITRuntime
+
+TOOL_LATENCY = {
+    "web_search": 0.20,
+    "read_file_content": 0.10,
+    "bilibili_get_info": 0.15,
+    "summarize": 0.05,
+    "write_file": 0.05,
+}
+SERIAL_TOOLS = {"write_file"}
+
+SCRIPTS = {
+    "扇出 (4 个独立调用)": """
+        $a = web_search(query="天气")
+        $b = web_search(query="新闻")
+        $c = read_file_content(path="a.md")
+        $d = bilibili_get_info(bvid="BV1xx")
+    """,
+    "扇出 + 汇总": """
+        $a = web_search(query="PeroCore")
+        $b = read_file_content(path="README.md")
+        $c = bilibili_get_info(bvid="BV1xx")
+        $s = summarize(items=[$a, $b, $c])
+    """,
+    "纯依赖链": """
+        $a = web_search(query="x")
+        $b = summarize(items=[$a])
+        $c = summarize(items=[$b])
+    """,
+    "含副作用屏障": """
+        $a = web_search(query="x")
+        $b = web_search(query="y")
+        write_file(path="out.md", content=$a)
+        $c = read_file_content(path="out.md")
+        $d = web_search(query="z")
+    """,
+}
+
+
+async def mock_tool(name, params):
+    await asyncio.sleep(TOOL_LATENCY.get(name, 0.05))
+    return f"{name}({sorted(params.items())})"
+
+
+async def run_sequential(pipeline):
+    """重现旧实现：逐条 await。"""
+    runtime = NITRuntime(mock_tool)
+    last = None
+    for statement in pipeline.statements:
+        last = await runtime.execute_statement(statement)
+    return runtime, last
+
+
+async def run_dataflow(pipeline):
+    runtime = NITRuntime(mock_tool, is_serial=lambda name: name in SERIAL_TOOLS)
+    last = await runtime.execute(pipeline)
+    return runtime, last
+
+
+def snapshot(runtime):
+    variables = runtime.variables
+    if isinstance(variables, dict):
+        return dict(variables)
+    return {name: variables.get(name) for name in ("a", "b", "c", "d", "s")}
+
+
+async def main():
+    print("=" * 80)
+    print(f"      INTERNAL TEST 5: NIT DATAFLOW RUNTIME (Rust runtime: {RUST_AVAILABLE})")
+    print("=" * 80)
+    print(f"{'脚本':<22}{'串行(ms)':>12}{'数据流(ms)':>12}{'加速比':>10}{'并发层数':>10}")
+
+    for title, script in SCRIPTS.items():
+        pipeline = parse_nit_script(script)
+        stages = NITRuntime(mock_tool, is_serial=lambda name: name in SERIAL_TOOLS).build_dependencies(
+            list(pipeline.statements)
+        )
+        levels = []
+        for before in stages:
+            levels.append(max((levels[i] + 1 for i in before), default=0))
+
+        start = time.perf_counter()
+        seq_runtime, seq_result = await run_sequential(pipeline)
+        seq_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        df_runtime, df_result = await run_dataflow(pipeline)
+        df_time = time.perf_counter() - start
+
+        assert seq_result == df_result, f"{title}: 返回值不一致"
+        assert snapshot(seq_runtime) == snapshot(df_runtime), f"{title}: 变量不一致"
+        print(f"{title:<22}{seq_time * 1000:>12.1f}{df_time * 1000:>12.1f}"
+              f"{seq_time / df_time:>9.2f}x{max(levels, default=-1) + 1:>10}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,257 @@
+"""
+流式标签过滤延迟测试 (Internal Test 6)
+
+测试内容:
+1. 旧路径 (XMLStreamFilter -> NITStreamFilter -> ThinkingBlockStreamFilter 三级串联) 与单遍 StreamTagFilter 的开销对比
+2. 以 1 字符为一个分片回放，统计每分片耗时 (us/chunk)
+3. 输出滞后: 每个可显示字符从进入过滤器到被输出之间又输入了多少个字符 (平均 / 最大)
+4. 校验两种方式的最终输出一致
+
+旧过滤器的实现原样复刻在本文件中，不依赖任何外部服务。
+"""
+
+import re
+import sys
+import time
+import random
+from pathlib import Path
+
+# 添加 backend 目录到路径
+BACKEND_DIR = Path(__file__).parent.parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from nit_core.stream_filter import StreamTagFilter, DEFAULT_THINKING_TAGS
+
+XML_TAGS = ["THOUGHT", "PEROCUE", "CHARACTER_STATUS", "METADATA"]
+
+
+class LegacyNITStreamFilter:
+    """旧 NITStreamFilter: 每个分片对整个缓冲区重新搜索，固定扣留 24 个字符。"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.in_block = False
+        self.m1_start, self.m1_end = "[[[NIT_CALL]]]", "[[[NIT_END]]]"
+        self.tag_pattern = re.compile(r'<(nit(?:-[0-9a-fA-F]{4})?)>', re.IGNORECASE)
+        self.end_tag_pattern = re.compile(r'</(nit(?:-[0-9a-fA-F]{4})?)>', re.IGNORECASE)
+
+    def filter(self, chunk):
+        self.buffer += chunk
+        output = ""
+        while self.buffer:
+            if not self.in_block:
+                idx1 = self.buffer.find(self.m1_start)
+                match2 = self.tag_pattern.search(self.buffer)
+                starts = [i for i in [idx1, match2.start() if match2 else -1] if i != -1]
+                if not starts:
+                    safe_len = len(self.buffer) - len(self.m1_start) - 10
+                    if safe_len > 0:
+                        output += self.buffer[:safe_len]
+                        self.buffer = self.buffer[safe_len:]
+                    return output
+                output += self.buffer[:min(starts)]
+                self.buffer = self.buffer[min(starts):]
+                self.in_block = True
+            else:
+                idx1_end = self.buffer.find(self.m1_end)
+                match2_end = self.end_tag_pattern.search(self.buffer)
+                idx2_end = match2_end.end() if match2_end else -1
+                if idx1_end != -1 and (idx2_end == -1 or idx1_end < idx2_end):
+                    self.buffer = self.buffer[idx1_end + len(self.m1_end):]
+                    self.in_block = False
+                elif idx2_end != -1:
+                    self.buffer = self.buffer[idx2_end:]
+                    self.in_block = False
+                else:
+                    return output
+        return output
+
+    def flush(self):
+        res = "" if self.in_block else self.buffer
+        self.buffer = ""
+        return res
+
+
+class LegacyXMLStreamFilter:
+    """旧 XMLStreamFilter: 每个标签对整个缓冲区做一次 upper().find()，固定扣留 20 个字符。"""
+
+    def __init__(self, tag_names):
+        self.tag_names = [t.upper() for t in tag_names]
+        self.buffer = ""
+        self.in_block = False
+        self.current_end_tag = ""
+
+    def filter(self, chunk):
+        self.buffer += chunk
+        output = ""
+        while self.buffer:
+            if not self.in_block:
+                found_tag, found_idx = None, -1
+                for tag in self.tag_names:
+                    idx = self.buffer.upper().find(f"<{tag}>")
+                    if idx != -1 and (found_idx == -1 or idx < found_idx):
+                        found_idx, found_tag = idx, tag
+                if found_idx == -1:
+                    safe_len = max(0, len(self.buffer) - 20)
+                    output += self.buffer[:safe_len]
+                    self.buffer = self.buffer[safe_len:]
+                    return output
+                output += self.buffer[:found_idx]
+                self.buffer = self.buffer[found_idx:]
+                self.in_block = True
+                self.current_end_tag = f"</{found_tag}>"
+            else:
+                idx = self.buffer.upper().find(self.current_end_tag)
+                if idx == -1:
+                    return output
+                self.buffer = self.buffer[idx + len(self.current_end_tag):]
+                self.in_block = False
+        return output
+
+    def flush(self):
+        res = "" if self.in_block else self.buffer
+        self.buffer = ""
+        return res
+
+
+class LegacyThinkingBlockStreamFilter:
+    """旧 ThinkingBlockStreamFilter: 固定扣留 15 个字符。"""
+
+    CLOSERS = {"【": "】", "[": "]", "(": ")"}
+
+    def __init__(self, tag_names):
+        self.start_pattern = re.compile(r'(?:【|\[|\()(?:' + '|'.join(tag_names) + r')', re.IGNORECASE)
+        self.buffer = ""
+        self.in_block = False
+        self.current_closer = ""
+
+    def filter(self, chunk):
+        self.buffer += chunk
+        output = ""
+        while self.buffer:
+            if not self.in_block:
+                match = self.start_pattern.search(self.buffer)
+                if not match:
+                    safe_len = max(0, len(self.buffer) - 15)
+                    output += self.buffer[:safe_len]
+                    self.buffer = self.buffer[safe_len:]
+                    return output
+                self.current_closer = self.CLOSERS[match.group(0)[0]]
+                output += self.buffer[:match.start()]
+                self.buffer = self.buffer[match.start():]
+                self.in_block = True
+            else:
+                idx = self.buffer.find(self.current_closer)
+                if idx == -1:
+                    return output
+                self.buffer = self.buffer[idx + 1:]
+                self.in_block = False
+        return output
+
+    def flush(self):
+        res = "" if self.in_block else self.buffer
+        self.buffer = ""
+        return res
+
+
+class LegacyChain:
+    """重现旧 TTS 路径: XML -> NIT -> Thinking 三级串联。"""
+
+    def __init__(self):
+        self.xml = LegacyXMLStreamFilter(XML_TAGS)
+        self.nit = LegacyNITStreamFilter()
+        self.thinking = LegacyThinkingBlockStreamFilter(list(DEFAULT_THINKING_TAGS))
+
+    def filter(self, chunk):
+        return self.thinking.filter(self.nit.filter(self.xml.filter(chunk)))
+
+    def flush(self):
+        text = self.nit.filter(self.xml.flush()) + self.nit.flush()
+        return self.thinking.filter(text) + self.thinking.flush()
+
+
+def build_reply(paragraphs: int = 40, seed: int = 7) -> str:
+    """生成一段带有 PEROCUE、思考块、NIT 调用的典型回复。"""
+    rng = random.Random(seed)
+    words = ["主人", "今天", "天气", "真好", "呀", "！", "我们", "去", "散步", "吧", "~", "，", "。", "Pero", " ok", "(笑)"]
+    parts = []
+    for i in range(paragraphs):
+        parts.append("".join(rng.choice(words) for _ in range(rng.randint(10, 40))))
+        kind = i % 4
+        if kind == 0:
+            parts.append('<PEROCUE>{"mood": "happy", "vibe": "calm"}</PEROCUE>')
+        elif kind == 1:
+            parts.append("【Thinking: 主人好像有点累，先关心一下】")
+        elif kind == 2:
+            parts.append(f'<nit-{i:04X}>\n$a = web_search(query="天气 {i}")\nsummarize(items=[$a])\n</nit-{i:04X}>')
+        else:
+            parts.append("<THOUGHT>要不要提醒喝水呢</THOUGHT>")
+    return "".join(parts)
+
+
+BLOCK_PATTERN = re.compile(
+    r"\[\[\[NIT_CALL\]\]\].*?\[\[\[NIT_END\]\]\]"
+    r"|<(nit(?:-[0-9a-f]{4})?)>.*?</\1>"
+    r"|<(" + "|".join(XML_TAGS) + r")>.*?</\2>"
+    r"|【(?:" + "|".join(DEFAULT_THINKING_TAGS) + r").*?】",
+    re.DOTALL | re.IGNORECASE,
+)
+
+
+def visible_positions(text):
+    """可显示字符在原文中的下标 (即理想情况下最早可输出的时刻)。"""
+    positions = []
+    last = 0
+    for match in BLOCK_PATTERN.finditer(text):
+        positions.extend(range(last, match.start()))
+        last = match.end()
+    positions.extend(range(last, len(text)))
+    return positions
+
+
+def replay(stream_filter, text):
+    """逐字符回放，返回 (输出, 总耗时, 每个输出字符被输出时已输入的字符下标)。"""
+    output = []
+    emitted_at = []
+    start = time.perf_counter()
+    for index, char in enumerate(text):
+        out = stream_filter.filter(char)
+        if out:
+            output.append(out)
+            emitted_at.extend([index] * len(out))
+    out = stream_filter.flush()
+    elapsed = time.perf_counter() - start
+    output.append(out)
+    emitted_at.extend([len(text)] * len(out))
+    return "".join(output), elapsed, emitted_at
+
+
+def main():
+    text = build_reply()
+    positions = visible_positions(text)
+    print("=" * 80)
+    print("      INTERNAL TEST 6: STREAMING TAG FILTER (1-char chunks)")
+    print("=" * 80)
+    print(f"回复长度: {len(text)} 字符")
+    print(f"{'实现':<26}{'总耗时(ms)':>12}{'us/chunk':>12}{'平均滞后':>10}{'最大滞后':>10}")
+
+    results = {}
+    for title, stream_filter in (
+        ("旧: 三级串联过滤", LegacyChain()),
+        ("新: StreamTagFilter", StreamTagFilter(nit=True, xml_tags=XML_TAGS, thinking_tags=DEFAULT_THINKING_TAGS)),
+    ):
+        output, elapsed, emitted_at = replay(stream_filter, text)
+        lags = [emit - source for emit, source in zip(emitted_at, positions)]
+        avg_lag = sum(lags) / len(lags)
+        max_lag = max(lags)
+        results[title] = output
+        print(f"{title:<26}{elapsed * 1000:>12.2f}{elapsed / len(text) * 1e6:>12.2f}{avg_lag:>10.2f}{max_lag:>10}")
+
+    outputs = list(results.values())
+    assert outputs[0] == outputs[1], "两种实现的输出不一致"
+    assert outputs[1] == "".join(text[i] for i in positions), "输出与整段移除结果不一致"
+    print("输出一致: OK")
+
+
+if __name__ == "__main__":
+    main()
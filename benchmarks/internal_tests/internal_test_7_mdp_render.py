@@ -0,0 +1,125 @@
+"""
+MDP 提示词渲染性能测试 (Internal Test 7)
+
+测试内容:
+1. 旧渲染路径 (逐个 get_template 探测覆盖名 + 每轮 from_string 重新编译) 与新 MDPManager.render 的耗时对比
+2. 渲染对象为真实的 core/templates/system_template，变量组装方式与 PromptManager._enrich_variables 一致
+3. 渲染轮数 (from_string 次数) 与模板缓存命中率
+4. 校验两种方式的输出一致
+
+旧路径的实现原样复刻在本文件中，不依赖任何外部服务。
+"""
+
+import re
+import sys
+import time
+from pathlib import Path
+
+# 添加 backend 目录到路径
+BACKEND_DIR = Path(__file__).parent.parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+import jinja2
+from services.mdp.manager import MDPManager
+
+ROUNDS = 200
+
+
+def legacy_render(mdp: MDPManager, template_name: str, context: dict, counter: dict) -> str:
+    """重现旧 MDPManager.render: 探测覆盖名，然后最多 5 轮 re.findall + from_string 递归展开。"""
+    env = mdp.jinja_env
+    target = template_name
+    agent_name = context.get("agent_name")
+    if agent_name:
+        override_name = f"{agent_name}/{template_name}"
+        for candidate in (override_name, f"{override_name}.md"):
+            try:
+                env.get_template(candidate)
+                target = candidate
+                break
+            except jinja2.TemplateNotFound:
+                pass
+
+    template = None
+    for candidate in (target, f"{target}.md"):
+        try:
+            template = env.get_template(candidate)
+            break
+        except jinja2.TemplateNotFound:
+            pass
+
+    rendered = template.render(**context)
+    for _ in range(5):
+        if "{{" not in rendered:
+            break
+        matches = re.findall(r"\{\{\s*([a-zA-Z0-9_./]+)\s*\}\}", rendered)
+        new_context = context.copy()
+        for var in matches:
+            if var not in new_context and var in mdp.prompts:
+                new_context[var] = mdp.prompts[var].content
+        prev_rendered = rendered
+        counter["compiles"] += 1
+        rendered = env.from_string(rendered).render(**new_context)
+        if rendered == prev_rendered:
+            break
+    return rendered
+
+
+def build_variables(mdp: MDPManager) -> dict:
+    """与 PromptManager._enrich_variables 相同的变量形态 (工具描述为占位文本)。"""
+    variables = {
+        "owner_name": "主人",
+        "user_persona": "喜欢猫的程序员",
+        "current_time": "2026-10-19 21:30",
+        "mood": "开心",
+        "vibe": "活泼",
+        "mind": "正在想主人...",
+        "vision_status": "",
+        "memory_context": "- 主人昨天说想去看海\n- 主人最近在学 Rust",
+        "graph_context": "",
+        "agent_name": "Pero",
+        "bot_name": "Pero",
+        "custom_persona": "你是一个全能的 AI 助手，你的名字是 {{ agent_name }}。",
+        "nit_tools_description": "- web_search(query): 搜索网页\n- read_file_content(path): 读取文件",
+    }
+    variables["persona_definition"] = mdp.render("pero/system_prompt", {"agent_name": "Pero", "owner_name": "主人"})
+    chain_prompt = mdp.get_prompt("chains/default")
+    variables["chain_logic"] = chain_prompt.content if chain_prompt else ""
+    return variables
+
+
+def main():
+    mdp = MDPManager(str(BACKEND_DIR / "services" / "mdp" / "prompts"))
+    variables = build_variables(mdp)
+    templates = ["core/templates/system_template", "core/templates/instruction_default"]
+
+    print("=" * 80)
+    print("      INTERNAL TEST 7: MDP TEMPLATE RENDERING")
+    print("=" * 80)
+    print(f"{'模板':<36}{'旧(ms)':>10}{'新(ms)':>10}{'加速比':>10}{'旧编译/次':>12}")
+
+    for name in templates:
+        counter = {"compiles": 0}
+        expected = legacy_render(mdp, name, dict(variables), counter)
+        assert mdp.render(name, dict(variables)) == expected, f"{name}: 输出不一致"
+
+        counter = {"compiles": 0}
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            legacy_render(mdp, name, dict(variables), counter)
+        legacy_time = (time.perf_counter() - start) / ROUNDS
+
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            mdp.render(name, dict(variables))
+        new_time = (time.perf_counter() - start) / ROUNDS
+
+        print(f"{name:<36}{legacy_time * 1000:>10.3f}{new_time * 1000:>10.3f}"
+              f"{legacy_time / new_time:>9.1f}x{counter['compiles'] / ROUNDS:>12.1f}")
+
+    print(f"模板缓存: {mdp.get_cache_stats()}")
+    print("输出一致: OK")
+
+
+if __name__ == "__main__":
+    main()
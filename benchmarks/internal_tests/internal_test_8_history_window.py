@@ -0,0 +1,161 @@
+"""
+对话历史 Token 窗口性能测试 (Internal Test 8)
+
+测试内容:
+1. 旧路径 (拉取 200 条记录 -> 逐条清理 + tiktoken 重新编码 -> list.insert(0) 构建窗口) 与新 HistoryPreprocessor 的耗时对比
+2. 新路径使用写入时记录的 token_count，通过窗口函数只拉取 100K Token 预算内的记录
+3. 不同历史长度 / 消息长度下每次请求拉取的行数与编码次数
+4. 校验两种方式得到的上下文窗口一致
+
+使用内存 SQLite (aiosqlite)。未安装 tiktoken 或无法下载 cl100k_base 时，
+改用按词 / 标点切分的近似编码器计时 (两条路径使用同一编码器)。
+"""
+
+import re
+import sys
+import time
+import random
+import asyncio
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# 添加 backend 目录到路径
+BACKEND_DIR = Path(__file__).parent.parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from services import history_tokens
+from services.memory_service import MemoryService
+from services.preprocessor.implementations import HistoryPreprocessor, HISTORY_MAX_TOKENS
+
+ROUNDS = 20
+SCENARIOS = [
+    # (标题, 历史条数, 单条消息平均字符数)
+    ("短消息 / 2000 条", 2000, 300),
+    ("代码片段 / 2000 条", 2000, 3000),
+    ("长文档 / 5000 条", 5000, 8000),
+]
+
+
+class ApproxEncoding:
+    """近似编码器：每个词 / 汉字 / 标点计 1 个 Token。"""
+    _pattern = re.compile(r"[A-Za-z0-9_]+|[^\sA-Za-z0-9_]")
+
+    def encode(self, text):
+        return self._pattern.findall(text)
+
+
+class CountingEncoding:
+    def __init__(self, inner):
+        self.inner = inner
+        self.calls = 0
+
+    def encode(self, text):
+        self.calls += 1
+        return self.inner.encode(text)
+
+
+async def legacy_window(session, encoding):
+    """重现旧 HistoryPreprocessor 的工作模式路径。"""
+    history_logs = await MemoryService.get_recent_logs(session, "ide", "work_bench", limit=200)
+    history_messages = []
+    for log in history_logs:
+        content = log.content
+        content = re.sub(r'<!-- PERO_RAG_BLOCK_START.*?-->', '', content, flags=re.S)
+        content = re.sub(r'<!-- PERO_RAG_BLOCK_END -->', '', content, flags=re.S)
+        content = re.sub(r'<([A-Z_]+)>.*?</\1>', '', content, flags=re.S)
+        content = re.sub(r'<[^>]+>', '', content)
+        content = content.strip()
+        if content:
+            history_messages.append({"role": log.role, "content": content})
+
+    current_tokens = 0
+    truncated_history = []
+    for msg in reversed(history_messages):
+        tokens = len(encoding.encode(msg["content"]))
+        if current_tokens + tokens > HISTORY_MAX_TOKENS:
+            break
+        current_tokens += tokens
+        truncated_history.insert(0, msg)
+    return truncated_history, len(history_logs)
+
+
+def build_message(rng, avg_chars):
+    words = ["主人", "这个函数", "需要", "重构", "def", "return", "self", "async", "await", "数据库", "索引", "。", "，", "\n"]
+    text = []
+    size = 0
+    target = rng.randint(avg_chars // 2, avg_chars * 3 // 2)
+    while size < target:
+        word = rng.choice(words)
+        text.append(word)
+        size += len(word) + 1
+    body = " ".join(text)
+    if rng.random() < 0.3:
+        body = f'<PEROCUE>{{"mood": "focus"}}</PEROCUE>{body}'
+    return body
+
+
+async def run_scenario(title, count, avg_chars, encoding):
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    rng = random.Random(count + avg_chars)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        start_time = datetime(2026, 1, 1)
+        for i in range(count):
+            role = "user" if i % 2 == 0 else "assistant"
+            log = await MemoryService.save_log(session, "ide", "work_bench", role, build_message(rng, avg_chars))
+            log.timestamp = start_time + timedelta(seconds=i)
+        await session.commit()
+
+        preprocessor = HistoryPreprocessor()
+        context = {"session": session, "memory_service": MemoryService, "source": "ide",
+                   "session_id": "work_bench", "messages": []}
+
+        encoding.calls = 0
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            legacy_messages, legacy_rows = await legacy_window(session, encoding)
+        legacy_time = (time.perf_counter() - start) / ROUNDS
+        legacy_calls = encoding.calls / ROUNDS
+
+        encoding.calls = 0
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            result = await preprocessor.process(dict(context))
+        new_time = (time.perf_counter() - start) / ROUNDS
+        new_calls = encoding.calls / ROUNDS
+        new_rows = len(await MemoryService.get_recent_logs_within_budget(
+            session, "ide", "work_bench", HISTORY_MAX_TOKENS, limit=200))
+
+        assert result["history_messages"] == legacy_messages, f"{title}: 上下文窗口不一致"
+        print(f"{title:<20}{legacy_time * 1000:>10.2f}{new_time * 1000:>10.2f}{legacy_time / new_time:>9.1f}x"
+              f"{legacy_rows:>8}/{new_rows:<5}{legacy_calls:>8.0f}/{new_calls:<5.0f}{len(legacy_messages):>8}")
+    await engine.dispose()
+
+
+async def main():
+    if history_tokens.tokens_available():
+        encoder_name = "tiktoken cl100k_base"
+        encoding = CountingEncoding(history_tokens._encoding)
+    else:
+        encoder_name = "近似编码器"
+        encoding = CountingEncoding(ApproxEncoding())
+    # 写入与读取统一经过计数包装，便于统计编码次数
+    history_tokens._encoding = encoding
+
+    print("=" * 80)
+    print(f"      INTERNAL TEST 8: HISTORY TOKEN WINDOW ({encoder_name}, 预算 {HISTORY_MAX_TOKENS})")
+    print("=" * 80)
+    print(f"{'场景':<20}{'旧(ms)':>10}{'新(ms)':>10}{'加速比':>10}{'拉取行数 旧/新':>16}{'编码次数 旧/新':>14}{'窗口条数':>8}")
+    for title, count, avg_chars in SCENARIOS:
+        await run_scenario(title, count, avg_chars, encoding)
+    print("窗口一致: OK")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+"""
+语音轮次分句流水线 TTS 测试 (Internal Test 9)
+
+测试内容:
+1. 旧流程 (等待完整回复 -> 整段合成 -> 发送) 与分句流水线 (边生成边分句、有限并发合成、按序发送) 的首段音频延迟对比
+2. 不同并发上限 (PERO_TTS_MAX_PARALLEL) 下整轮结束时间的变化
+3. 校验流水线发送的音频顺序与句子顺序一致，且拼接后的文本与整段文本一致
+
+LLM 与 TTS 均为模拟后端 (asyncio.sleep)，不依赖任何外部服务:
+- LLM: 首 token 延迟 + 每字符固定间隔
+- TTS: 每次请求固定开销 + 每字符合成时间
+"""
+
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+# 添加 backend 目录到路径
+BACKEND_DIR = Path(__file__).parent.parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from services.tts_pipeline import SentenceSplitter, TTSPipeline
+
+LLM_FIRST_TOKEN = 0.30
+LLM_PER_CHAR = 0.004
+TTS_OVERHEAD = 0.25
+TTS_PER_CHAR = 0.010
+
+REPLIES = {
+    "短回复": "好呀，主人！我这就去帮你查一下今天的天气。",
+    "中等回复": (
+        "今天上海多云转晴，气温十八到二十五度，很适合出门散步哦。"
+        "不过傍晚可能会起风，记得带一件薄外套。"
+        "如果要去公园的话，下午三点左右光线最好，拍照也很好看！"
+        "对了，明天有小雨，记得提前把伞放进包里。"
+    ),
+    "长回复": (
+        "我把你刚才说的几件事整理了一下。"
+        "第一，周三下午的会议已经改到四点，会议室还是原来那间。"
+        "第二，你想看的那本书图书馆有馆藏，可以在线预约，周末之前去取就行。"
+        "第三，关于旅行计划，我比较推荐先去杭州再去苏州，这样高铁换乘更顺。"
+        "第四，猫粮快吃完了，我已经把常买的那款加进购物清单里了。"
+        "最后，今晚早点休息吧，最近你睡得有点晚，我会担心的。"
+    ),
+}
+
+
+async def stream_reply(text):
+    await asyncio.sleep(LLM_FIRST_TOKEN)
+    for i in range(0, len(text), 4):
+        await asyncio.sleep(LLM_PER_CHAR * 4)
+        yield text[i:i + 4]
+
+
+async def stub_synthesize(text):
+    await asyncio.sleep(TTS_OVERHEAD + TTS_PER_CHAR * len(text))
+    return text
+
+
+async def run_legacy(text):
+    """重现旧实现：等待完整回复后整段合成，再发送。"""
+    start = time.perf_counter()
+    full = ""
+    async for chunk in stream_reply(text):
+        full += chunk
+    audio = await stub_synthesize(full)
+    first_audio = time.perf_counter() - start
+    return first_audio, time.perf_counter() - start, [audio]
+
+
+async def run_pipeline(text, max_parallel):
+    sent = []
+    first = []
+    start = time.perf_counter()
+
+    async def send(audio):
+        if not first:
+            first.append(time.perf_counter() - start)
+        sent.append(audio)
+
+    pipeline = TTSPipeline(stub_synthesize, send, max_parallel=max_parallel)
+    splitter = SentenceSplitter()
+    async for chunk in stream_reply(text):
+        for sentence in splitter.feed(chunk):
+            pipeline.submit(sentence)
+    rest = splitter.flush()
+    if rest.strip():
+        pipeline.submit(rest)
+    await pipeline.close()
+    return first[0], time.perf_counter() - start, sent
+
+
+async def main():
+    print("=" * 80)
+    print("      INTERNAL TEST 9: SENTENCE-LEVEL STREAMING TTS PIPELINE")
+    print("=" * 80)
+    print(f"LLM: 首 token {LLM_FIRST_TOKEN * 1000:.0f}ms + {LLM_PER_CHAR * 1000:.0f}ms/字; "
+          f"TTS: {TTS_OVERHEAD * 1000:.0f}ms/次 + {TTS_PER_CHAR * 1000:.0f}ms/字")
+    print(f"{'回复':<10}{'模式':<16}{'首段音频(ms)':>14}{'整轮(ms)':>12}{'音频段数':>10}")
+
+    for title, text in REPLIES.items():
+        legacy_first, legacy_total, legacy_audio = await run_legacy(text)
+        print(f"{title:<10}{'整段合成':<16}{legacy_first * 1000:>14.0f}{legacy_total * 1000:>12.0f}{len(legacy_audio):>10}")
+        for max_parallel in (1, 2, 4):
+            first, total, audio = await run_pipeline(text, max_parallel)
+            assert "".join(audio) == text, f"{title}: 流水线音频顺序或内容不一致"
+            print(f"{'':<10}{f'流水线 (并发 {max_parallel})':<16}{first * 1000:>14.0f}{total * 1000:>12.0f}{len(audio):>10}"
+                  f"   首段提速 {legacy_first / first:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())